@@ -51,6 +51,17 @@ async def get_db():
             db_manager = None
     return db_manager
 
+def read_query(db, query: str, params=None, **kwargs):
+    """Run a read-only dashboard query, on the read replica when it is fresh enough"""
+    if not hasattr(db, 'use_replica'):
+        return db.execute_query(query, params, **kwargs)
+    return db.execute_query(query, params, workload='analytics', replica=db.use_replica(), **kwargs)
+
+def record_write(db) -> None:
+    """Keep the next reads on the primary so the admin sees their own change"""
+    if hasattr(db, 'mark_write'):
+        db.mark_write()
+
 # Pydantic models for API
 class SettingsUpdate(BaseModel):
     welcome_message: Optional[str] = None
@@ -139,7 +150,7 @@ async def get_dashboard_stats(db: Optional[object] = Depends(get_db)):
         
         # Get user statistics
         users_query = "SELECT COUNT(*) as total FROM users"
-        result = db.execute_query(users_query, fetch_one=True)
+        result = read_query(db, users_query, fetch_one=True)
         total_users = result['total'] if result else 0
         
         # Get active users (last 7 days)
@@ -151,12 +162,12 @@ async def get_dashboard_stats(db: Optional[object] = Depends(get_db)):
         WHERE last_interaction > ?
         """
         week_ago = datetime.now() - timedelta(days=7)
-        result = db.execute_query(active_query, (week_ago,), fetch_one=True)
+        result = read_query(db, active_query, (week_ago,), fetch_one=True)
         active_users = result['active'] if result else 0
         
         # Get message count
         messages_query = "SELECT COUNT(*) as total FROM user_messages"
-        result = db.execute_query(messages_query, fetch_one=True)
+        result = read_query(db, messages_query, fetch_one=True)
         total_messages = result['total'] if result else 0
         
         return {
@@ -209,7 +220,7 @@ async def get_products(db: Optional[object] = Depends(get_db)):
         FROM products
         ORDER BY created_at DESC
         """
-        products = db.execute_query(query, fetch_all=True)
+        products = read_query(db, query, fetch_all=True)
         return products or []
     except Exception as e:
         print(f"Error getting products: {e}")
@@ -238,6 +249,7 @@ async def create_product(product: ProductCreate, db: Optional[object] = Depends(
             product.stripe_price_id,
             product.is_active
         ))
+        record_write(db)
         return {"message": "Product created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -264,6 +276,7 @@ async def update_product(product_id: int, product: ProductUpdate, db: Optional[o
         query = f"UPDATE products SET {', '.join(updates)} WHERE id = %s" if hasattr(db, '_db_type') and db._db_type == 'postgresql' else f"UPDATE products SET {', '.join(updates)} WHERE id = ?"
         
         db.execute_query(query, params)
+        record_write(db)
         return {"message": "Product updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -277,6 +290,7 @@ async def delete_product(product_id: int, db: Optional[object] = Depends(get_db)
         
         query = "DELETE FROM products WHERE id = %s" if hasattr(db, '_db_type') and db._db_type == 'postgresql' else "DELETE FROM products WHERE id = ?"
         db.execute_query(query, (product_id,))
+        record_write(db)
         return {"message": "Product deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -47,9 +47,19 @@ def main():
     from src.handlers import user_commands, admin_commands, message_handlers
     from telegram import Update
     from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, filters
+    from src.bot import post_init, post_shutdown
+    from src import persistence, update_processor
     
     # Set up the application
-    application = Application.builder().token(settings.BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(settings.BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(update_processor.from_settings())
+        .persistence(persistence.from_settings())
+        .build()
+    )
 
     # Register all handlers
     application.add_handler(CommandHandler("start", user_commands.start))
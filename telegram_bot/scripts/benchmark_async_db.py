@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent update throughput with the synchronous and async database paths.
+
+Each simulated update runs the message-path queries (ban check, cost lookup,
+tier lookup, credit decrement) and then awaits a fake Telegram forward. The
+synchronous path blocks the event loop during every query; the async path
+does not. Event loop lag is sampled alongside to make the stall visible.
+
+Usage:
+    python scripts/benchmark_async_db.py [--updates 2000] [--concurrency 100] [--users 200]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_async_db_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database, async_database  # noqa: E402
+from src.async_database import async_db_manager  # noqa: E402
+
+USER_ID_BASE = 900_000_000
+
+
+def seed_users(count: int) -> None:
+    """Create benchmark users with plenty of credits."""
+    placeholder = '%s' if database.db_manager._db_type == 'postgresql' else '?'
+    operations = [
+        {'query': f"DELETE FROM users WHERE telegram_id >= {placeholder}", 'params': (USER_ID_BASE,)}
+    ]
+    for i in range(count):
+        operations.append({
+            'query': f"INSERT INTO users (telegram_id, username, message_credits) VALUES ({placeholder}, {placeholder}, {placeholder})",
+            'params': (USER_ID_BASE + i, f"bench{i}", 1_000_000)
+        })
+    database.db_manager.execute_transaction(operations)
+
+
+async def sync_update(user_id: int, api_latency: float) -> None:
+    """One update using the blocking helpers."""
+    if database.is_user_banned(user_id):
+        return
+    cost = int(database.get_setting('cost_text_message', '1'))
+    tier = database.get_user_tier(user_id)
+    database.decrement_user_credits_optimized(user_id, database.apply_tier_discount(cost, tier))
+    await asyncio.sleep(api_latency)
+
+
+async def async_update(user_id: int, api_latency: float) -> None:
+    """One update using the async helpers."""
+    if await async_database.is_user_banned(user_id):
+        return
+    cost = int(await async_database.get_setting('cost_text_message', '1'))
+    tier = await async_database.get_user_tier(user_id)
+    await async_database.decrement_user_credits_optimized(user_id, database.apply_tier_discount(cost, tier))
+    await asyncio.sleep(api_latency)
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.01) -> None:
+    """Record how late the event loop wakes a periodic timer."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def run_mode(name: str, handler, updates: int, concurrency: int, users: int, api_latency: float) -> dict:
+    """Drive ``updates`` simulated updates through ``handler`` with bounded concurrency."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    lag_samples = []
+    stop = asyncio.Event()
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await handler(USER_ID_BASE + (i % users), api_latency)
+            latencies.append(time.perf_counter() - started)
+
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag_samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(updates)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    latencies.sort()
+    return {
+        'mode': name,
+        'elapsed_s': elapsed,
+        'updates_per_s': updates / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'max_loop_lag_ms': max(lag_samples, default=0.0) * 1000,
+    }
+
+
+async def main_async(args) -> None:
+    await async_db_manager.initialize()
+    print(f"📦 Backend: sync={database.db_manager._db_type}, async={async_db_manager._backend}")
+
+    results = []
+    for name, handler in (('sync', sync_update), ('async', async_update)):
+        seed_users(args.users)
+        results.append(await run_mode(name, handler, args.updates, args.concurrency, args.users, args.api_latency))
+
+    print(f"\n{'mode':<6} {'elapsed':>9} {'upd/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'loop lag':>9}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['elapsed_s']:>8.2f}s {r['updates_per_s']:>9.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['max_loop_lag_ms']:>7.1f}ms")
+
+    speedup = results[1]['updates_per_s'] / results[0]['updates_per_s']
+    print(f"\n🚀 Async throughput: {speedup:.2f}x the synchronous path")
+    print(f"🧵 DB executor: {database.db_manager.get_executor_stats()}")
+
+    await async_db_manager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--api-latency', type=float, default=0.05,
+                        help='Simulated Telegram forward latency in seconds')
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
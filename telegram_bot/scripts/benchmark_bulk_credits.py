@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Compare per-user credit updates with the set-based bulk adjustment.
+
+Seeds ``--users`` users, then gifts all of them credits and time twice: once
+the old way (an ``UPDATE`` plus ledger ``INSERT`` statements per user inside
+a transaction, as ``batch_update_user_credits`` did) and once through
+``bulk_credits.apply_credit_adjustments``. It checks that the bulk pass
+updated every balance, wrote one ledger row per user, skipped unknown users
+and adjustments that would go negative, and reported progress per batch.
+
+Usage:
+    python scripts/benchmark_bulk_credits.py [--users 100000]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used. SQLite has no network round trips, so per-statement
+overhead (and the gap between the two) is far smaller there.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_bulk_credits_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import bulk_credits  # noqa: E402
+from src.database import db_manager  # noqa: E402
+
+FIRST_ID = 800_000_000
+REASON = 'bench_gift'
+
+
+def seed(users: int) -> None:
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM users WHERE telegram_id >= {placeholder}", (FIRST_ID,))
+        cursor.execute(f"DELETE FROM transactions WHERE transaction_type LIKE {placeholder}", ('bench_%',))
+        cursor.executemany(
+            f"INSERT INTO users (telegram_id, username, message_credits, time_credits_seconds) "
+            f"VALUES ({placeholder}, {placeholder}, 10, 0)",
+            [(FIRST_ID + i, f"bench{i}") for i in range(users)]
+        )
+        conn.commit()
+
+
+def per_user(user_ids: list, amount: int, seconds: int) -> float:
+    """The old way, doing the same work: an UPDATE and two ledger INSERTs per user."""
+    p = '%s' if db_manager._db_type == 'postgresql' else '?'
+    update = (f"UPDATE users SET message_credits = message_credits + {p}, "
+              f"time_credits_seconds = time_credits_seconds + {p}, updated_at = CURRENT_TIMESTAMP "
+              f"WHERE telegram_id = {p}")
+    ledger = f"INSERT INTO transactions (user_id, amount, transaction_type, description) VALUES ({p}, {p}, {p}, {p})"
+    operations = []
+    for user_id in user_ids:
+        operations.append({'query': update, 'params': (amount, seconds, user_id)})
+        operations.append({'query': ledger, 'params': (user_id, amount, 'bench_per_user', 'benchmark')})
+        operations.append({'query': ledger, 'params': (user_id, seconds, 'bench_per_user_time', 'benchmark')})
+    started = time.perf_counter()
+    assert db_manager.execute_transaction(operations)
+    return time.perf_counter() - started
+
+
+def scalar(sql: str, params: tuple = ()) -> int:
+    if db_manager._db_type != 'postgresql':
+        sql = sql.replace('%s', '?')
+    return db_manager.execute_query(sql, params, fetch_one=True)[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}, {args.users} users")
+    seed(args.users)
+    user_ids = list(range(FIRST_ID, FIRST_ID + args.users))
+
+    elapsed = per_user(user_ids, 5, 60)
+    print(f"per-user statements {elapsed:8.2f} s  ({3 * args.users} statements)")
+
+    stages = []
+    result = bulk_credits.gift_users(user_ids, 5, 60, reason=REASON, description='benchmark',
+                                     progress=lambda stage, rows: stages.append((stage, rows)))
+    assert result is not None
+    print(f"bulk adjustment     {result.elapsed:8.2f} s  ({len(stages) - 1} staged batches, 1 apply); "
+          f"{elapsed / max(result.elapsed, 1e-9):.1f}x faster")
+
+    assert result.users == args.users and result.skipped == 0, result
+    assert result.message_credits == 5 * args.users and result.time_seconds == 60 * args.users, result
+    assert scalar("SELECT COUNT(*) FROM users WHERE telegram_id >= %s AND message_credits = 20",
+                  (FIRST_ID,)) == args.users
+    assert scalar("SELECT COUNT(*) FROM transactions WHERE transaction_type = %s", (REASON,)) == args.users
+    assert scalar("SELECT COUNT(*) FROM transactions WHERE transaction_type = %s", (f"{REASON}_time",)) == args.users
+    assert stages[-1] == ('applied', args.users), stages[-1]
+    print(f"Balances + ledger: ok ({result.ledger_rows} ledger rows)")
+
+    # Rows for one user are summed; unknown users and overdrafts are skipped, not applied
+    result = bulk_credits.apply_credit_adjustments(
+        [(FIRST_ID, 3, 0), (FIRST_ID, 2, 0), (FIRST_ID + 1, -1000, 0), (1, 5, 0)], reason=REASON)
+    assert result.users == 1 and result.skipped == 2 and result.message_credits == 5, result
+    assert scalar("SELECT message_credits FROM users WHERE telegram_id = %s", (FIRST_ID + 1,)) == 20
+    print("Merging/skipping:  ok (duplicates summed, overdraft and unknown user skipped)")
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-message charging: the legacy query sequence vs charge_message().
+
+The legacy path is the sequence master_message_handler used to run for every
+paid message (ban check, cost setting, tier, decrement, threshold setting,
+notification cooldown, auto-recharge settings, balance re-read). The new path
+is a single charge_message() call. Round trips are counted by wrapping
+DatabaseManager.get_connection.
+
+Usage:
+    python scripts/benchmark_charge_message.py [--messages 2000] [--users 100]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_charge_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database  # noqa: E402
+from src.database import db_manager  # noqa: E402
+
+USER_ID_BASE = 900_000_000
+round_trips = 0
+
+
+def count_round_trips() -> None:
+    """Count connection checkouts, one per query round trip."""
+    original = db_manager.get_connection
+
+    def counting_get_connection(*args, **kwargs):
+        global round_trips
+        round_trips += 1
+        return original(*args, **kwargs)
+
+    db_manager.get_connection = counting_get_connection
+
+
+def seed_users(count: int) -> None:
+    """Create benchmark users with plenty of credits."""
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    operations = [
+        {'query': f"DELETE FROM users WHERE telegram_id >= {placeholder}", 'params': (USER_ID_BASE,)}
+    ]
+    for i in range(count):
+        operations.append({
+            'query': f"INSERT INTO users (telegram_id, username, message_credits) VALUES ({placeholder}, {placeholder}, {placeholder})",
+            'params': (USER_ID_BASE + i, f"bench{i}", 1_000_000)
+        })
+    db_manager.execute_transaction(operations)
+
+
+def legacy_charge(user_id: int) -> None:
+    """The pre-charge_message query sequence."""
+    if database.is_user_banned(user_id):
+        return
+    cost = int(database.get_setting('cost_text_message', '1'))
+    tier = database.get_user_tier(user_id)
+    new_balance = database.decrement_user_credits_optimized(user_id, database.apply_tier_discount(cost, tier))
+    threshold = int(database.get_setting('low_credit_threshold', '5'))
+    if 0 < new_balance <= threshold and database.can_send_low_balance_notification(user_id):
+        database.get_user_auto_recharge_settings(user_id)
+    database.get_user_credits_optimized(user_id)
+
+
+def single_charge(user_id: int) -> None:
+    """One round trip per message."""
+    database.charge_message(user_id, 'text')
+
+
+def run(name: str, func, messages: int, users: int) -> dict:
+    global round_trips
+    seed_users(users)
+    round_trips = 0
+    latencies = []
+    started = time.perf_counter()
+    for i in range(messages):
+        t0 = time.perf_counter()
+        func(USER_ID_BASE + (i % users))
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'name': name,
+        'msgs_per_s': messages / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'round_trips': round_trips / messages,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"📦 Backend: {db_manager._db_type}")
+    count_round_trips()
+    results = [run('legacy', legacy_charge, args.messages, args.users),
+               run('charge_message', single_charge, args.messages, args.users)]
+
+    print(f"\n{'path':<15} {'msg/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'trips/msg':>10}")
+    for r in results:
+        print(f"{r['name']:<15} {r['msgs_per_s']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['round_trips']:>10.1f}")
+
+    print(f"\n🚀 p50 latency: {results[0]['p50_ms'] / results[1]['p50_ms']:.1f}x lower with charge_message")
+
+
+if __name__ == '__main__':
+    main()
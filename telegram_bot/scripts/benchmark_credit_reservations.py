@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Parallel load test for credit reservations.
+
+Worker threads reserve credits, then commit or release the hold (a
+configurable share of "failed forwards" release it). Runs three times: every
+worker hitting one hot user, workers spread across many users (so the cost of
+row-lock contention is visible), and a hot user with too few credits for the
+load (so overselling would show). After each run the ledger is checked: no
+balance went negative and balance + committed holds equals the starting
+credits. Finally, stale holds are expired and swept to check they are
+released.
+
+Usage:
+    python scripts/benchmark_credit_reservations.py [--workers 16] [--ops 200] [--credits 1000]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_reservations_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database  # noqa: E402
+from src.database import db_manager  # noqa: E402
+
+USER_ID_BASE = 900_000_000
+
+
+def placeholder() -> str:
+    return '%s' if db_manager._db_type == 'postgresql' else '?'
+
+
+def seed_users(count: int, credits: int) -> None:
+    """Create benchmark users and clear their reservations."""
+    p = placeholder()
+    operations = [
+        {'query': f"DELETE FROM credit_reservations WHERE telegram_id >= {p}", 'params': (USER_ID_BASE,)},
+        {'query': f"DELETE FROM users WHERE telegram_id >= {p}", 'params': (USER_ID_BASE,)},
+    ]
+    for i in range(count):
+        operations.append({
+            'query': f"INSERT INTO users (telegram_id, username, message_credits) VALUES ({p}, {p}, {p})",
+            'params': (USER_ID_BASE + i, f"bench{i}", credits)
+        })
+    db_manager.execute_transaction(operations)
+
+
+def balances(count: int) -> list:
+    p = placeholder()
+    rows = db_manager.execute_query(
+        f"SELECT message_credits FROM users WHERE telegram_id >= {p} ORDER BY telegram_id",
+        (USER_ID_BASE,), fetch_all=True
+    )
+    return [row['message_credits'] for row in rows]
+
+
+def run(name: str, users: int, credits: int, args) -> dict:
+    """Drive workers x ops reserve/settle cycles and verify the ledger."""
+    seed_users(users, credits)
+    lock = threading.Lock()
+    latencies, committed, denied = [], [0], [0]
+
+    def worker(worker_id: int) -> None:
+        rng = random.Random(worker_id)
+        for i in range(args.ops):
+            user_id = USER_ID_BASE + rng.randrange(users)
+            started = time.perf_counter()
+            reservation_id = database.reserve_credits(user_id, args.amount)
+            if reservation_id is None:
+                with lock:
+                    denied[0] += 1
+                    latencies.append(time.perf_counter() - started)
+                continue
+            if rng.random() < args.failure_rate:
+                database.release_reservation(reservation_id)
+                settled = 0
+            else:
+                settled = args.amount if database.commit_reservation(reservation_id) else 0
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                committed[0] += settled
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(worker, range(args.workers)))
+    elapsed = time.perf_counter() - started
+
+    final = balances(users)
+    latencies.sort()
+    return {
+        'name': name,
+        'cycles_per_s': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'denied': denied[0],
+        'ok': min(final) >= 0 and sum(final) + committed[0] == users * credits,
+    }
+
+
+def check_expiry() -> bool:
+    """Stale holds are released by the sweeper and credited back, and re-debited on a late commit."""
+    seed_users(1, 10)
+    user_id = USER_ID_BASE
+    holds = [database.reserve_credits(user_id, 3) for _ in range(3)]
+    if database.reserve_credits(user_id, 3) is not None or None in holds:
+        return False
+    p = placeholder()
+    past = "CURRENT_TIMESTAMP - INTERVAL '1 minute'" if p == '%s' else "datetime('now', '-1 minute')"
+    db_manager.execute_query(f"UPDATE credit_reservations SET expires_at = {past} WHERE telegram_id = {p}", (user_id,))
+    released = database.release_expired_reservations()
+    swept = released == 3 and balances(1) == [10]
+    # A late commit of a swept hold charges it again; an explicitly released hold stays refunded
+    recommitted = database.commit_reservation(holds[0]) and balances(1) == [7]
+    hold = database.reserve_credits(user_id, 3)
+    database.release_reservation(hold)
+    return swept and recommitted and not database.commit_reservation(hold) and balances(1) == [7]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=200, help='Reserve/settle cycles per worker')
+    parser.add_argument('--credits', type=int, default=1_000_000, help='Starting credits per user')
+    parser.add_argument('--amount', type=int, default=3, help='Credits held per cycle')
+    parser.add_argument('--users', type=int, default=64, help='Users in the spread run')
+    parser.add_argument('--failure-rate', type=float, default=0.2, help='Share of holds released')
+    args = parser.parse_args()
+
+    print(f"📦 Backend: {db_manager._db_type}, {args.workers} workers x {args.ops} cycles")
+    scarce = args.workers * args.ops * args.amount // 4
+    results = [run('hot user', 1, args.credits, args),
+               run(f"{args.users} users", args.users, args.credits, args),
+               run('oversell', 1, scarce, args)]
+
+    print(f"\n{'run':<10} {'cycles/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'denied':>7} {'ledger':>7}")
+    for r in results:
+        print(f"{r['name']:<10} {r['cycles_per_s']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['denied']:>7} {'ok' if r['ok'] else 'BROKEN':>7}")
+
+    print(f"\n🔒 Hot-row contention cost: {results[1]['cycles_per_s'] / results[0]['cycles_per_s']:.2f}x "
+          f"throughput when spread across users")
+    expiry_ok = check_expiry()
+    print(f"⏱️ Expired holds swept: {'ok' if expiry_ok else 'BROKEN'}")
+
+    if not all(r['ok'] for r in results) or not expiry_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Send a mixed burst through the outbound scheduler against a local fake Bot API.
+
+The fake API answers ``sendMessage``, ``copyMessage`` and ``forwardMessage``
+with a per-request latency. It returns 429 with ``retry_after`` once more
+than ``--api-rate`` sends arrive within a second, or more than 20 within a
+minute to the same group. A real python-telegram-bot ``Bot`` points at it.
+
+The burst is a broadcast to ``--broadcast`` users, low-balance notices
+where every key is submitted twice, and user messages forwarded to the
+admin group. While all of that is queued, the admin replies to a user every
+200 ms. The burst is sent twice:
+
+* directly: every handler calls the bot at once, as before;
+* through ``OutboundScheduler``: lanes, rate limits, RetryAfter retries and
+  coalescing.
+
+For each run the script prints admin reply latency, 429s, failed sends and
+messages delivered. The scheduled run must deliver everything exactly once,
+with one notice per key, and then prints its stats and metric lines.
+
+Usage:
+    python scripts/benchmark_outbound.py [--broadcast 300] [--rate 30] [--api-rate 28]
+
+Nothing is sent to Telegram.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from urllib.parse import parse_qs
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_outbound_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+from src import outbound  # noqa: E402
+from src.database import settings  # noqa: E402
+from src.outbound import Lane  # noqa: E402
+
+TOKEN = '123456:benchmark'
+ADMIN_GROUP = -100123
+FIRST_USER = 700_000_000
+REPLY_USER = 800_000_000
+GROUP_LIMIT = 20  # messages per minute to one group
+
+
+class FakeBotAPI:
+    """Just enough of the Bot API over HTTP/1.1 keep-alive."""
+
+    def __init__(self, latency: float, rate: int):
+        self.latency = latency
+        self.rate = rate
+        self.received = Counter()  # (chat_id, text or message_id) -> times delivered
+        self.throttled = 0
+        self._recent = deque()  # monotonic times of accepted sends in the last second
+        self._group_recent = defaultdict(deque)  # group chat_id -> accepted sends in the last minute
+        self._next_id = 1
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._connection, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _connection(self, reader, writer) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                path = lines[0].split(' ')[1]
+                headers = {k.strip().lower(): v.strip() for k, v in (line.split(':', 1) for line in lines[1:] if ':' in line)}
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self._handle(path.rsplit('/', 1)[-1], headers.get('content-type', ''), body)
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _too_many(self, retry_after: int):
+        self.throttled += 1
+        return 429, {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {retry_after}',
+                     'parameters': {'retry_after': retry_after}}
+
+    async def _handle(self, method: str, content_type: str, body: bytes):
+        if 'json' in content_type:
+            params = json.loads(body or b'{}')
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}}
+
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        chat_id = int(params['chat_id'])
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate:
+            return self._too_many(1)
+        if chat_id < 0:
+            group = self._group_recent[chat_id]
+            while group and now - group[0] > 60.0:
+                group.popleft()
+            if len(group) >= GROUP_LIMIT:
+                return self._too_many(int(60 - (now - group[0])) + 1)
+            group.append(now)
+        self._recent.append(now)
+
+        self.received[(chat_id, params.get('text') or params.get('message_id'))] += 1
+        self._next_id += 1
+        if method == 'copyMessage':
+            return 200, {'ok': True, 'result': {'message_id': self._next_id}}
+        return 200, {'ok': True, 'result': {'message_id': self._next_id, 'date': int(time.time()),
+                                            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+                                            'text': params.get('text')}}
+
+
+async def timed(latencies: list, errors: Counter, bot: Bot, lane: Lane, method: str,
+                coalesce_key=None, **kwargs) -> None:
+    started = time.perf_counter()
+    try:
+        await outbound.send(bot, lane, method, coalesce_key, **kwargs)
+        latencies.append(time.perf_counter() - started)
+    except Exception as e:
+        errors[type(e).__name__] += 1
+
+
+async def burst(bot: Bot, args) -> dict:
+    """Fire the whole mix at once; returns per-kind latencies and errors."""
+    errors = Counter()
+    latencies = defaultdict(list)
+    tasks = []
+
+    def fire(kind: str, lane: Lane, method: str, coalesce_key=None, **kwargs) -> None:
+        tasks.append(asyncio.create_task(
+            timed(latencies[kind], errors, bot, lane, method, coalesce_key, **kwargs)))
+
+    for i in range(args.broadcast):
+        fire('broadcast', Lane.BROADCAST, 'send_message', chat_id=FIRST_USER + i, text='Broadcast')
+    for i in range(args.notices):
+        for _ in range(2):
+            fire('notification', Lane.NOTIFICATION, 'send_message', coalesce_key=f"low_balance:{FIRST_USER + i}",
+                 chat_id=FIRST_USER + i, text='Low balance')
+    for i in range(args.forwards):
+        fire('forward', Lane.USER_FORWARD, 'forward_message', chat_id=ADMIN_GROUP,
+             from_chat_id=FIRST_USER + i, message_id=i + 1)
+
+    for i in range(args.replies):
+        await asyncio.sleep(0.2)
+        fire('admin reply', Lane.ADMIN_REPLY, 'copy_message', chat_id=REPLY_USER + i,
+             from_chat_id=ADMIN_GROUP, message_id=10_000 + i)
+    await asyncio.gather(*tasks)
+    return {'latencies': latencies, 'errors': errors}
+
+
+def report(label: str, result: dict, api: FakeBotAPI, elapsed: float) -> None:
+    print(f"\n{label}: {elapsed:.1f}s, {api.throttled} x 429, "
+          f"{sum(result['errors'].values())} failed {dict(result['errors']) or ''}")
+    for kind in ('admin reply', 'forward', 'notification', 'broadcast'):
+        values = sorted(result['latencies'][kind])
+        if values:
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            print(f"  {kind:<13} {len(values):>4} ok   p50 {statistics.median(values) * 1000:7.0f} ms   "
+                  f"p95 {p95 * 1000:7.0f} ms")
+        else:
+            print(f"  {kind:<13}    0 ok")
+
+
+async def main_async(args) -> None:
+    settings.OUTBOUND_RATE_PER_SEC = args.rate
+    api = FakeBotAPI(args.latency, args.api_rate)
+    port = await api.start()
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{port}/bot",
+              request=HTTPXRequest(connection_pool_size=64, pool_timeout=120.0))
+    await bot.initialize()
+    print(f"{args.broadcast} broadcast sends, {args.notices} notices x2, {args.forwards} forwards to the admin group, "
+          f"{args.replies} admin replies; scheduler {args.rate:g}/s, fake API {args.api_rate}/s")
+
+    # 1. Direct: everything hits the API at once, 429s reach the caller
+    started = time.perf_counter()
+    direct = await burst(bot, args)
+    report("Direct", direct, api, time.perf_counter() - started)
+
+    # 2. Through the scheduler, against a fresh API state
+    await bot.shutdown()
+    await api.stop()
+    api = FakeBotAPI(args.latency, args.api_rate)
+    port = await api.start()
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{port}/bot",
+              request=HTTPXRequest(connection_pool_size=int(settings.OUTBOUND_WORKERS) + 2, pool_timeout=120.0))
+    await bot.initialize()
+    outbound.scheduler.start(bot)
+    started = time.perf_counter()
+    scheduled = await burst(bot, args)
+    elapsed = time.perf_counter() - started
+    report("Scheduled", scheduled, api, elapsed)
+    await outbound.scheduler.stop()
+
+    assert not scheduled['errors'], scheduled['errors']
+    assert all(count == 1 for count in api.received.values()), "a message was delivered twice"
+    notices = sum(1 for (chat_id, text) in api.received if text == 'Low balance')
+    assert notices == args.notices, f"{notices} notices delivered for {args.notices} keys"
+    assert sum(api.received.values()) == args.broadcast + args.notices + args.forwards + args.replies
+
+    stats = outbound.scheduler.get_stats()
+    print(f"\nScheduler: {stats['retry_after']} RetryAfter retried, {stats['rate_wait_s']}s rate wait, "
+          f"queue depth {stats['queue_depth']} after the run")
+    for lane, lane_stats in stats['lanes'].items():
+        print(f"  {lane:<13} sent {lane_stats['sent']:>4}   coalesced {lane_stats['coalesced']:>3}   "
+              f"failed {lane_stats['failed']}")
+    print("\n" + "\n".join(line for line in outbound.scheduler.prometheus()
+                            if line.startswith(('bot_outbound_queue_depth', 'bot_outbound_coalesced_total'))))
+
+    await bot.shutdown()
+    await api.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--broadcast', type=int, default=300)
+    parser.add_argument('--notices', type=int, default=40, help="notification keys, each submitted twice")
+    parser.add_argument('--forwards', type=int, default=8, help="user messages forwarded to the admin group")
+    parser.add_argument('--replies', type=int, default=20, help="admin replies, one every 200 ms")
+    parser.add_argument('--rate', type=float, default=30.0, help="scheduler sends per second")
+    parser.add_argument('--api-rate', type=int, default=28, help="fake API sends per second before 429s")
+    parser.add_argument('--latency', type=float, default=0.02, help="fake API seconds per request")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
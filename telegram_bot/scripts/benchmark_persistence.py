@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of flushing python-telegram-bot state to the database.
+
+Gives ``--users`` users some ``user_data`` (a small form state, and a
+larger draft for one user in ten), then hands it to ``DatabasePersistence``
+the way ``Application.update_persistence`` does: one concurrent
+``update_user_data`` call per user, on every run. It reports:
+
+* the first flush of every user, against writing each user with its own
+  statement (timed on ``--single`` users and scaled up);
+* a steady-state run where ``--active`` users sent updates and
+  ``--changed`` of them changed their data: only the changed ones are
+  written, in one batched statement;
+* bytes stored per user, and how much compression saves on the drafts;
+* startup: only users written within ``PERSISTENCE_IDLE_TTL`` are loaded
+  (``--idle`` of them are aged past it); one of the others is loaded on
+  its first update;
+* eviction of idle users from memory, keeping their rows.
+
+Usage:
+    python scripts/benchmark_persistence.py [--users 100000] [--active 2000] [--changed 500]
+
+Set DATABASE_URL to run against PostgreSQL; otherwise a temporary SQLite
+database is used.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_persistence_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import async_database  # noqa: E402
+from src.database import db_manager, run_db  # noqa: E402
+from src.persistence import DatabasePersistence  # noqa: E402
+from src.query_stats import query_stats  # noqa: E402
+
+FIRST_USER = 300_000_000
+IDLE_TTL = 86400
+
+
+def user_data(i: int, version: int = 0) -> dict:
+    data = {'mass_gift_target': 'vip', 'gift_credits': {'user_id': FIRST_USER + i, 'amount': 10 + version}}
+    if i % 10 == 0:
+        data['product_creation'] = {'label': f'Bundle {i}', 'item_type': 'credits', 'amount': 100,
+                                    'description': 'Premium credits bundle with priority replies. ' * 20}
+    return data
+
+
+def reset() -> None:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM persistence_data")
+        conn.commit()
+
+
+def write_one_by_one(persistence: DatabasePersistence, users: range) -> None:
+    """A write per user per run, as a persistence without batching does."""
+    if db_manager._db_type == 'postgresql':
+        sql = ("INSERT INTO persistence_data (kind, entity_key, data) VALUES (%s, %s, %s) "
+               "ON CONFLICT (kind, entity_key) DO UPDATE SET data = EXCLUDED.data")
+    else:
+        sql = db_manager.sql('persistence_upsert')
+    for i in users:
+        with db_manager.get_connection() as conn:
+            conn.cursor().execute(sql, ('user', str(FIRST_USER + i), persistence.dumps(user_data(i))))
+            conn.commit()
+
+
+def table_stats() -> tuple:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), SUM(LENGTH(data)) FROM persistence_data WHERE kind = 'user'")
+        row = cursor.fetchone()
+        return row[0], row[1] or 0
+
+
+def age_users(users: range, seconds: int) -> None:
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    if db_manager._db_type == 'postgresql':
+        older = f"CURRENT_TIMESTAMP - INTERVAL '{seconds} seconds'"
+    else:
+        older = f"datetime('now', '-{seconds} seconds')"
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(f"UPDATE persistence_data SET updated_at = {older} "
+                           f"WHERE kind = 'user' AND entity_key = {placeholder}",
+                           [(str(FIRST_USER + i),) for i in users])
+        conn.commit()
+
+
+async def persistence_run(persistence: DatabasePersistence, data: dict) -> float:
+    """One ``update_persistence`` run plus the flush it triggers; returns seconds."""
+    started = time.perf_counter()
+    await asyncio.gather(*(persistence.update_user_data(user_id, values) for user_id, values in data.items()))
+    await persistence.flush()
+    return time.perf_counter() - started
+
+
+class FakeApplication:
+    """The two methods ``evict_idle`` calls."""
+
+    def __init__(self, persistence: DatabasePersistence, user_data: dict):
+        self.persistence = persistence
+        self.user_data = user_data
+
+    def drop_user_data(self, user_id: int) -> None:
+        self.user_data.pop(user_id, None)
+
+    def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+
+async def main_async(args) -> None:
+    await run_db(reset)
+    print(f"Database: {db_manager._db_type}, {args.users} users, {args.active} active per run, "
+          f"{args.changed} of them changed")
+
+    # 1. First flush of every user: one statement each vs one batched run
+    persistence = DatabasePersistence(idle_ttl=IDLE_TTL)
+    started = time.perf_counter()
+    await run_db(write_one_by_one, persistence, range(args.single))
+    per_user = (time.perf_counter() - started) / args.single
+    print(f"Write per user:       {per_user * 1e6:8.1f} us/user -> {per_user * args.users:7.2f} s per "
+          f"{args.users} users (timed on {args.single})")
+    await run_db(reset)
+
+    memory = {FIRST_USER + i: user_data(i) for i in range(args.users)}
+    for user_id in memory:
+        persistence._resident['user'][user_id] = time.monotonic()  # as if seen by refresh_user_data
+    calls = query_stats.totals()['calls']
+    elapsed = await persistence_run(persistence, memory)
+    statements = query_stats.totals()['calls'] - calls
+    count, size = await run_db(table_stats)
+    assert count == args.users, count
+    print(f"Batched first flush:  {elapsed / args.users * 1e6:8.1f} us/user -> {elapsed:7.2f} s per "
+          f"{args.users} users ({statements} statement, {per_user * args.users / elapsed:.0f}x cheaper)")
+
+    # 2. Steady state: only the changed users are written
+    active = {FIRST_USER + i: memory[FIRST_USER + i] for i in range(0, args.users, args.users // args.active)}
+    for n, user_id in enumerate(active):
+        if n < args.changed:
+            active[user_id] = user_data(user_id - FIRST_USER, version=1)
+    written, unchanged = persistence.written, persistence.unchanged
+    elapsed = await persistence_run(persistence, active)
+    assert persistence.written - written == args.changed, persistence.written - written
+    assert persistence.unchanged - unchanged == len(active) - args.changed
+    print(f"Steady-state run:     {elapsed * 1000:8.1f} ms for {len(active)} active users, "
+          f"{args.changed} written, {len(active) - args.changed} unchanged skipped")
+    elapsed = await persistence_run(persistence, active)
+    print(f"Nothing changed:      {elapsed * 1000:8.1f} ms for {len(active)} active users, 0 written")
+
+    # 3. Size on disk
+    draft = user_data(0)
+    raw = len(persistence.dumps(draft))
+    uncompressed = len(DatabasePersistence(compress_min_bytes=1 << 30).dumps(draft))
+    print(f"Stored size:          {size / count:8.0f} bytes/user on average; a {uncompressed}-byte draft "
+          f"is stored in {raw} bytes")
+
+    # 4. Startup: only recently written users are loaded, the rest on their first update
+    idle = range(args.users - args.idle, args.users)
+    await run_db(age_users, idle, IDLE_TTL * 2)
+    restarted = DatabasePersistence(idle_ttl=IDLE_TTL)
+    started = time.perf_counter()
+    loaded = await restarted.get_user_data()
+    load_s = time.perf_counter() - started
+    assert len(loaded) == args.users - args.idle, len(loaded)
+    late_user = FIRST_USER + idle[0]
+    late_data = {}
+    await restarted.refresh_user_data(late_user, late_data)
+    assert late_data == active.get(late_user, memory[late_user]), late_data
+    print(f"Startup load:         {len(loaded)} recently active users in {load_s:.2f} s; "
+          f"{args.idle} idle users load on their first update")
+
+    # 5. Eviction: idle users leave memory, their rows stay
+    application = FakeApplication(restarted, loaded)
+    for user_id in list(restarted._resident['user'])[:args.evict]:
+        restarted._resident['user'][user_id] -= IDLE_TTL + 1
+    evicted = restarted.evict_idle(application)
+    await asyncio.gather(*(restarted.drop_user_data(user_id) for user_id in list(restarted._evicting['user'])))
+    assert evicted == args.evict and (await run_db(table_stats))[0] == args.users
+    print(f"Eviction:             {evicted} idle users dropped from memory, {args.users} rows kept")
+    print("Stats:", restarted.get_stats())
+
+    await run_db(reset)
+    await async_database.async_db_manager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--active', type=int, default=2000, help="users handed over in a steady-state run")
+    parser.add_argument('--changed', type=int, default=500, help="active users whose data changed")
+    parser.add_argument('--single', type=int, default=2000, help="users written one statement at a time")
+    parser.add_argument('--idle', type=int, default=90000, help="users aged past the idle TTL before restart")
+    parser.add_argument('--evict', type=int, default=1000, help="resident users made idle for eviction")
+    asyncio.run(main_async(parser.parse_args()))
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Size the connection pool from measurements.
+
+Runs a fixed number of worker threads against ConnectionPool for a range of
+``maxconn`` values. Each checkout runs a query and holds the connection for
+``--hold-ms`` (standing in for network round trips and Python work between
+statements). For each size it prints throughput, wait p95, timeouts and the
+pool's own Little's-law ``suggested_max``; the smallest size past which
+throughput stops improving is what DB_POOL_MAX should be.
+
+It also checks the pool's guarantees: waiters are served first come first
+served, an exhausted pool raises PoolTimeout after the timeout, and
+connections are recycled after DB_POOL_MAX_USES checkouts.
+
+Usage:
+    python scripts/benchmark_pool.py [--threads 32] [--seconds 2] [--hold-ms 5]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise connections to
+a temporary SQLite database are pooled.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.db_pool import ConnectionPool, PoolTimeout  # noqa: E402
+
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+
+
+def connect_factory():
+    if DATABASE_URL:
+        import psycopg2
+        return lambda: psycopg2.connect(DATABASE_URL, keepalives=1, keepalives_idle=30)
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_pool_'), 'pool.db')
+    return lambda: sqlite3.connect(path, check_same_thread=False)
+
+
+def run_load(connect, size: int, threads: int, seconds: float, hold: float, timeout: float) -> dict:
+    pool = ConnectionPool(connect, minconn=1, maxconn=size, timeout=timeout, name=f"size{size}")
+    deadline = time.monotonic() + seconds
+    counts = [0] * threads
+
+    def worker(index: int) -> None:
+        while time.monotonic() < deadline:
+            try:
+                conn = pool.getconn()
+            except PoolTimeout:
+                continue
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                time.sleep(hold)
+            finally:
+                pool.putconn(conn)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    stats = pool.get_stats()
+    pool.closeall()
+    stats['throughput'] = sum(counts) / seconds
+    return stats
+
+
+def check_fairness(connect) -> None:
+    """Callers queued on a full pool are served in arrival order."""
+    pool = ConnectionPool(connect, minconn=1, maxconn=1, timeout=5)
+    held = pool.getconn()
+    served = []
+
+    def waiter(index: int) -> None:
+        conn = pool.getconn()
+        served.append(index)
+        pool.putconn(conn)
+
+    threads = []
+    for index in range(5):
+        thread = threading.Thread(target=waiter, args=(index,))
+        thread.start()
+        threads.append(thread)
+        while pool.get_stats()['waiting'] < index + 1:
+            time.sleep(0.001)
+    pool.putconn(held)
+    for thread in threads:
+        thread.join()
+    assert served == list(range(5)), served
+    pool.closeall()
+    print("FIFO hand-off:   ok (served in arrival order)")
+
+
+def check_timeout_and_recycling(connect) -> None:
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, timeout=0.05, max_uses=3)
+    held = pool.getconn()
+    started = time.monotonic()
+    try:
+        pool.getconn()
+        raise AssertionError("expected PoolTimeout")
+    except PoolTimeout:
+        waited = time.monotonic() - started
+    pool.putconn(held)
+    print(f"Timeout:         ok (PoolTimeout after {waited * 1000:.0f} ms)")
+
+    for _ in range(6):
+        pool.putconn(pool.getconn())
+    stats = pool.get_stats()
+    assert stats['recycled']['uses'] == 2 and stats['created'] == 3, stats
+    pool.closeall()
+    print(f"Recycling:       ok ({stats['created']} connections for 7 checkouts at max_uses=3)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--hold-ms', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--sizes', default='1,2,4,8,16,32')
+    args = parser.parse_args()
+
+    connect = connect_factory()
+    print(f"Database: {'postgresql' if DATABASE_URL else 'sqlite'}, {args.threads} threads, "
+          f"{args.hold_ms:g} ms hold")
+    check_fairness(connect)
+    check_timeout_and_recycling(connect)
+
+    print(f"\n{'max':>4} {'ops/s':>9} {'wait p95':>9} {'peak':>5} {'timeouts':>8} {'avg busy':>9} {'suggested':>9}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        stats = run_load(connect, size, args.threads, args.seconds, args.hold_ms / 1000, args.timeout)
+        print(f"{size:>4} {stats['throughput']:>9.0f} {stats['wait_p95_ms']:>7g}ms {stats['peak_in_use']:>5} "
+              f"{stats['timeouts']:>8} {stats['avg_busy']:>9} {stats['suggested_max']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark SQL preparation: per-call dialect branching vs the query registry.
+
+The legacy path is what every query helper used to do on each call: pick a
+PostgreSQL or SQLite string and rewrite its placeholders. The registry path
+looks up text compiled once per dialect. Both are then executed end to end
+through DatabaseManager, and every registered statement is checked to
+compile for the current database.
+
+Usage:
+    python scripts/benchmark_query_registry.py [--calls 20000]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_queries_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database, queries  # noqa: E402
+from src.database import db_manager  # noqa: E402
+import src.user_profile  # noqa: E402,F401  (registers its statement)
+import src.segments  # noqa: E402,F401  (registers the segment statements)
+import src.broadcast  # noqa: E402,F401  (registers the broadcast statements)
+import src.topic_manager  # noqa: E402,F401  (registers the topic registry load)
+import src.reply_map  # noqa: E402,F401  (registers the reply route statements)
+import src.persistence  # noqa: E402,F401  (registers the persistence statements)
+
+USER_ID = 900_000_001
+
+LEGACY_PG = """
+    SELECT telegram_id, message_credits, is_banned
+    FROM users WHERE telegram_id = %s
+"""
+LEGACY_SQLITE = """
+    SELECT telegram_id, message_credits, is_banned
+    FROM users WHERE telegram_id = ?
+"""
+queries.register('bench_user_row', LEGACY_PG)
+
+
+def legacy_sql() -> str:
+    return LEGACY_PG if db_manager._db_type == 'postgresql' else LEGACY_SQLITE
+
+
+def legacy_translated_sql() -> str:
+    # Helpers that built one string and rewrote it per call
+    return LEGACY_PG if db_manager._db_type == 'postgresql' else LEGACY_PG.replace('%s', '?')
+
+
+def registry_sql() -> str:
+    return db_manager.sql('bench_user_row')
+
+
+def time_it(name: str, func, calls: int) -> None:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<30} {elapsed / calls * 1e6:>8.2f} us/call")
+
+
+def check_statements() -> None:
+    """Every statement the registry knows must compile for this database."""
+    dialect = db_manager._db_type
+    if dialect != 'sqlite':
+        # PREPARE validates the statement without running it
+        probe = lambda name: (queries.registry.prepare_sql(name), None)  # noqa: E731
+    else:
+        probe = lambda name: (f"EXPLAIN {db_manager.sql(name)}",  # noqa: E731
+                              [None] * db_manager.sql(name).count('?'))
+    failures, skipped = [], 0
+    for name in queries.registry.names():
+        statement = queries.registry.get(name)
+        if dialect == 'sqlite' and statement.sqlite is None and statement.postgresql.startswith('WITH'):
+            skipped += 1  # writable CTEs are PostgreSQL-only; their helpers branch
+            continue
+        sql, params = probe(name)
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, params) if params is not None else cursor.execute(sql)
+                if dialect != 'sqlite':
+                    cursor.execute(f"DEALLOCATE {name}")
+        except Exception as e:
+            failures.append((name, e))
+    for name, error in failures:
+        print(f"  {name}: {error}")
+    print(f"Statements compiled: {len(queries.registry) - len(failures) - skipped}/{len(queries.registry)}"
+          f" ({skipped} PostgreSQL-only skipped)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}")
+    database.ensure_user_exists(USER_ID, 'bench', 'Bench')
+
+    # Rows support both access styles on either database
+    row = db_manager.execute_named('bench_user_row', (USER_ID,), fetch_one=True)
+    assert isinstance(row, queries.Row), type(row)
+    assert row['telegram_id'] == row[0] == USER_ID, row
+    assert dict(row)['telegram_id'] == USER_ID
+
+    time_it('per-call branching', legacy_sql, args.calls)
+    time_it('per-call rewrite', legacy_translated_sql, args.calls)
+    time_it('registry lookup', registry_sql, args.calls)
+    time_it('execute (per-call rewrite)',
+            lambda: db_manager.execute_query(legacy_translated_sql(), (USER_ID,), fetch_one=True),
+            max(args.calls // 10, 1))
+    time_it('execute_named',
+            lambda: db_manager.execute_named('bench_user_row', (USER_ID,), fetch_one=True),
+            max(args.calls // 10, 1))
+    check_statements()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark and check the two-tier (in-process L1 + Redis L2) cache.
+
+Simulates several bot replicas in one process, each with its own L1 and all
+sharing one Redis. Compares database loads with and without the shared L2,
+checks that an invalidation on one replica reaches the others over pub/sub,
+and that the cache keeps serving L1-only while Redis is down.
+
+Usage:
+    python scripts/benchmark_redis_cache.py [--replicas 4] [--keys 200] [--reads 20000]
+
+Uses REDIS_URL if set, otherwise an in-memory fakeredis server
+(pip install fakeredis).
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.cache import CacheEngine, TieredCache, NAMESPACE_TTLS  # noqa: E402
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class Replica:
+    """One bot process: a TieredCache in front of a counting fake database."""
+
+    def __init__(self, client, db_latency: float):
+        self.cache = TieredCache(CacheEngine(namespace_ttls=NAMESPACE_TTLS), client, retry_interval=0.5)
+        self.db_latency = db_latency
+        self.db_loads = 0
+
+    def read(self, key: str):
+        value = self.cache.get(key)
+        if value is None:
+            self.db_loads += 1
+            time.sleep(self.db_latency)
+            value = f"value-of-{key}"
+            self.cache.set(key, value)
+        return value
+
+
+def make_client_factory():
+    """Return (factory, server) where factory() builds a client on the shared Redis."""
+    url = os.getenv('REDIS_URL')
+    if url:
+        import redis
+        return (lambda: redis.Redis.from_url(url, socket_timeout=0.25, decode_responses=True)), None
+    if fakeredis is None:
+        sys.exit("Set REDIS_URL or pip install fakeredis")
+    server = fakeredis.FakeServer()
+    return (lambda: fakeredis.FakeRedis(server=server, decode_responses=True)), server
+
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def run_reads(replicas, keys: int, reads: int) -> float:
+    rng = random.Random(7)
+    started = time.perf_counter()
+    for i in range(reads):
+        replicas[i % len(replicas)].read(f"setting:key{rng.randrange(keys)}")
+        if i % 500 == 0:
+            # Let the background writers publish to L2, as they would between updates
+            time.sleep(0.01)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--replicas', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=200)
+    parser.add_argument('--reads', type=int, default=20000)
+    parser.add_argument('--db-latency', type=float, default=0.001, help='Simulated query time in seconds')
+    args = parser.parse_args()
+
+    factory, server = make_client_factory()
+    factory().flushdb()
+
+    l1_only = [Replica(None, args.db_latency) for _ in range(args.replicas)]
+    tiered = [Replica(factory(), args.db_latency) for _ in range(args.replicas)]
+    time.sleep(0.2)  # let listeners subscribe
+
+    results = []
+    for name, replicas in (('L1 only', l1_only), ('L1 + Redis', tiered)):
+        elapsed = run_reads(replicas, args.keys, args.reads)
+        loads = sum(r.db_loads for r in replicas)
+        results.append((name, loads, elapsed))
+
+    print(f"🧩 {args.replicas} replicas, {args.keys} hot keys, {args.reads} reads")
+    print(f"\n{'mode':<12} {'db loads':>9} {'elapsed':>9}")
+    for name, loads, elapsed in results:
+        print(f"{name:<12} {loads:>9} {elapsed:>8.2f}s")
+    print(f"\n📉 DB loads with shared L2: {results[1][1] / max(results[0][1], 1):.0%} of L1-only")
+
+    # Cross-replica invalidation
+    a, b = tiered[0], tiered[1]
+    a.read('user:42:credits'), b.read('user:42:credits')
+    a.cache.invalidate_user(42)
+    propagated = wait_until(lambda: not b.cache.l1.contains('user:42:credits'))
+    print(f"📣 Invalidation reached other replica: {'ok' if propagated else 'BROKEN'}")
+
+    # Redis outage: reads keep working from L1 and the database
+    fallback_ok = True
+    if server is not None:
+        server.connected = False
+        loads_before = a.db_loads
+        fallback_ok = a.read('setting:outage') == 'value-of-setting:outage' and a.read('setting:outage') is not None
+        fallback_ok = fallback_ok and a.db_loads == loads_before + 1 and not a.cache.l2.available
+        server.connected = True
+        print(f"🛟 L1-only fallback while Redis is down: {'ok' if fallback_ok else 'BROKEN'}")
+
+    for replica in tiered:
+        replica.cache.l2.close()
+    if not (propagated and fallback_ok):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
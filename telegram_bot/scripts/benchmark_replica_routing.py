@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Check read-replica routing end to end.
+
+Points DATABASE_REPLICA_URL at a copy of the database and verifies that:
+
+* read-only statements are served by the replica;
+* a user's write sends that user's reads to the primary for
+  DB_READ_YOUR_WRITES_S, while other users keep reading the replica;
+* a lagging replica (probe reporting more than DB_REPLICA_MAX_LAG_S) and an
+  unreachable one are bypassed, and reads still succeed on the primary.
+
+Without DATABASE_URL a temporary SQLite database is used and a file copy
+stands in for the replica; the copy never receives later writes, so which
+side answered is visible in the data.
+
+Usage:
+    python scripts/benchmark_replica_routing.py [--reads 2000]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    workdir = tempfile.mkdtemp(prefix='bench_replica_')
+    os.chdir(workdir)
+    os.environ.setdefault('DATABASE_REPLICA_URL', f"sqlite:///{os.path.join(workdir, 'replica.db')}")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database  # noqa: E402
+from src.database import db_manager  # noqa: E402
+
+READER = 900_000_101
+WRITER = 900_000_102
+
+
+def credits(user_id: int) -> int:
+    row = db_manager.execute_named('get_user_credits', (user_id,), fetch_one=True)
+    return row['message_credits'] if row else -1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reads', type=int, default=2000)
+    args = parser.parse_args()
+
+    if db_manager._router is None:
+        raise SystemExit("DATABASE_REPLICA_URL is not set")
+    router = db_manager._router
+    router.window = 1.0  # keep the run short
+    print(f"Database: {db_manager._db_type}, read-your-writes window {router.window:g}s")
+
+    for user_id in (READER, WRITER):
+        database.ensure_user_exists(user_id, 'bench', 'Bench')
+    if db_manager._db_type == 'sqlite':
+        # Snapshot the primary as the "replica"; later writes only reach the primary
+        shutil.copyfile(db_manager._sqlite_path, db_manager._sqlite_replica_path)
+        time.sleep(router.window)  # let the setup writes age out of the window
+        router._checked_at = None  # re-probe now that the copy exists
+        with sqlite3.connect(db_manager._sqlite_path) as conn:
+            conn.execute("UPDATE users SET message_credits = 77 WHERE telegram_id = ?", (READER,))
+        replica_credits = credits(READER)
+        assert replica_credits != 77, "read was not served by the replica copy"
+        print(f"Replica reads:   ok (stale copy answered {replica_credits}, primary has 77)")
+
+    # A write pins the writer's reads to the primary, but not other users'
+    database.add_user_credits(WRITER, 5)
+    before = dict(router.get_stats()['reads'])
+    if db_manager._db_type == 'sqlite':
+        assert credits(WRITER) == db_manager.execute_query(
+            "SELECT message_credits FROM users WHERE telegram_id = ?", (WRITER,), fetch_one=True)[0]
+    else:
+        credits(WRITER)
+    reader_credits = credits(READER)
+    after = router.get_stats()['reads']
+    assert after['pinned_user'] == before['pinned_user'] + 1, after
+    assert db_manager._db_type != 'sqlite' or reader_credits != 77, "other users were pinned too"
+    print("Read-your-writes: ok (writer pinned to primary, other users still on the replica)")
+
+    started = time.perf_counter()
+    for _ in range(args.reads):
+        credits(READER)
+    elapsed = time.perf_counter() - started
+    print(f"Replica reads:   {elapsed / args.reads * 1e6:.1f} us per read including routing ({args.reads} reads)")
+
+    # A lagging replica is bypassed until it catches up
+    probe = router.probe
+    router.probe = lambda: router.max_lag + 60
+    router._checked_at = None
+    assert not router.use_replica(READER)
+    assert credits(READER) >= 0
+    print(f"Lagging replica: ok (bypassed at {router.get_stats()['lag_s']}s lag)")
+
+    # An unreachable replica fails over to the primary on the same call
+    router.probe = probe
+    router._checked_at = None
+    if db_manager._db_type == 'sqlite':
+        os.remove(db_manager._sqlite_replica_path)
+        router._healthy = True
+        router._checked_at = time.monotonic()
+        assert credits(READER) == 77
+        print(f"Replica down:    ok (fell back to the primary; {router.get_stats()['last_error']})")
+
+    print(f"Stats: {db_manager.get_replica_stats()}")
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark the reply map: write cost, lookup latency, memory and restarts.
+
+Records ``--routes`` forwarded-message routes and reports:
+
+* the cost of writing them one INSERT per route vs ``ReplyMap.flush()``'s
+  batches of ``--batch`` routes;
+* lookup latency for routes still in memory, and for older routes that
+  have to be read back from ``reply_routes``;
+* memory held per in-memory route (tracemalloc), with the LRU capped at
+  ``--max-entries``;
+* that a fresh ``ReplyMap`` (a restart) routes replies to messages
+  forwarded before it started;
+* that the retention purge removes only expired routes.
+
+Usage:
+    python scripts/benchmark_reply_map.py [--routes 20000] [--batch 500] [--max-entries 5000]
+
+Set DATABASE_URL to run against PostgreSQL; otherwise a temporary SQLite
+database is used.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_reply_map_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import async_database  # noqa: E402
+from src.database import db_manager, run_db  # noqa: E402
+from src.query_stats import query_stats  # noqa: E402
+from src.reply_map import ReplyMap  # noqa: E402
+
+ADMIN_CHAT = 424242
+FIRST_MESSAGE = 1_000_000
+FIRST_USER = 600_000_000
+
+
+def reset() -> None:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM reply_routes")
+        conn.commit()
+
+
+def insert_one_by_one(routes: list) -> None:
+    """What a write per forwarded message costs: one statement and commit each."""
+    sql = db_manager.sql('reply_routes_insert') if db_manager._db_type != 'postgresql' else (
+        "INSERT INTO reply_routes (chat_id, message_id, user_id) VALUES (%s, %s, %s) "
+        "ON CONFLICT (chat_id, message_id) DO NOTHING")
+    for route in routes:
+        with db_manager.get_connection() as conn:
+            conn.cursor().execute(sql, route)
+            conn.commit()
+
+
+def age_routes(message_ids: list, days: int) -> None:
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    if db_manager._db_type == 'postgresql':
+        older = f"CURRENT_TIMESTAMP - INTERVAL '{days} days'"
+    else:
+        older = f"datetime('now', '-{days} days')"
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(f"UPDATE reply_routes SET created_at = {older} WHERE message_id = {placeholder}",
+                           [(message_id,) for message_id in message_ids])
+        conn.commit()
+
+
+def route_count() -> int:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM reply_routes")
+        return cursor.fetchone()[0]
+
+
+def memory_per_route(count: int) -> float:
+    """Bytes tracemalloc attributes to each route held in a ReplyMap's LRU."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    replies = ReplyMap(count + 1, batch_size=count + 1)
+    for i in range(count):
+        replies._remember((ADMIN_CHAT, FIRST_MESSAGE + i), FIRST_USER + i)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+
+async def main_async(args) -> None:
+    routes = [(ADMIN_CHAT, FIRST_MESSAGE + i, FIRST_USER + i) for i in range(args.routes)]
+    print(f"Database: {db_manager._db_type}, {args.routes} routes, batches of {args.batch}, "
+          f"{args.max_entries} kept in memory")
+
+    # 1. Writes: per route vs batched
+    await run_db(reset)
+    started = time.perf_counter()
+    await run_db(insert_one_by_one, routes[:args.single])
+    per_row = (time.perf_counter() - started) / args.single
+    print(f"One INSERT per route:  {per_row * 1e6:8.1f} us/route ({args.single} routes)")
+
+    await run_db(reset)
+    replies = ReplyMap(args.max_entries, args.batch)
+    calls = query_stats.totals()['calls']
+    started = time.perf_counter()
+    for i, route in enumerate(routes):
+        replies.record(*route)
+        if (i + 1) % args.batch == 0:
+            await replies.flush()
+    await replies.flush()
+    batched = (time.perf_counter() - started) / len(routes)
+    statements = query_stats.totals()['calls'] - calls
+    assert await run_db(route_count) == len(routes)
+    print(f"Batched flush:         {batched * 1e6:8.1f} us/route ({statements} statements, "
+          f"{per_row / batched:.0f}x cheaper)")
+
+    # 2. Lookups: recent routes from memory, older ones from the table
+    recent = routes[-args.max_entries:]
+    calls = query_stats.totals()['calls']
+    started = time.perf_counter()
+    for chat_id, message_id, user_id in recent:
+        assert await replies.lookup(chat_id, message_id) == user_id
+    in_memory = (time.perf_counter() - started) / len(recent)
+    assert query_stats.totals()['calls'] == calls, "in-memory lookups ran queries"
+    print(f"Lookup, in memory:     {in_memory * 1e6:8.2f} us/lookup, 0 queries")
+
+    older = routes[:min(1000, len(routes) - args.max_entries)]
+    started = time.perf_counter()
+    for chat_id, message_id, user_id in older:
+        assert await replies.lookup(chat_id, message_id) == user_id
+    from_db = (time.perf_counter() - started) / max(1, len(older))
+    print(f"Lookup, from database: {from_db * 1e6:8.1f} us/lookup ({len(older)} evicted routes)")
+    assert len(replies._lru) <= args.max_entries
+
+    # 3. Memory
+    per_entry = memory_per_route(args.max_entries)
+    print(f"Memory:                {per_entry:8.0f} bytes/route in memory "
+          f"({per_entry * args.max_entries / 1024 / 1024:.1f} MB at {args.max_entries} routes)")
+
+    # 4. Restart: a new map routes replies to messages forwarded before it existed
+    restarted = ReplyMap(args.max_entries, args.batch)
+    chat_id, message_id, user_id = routes[len(routes) // 2]
+    assert await restarted.lookup(chat_id, message_id) == user_id
+    assert await restarted.lookup(ADMIN_CHAT, FIRST_MESSAGE - 1) is None
+    print(f"Restart:               message {message_id} still routes to user {user_id}")
+
+    # 5. Retention
+    expired = [message_id for _, message_id, _ in routes[:args.expired]]
+    await run_db(age_routes, expired, 120)
+    purged = await run_db(restarted.purge, 90)
+    assert purged == len(expired), f"purged {purged}, expected {len(expired)}"
+    assert await run_db(route_count) == len(routes) - len(expired)
+    print(f"Retention (90 days):   purged {purged} expired routes, kept {len(routes) - len(expired)}")
+
+    await run_db(reset)
+    await async_database.async_db_manager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--max-entries', type=int, default=5000)
+    parser.add_argument('--single', type=int, default=2000, help="routes written one INSERT at a time")
+    parser.add_argument('--expired', type=int, default=500, help="routes aged past the retention window")
+    asyncio.run(main_async(parser.parse_args()))
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    main()
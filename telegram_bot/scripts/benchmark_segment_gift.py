@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Time segment counts and segment-wide gifts on a large users table.
+
+Seeds ``--users`` users spread over the VIP, new and active segments, then
+for each segment times the ``COUNT`` behind the confirmation screen and the
+gift (one ``UPDATE ... WHERE <segment>`` plus its ledger ``INSERT ...
+SELECT``). Each gift is checked against the count: every member gets the
+credits and exactly one ledger row, and nobody else changes.
+
+Usage:
+    python scripts/benchmark_segment_gift.py [--users 1000000]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_segments_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import segments  # noqa: E402
+from src.database import db_manager  # noqa: E402
+
+FIRST_ID = 700_000_000
+
+
+def sql(text: str) -> str:
+    return text if db_manager._db_type == 'postgresql' else text.replace('%s', '?')
+
+
+def scalar(text: str, params: tuple = ()) -> int:
+    return db_manager.execute_query(sql(text), params, fetch_one=True)[0]
+
+
+def seed(users: int) -> None:
+    """Every 10th user is VIP, every 7th joined this week, every 3rd was active this month."""
+    if db_manager._db_type == 'postgresql':
+        days_ago = "CURRENT_TIMESTAMP - (%s * INTERVAL '1 day')"
+    else:
+        days_ago = "datetime('now', '-' || ? || ' days')"
+    rows = [(FIRST_ID + i, 150 if i % 10 == 0 else i % 100, 2 if i % 7 == 0 else 60, 5 if i % 3 == 0 else 90)
+            for i in range(users)]
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql("DELETE FROM users WHERE telegram_id >= %s"), (FIRST_ID,))
+        cursor.execute("DELETE FROM transactions WHERE transaction_type = 'bench_segment'")
+        cursor.executemany(sql(f"INSERT INTO users (telegram_id, message_credits, created_at, last_active) "
+                               f"VALUES (%s, %s, {days_ago}, {days_ago})"), rows)
+        conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}, seeding {args.users} users...")
+    seed(args.users)
+    print(f"{'segment':<8} {'members':>9} {'count':>9} {'gift':>9}")
+    total_gifted = 0
+    for name in ('vip', 'new', 'active', 'all'):
+        before_total = scalar("SELECT COALESCE(SUM(message_credits), 0) FROM users")
+
+        started = time.perf_counter()
+        members = segments.count_segment(name)
+        count_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        gifted = segments.gift_segment(name, 1, reason='bench_segment')
+        gift_s = time.perf_counter() - started
+
+        assert gifted == members, (name, gifted, members)
+        total_gifted += gifted
+        assert scalar("SELECT COALESCE(SUM(message_credits), 0) FROM users") == before_total + members
+        print(f"{name:<8} {members:>9} {count_s * 1000:>7.0f}ms {gift_s * 1000:>7.0f}ms")
+
+    ledger = scalar("SELECT COUNT(*) FROM transactions WHERE transaction_type = 'bench_segment'")
+    assert ledger == total_gifted, (ledger, total_gifted)
+    print(f"Ledger: ok ({ledger} rows, one per gifted user)")
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    main()
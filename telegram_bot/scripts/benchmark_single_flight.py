@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark single-flight loading, negative caching and stale-while-revalidate.
+
+Runs against the in-process cache with a simulated slow database load, so no
+database or Redis is needed:
+
+1. Thundering herd (threads): many threads miss the same key at once.
+2. Thundering herd (asyncio): many coroutines miss the same key at once.
+3. Negative caching: repeated lookups of a key whose load returns None.
+4. Stale-while-revalidate: latency of a read that lands on an expired entry.
+
+Usage:
+    python scripts/benchmark_single_flight.py [--callers 64] [--load-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.cache import CacheEngine, TieredCache  # noqa: E402
+
+
+class SlowLoader:
+    """Counts loads and sleeps like a database round trip."""
+
+    def __init__(self, latency: float, value='42'):
+        self.latency = latency
+        self.value = value
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.loads += 1
+        time.sleep(self.latency)
+        return self.value
+
+    async def load_async(self):
+        self.loads += 1
+        await asyncio.sleep(self.latency)
+        return self.value
+
+
+def herd_threads(callers: int, latency: float, coalesce: bool) -> int:
+    cache = TieredCache(CacheEngine())
+    loader = SlowLoader(latency)
+    barrier = threading.Barrier(callers)
+
+    def naive():
+        barrier.wait()
+        value = cache.get('setting:hot')
+        if value is None:
+            value = loader()
+            cache.set('setting:hot', value)
+        return value
+
+    def coalesced():
+        barrier.wait()
+        return cache.get_or_load('setting:hot', loader)
+
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(lambda _: (coalesced if coalesce else naive)(), range(callers)))
+    return loader.loads
+
+
+async def herd_async(callers: int, latency: float) -> int:
+    cache = TieredCache(CacheEngine())
+    loader = SlowLoader(latency)
+    await asyncio.gather(*(cache.aget_or_load('user:1:credits', loader.load_async) for _ in range(callers)))
+    return loader.loads
+
+
+def negative(lookups: int, latency: float) -> int:
+    cache = TieredCache(CacheEngine())
+    loader = SlowLoader(latency, value=None)
+    for _ in range(lookups):
+        cache.get_or_load('setting:missing', loader, negative_ttl=30)
+    return loader.loads
+
+
+def stale_read_ms(latency: float) -> tuple:
+    cache = TieredCache(CacheEngine())
+    loader = SlowLoader(latency)
+    cache.get_or_load('setting:swr', loader, ttl=0.01, stale_ttl=60)
+    time.sleep(0.02)  # entry is now stale
+
+    started = time.perf_counter()
+    cache.get_or_load('setting:swr', loader, ttl=0.01, stale_ttl=60)
+    stale_ms = (time.perf_counter() - started) * 1000
+
+    time.sleep(latency * 2)  # background refresh lands
+    return stale_ms, loader.loads, cache.get_stats()['loading']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--callers', type=int, default=64)
+    parser.add_argument('--load-latency', type=float, default=0.05, help='Simulated load time in seconds')
+    args = parser.parse_args()
+
+    naive_loads = herd_threads(args.callers, args.load_latency, coalesce=False)
+    flight_loads = herd_threads(args.callers, args.load_latency, coalesce=True)
+    async_loads = asyncio.run(herd_async(args.callers * 4, args.load_latency))
+    negative_loads = negative(1000, 0.001)
+    stale_ms, swr_loads, loading = stale_read_ms(args.load_latency)
+
+    print(f"🐘 Thundering herd, {args.callers} threads: {naive_loads} loads naive, {flight_loads} with single-flight")
+    print(f"⚡ Thundering herd, {args.callers * 4} coroutines: {async_loads} load(s)")
+    print(f"🚫 Negative caching, 1000 lookups of a missing key: {negative_loads} load(s)")
+    print(f"♻️ Stale read served in {stale_ms:.2f} ms (load takes {args.load_latency * 1000:.0f} ms); "
+          f"{swr_loads} loads incl. background refresh")
+    print(f"📊 Loading counters (last run): {loading}")
+
+    if flight_loads != 1 or async_loads != 1 or negative_loads != 1 or swr_loads != 2:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark schema checks at startup: legacy ensure_schema vs versioned migrations.
+
+The legacy path is what every process start used to run (twice): each
+CREATE TABLE IF NOT EXISTS, one column check per migrated column, and the
+default data inserts. The migration path is DatabaseManager.ensure_schema()
+against a database that is already current, i.e. one version check.
+Statements are counted with sqlite3's trace callback (SQLite only).
+
+Usage:
+    python scripts/benchmark_startup.py [--runs 50]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_startup_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import migrations  # noqa: E402
+from src.database import db_manager  # noqa: E402
+from src.schema import get_schema_queries, get_default_settings  # noqa: E402
+
+statements = 0
+LEGACY_COLUMNS = ['stripe_customer_id', 'auto_recharge_enabled', 'auto_recharge_amount',
+                  'auto_recharge_threshold', 'last_low_balance_notification']
+
+
+def count_statements() -> None:
+    """Count every statement SQLite executes."""
+    original = db_manager.get_connection
+
+    @contextmanager
+    def traced_connection(*args, **kwargs):
+        with original(*args, **kwargs) as conn:
+            if db_manager._db_type == 'sqlite':
+                def trace(_sql):
+                    global statements
+                    statements += 1
+                conn.set_trace_callback(trace)
+            yield conn
+
+    db_manager.get_connection = traced_connection
+
+
+def legacy_ensure_schema() -> None:
+    """The pre-migration startup checks (run twice per process start)."""
+    dialect = db_manager._db_type
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for query in get_schema_queries():
+            cursor.execute(migrations.to_sqlite(query) if dialect == 'sqlite' else query)
+        conn.commit()
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for column in LEGACY_COLUMNS:
+            if dialect == 'sqlite':
+                cursor.execute("PRAGMA table_info(users)")
+            else:
+                cursor.execute("SELECT column_name FROM information_schema.columns "
+                               "WHERE table_name='users' AND column_name=%s", (column,))
+            cursor.fetchall()
+        conn.commit()
+    placeholder = '?' if dialect == 'sqlite' else '%s'
+    for key, value in get_default_settings():
+        db_manager.execute_query(
+            f"INSERT INTO bot_settings (setting_key, setting_value) VALUES ({placeholder}, {placeholder}) "
+            f"ON CONFLICT (setting_key) DO NOTHING", (key, value))
+    # The old product inserts are left out: with no unique key on products
+    # they duplicated the catalogue on every start.
+
+
+def run(name: str, func, runs: int) -> None:
+    global statements
+    statements = 0
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    per_run = f"{statements / runs:>6.1f} statements" if db_manager._db_type == 'sqlite' else ''
+    print(f"{name:<28} {per_run}  median {statistics.median(timings) * 1000:>8.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}, schema version {migrations.schema_version(db_manager)}")
+    assert migrations.schema_version(db_manager) == migrations.LATEST_VERSION
+    count_statements()
+
+    # Legacy DatabaseManager.__init__ ran ensure_schema twice
+    run('legacy ensure_schema x2', lambda: (legacy_ensure_schema(), legacy_ensure_schema()), args.runs)
+    run('migrations (current)', db_manager.ensure_schema, args.runs)
+
+
+if __name__ == '__main__':
+    main()
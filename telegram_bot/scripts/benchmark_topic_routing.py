@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark user <-> topic routing: a query per lookup vs the topic registry.
+
+Seeds ``--users`` conversations with forum topics, then routes
+``--lookups`` user messages (user -> topic) and as many admin replies
+(topic -> user) two ways:
+
+* the database helpers each message used to call;
+* ``topic_manager.registry`` after its startup load.
+
+It reports the time per lookup and the queries each path ran. The registry
+must run no queries after the load. A topic saved on another replica
+(simulated by changing the row and delivering the invalidation the cache
+feed would carry) must be picked up with one query.
+
+Usage:
+    python scripts/benchmark_topic_routing.py [--users 20000] [--lookups 5000]
+
+Set DATABASE_URL to run against PostgreSQL; otherwise a temporary SQLite
+database is used.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_topics_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import async_database, cache, topic_manager  # noqa: E402
+from src.database import db_manager, run_db  # noqa: E402
+from src.query_stats import query_stats  # noqa: E402
+
+FIRST_USER = 500_000_000
+FIRST_TOPIC = 10_000
+
+
+def seed(users: int) -> None:
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM conversations WHERE user_id >= {placeholder}", (FIRST_USER,))
+        cursor.executemany(
+            f"INSERT INTO conversations (user_id, topic_id, status) VALUES ({placeholder}, {placeholder}, 'active')",
+            [(FIRST_USER + i, FIRST_TOPIC + i) for i in range(users)]
+        )
+        conn.commit()
+
+
+def move_topic(user_id: int, topic_id: int) -> None:
+    """What another replica does when it saves a new topic for the user."""
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"UPDATE conversations SET topic_id = {placeholder} WHERE user_id = {placeholder}",
+                       (topic_id, user_id))
+        conn.commit()
+
+
+async def route(lookups: list, get_topic, get_user) -> tuple:
+    """Route every (user, topic) pair both ways; returns (seconds, queries run)."""
+    calls = query_stats.totals()['calls']
+    started = time.perf_counter()
+    for user_id, topic_id in lookups:
+        assert await get_topic(user_id) == topic_id
+        assert await get_user(topic_id) == user_id
+    return time.perf_counter() - started, query_stats.totals()['calls'] - calls
+
+
+async def main_async(args) -> None:
+    await run_db(seed, args.users)
+    rng = random.Random(7)
+    lookups = [(FIRST_USER + i, FIRST_TOPIC + i) for i in (rng.randrange(args.users) for _ in range(args.lookups))]
+    print(f"Database: {db_manager._db_type}, {args.users} user topics, {args.lookups} messages + "
+          f"{args.lookups} admin replies")
+
+    elapsed, queries_run = await route(lookups, async_database.get_or_create_user_topic,
+                                       async_database.get_user_by_topic_id)
+    per_lookup = elapsed / (2 * len(lookups)) * 1e6
+    print(f"Query per lookup:  {per_lookup:8.1f} us/lookup, {queries_run} queries")
+
+    calls = query_stats.totals()['calls']
+    started = time.perf_counter()
+    loaded = await run_db(topic_manager.registry.load)
+    load_s = time.perf_counter() - started
+    load_queries = query_stats.totals()['calls'] - calls
+    registry = topic_manager.registry
+    elapsed, queries_run = await route(lookups, registry.get_topic, registry.get_user)
+    assert queries_run == 0, f"registry ran {queries_run} queries after the load"
+    print(f"Registry:          {elapsed / (2 * len(lookups)) * 1e6:8.1f} us/lookup, 0 queries "
+          f"(startup load: {loaded} users, {load_queries} query, {load_s * 1000:.0f} ms)")
+
+    # Another replica moves a user to a new topic and publishes the invalidation
+    user_id, old_topic = lookups[0]
+    new_topic = FIRST_TOPIC + args.users + 1
+    await run_db(move_topic, user_id, new_topic)
+    cache._cache._apply_remote('key', f"user:{user_id}:topic")  # as delivered by the Redis subscriber
+    calls = query_stats.totals()['calls']
+    assert await registry.get_topic(user_id) == new_topic
+    assert await registry.get_user(new_topic) == user_id
+    assert await registry.get_topic(user_id) == new_topic
+    refreshed = query_stats.totals()['calls'] - calls
+    assert refreshed == 1, refreshed
+    print(f"Remote save:       topic {old_topic} -> {new_topic} picked up with {refreshed} query")
+    await async_database.async_db_manager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    asyncio.run(main_async(parser.parse_args()))
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Load-test concurrent update processing and check per-user ordering.
+
+Builds a real python-telegram-bot ``Application`` (its bot points at a local
+server that only answers ``getMe``) with one message handler that sleeps for
+``--latency`` seconds, standing in for a Telegram forward plus database
+calls. ``--users`` users send ``--messages`` messages each, interleaved, and
+one extra user sends a burst of ``--hot`` messages first. All updates go
+onto the application's update queue, as the webhook does.
+
+For each concurrency level (1 is python-telegram-bot's sequential default)
+the script prints throughput and the most handlers seen running at once.
+It checks that:
+
+* every user's messages were handled in the order they were sent;
+* no two updates from the same user ever ran at the same time;
+* no more than the configured number of handlers ran at once.
+
+Usage:
+    python scripts/benchmark_update_processing.py [--users 200] [--messages 5] [--latency 0.02]
+
+Nothing is sent to Telegram.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_updates_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, MessageHandler, filters  # noqa: E402
+
+from src.update_processor import KeyedUpdateProcessor  # noqa: E402
+
+TOKEN = '123456:benchmark'
+FIRST_USER = 900_000_000
+HOT_USER = FIRST_USER - 1
+
+
+async def get_me_server() -> asyncio.AbstractServer:
+    """Answers every request with ``getMe``'s result; the handlers make no API calls."""
+    payload = json.dumps({'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bench',
+                                                 'username': 'bench_bot'}}).encode()
+
+    async def connection(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = next((int(line.split(b':', 1)[1]) for line in head.split(b'\r\n')
+                               if line.lower().startswith(b'content-length:')), 0)
+                await reader.readexactly(length)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(payload) + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(connection, '127.0.0.1', 0)
+
+
+def make_updates(args) -> list:
+    """``(user_id, sequence)`` in send order: the hot user's burst, then everyone interleaved."""
+    sends = [(HOT_USER, i) for i in range(args.hot)]
+    sends += [(FIRST_USER + user, i) for i in range(args.messages) for user in range(args.users)]
+    return sends
+
+
+def to_update(update_id: int, user_id: int, sequence: int, bot) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': str(sequence),
+        },
+    }, bot)
+
+
+async def run(concurrency: int, sends: list, port: int, latency: float) -> dict:
+    handled = defaultdict(list)  # user_id -> sequences in handling order
+    running = set()  # users with a handler running
+    overlaps = 0
+    rng = random.Random(concurrency)
+
+    async def handle(update: Update, context) -> None:
+        nonlocal overlaps
+        user_id = update.effective_user.id
+        if user_id in running:
+            overlaps += 1
+        running.add(user_id)
+        # Jitter, so a later message would overtake an earlier one without ordering
+        await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        handled[user_id].append(int(update.message.text))
+        running.discard(user_id)
+
+    processor = KeyedUpdateProcessor(concurrency) if concurrency > 1 else False
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{port}/bot")
+        .updater(None)
+        .concurrent_updates(processor)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, handle))
+
+    async with application:
+        await application.start()
+        updates = [to_update(i + 1, user_id, sequence, application.bot)
+                   for i, (user_id, sequence) in enumerate(sends)]
+        started = time.perf_counter()
+        for update in updates:
+            await application.update_queue.put(update)
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+
+    out_of_order = sum(1 for sequences in handled.values() if sequences != sorted(sequences))
+    total = sum(len(sequences) for sequences in handled.values())
+    assert total == len(sends), f"{total} of {len(sends)} updates handled"
+    assert out_of_order == 0, f"{out_of_order} users saw their messages reordered"
+    assert overlaps == 0, f"{overlaps} updates ran alongside another from the same user"
+    peak = processor.max_in_flight if processor else 1
+    assert peak <= concurrency, f"{peak} handlers ran at once, limit {concurrency}"
+    return {'elapsed': elapsed, 'peak': peak}
+
+
+async def main_async(args) -> None:
+    server = await get_me_server()
+    port = server.sockets[0].getsockname()[1]
+    sends = make_updates(args)
+    print(f"{len(sends)} updates: {args.users} users x {args.messages} + one user x {args.hot}; "
+          f"handler {args.latency * 1000:.0f} ms +-50%")
+    print(f"{'concurrency':>11}  {'updates/s':>9}  {'elapsed':>8}  {'peak in flight':>14}  order")
+    baseline = None
+    for concurrency in args.concurrency:
+        result = await run(concurrency, sends, port, args.latency)
+        rate = len(sends) / result['elapsed']
+        baseline = baseline or rate
+        print(f"{concurrency:>11}  {rate:>9.0f}  {result['elapsed']:>7.2f}s  {result['peak']:>14}  "
+              f"kept ({rate / baseline:.1f}x)")
+    server.close()
+    await server.wait_closed()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=5, help="messages per user")
+    parser.add_argument('--hot', type=int, default=50, help="burst from one user, sent first")
+    parser.add_argument('--latency', type=float, default=0.02, help="handler seconds per update")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128])
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-update user lookups: individual helpers vs one UserProfile.
+
+The legacy path is what /balance used to run for every update (credits, tier,
+stats, auto-recharge settings; the tier and stats helpers issue their own
+queries). The profile path hydrates a UserProfile in one query, first with
+the shared cache cleared before every update, then with it warm. Round trips
+are counted by wrapping DatabaseManager.get_connection.
+
+Usage:
+    python scripts/benchmark_user_profile.py [--updates 2000] [--users 100]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_profile_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import cache, database  # noqa: E402
+from src.database import db_manager  # noqa: E402
+from src.user_profile import load_user_profile  # noqa: E402
+
+USER_ID_BASE = 900_000_000
+round_trips = 0
+
+
+def count_round_trips() -> None:
+    """Count connection checkouts, one per query round trip."""
+    original = db_manager.get_connection
+
+    def counting_get_connection(*args, **kwargs):
+        global round_trips
+        round_trips += 1
+        return original(*args, **kwargs)
+
+    db_manager.get_connection = counting_get_connection
+
+
+def seed_users(count: int) -> None:
+    """Create benchmark users with a few purchases and messages each."""
+    placeholder = '%s' if db_manager._db_type == 'postgresql' else '?'
+    operations = [
+        {'query': f"DELETE FROM users WHERE telegram_id >= {placeholder}", 'params': (USER_ID_BASE,)},
+        {'query': f"DELETE FROM payment_logs WHERE telegram_id >= {placeholder}", 'params': (USER_ID_BASE,)},
+        {'query': f"DELETE FROM transactions WHERE user_id >= {placeholder}", 'params': (USER_ID_BASE,)},
+    ]
+    for i in range(count):
+        user_id = USER_ID_BASE + i
+        operations.append({
+            'query': f"INSERT INTO users (telegram_id, username, message_credits) VALUES ({placeholder}, {placeholder}, {placeholder})",
+            'params': (user_id, f"bench{i}", 40 + i)
+        })
+        operations.append({
+            'query': f"INSERT INTO payment_logs (telegram_id, credit_type, amount) VALUES ({placeholder}, 'credits', 25)",
+            'params': (user_id,)
+        })
+        operations.append({
+            'query': f"INSERT INTO transactions (user_id, amount, transaction_type, description) VALUES ({placeholder}, -1, 'message', 'bench')",
+            'params': (user_id,)
+        })
+    db_manager.execute_transaction(operations)
+
+
+def legacy_lookups(user_id: int) -> tuple:
+    credits = database.get_user_credits_optimized(user_id)
+    tier = database.get_user_tier(user_id)
+    stats = database.get_user_stats_individual(user_id)
+    auto_recharge = database.get_user_auto_recharge_settings(user_id)
+    return credits, tier, stats, auto_recharge
+
+
+def profile_lookups(user_id: int) -> tuple:
+    profile = load_user_profile(user_id)
+    return profile.message_credits, profile.tier, profile.stats, profile.auto_recharge
+
+
+def run(name: str, lookup, updates: int, users: int, cold: bool) -> None:
+    global round_trips
+    cache.clear_all_cache()
+    round_trips = 0
+    latencies = []
+    started = time.perf_counter()
+    for i in range(updates):
+        if cold:
+            cache.clear_all_cache()
+        t0 = time.perf_counter()
+        lookup(USER_ID_BASE + i % users)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{name:<22} {round_trips / updates:>6.2f} queries/update  "
+          f"p50 {statistics.median(latencies) * 1000:>7.3f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:>7.3f} ms  "
+          f"{updates / elapsed:>9.0f} updates/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}")
+    seed_users(args.users)
+    count_round_trips()
+
+    # Both paths must agree before timing them
+    for i in range(args.users):
+        user_id = USER_ID_BASE + i
+        cache.clear_all_cache()
+        legacy = legacy_lookups(user_id)
+        assert profile_lookups(user_id) == legacy, (user_id, legacy)
+
+    run('individual helpers', legacy_lookups, args.updates, args.users, cold=True)
+    run('profile (cold cache)', profile_lookups, args.updates, args.users, cold=True)
+    run('profile (warm cache)', profile_lookups, args.updates, args.users, cold=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Show that slow analytics queries no longer hold up the message path.
+
+Floods the database with slow searches while timing the per-message credit
+lookup, twice: once with the searches on the OLTP workload (how every query
+used to share one pool and executor) and once on the analytics workload.
+Message-path latency should stay flat in the second run.
+
+Usage:
+    python scripts/benchmark_workload_isolation.py [--searches 8] [--lookups 50]
+
+Set DATABASE_URL to benchmark against PostgreSQL; otherwise a temporary
+SQLite database is used.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks only need the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'benchmark',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'benchmark',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='bench_workloads_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database, queries  # noqa: E402
+from src.database import db_manager  # noqa: E402
+
+USER_ID = 900_000_001
+
+# A deliberately expensive read standing in for an ILIKE '%q%' search
+SLOW_SQL = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+    SELECT COUNT(*) FROM n
+"""
+
+
+def slow_search(workload: str, rows: int) -> None:
+    sql = SLOW_SQL if db_manager._db_type == 'postgresql' else SLOW_SQL.replace('%s', '?')
+    db_manager.execute_query(sql, (rows,), fetch_one=True, statement='bench_slow_search', workload=workload)
+
+
+async def measure(workload: str, searches: int, lookups: int, rows: int) -> list:
+    background = [asyncio.ensure_future(database.run_db(slow_search, workload, rows, workload=workload,
+                                                        timeout=120))
+                  for _ in range(searches)]
+    await asyncio.sleep(0.05)  # let the searches take the executor first
+    latencies = []
+    for _ in range(lookups):
+        started = time.perf_counter()
+        await db_manager.execute_named_async('get_user_credits', (USER_ID,), fetch_one=True, timeout=120)
+        latencies.append((time.perf_counter() - started) * 1000)
+    await asyncio.gather(*background)
+    return latencies
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--searches', type=int, default=8)
+    parser.add_argument('--lookups', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='size of each slow query')
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}, {args.searches} concurrent slow searches")
+    await database.run_db(database.ensure_user_exists, USER_ID, 'bench', 'Bench')
+    assert queries.registry.workload('search_users') == queries.ANALYTICS
+    assert queries.registry.workload('get_user_credits') == queries.OLTP
+
+    for label, workload in (('shared (oltp)', queries.OLTP), ('isolated (analytics)', queries.ANALYTICS)):
+        latencies = await measure(workload, args.searches, args.lookups, args.rows)
+        print(f"{label:<22} credit lookup mean {statistics.mean(latencies):8.2f} ms, "
+              f"max {max(latencies):8.2f} ms")
+    print(f"oltp executor:      {db_manager.get_executor_stats(queries.OLTP)}")
+    print(f"analytics executor: {db_manager.get_executor_stats(queries.ANALYTICS)}")
+    db_manager.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Index advisor: EXPLAIN every registered query and flag sequential scans.
+
+Runs each statement in the query registry (src/queries.py) through the
+planner against a seeded database and reports the tables it reads with a
+full scan. A scan listed in EXPECTED_SCANS (counts over a whole table,
+substring searches, ...) is reported but not flagged; anything else is,
+and the script exits with status 1 so it can gate CI.
+
+Without DATABASE_URL a temporary SQLite database is created, migrated and
+seeded. With DATABASE_URL (PostgreSQL) nothing is written: the EXPLAINs run
+with enable_seqscan off, so a remaining Seq Scan means no index can serve
+the query at all, whatever the table sizes.
+
+Usage:
+    python scripts/index_advisor.py [--rows 2000] [--verbose]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+# The advisor only needs the database settings; fill in the rest with dummies
+for _key, _value in {
+    'BOT_TOKEN': 'advisor',
+    'DATABASE_URL': '',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'advisor',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if not os.environ['DATABASE_URL']:
+    os.chdir(tempfile.mkdtemp(prefix='index_advisor_'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import migrations, queries  # noqa: E402
+from src.database import db_manager  # noqa: E402
+import src.user_profile  # noqa: E402,F401  (registers its statement)
+import src.segments  # noqa: E402,F401  (registers the segment statements)
+import src.broadcast  # noqa: E402,F401  (registers the broadcast statements)
+import src.topic_manager  # noqa: E402,F401  (registers the topic registry load)
+import src.reply_map  # noqa: E402,F401  (registers the reply route statements)
+import src.persistence  # noqa: E402,F401  (registers the persistence statements)
+
+# Statements that legitimately read a whole table, and why
+EXPECTED_SCANS = {
+    'health_check': 'no table',
+    'get_user_stats': 'counts every user',
+    'count_all_users': 'counts every user',
+    'count_unbanned_users': 'counts nearly every user',
+    'all_user_ids': 'broadcast audience',
+    'user_balance_totals': 'aggregates every balance',
+    'total_topics': 'counts every topic',
+    'get_all_products': 'lists the whole catalogue',
+    'get_all_quick_replies': 'lists every quick reply',
+    'get_all_users': 'paginated admin listing',
+    'vip_users_list': 'message_credits is deliberately unindexed to keep updates HOT',
+    'active_conversations_count': 'last_message_at is deliberately unindexed to keep updates HOT',
+    'conversations_with_details': 'last_message_at is deliberately unindexed to keep updates HOT',
+    'segment_count_all': 'counts every user',
+    'segment_gift_all': 'gifts every user',
+    'segment_gift_ledger_all': 'gifts every user',
+    'segment_count_vip': 'message_credits is deliberately unindexed to keep updates HOT',
+    'segment_gift_vip': 'message_credits is deliberately unindexed to keep updates HOT',
+    'segment_gift_ledger_vip': 'message_credits is deliberately unindexed to keep updates HOT',
+    'broadcast_count_all': 'counts every user',
+    'broadcast_count_vip': 'message_credits is deliberately unindexed to keep updates HOT',
+    'broadcast_jobs_recent': 'a handful of rows, newest first by primary key',
+    'broadcast_jobs_resumable': 'a handful of rows',
+    'broadcast_last_reach': 'a handful of rows, newest first by primary key',
+    'all_user_topics': 'loads every user topic once at startup',
+    'search_users': 'substring search',
+    'search_messages': 'substring search',
+    'search_transactions': 'substring search',
+    'search_locked_content': 'substring search',
+}
+
+# SEARCH is an index lookup; SCAN reads the whole table, or a whole index,
+# which is only fine when the index is partial
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+PARTIAL_INDEXES = {name for name, _, _, predicate in migrations.ACCESS_PATH_INDEXES + migrations.ACTIVE_USER_INDEXES
+                   if predicate}
+
+
+def seed(rows: int) -> None:
+    """Fill the temporary SQLite database so the plans reflect real tables."""
+    users, conversations, transactions, payments = [], [], [], []
+    for i in range(rows):
+        user_id = 1_000_000 + i
+        users.append((user_id, f"user{i}", i % 150, 1 if i % 97 == 0 else 0))
+        conversations.append((user_id, 10_000 + i))
+        payments.append((user_id, 25))
+        for kind in ('message', 'message', 'purchase'):
+            transactions.append((user_id, -1, kind, 'seed'))
+    with db_manager.get_connection() as conn:
+        conn.executemany("INSERT INTO users (telegram_id, username, message_credits, is_banned) "
+                         "VALUES (?, ?, ?, ?)", users)
+        conn.executemany("INSERT INTO conversations (user_id, topic_id) VALUES (?, ?)", conversations)
+        conn.executemany("INSERT INTO payment_logs (telegram_id, amount) VALUES (?, ?)", payments)
+        conn.executemany("INSERT INTO transactions (user_id, amount, transaction_type, description) "
+                         "VALUES (?, ?, ?, ?)", transactions)
+        conn.execute("ANALYZE")
+        conn.commit()
+
+
+def sqlite_scans(conn, sql: str) -> list:
+    params = ['1'] * sql.count('?')
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    scans = set()
+    for row in plan:
+        match = _SQLITE_SCAN_RE.match(row['detail'])
+        if match and match.group(2) not in PARTIAL_INDEXES:
+            scans.add(match.group(1))
+    return sorted(scans)
+
+
+def postgresql_scans(cursor, sql: str) -> list:
+    # Untyped '1' literals coerce to whatever each parameter's column needs
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", ['1'] * sql.count('%s'))
+    plan = cursor.fetchone()['QUERY PLAN']
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans, stack = set(), [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        if node.get('Node Type') == 'Seq Scan':
+            scans.add(node['Relation Name'])
+        stack.extend(node.get('Plans', []))
+    return sorted(scans)
+
+
+def explain_all(verbose: bool) -> int:
+    dialect = db_manager._db_type
+    flagged = 0
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        if dialect == 'postgresql':
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for name in sorted(queries.registry.names()):
+            statement = queries.registry.get(name)
+            if dialect == 'sqlite' and statement.sqlite is None and statement.postgresql.startswith('WITH'):
+                continue  # PostgreSQL-only writable CTEs
+            sql = db_manager.sql(name)
+            try:
+                scans = sqlite_scans(conn, sql) if dialect == 'sqlite' else postgresql_scans(cursor, sql)
+            except Exception as e:
+                print(f"  ?? {name}: could not explain ({e})")
+                if dialect == 'postgresql':
+                    conn.rollback()
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                continue
+            if not scans:
+                if verbose:
+                    print(f"  ok {name}")
+            elif name in EXPECTED_SCANS:
+                if verbose:
+                    print(f"  ok {name}: scans {', '.join(scans)} ({EXPECTED_SCANS[name]})")
+            else:
+                flagged += 1
+                print(f"  !! {name}: sequential scan on {', '.join(scans)}")
+        conn.rollback()
+    return flagged
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000, help='users to seed (SQLite only)')
+    parser.add_argument('--verbose', action='store_true', help='also list statements that pass')
+    args = parser.parse_args()
+
+    print(f"Database: {db_manager._db_type}, {len(queries.registry)} registered statements")
+    if db_manager._db_type == 'sqlite':
+        seed(args.rows)
+    flagged = explain_all(args.verbose)
+    print(f"{flagged} statements need an index" if flagged else "No unexpected sequential scans")
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+Native asyncio database engine for the bot's hot path.
+
+Coroutines in the message path await these helpers instead of calling the
+synchronous ``database`` module, so a slow query only suspends the update
+that issued it rather than the whole event loop.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Any, Dict, List, AsyncGenerator
+
+# Try to import asyncpg, fall back to the threaded stand-in if not available
+try:
+    import asyncpg
+    HAS_ASYNCPG = True
+except ImportError:
+    asyncpg = None
+    HAS_ASYNCPG = False
+
+from src import cache, database, queries
+from src.query_stats import query_stats, describe as describe_statement
+from src.database import db_manager, settings, ChargeResult
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r'%s')
+
+
+class AsyncDatabaseManager:
+    """Async counterpart to DatabaseManager backed by an asyncpg pool.
+
+    Queries are written once with ``%s`` placeholders, exactly like the
+    synchronous helpers, and converted to ``$n`` (asyncpg) or ``?`` (SQLite)
+    here. When asyncpg or PostgreSQL is unavailable the manager falls back to
+    a local stand-in that runs the synchronous ``db_manager`` on its bounded
+    executor, so the SQLite fallback keeps working unchanged.
+    """
+
+    _instance: Optional['AsyncDatabaseManager'] = None
+
+    def __new__(cls) -> 'AsyncDatabaseManager':
+        """Singleton pattern implementation."""
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Set up lazy state; the pool is created on first use inside the event loop."""
+        if self._initialized:
+            return
+        self._initialized = True
+        self._pool = None
+        self._backend = 'unknown'
+        self._init_lock: Optional[asyncio.Lock] = None
+        self._converted: Dict[str, str] = {}
+
+    @property
+    def dialect(self) -> str:
+        """SQL dialect of the underlying database ('postgresql' or 'sqlite')."""
+        if self._backend == 'asyncpg':
+            return 'postgresql'
+        return 'postgresql' if db_manager._db_type == 'postgresql' else 'sqlite'
+
+    async def initialize(self) -> None:
+        """Create the asyncpg pool, or select the threaded stand-in."""
+        if self._backend != 'unknown':
+            return
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+
+        async with self._init_lock:
+            if self._backend != 'unknown':
+                return
+
+            if HAS_ASYNCPG and settings.DATABASE_URL and db_manager._db_type == 'postgresql':
+                try:
+                    self._pool = await asyncpg.create_pool(
+                        dsn=settings.DATABASE_URL,
+                        min_size=int(getattr(settings, 'DB_POOL_MIN', 1)),
+                        max_size=int(getattr(settings, 'DB_POOL_MAX', 10)),
+                        server_settings={
+                            'application_name': 'telegram_bot:oltp',
+                            'statement_timeout': str(int(getattr(settings, 'DB_STATEMENT_TIMEOUT_MS', 10000))),
+                        },
+                    )
+                    self._backend = 'asyncpg'
+                    logger.info("Async database pool initialized (asyncpg)")
+                    return
+                except Exception as e:
+                    logger.error(f"Failed to initialize asyncpg pool, using threaded stand-in: {e}")
+
+            self._backend = 'threaded'
+            logger.info(f"Async database initialized with threaded stand-in ({db_manager._db_type})")
+
+    def _convert_query(self, query: str) -> str:
+        """Convert ``%s`` placeholders to the backend's parameter style."""
+        converted = self._converted.get(query)
+        if converted is not None:
+            return converted
+
+        if self._backend == 'asyncpg':
+            counter = iter(range(1, query.count('%s') + 1))
+            converted = _PLACEHOLDER_RE.sub(lambda _: f"${next(counter)}", query)
+        elif self.dialect == 'sqlite':
+            converted = query.replace('%s', '?')
+        else:
+            converted = query
+
+        self._converted[query] = converted
+        return converted
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[Any, None]:
+        """Acquire a raw asyncpg connection (asyncpg backend only)."""
+        await self.initialize()
+        if self._backend != 'asyncpg':
+            raise RuntimeError("Raw async connections require the asyncpg backend")
+        async with self._pool.acquire() as conn:
+            yield conn
+
+    async def execute_query(self, query: str, params: Optional[tuple] = None,
+                            fetch_one: bool = False, fetch_all: bool = False,
+                            statement: Optional[str] = None) -> Any:
+        """Execute a query without blocking the event loop."""
+        await self.initialize()
+        sql = self._convert_query(query)
+        params = tuple(params or ())
+
+        if self._backend == 'asyncpg':
+            return await self._execute_asyncpg(sql, params, fetch_one, fetch_all,
+                                               statement or describe_statement(query))
+
+        return await db_manager.execute_query_async(sql, params, fetch_one, fetch_all, statement=statement)
+
+    async def _execute_asyncpg(self, sql: str, params: tuple, fetch_one: bool, fetch_all: bool,
+                               name: str) -> Any:
+        """Run one query on the asyncpg pool, recording it in the query stats."""
+        started = time.perf_counter()
+        pool_wait = None
+        try:
+            async with self._pool.acquire() as conn:
+                pool_wait = time.perf_counter() - started
+                if fetch_one:
+                    result = await conn.fetchrow(sql, *params)
+                    rows = 1 if result is not None else 0
+                elif fetch_all:
+                    result = await conn.fetch(sql, *params)
+                    rows = len(result)
+                else:
+                    status = await conn.execute(sql, *params)
+                    # asyncpg returns a status tag such as "UPDATE 3"
+                    try:
+                        result = rows = int(status.split()[-1])
+                    except (ValueError, IndexError):
+                        result = rows = 0
+        except Exception:
+            query_stats.record(name, time.perf_counter() - started - (pool_wait or 0.0),
+                               pool_wait=pool_wait, error=True)
+            raise
+        elapsed = time.perf_counter() - started - pool_wait
+        query_stats.record(name, elapsed, rows, pool_wait)
+        query_stats.check_slow(name, elapsed, params, float(getattr(settings, 'SLOW_QUERY_MS', 250.0)))
+        return result
+
+    async def execute_named(self, statement: str, params: Optional[tuple] = None,
+                            fetch_one: bool = False, fetch_all: bool = False) -> Any:
+        """Execute a statement registered in ``src.queries`` by name."""
+        await self.initialize()
+        params = tuple(params or ())
+        replica = db_manager.route(statement, params)
+        # Analytics statements stay on their own pool instead of the message path's,
+        # and replica reads use db_manager's replica pools
+        workload = queries.registry.workload(statement)
+        if self._backend == 'asyncpg' and workload == queries.OLTP and not replica:
+            return await self.execute_query(queries.registry.sql(statement, 'postgresql'),
+                                            params, fetch_one, fetch_all, statement=statement)
+        return await db_manager.execute_query_async(db_manager.sql(statement), params, fetch_one, fetch_all,
+                                                    statement=statement, workload=workload, replica=replica)
+
+    async def execute_transaction(self, operations: List[Dict[str, Any]], statement: Optional[str] = None) -> bool:
+        """Execute multiple operations in a single transaction, recorded as one ``statement``."""
+        await self.initialize()
+        if not operations:
+            return True
+        converted = [
+            {'query': self._convert_query(op['query']), 'params': tuple(op.get('params') or ())}
+            for op in operations
+        ]
+
+        if self._backend == 'asyncpg':
+            name = statement or f"transaction:{describe_statement(operations[0]['query'])[4:]}"
+            started = time.perf_counter()
+            pool_wait = None
+            try:
+                async with self._pool.acquire() as conn:
+                    pool_wait = time.perf_counter() - started
+                    async with conn.transaction():
+                        for op in converted:
+                            await conn.execute(op['query'], *op['params'])
+                query_stats.record(name, time.perf_counter() - started - pool_wait, len(converted), pool_wait)
+                return True
+            except Exception as e:
+                query_stats.record(name, time.perf_counter() - started - (pool_wait or 0.0),
+                                   pool_wait=pool_wait, error=True)
+                logger.error(f"Async transaction failed: {e}")
+                return False
+
+        return await db_manager.run_in_executor(db_manager.execute_transaction, converted, statement)
+
+    async def close(self) -> None:
+        """Close the async pool."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        self._backend = 'unknown'
+        self._converted.clear()
+        logger.info("Async database pool closed")
+
+
+# Global async database manager instance
+async_db_manager = AsyncDatabaseManager()
+
+
+# ========================= Message Path Helpers =========================
+
+async def get_user_credits_optimized(user_id: int) -> int:
+    """Get user message credits."""
+    try:
+        result = await async_db_manager.execute_named('get_user_credits', (user_id,), fetch_one=True)
+        return (result['message_credits'] or 0) if result else 0
+    except Exception as e:
+        logger.error(f"Error getting user credits: {e}")
+        return 0
+
+
+async def decrement_user_credits_optimized(user_id: int, cost: int) -> int:
+    """Deduct credits only if the balance covers them; -1 when it does not."""
+    try:
+        result = await async_db_manager.execute_named('decrement_user_credits', (cost, user_id, cost),
+                                                      fetch_one=True)
+        if not result:
+            return -1
+        database.notify_credits_changed(user_id)
+        return result['message_credits']
+    except Exception as e:
+        logger.error(f"Error decrementing credits: {e}")
+        return -1
+
+
+async def add_user_credits(user_id: int, amount: int, credit_type: str = 'message') -> bool:
+    """Add credits or time to a user's account."""
+    try:
+        statement = 'add_user_time_credits' if credit_type == 'time' else 'add_user_message_credits'
+        await async_db_manager.execute_named(statement, (amount, user_id))
+        database.notify_credits_changed(user_id)
+        return True
+    except Exception as e:
+        logger.error(f"Error adding user credits: {e}")
+        return False
+
+
+async def get_setting(key: str, default: str = None) -> Optional[str]:
+    """Get a specific setting from the settings snapshot (no query unless it is reloading)."""
+    try:
+        from src.settings_snapshot import get_settings
+        return get_settings().get(key, default)
+    except Exception as e:
+        logger.error(f"Error getting setting '{key}': {e}")
+        return default
+
+
+async def is_user_banned(user_id: int) -> bool:
+    """Check if a user is banned."""
+    try:
+        result = await async_db_manager.execute_named('is_user_banned', (user_id,), fetch_one=True)
+        return bool(result['is_banned']) if result and result['is_banned'] else False
+    except Exception as e:
+        logger.error(f"Error checking if user {user_id} is banned: {e}")
+        return False
+
+
+async def get_user_tier(user_id: int) -> str:
+    """Get the user's tier based on their credit balance."""
+    credits = await get_user_credits_optimized(user_id)
+    if credits >= 100:
+        return 'VIP'
+    elif credits >= 50:
+        return 'Regular'
+    else:
+        return 'New'
+
+
+async def can_send_low_balance_notification(user_id: int) -> bool:
+    """Check if a low balance notification can be sent to the user."""
+    try:
+        result = await async_db_manager.execute_named('last_low_balance_notification', (user_id,), fetch_one=True)
+        if result and result['last_low_balance_notification']:
+            last_notification_time = result['last_low_balance_notification']
+            if isinstance(last_notification_time, str):
+                last_notification_time = datetime.fromisoformat(last_notification_time)
+            if datetime.now() - last_notification_time < timedelta(hours=24):
+                return False
+        return True
+    except Exception as e:
+        logger.error(f"Error checking low balance notification status for user {user_id}: {e}")
+        return True
+
+
+async def update_low_balance_notification_status(user_id: int) -> None:
+    """Update the timestamp of the last low balance notification."""
+    try:
+        await async_db_manager.execute_named('touch_low_balance_notification', (user_id,))
+    except Exception as e:
+        logger.error(f"Error updating low balance notification status for user {user_id}: {e}")
+
+
+async def clear_low_balance_notification_status(user_id: int) -> None:
+    """Give back a low balance notification claimed for a charge that was refunded."""
+    try:
+        await async_db_manager.execute_named('clear_low_balance_notification', (user_id,))
+    except Exception as e:
+        logger.error(f"Error clearing low balance notification status for user {user_id}: {e}")
+
+
+async def get_user_auto_recharge_settings(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get user's auto-recharge settings."""
+    try:
+        result = await async_db_manager.execute_named('get_auto_recharge_settings', (user_id,), fetch_one=True)
+        if result:
+            return {
+                'enabled': bool(result['enabled']),
+                'amount': result['amount'] or 10,
+                'threshold': result['threshold'] or 5
+            }
+        return None
+    except Exception as e:
+        logger.error(f"Error getting auto-recharge settings: {e}")
+        return None
+
+
+async def process_auto_recharge(user_id: int, amount: int) -> bool:
+    """Process automatic recharge for a user."""
+    try:
+        # For now, just add credits (in real implementation, this would charge payment method)
+        success = await add_user_credits(user_id, amount)
+        if success:
+            try:
+                await async_db_manager.execute_named(
+                    'log_auto_recharge', (user_id, amount, f"Auto-recharge: {amount} credits")
+                )
+            except Exception as e:
+                logger.warning(f"Failed to log auto-recharge transaction: {e}")
+        return success
+    except Exception as e:
+        logger.error(f"Error processing auto-recharge: {e}")
+        return False
+
+
+async def get_user_info(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get detailed user information."""
+    try:
+        result = await async_db_manager.execute_named('get_user_info', (user_id,), fetch_one=True)
+        return dict(result) if result else None
+    except Exception as e:
+        logger.error(f"Error getting user info for {user_id}: {e}")
+        return None
+
+
+async def get_user_purchase_count(user_id: int) -> int:
+    """Get total purchase count for user."""
+    try:
+        result = await async_db_manager.execute_named('user_purchase_count', (user_id,), fetch_one=True)
+        return result[0] if result else 0
+    except Exception as e:
+        logger.error(f"Error getting user purchase count: {e}")
+        return 0
+
+
+async def charge_message(user_id: int, message_type: str) -> ChargeResult:
+    """Charge a user for one message in a single round trip (see database.charge_message)."""
+    if async_db_manager.dialect != 'postgresql':
+        return await db_manager.run_in_executor(database.charge_message, user_id, message_type)
+
+    setting_key, default_cost = database.MESSAGE_COST_SETTINGS.get(
+        message_type, database.MESSAGE_COST_SETTINGS['text']
+    )
+    try:
+        row = await async_db_manager.execute_named(
+            'charge_message',
+            (setting_key, default_cost, setting_key, user_id, database.reservation_ttl()),
+            fetch_one=True
+        )
+        result = database.charge_result_from_row(row)
+        if result.charged:
+            database.notify_credits_changed(user_id)
+        return result
+    except Exception as e:
+        logger.error(f"Error charging message for user {user_id}: {e}")
+        return database.charge_result_from_row(None)._replace(error=True)
+
+
+# ========================= Credit Reservations =========================
+
+async def reserve_credits(user_id: int, amount: int, reason: str = 'message') -> Optional[int]:
+    """Hold credits for a pending action (see database.reserve_credits)."""
+    if async_db_manager.dialect != 'postgresql':
+        return await db_manager.run_in_executor(database.reserve_credits, user_id, amount, reason)
+    try:
+        row = await async_db_manager.execute_named(
+            'reserve_credits',
+            (amount, user_id, amount, amount, reason, database.reservation_ttl()),
+            fetch_one=True
+        )
+        if not row:
+            return None
+        database.notify_credits_changed(user_id)
+        return row['id']
+    except Exception as e:
+        logger.error(f"Error reserving {amount} credits for user {user_id}: {e}")
+        return None
+
+
+async def commit_reservation(reservation_id: Optional[int]) -> bool:
+    """Make a held reservation permanent once the paid action succeeded (re-debiting an expired one)."""
+    if reservation_id is None:
+        return False
+    if async_db_manager.dialect != 'postgresql':
+        return await db_manager.run_in_executor(database.commit_reservation, reservation_id)
+    try:
+        committed = await async_db_manager.execute_named('commit_reservation', (reservation_id,)) == 1
+        if not committed:
+            # Rare: the sweeper refunded it while the send was queued
+            committed = await db_manager.run_in_executor(database.commit_expired_reservation, reservation_id)
+        if not committed:
+            logger.warning(f"Credit reservation {reservation_id} was already settled before commit")
+        return committed
+    except Exception as e:
+        logger.error(f"Error committing credit reservation {reservation_id}: {e}")
+        return False
+
+
+async def release_reservation(reservation_id: Optional[int]) -> bool:
+    """Return a held reservation's credits after the paid action failed."""
+    if reservation_id is None:
+        return False
+    if async_db_manager.dialect != 'postgresql':
+        return await db_manager.run_in_executor(database.release_reservation, reservation_id)
+    try:
+        rows = await async_db_manager.execute_named('release_reservation', (reservation_id,), fetch_all=True)
+        for row in rows or []:
+            database.notify_credits_changed(row['telegram_id'])
+        return bool(rows)
+    except Exception as e:
+        logger.error(f"Error releasing credit reservation {reservation_id}: {e}")
+        return False
+
+
+async def run_reservation_sweeper(interval: Optional[float] = None) -> None:
+    """Release expired credit holds every ``interval`` seconds until cancelled."""
+    if interval is None:
+        interval = float(getattr(settings, 'CREDIT_RESERVATION_SWEEP_INTERVAL', 30.0))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db_manager.run_in_executor(database.release_expired_reservations)
+        except Exception as e:
+            logger.error(f"Credit reservation sweep failed: {e}")
+
+
+# ========================= Topic Helpers =========================
+
+async def get_or_create_user_topic(user_id: int, username: str = None, first_name: str = None) -> Optional[int]:
+    """Get the existing topic ID for a user (creation is handled by the bot)."""
+    try:
+        result = await async_db_manager.execute_named('get_user_topic', (user_id,), fetch_one=True)
+        return result['topic_id'] if result and result['topic_id'] else None
+    except Exception as e:
+        logger.error(f"Error getting/creating user topic for {user_id}: {e}")
+        return None
+
+
+async def save_user_topic(user_id: int, topic_id: int) -> bool:
+    """Save the topic ID for a user after topic creation."""
+    try:
+        await async_db_manager.execute_named('save_user_topic', (user_id, topic_id))
+        cache.invalidate_user_cache(user_id)
+        logger.info(f"Saved topic {topic_id} for user {user_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving user topic for {user_id}: {e}")
+        return False
+
+
+
+async def claim_user_topic(user_id: int, topic_id: int) -> Optional[int]:
+    """Save ``topic_id`` for the user unless they already have a topic.
+
+    The row for ``user_id`` is unique, so of two replicas that created a topic
+    for the same user at once, the first to save wins. Returns the topic the
+    user ends up with (``topic_id`` or the winner's), or None on error.
+    """
+    try:
+        result = await async_db_manager.execute_named('claim_user_topic', (user_id, topic_id), fetch_one=True)
+        winner = result['topic_id'] if result else None
+        if winner == topic_id:
+            cache.invalidate_user_cache(user_id)
+            logger.info(f"Saved topic {topic_id} for user {user_id}")
+        return winner
+    except Exception as e:
+        logger.error(f"Error claiming user topic for {user_id}: {e}")
+        return None
+
+async def update_conversation_activity(user_id: int, topic_id: int = None) -> bool:
+    """Update the last message timestamp for a conversation."""
+    try:
+        if topic_id:
+            await async_db_manager.execute_named('touch_conversation_topic', (user_id, topic_id))
+        else:
+            await async_db_manager.execute_named('touch_conversation', (user_id,))
+        return True
+    except Exception as e:
+        logger.error(f"Error updating conversation activity for {user_id}: {e}")
+        return False
+
+
+async def get_user_by_topic_id(topic_id: int) -> Optional[int]:
+    """Get user ID by topic ID."""
+    try:
+        result = await async_db_manager.execute_named('get_user_by_topic_id', (topic_id,), fetch_one=True)
+        return result['user_id'] if result else None
+    except Exception as e:
+        logger.error(f"Error getting user by topic ID {topic_id}: {e}")
+        return None
+
+
+async def get_quick_reply(keyword: str) -> Optional[str]:
+    """Get quick reply response by keyword."""
+    try:
+        result = await async_db_manager.execute_named('get_quick_reply', (keyword,), fetch_one=True)
+        return result['response'] if result else None
+    except Exception as e:
+        logger.error(f"Error getting quick reply: {e}")
+        return None
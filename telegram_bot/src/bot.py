@@ -11,7 +11,13 @@ from telegram.ext import Application, CommandHandler, CallbackQueryHandler, Mess
 
 # Import handlers
 from src.handlers import user_commands, admin_commands, message_handlers
-from src import enhanced_admin_ui
+from src import (
+    broadcast, enhanced_admin_ui, outbound, persistence, reply_map, topic_manager, update_processor,
+)
+from src.async_database import async_db_manager, run_reservation_sweeper
+from src.database import db_manager
+from src.settings_snapshot import reload_settings
+from src.query_stats import start_metrics_server, stop_metrics_server
 from src.config import settings
 
 # Configure logging
@@ -21,6 +27,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Background tasks started in post_init and cancelled in post_shutdown
+_background_tasks = []
+
 async def error_handler(update, context):
     """Log the error and send a telegram message to notify the developer."""
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
@@ -29,7 +38,9 @@ async def error_handler(update, context):
     if update and hasattr(update, 'effective_chat'):
         try:
             if update.effective_chat.id == settings.ADMIN_CHAT_ID:
-                await context.bot.send_message(
+                await outbound.send(
+                    context.bot, outbound.Lane.NOTIFICATION, 'send_message',
+                    coalesce_key=f"error:{type(context.error).__name__}",
                     chat_id=update.effective_chat.id,
                     text=f"❌ **Bot Error**\n\n`{str(context.error)[:500]}`",
                     parse_mode='Markdown'
@@ -38,6 +49,40 @@ async def error_handler(update, context):
             logger.error(f"Failed to send error message to admin: {e}")
 
 
+async def post_init(application) -> None:
+    """Start database, outbound and background services once the loop is running."""
+    await async_db_manager.initialize()
+    outbound.scheduler.start(application.bot)
+    # Load the settings snapshot before the first update needs it
+    await db_manager.run_in_executor(reload_settings)
+    if topic_manager.is_topic_enabled():
+        try:
+            await db_manager.run_in_executor(topic_manager.registry.load)
+        except Exception as e:
+            # Topics are then looked up as users write in
+            logger.error(f"Loading user topics failed: {e}")
+    _background_tasks.append(asyncio.create_task(run_reservation_sweeper()))
+    _background_tasks.append(asyncio.create_task(reply_map.run_reply_map_flusher()))
+    _background_tasks.append(
+        asyncio.create_task(persistence.run_persistence_maintenance(application))
+    )
+    # Resumes broadcasts interrupted by a restart, and those of replicas that died
+    _background_tasks.append(asyncio.create_task(broadcast.run_broadcast_resumer(application.bot)))
+    if settings.METRICS_PORT:
+        start_metrics_server(settings.METRICS_PORT)
+
+
+async def post_shutdown(application) -> None:
+    """Stop background services and flush pending state on shutdown."""
+    while _background_tasks:
+        _background_tasks.pop().cancel()
+    await broadcast.stop_broadcasts()
+    await outbound.scheduler.stop()
+    await reply_map.store.flush()
+    stop_metrics_server()
+    await async_db_manager.close()
+
+
 async def setup_webhook(application):
     """Set up webhook for production deployment."""
     try:
@@ -61,7 +106,15 @@ async def main() -> None:
     logger.info("Configuration loaded and validated successfully.")
 
     # Set up the application
-    application = Application.builder().token(settings.BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(settings.BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(update_processor.from_settings())
+        .persistence(persistence.from_settings())
+        .build()
+    )
 
     # Import and register enhanced interfaces
     try:
@@ -89,7 +142,9 @@ async def main() -> None:
     
     # Register additional commands
     application.add_handler(CommandHandler("buy_content", admin_commands.buy_content_command))
-    application.add_handler(CallbackQueryHandler(admin_commands.handle_content_purchase, pattern=r"^purchase_"))
+    application.add_handler(
+        CallbackQueryHandler(admin_commands.handle_content_purchase, pattern=r"^purchase_")
+    )
     
     # Register enhanced admin commands if available
     try:
@@ -110,7 +165,9 @@ async def main() -> None:
         logger.warning("Some admin conversation handlers not available")
     
     # Register message handler (must be last)
-    application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, message_handlers.master_message_handler))
+    application.add_handler(
+        MessageHandler(filters.ALL & ~filters.COMMAND, message_handlers.master_message_handler)
+    )
     application.add_error_handler(error_handler)
     
     # The health check endpoint is now managed by the webserver library (e.g., uvicorn)
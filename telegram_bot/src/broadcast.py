@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Resumable, rate-limited broadcasts.
+
+A broadcast is a row in ``broadcast_jobs``: the target segment (one of
+``src.segments.SEGMENTS``, banned users excluded), the message to copy, a
+status and a checkpoint. ``BroadcastEngine`` sends one job:
+
+* recipients are read in keyset pages (``telegram_id > last ORDER BY
+  telegram_id LIMIT BROADCAST_PAGE_SIZE``) on the analytics workload, instead
+  of loading every ID with ``get_all_user_ids()``. Short pages hold no
+  transaction or server-side cursor open for the hours a large broadcast can
+  take, and the last ID doubles as the resume point;
+* every send waits for its chat's slot (``BROADCAST_PER_CHAT_INTERVAL``) and
+  a token from the process-wide ``TokenBucket`` (``BROADCAST_RATE_PER_SEC``).
+  A ``RetryAfter`` pauses the bucket for all workers, then the send is
+  retried;
+* ``Forbidden`` (bot blocked, user deactivated) and a vanished chat count as
+  blocked, other rejections as failed; timeouts and network errors are
+  retried up to ``BROADCAST_MAX_ATTEMPTS`` times;
+* every ``BROADCAST_CHECKPOINT_INTERVAL`` seconds the highest ID below which
+  every recipient is settled is saved with the counts, renewing the job's
+  lease. A job whose lease expires (its process died) is picked up by
+  ``resume_broadcasts`` and continues after that ID.
+
+A graceful stop (``stop_broadcasts``, on shutdown) lets in-flight sends
+finish and starts no new ones, so resuming repeats nobody. After a crash the
+recipients settled since the last checkpoint are sent to again.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from src import outbound, queries, segments
+from src.database import db_manager, run_db, settings
+from src.rate_limit import KeyedRateLimiter, TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+DELIVERED, BLOCKED, FAILED = 'delivered', 'blocked', 'failed'
+
+# Identifies this process in broadcast_jobs.lease_owner
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# BadRequest descriptions meaning the recipient is gone rather than the message being wrong
+_GONE_CHAT_ERRORS = ('chat not found', 'user not found', 'peer_id_invalid')
+
+_LEASE_UNTIL = "CURRENT_TIMESTAMP + CAST(%s AS INTEGER) * INTERVAL '1 second'"
+_SQLITE_LEASE_UNTIL = "datetime('now', '+' || %s || ' seconds')"
+
+TARGETS_SQL = """
+SELECT telegram_id FROM users
+WHERE ({predicate}) AND is_banned = FALSE AND telegram_id > %s
+ORDER BY telegram_id
+LIMIT %s
+"""
+
+COUNT_SQL = "SELECT COUNT(*) AS total FROM users WHERE ({predicate}) AND is_banned = FALSE"
+
+for _segment in segments.SEGMENTS.values():
+    queries.register(f"broadcast_targets_{_segment.name}", TARGETS_SQL.format(predicate=_segment.postgresql),
+                     sqlite=TARGETS_SQL.format(predicate=_segment.sqlite), workload=queries.ANALYTICS)
+    queries.register(f"broadcast_count_{_segment.name}", COUNT_SQL.format(predicate=_segment.postgresql),
+                     sqlite=COUNT_SQL.format(predicate=_segment.sqlite), workload=queries.ANALYTICS)
+
+# Job bookkeeping is not user data: it must not pin other reads to the primary,
+# and its own reads must see the latest checkpoint
+queries.register('broadcast_job_create', """
+    INSERT INTO broadcast_jobs (segment, message_text, source_chat_id, source_message_id, total, created_by)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING id
+""", pins_reads=False)
+
+CLAIM_SQL = """
+UPDATE broadcast_jobs
+SET status = 'running', lease_owner = %s, lease_expires_at = {lease_until},
+    started_at = COALESCE(started_at, CURRENT_TIMESTAMP), updated_at = CURRENT_TIMESTAMP
+WHERE id = %s AND status IN ('pending', 'running')
+  AND (lease_owner IS NULL OR lease_owner = %s OR lease_expires_at < CURRENT_TIMESTAMP)
+RETURNING id, segment, message_text, source_chat_id, source_message_id, total,
+          last_user_id, delivered, blocked, failed, created_by
+"""
+queries.register('broadcast_job_claim', CLAIM_SQL.format(lease_until=_LEASE_UNTIL),
+                 sqlite=CLAIM_SQL.format(lease_until=_SQLITE_LEASE_UNTIL), pins_reads=False)
+
+CHECKPOINT_SQL = """
+UPDATE broadcast_jobs
+SET last_user_id = %s, delivered = %s, blocked = %s, failed = %s,
+    lease_expires_at = {lease_until}, updated_at = CURRENT_TIMESTAMP
+WHERE id = %s AND lease_owner = %s AND status = 'running'
+"""
+queries.register('broadcast_job_checkpoint', CHECKPOINT_SQL.format(lease_until=_LEASE_UNTIL),
+                 sqlite=CHECKPOINT_SQL.format(lease_until=_SQLITE_LEASE_UNTIL), pins_reads=False)
+
+# Final checkpoint and lease release. 'running' leaves the job resumable; a
+# job cancelled meanwhile keeps its status but still gets the final counts
+queries.register('broadcast_job_settle', """
+    UPDATE broadcast_jobs
+    SET status = CASE WHEN status = 'running' THEN %s ELSE status END,
+        last_user_id = %s, delivered = %s, blocked = %s, failed = %s,
+        lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP,
+        finished_at = CASE WHEN status <> 'running' OR %s = 'running' THEN finished_at ELSE CURRENT_TIMESTAMP END
+    WHERE id = %s AND lease_owner = %s
+    RETURNING status
+""", pins_reads=False)
+
+queries.register('broadcast_job_cancel', """
+    UPDATE broadcast_jobs
+    SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND status IN ('pending', 'running')
+""", pins_reads=False)
+
+queries.register('broadcast_jobs_recent', """
+    SELECT id, segment, status, total, delivered, blocked, failed, created_at, finished_at
+    FROM broadcast_jobs
+    ORDER BY id DESC
+    LIMIT %s
+""", replica=False)
+
+queries.register('broadcast_jobs_resumable', """
+    SELECT id FROM broadcast_jobs
+    WHERE status IN ('pending', 'running')
+      AND (lease_owner IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
+    ORDER BY id
+""", replica=False)
+
+queries.register('broadcast_last_reach', """
+    SELECT delivered FROM broadcast_jobs
+    WHERE status = 'completed'
+    ORDER BY id DESC
+    LIMIT 1
+""", workload=queries.ANALYTICS, replica=False)
+
+
+class BroadcastProgress(NamedTuple):
+    job_id: int
+    status: str  # job status after the run: completed, cancelled, running (stopped), or lost
+    total: int  # recipients when the job was created
+    delivered: int
+    blocked: int
+    failed: int
+    elapsed: float  # seconds in this run
+    retry_after: int  # RetryAfter responses in this run
+
+
+# ========================= Job Storage =========================
+
+def count_targets(segment: str) -> int:
+    """Number of unbanned users a broadcast to the segment would reach."""
+    params = segments.get_segment(segment).params
+    try:
+        row = db_manager.execute_named(f"broadcast_count_{segment}", params, fetch_one=True)
+        return row['total'] if row else 0
+    except Exception as e:
+        logger.error(f"Error counting broadcast targets for {segment}: {e}")
+        return 0
+
+
+def fetch_targets(segment: str, after: int, limit: int) -> List[int]:
+    """Up to ``limit`` recipient IDs above ``after``, in ID order. Raises on database errors."""
+    rows = db_manager.execute_named(f"broadcast_targets_{segment}",
+                                    (*segments.get_segment(segment).params, after, limit), fetch_all=True)
+    return [row[0] for row in rows] if rows else []
+
+
+def create_job(segment: str, created_by: Optional[int], message_text: Optional[str] = None,
+               source_chat_id: Optional[int] = None, source_message_id: Optional[int] = None) -> Optional[int]:
+    """Record a pending broadcast; returns its ID.
+
+    With ``source_chat_id``/``source_message_id`` each recipient gets a copy of
+    that message (any content type), otherwise ``message_text``.
+    """
+    try:
+        row = db_manager.execute_named('broadcast_job_create', (
+            segment, message_text, source_chat_id, source_message_id, count_targets(segment), created_by
+        ), fetch_one=True)
+        return row['id'] if row else None
+    except Exception as e:
+        logger.error(f"Error creating broadcast to {segment}: {e}")
+        return None
+
+
+def claim_job(job_id: int, owner: str = OWNER, lease_seconds: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Take the job's lease; None if it is finished or another live process holds it."""
+    lease_seconds = int(lease_seconds or getattr(settings, 'BROADCAST_LEASE_S', 60))
+    try:
+        return db_manager.execute_named('broadcast_job_claim', (owner, lease_seconds, job_id, owner), fetch_one=True)
+    except Exception as e:
+        logger.error(f"Error claiming broadcast {job_id}: {e}")
+        return None
+
+
+def cancel_job(job_id: int) -> bool:
+    """Mark an unfinished job cancelled; its sender stops at its next checkpoint."""
+    try:
+        return db_manager.execute_named('broadcast_job_cancel', (job_id,)) > 0
+    except Exception as e:
+        logger.error(f"Error cancelling broadcast {job_id}: {e}")
+        return False
+
+
+def recent_jobs(limit: int = 5) -> List[Dict[str, Any]]:
+    """The latest broadcasts, newest first."""
+    try:
+        return db_manager.execute_named('broadcast_jobs_recent', (limit,), fetch_all=True) or []
+    except Exception as e:
+        logger.error(f"Error getting recent broadcasts: {e}")
+        return []
+
+
+def resumable_jobs() -> List[int]:
+    """Unfinished jobs nobody holds a live lease on."""
+    try:
+        rows = db_manager.execute_named('broadcast_jobs_resumable', fetch_all=True)
+        return [row[0] for row in rows] if rows else []
+    except Exception as e:
+        logger.error(f"Error getting resumable broadcasts: {e}")
+        return []
+
+
+def last_broadcast_reach() -> int:
+    """Recipients reached by the latest completed broadcast."""
+    try:
+        row = db_manager.execute_named('broadcast_last_reach', fetch_one=True)
+        return row[0] if row else 0
+    except Exception as e:
+        logger.error(f"Error getting last broadcast reach: {e}")
+        return 0
+
+
+# ========================= Sending =========================
+
+_bucket: Optional[TokenBucket] = None
+
+
+def shared_bucket() -> TokenBucket:
+    """The process-wide broadcast token bucket (Telegram's limit is per bot, not per job)."""
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(float(getattr(settings, 'BROADCAST_RATE_PER_SEC', 25.0)))
+    return _bucket
+
+
+class BroadcastEngine:
+    """Sends one broadcast job, checkpointing as it goes."""
+
+    def __init__(self, bot, job_id: int, bucket: Optional[TokenBucket] = None,
+                 concurrency: Optional[int] = None, page_size: Optional[int] = None,
+                 checkpoint_interval: Optional[float] = None, lease_seconds: Optional[int] = None,
+                 owner: str = OWNER):
+        self.bot = bot
+        self.job_id = job_id
+        self.bucket = bucket or shared_bucket()
+        self.per_chat = KeyedRateLimiter(float(getattr(settings, 'BROADCAST_PER_CHAT_INTERVAL', 1.0)))
+        self.concurrency = int(concurrency or getattr(settings, 'BROADCAST_CONCURRENCY', 8))
+        self.page_size = int(page_size or getattr(settings, 'BROADCAST_PAGE_SIZE', 1000))
+        self.checkpoint_interval = float(checkpoint_interval or getattr(settings, 'BROADCAST_CHECKPOINT_INTERVAL', 2.0))
+        self.lease_seconds = int(lease_seconds or getattr(settings, 'BROADCAST_LEASE_S', 60))
+        self.max_attempts = int(getattr(settings, 'BROADCAST_MAX_ATTEMPTS', 5))
+        self.owner = owner
+        self.job: Optional[Dict[str, Any]] = None
+        self.last_user_id = 0
+        self.counts = {DELIVERED: 0, BLOCKED: 0, FAILED: 0}
+        self.retry_after = 0
+        self._stopping = False
+        self._pending: Deque[int] = deque()  # recipients handed to workers, in ID order
+        self._settled: Dict[int, str] = {}  # outcomes not yet behind the watermark
+
+    def stop(self) -> None:
+        """Finish in-flight sends and stop; the job stays resumable."""
+        self._stopping = True
+
+    async def run(self) -> Optional[BroadcastProgress]:
+        """Claim and send the job; None if it could not be claimed."""
+        job = await run_db(claim_job, self.job_id, self.owner, self.lease_seconds)
+        if job is None:
+            logger.info(f"Broadcast {self.job_id} is finished or owned by another process")
+            return None
+        self.job = job
+        self.last_user_id = job['last_user_id'] or 0
+        self.counts = {DELIVERED: job['delivered'] or 0, BLOCKED: job['blocked'] or 0, FAILED: job['failed'] or 0}
+        logger.info(f"Broadcast {self.job_id} to {job['segment']} running after user {self.last_user_id}")
+
+        started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        producer = asyncio.create_task(self._produce(queue))
+        workers = [asyncio.create_task(self._work(queue)) for _ in range(self.concurrency)]
+        checkpointer = asyncio.create_task(self._checkpoint_loop())
+        try:
+            exhausted = await producer
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            # Hard stop: sends cut off mid-flight are repeated on resume
+            for task in (producer, *workers):
+                task.cancel()
+            await asyncio.gather(producer, *workers, return_exceptions=True)
+            await run_db(self._settle, 'running')
+            raise
+        finally:
+            checkpointer.cancel()
+
+        status = await run_db(self._settle, 'completed' if exhausted and not self._stopping else 'running')
+        progress = BroadcastProgress(self.job_id, status, job['total'] or 0, self.counts[DELIVERED],
+                                     self.counts[BLOCKED], self.counts[FAILED], time.monotonic() - started,
+                                     self.retry_after)
+        logger.info(f"Broadcast {self.job_id} {status}: {progress.delivered} delivered, {progress.blocked} blocked, "
+                    f"{progress.failed} failed in {progress.elapsed:.1f}s ({self.retry_after} RetryAfter)")
+        if status in ('completed', 'cancelled'):
+            await self._notify(progress)
+        return progress
+
+    async def _produce(self, queue: asyncio.Queue) -> bool:
+        """Feed recipients to the workers in ID order; True once every recipient was handed out."""
+        after, exhausted = self.last_user_id, False
+        try:
+            while not self._stopping:
+                page = await run_db(fetch_targets, self.job['segment'], after, self.page_size,
+                                    workload=queries.ANALYTICS)
+                if not page:
+                    exhausted = True
+                    break
+                for user_id in page:
+                    if self._stopping:
+                        break
+                    self._pending.append(user_id)
+                    await queue.put(user_id)
+                after = page[-1]
+        except Exception as e:
+            logger.error(f"Reading recipients for broadcast {self.job_id} failed, stopping until resumed: {e}")
+            self._stopping = True
+        for _ in range(self.concurrency):
+            await queue.put(None)
+        return exhausted
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            user_id = await queue.get()
+            if user_id is None:
+                return
+            if self._stopping:
+                # Left unsent; the watermark stops before it
+                continue
+            self._settled[user_id] = await self._deliver(user_id)
+            self._advance()
+
+    def _advance(self) -> None:
+        """Move the watermark over the settled prefix of handed-out recipients."""
+        while self._pending and self._pending[0] in self._settled:
+            user_id = self._pending.popleft()
+            self.counts[self._settled.pop(user_id)] += 1
+            self.last_user_id = user_id
+
+    async def _deliver(self, chat_id: int) -> str:
+        attempt = 0
+        while True:
+            await self.per_chat.acquire(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self._send(chat_id)
+                return DELIVERED
+            except RetryAfter as e:
+                self.retry_after += 1
+                self.bucket.pause(retry_after_seconds(e.retry_after))
+            except Forbidden:
+                return BLOCKED
+            except BadRequest as e:
+                if any(error in e.message.lower() for error in _GONE_CHAT_ERRORS):
+                    return BLOCKED
+                logger.warning(f"Broadcast {self.job_id} to {chat_id} rejected: {e.message}")
+                return FAILED
+            except NetworkError as e:  # includes TimedOut
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    logger.warning(f"Broadcast {self.job_id} to {chat_id} failed after {attempt} attempts: {e}")
+                    return FAILED
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 30.0))
+            except TelegramError as e:
+                logger.warning(f"Broadcast {self.job_id} to {chat_id} failed: {e}")
+                return FAILED
+            except Exception as e:
+                logger.error(f"Broadcast {self.job_id} to {chat_id} failed unexpectedly: {e}")
+                return FAILED
+
+    async def _send(self, chat_id: int) -> None:
+        # Lowest lane: replies and forwards to the admin go first when the scheduler is running
+        if self.job['source_message_id']:
+            await outbound.send(self.bot, outbound.Lane.BROADCAST, 'copy_message', chat_id=chat_id,
+                                from_chat_id=self.job['source_chat_id'], message_id=self.job['source_message_id'])
+        else:
+            await outbound.send(self.bot, outbound.Lane.BROADCAST, 'send_message',
+                                chat_id=chat_id, text=self.job['message_text'])
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                saved = await run_db(
+                    db_manager.execute_named, 'broadcast_job_checkpoint',
+                    (self.last_user_id, self.counts[DELIVERED], self.counts[BLOCKED], self.counts[FAILED],
+                     self.lease_seconds, self.job_id, self.owner))
+            except Exception as e:
+                # Keep sending; the next checkpoint renews the lease if the database is back in time
+                logger.error(f"Checkpointing broadcast {self.job_id} failed: {e}")
+                continue
+            if not saved:
+                logger.warning(f"Broadcast {self.job_id} was cancelled or taken over; stopping")
+                self._stopping = True
+                return
+
+    def _settle(self, status: str) -> str:
+        """Save the final checkpoint and release the lease; returns the job's status."""
+        try:
+            row = db_manager.execute_named('broadcast_job_settle', (
+                status, self.last_user_id, self.counts[DELIVERED], self.counts[BLOCKED], self.counts[FAILED],
+                status, self.job_id, self.owner), fetch_one=True)
+            return row['status'] if row else 'lost'
+        except Exception as e:
+            logger.error(f"Saving broadcast {self.job_id} progress failed; it resumes when the lease expires: {e}")
+            return 'running'
+
+    async def _notify(self, progress: BroadcastProgress) -> None:
+        if not self.job['created_by']:
+            return
+        try:
+            await outbound.send(
+                self.bot, outbound.Lane.NOTIFICATION, 'send_message',
+                chat_id=self.job['created_by'],
+                text=(f"📢 Broadcast #{progress.job_id} {progress.status}\n\n"
+                      f"✅ Delivered: {progress.delivered}\n"
+                      f"🚫 Blocked: {progress.blocked}\n"
+                      f"❌ Failed: {progress.failed}")
+            )
+        except Exception as e:
+            logger.error(f"Failed to send broadcast {progress.job_id} summary: {e}")
+
+
+# ========================= Running Jobs =========================
+
+_engines: Dict[int, BroadcastEngine] = {}
+_tasks: Dict[int, asyncio.Task] = {}
+
+
+def start_broadcast(bot, job_id: int) -> asyncio.Task:
+    """Send the job in the background on the running loop."""
+    if job_id in _tasks:
+        return _tasks[job_id]
+    engine = BroadcastEngine(bot, job_id)
+    task = asyncio.create_task(engine.run())
+    _engines[job_id], _tasks[job_id] = engine, task
+
+    def _done(finished: asyncio.Task) -> None:
+        _engines.pop(job_id, None)
+        _tasks.pop(job_id, None)
+        if not finished.cancelled() and finished.exception():
+            logger.error(f"Broadcast {job_id} crashed: {finished.exception()}")
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def cancel_broadcast(job_id: int) -> bool:
+    """Cancel a broadcast, stopping it straight away if this process is sending it."""
+    cancelled = await run_db(cancel_job, job_id)
+    engine = _engines.get(job_id)
+    if cancelled and engine:
+        engine.stop()
+    return cancelled
+
+
+async def resume_broadcasts(bot) -> int:
+    """Start every unfinished job without a live owner; returns how many were started."""
+    started = 0
+    for job_id in await run_db(resumable_jobs):
+        if job_id not in _tasks:
+            start_broadcast(bot, job_id)
+            started += 1
+    if started:
+        logger.info(f"Resuming {started} broadcasts")
+    return started
+
+
+async def run_broadcast_resumer(bot, interval: Optional[float] = None) -> None:
+    """Pick up broadcasts whose owner died, every ``interval`` seconds until cancelled."""
+    if interval is None:
+        interval = float(getattr(settings, 'BROADCAST_LEASE_S', 60))
+    while True:
+        try:
+            await resume_broadcasts(bot)
+        except Exception as e:
+            logger.error(f"Broadcast resume check failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def stop_broadcasts(timeout: float = 10.0) -> None:
+    """Stop local broadcasts gracefully, cancelling any still sending after ``timeout`` seconds."""
+    tasks = list(_tasks.values())
+    if not tasks:
+        return
+    for engine in list(_engines.values()):
+        engine.stop()
+    _, still_running = await asyncio.wait(tasks, timeout=timeout)
+    for task in still_running:
+        task.cancel()
+    await asyncio.gather(*still_running, return_exceptions=True)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Set-based bulk credit adjustments.
+
+``batch_update_user_credits`` used to run one ``UPDATE`` per user and mass
+gifts one ``add_user_credits`` call per user, so gifting 100k users meant
+100k statements. ``apply_credit_adjustments`` streams
+``(user_id, delta_message, delta_time)`` rows into a temporary table (with
+``COPY`` on PostgreSQL, ``executemany`` batches on SQLite), then applies them
+in one ``UPDATE ... FROM`` that also writes the matching ``transactions``
+ledger rows, all in a single transaction.
+
+Rows for the same user are summed. A user who does not exist, or whose
+balance the adjustment would take below zero, is skipped and counted. Time
+deltas are seconds, applied to ``time_credits_seconds`` like
+``add_user_credits(..., credit_type='time')``.
+
+Progress is reported through an optional ``progress(stage, rows)`` callback:
+``'staged'`` after each batch with the rows streamed so far, then
+``'applied'`` with the number of users updated.
+"""
+
+import io
+import logging
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from src import cache
+from src.database import db_manager, settings
+from src.query_stats import query_stats
+
+logger = logging.getLogger(__name__)
+
+Adjustment = Tuple[int, int, int]  # (user_id, delta_message, delta_time_seconds)
+ProgressCallback = Callable[[str, int], None]
+
+# Up to this many users are invalidated one by one; beyond it all per-user cache entries are dropped
+INVALIDATE_PER_USER_LIMIT = 1000
+
+STATEMENT_NAME = 'bulk_credit_adjustment'
+
+PG_CREATE_STAGING = """
+CREATE TEMP TABLE bulk_credit_deltas (
+    user_id BIGINT NOT NULL,
+    delta_message INTEGER NOT NULL,
+    delta_time INTEGER NOT NULL
+) ON COMMIT DROP
+"""
+
+PG_COPY = "COPY bulk_credit_deltas (user_id, delta_message, delta_time) FROM STDIN"
+
+# Sum per user, apply, and write ledger rows for what was applied, in one statement
+PG_APPLY = """
+WITH deltas AS (
+    SELECT user_id, SUM(delta_message) AS delta_message, SUM(delta_time) AS delta_time
+    FROM bulk_credit_deltas
+    GROUP BY user_id
+),
+updated AS (
+    UPDATE users u
+    SET message_credits = u.message_credits + d.delta_message,
+        time_credits_seconds = u.time_credits_seconds + d.delta_time,
+        updated_at = CURRENT_TIMESTAMP
+    FROM deltas d
+    WHERE u.telegram_id = d.user_id
+      AND u.message_credits + d.delta_message >= 0
+      AND u.time_credits_seconds + d.delta_time >= 0
+    RETURNING u.telegram_id, d.delta_message, d.delta_time
+),
+ledger AS (
+    INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
+    SELECT telegram_id, delta_message, %s, %s, CURRENT_TIMESTAMP FROM updated WHERE delta_message <> 0
+    UNION ALL
+    SELECT telegram_id, delta_time, %s, %s, CURRENT_TIMESTAMP FROM updated WHERE delta_time <> 0
+    RETURNING 1
+)
+SELECT (SELECT COUNT(*) FROM deltas) AS distinct_users,
+       (SELECT COUNT(*) FROM updated) AS users,
+       (SELECT COALESCE(SUM(delta_message), 0) FROM updated) AS message_credits,
+       (SELECT COALESCE(SUM(delta_time), 0) FROM updated) AS time_seconds,
+       (SELECT COUNT(*) FROM ledger) AS ledger_rows
+"""
+
+SQLITE_APPLY = [
+    """CREATE TEMP TABLE bulk_credit_totals AS
+       SELECT user_id, SUM(delta_message) AS delta_message, SUM(delta_time) AS delta_time
+       FROM bulk_credit_deltas GROUP BY user_id""",
+    """DELETE FROM bulk_credit_totals WHERE NOT EXISTS (
+           SELECT 1 FROM users u
+           WHERE u.telegram_id = bulk_credit_totals.user_id
+             AND u.message_credits + bulk_credit_totals.delta_message >= 0
+             AND u.time_credits_seconds + bulk_credit_totals.delta_time >= 0)""",
+    """UPDATE users
+       SET message_credits = message_credits + t.delta_message,
+           time_credits_seconds = time_credits_seconds + t.delta_time,
+           updated_at = datetime('now')
+       FROM bulk_credit_totals t
+       WHERE users.telegram_id = t.user_id""",
+]
+
+SQLITE_LEDGER = """
+INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
+SELECT user_id, delta_message, ?, ?, datetime('now') FROM bulk_credit_totals WHERE delta_message <> 0
+UNION ALL
+SELECT user_id, delta_time, ?, ?, datetime('now') FROM bulk_credit_totals WHERE delta_time <> 0
+"""
+
+
+class BulkAdjustmentResult(NamedTuple):
+    staged: int  # rows streamed in
+    users: int  # users whose balance changed
+    skipped: int  # distinct users not found or that would go negative
+    message_credits: int  # net message credits applied
+    time_seconds: int  # net time applied, in seconds
+    ledger_rows: int
+    elapsed: float  # seconds
+
+
+def _batches(adjustments: Iterable[Adjustment], size: int) -> Iterator[List[Adjustment]]:
+    iterator = iter(adjustments)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _copy_buffer(batch: List[Adjustment]) -> io.StringIO:
+    """Tab-separated COPY text for one batch (integers only, so no escaping)."""
+    return io.StringIO(''.join(f"{int(user)}\t{int(message)}\t{int(seconds)}\n"
+                               for user, message, seconds in batch))
+
+
+def _stage(adjustments: Iterable[Adjustment], write_batch: Callable[[List[Adjustment]], None],
+           progress: Optional[ProgressCallback], touched: Set[int]) -> int:
+    """Stream batches into the staging table; remembers users while few enough to invalidate singly."""
+    staged = 0
+    for batch in _batches(adjustments, int(getattr(settings, 'BULK_CREDIT_BATCH_SIZE', 10000))):
+        write_batch(batch)
+        staged += len(batch)
+        if len(touched) <= INVALIDATE_PER_USER_LIMIT:
+            touched.update(int(row[0]) for row in batch)
+        if progress:
+            progress('staged', staged)
+    return staged
+
+
+def _apply_postgresql(conn, adjustments, reason, description, progress, touched) -> tuple:
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = %s",
+                       (int(getattr(settings, 'BULK_CREDIT_STATEMENT_TIMEOUT_MS', 300000)),))
+        cursor.execute(PG_CREATE_STAGING)
+        staged = _stage(adjustments, lambda batch: cursor.copy_expert(PG_COPY, _copy_buffer(batch)),
+                        progress, touched)
+        cursor.execute(PG_APPLY, (reason, description, f"{reason}_time", description))
+        row = cursor.fetchone()
+    conn.commit()
+    return (staged, row['distinct_users'], row['users'], row['message_credits'],
+            row['time_seconds'], row['ledger_rows'])
+
+
+def _apply_sqlite(conn, adjustments, reason, description, progress, touched) -> tuple:
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("""CREATE TEMP TABLE bulk_credit_deltas (
+        user_id INTEGER NOT NULL, delta_message INTEGER NOT NULL, delta_time INTEGER NOT NULL)""")
+    staged = _stage(
+        adjustments,
+        lambda batch: cursor.executemany("INSERT INTO bulk_credit_deltas VALUES (?, ?, ?)", batch),
+        progress, touched)
+    distinct = cursor.execute("SELECT COUNT(DISTINCT user_id) FROM bulk_credit_deltas").fetchone()[0]
+    for statement in SQLITE_APPLY:
+        cursor.execute(statement)
+    cursor.execute(SQLITE_LEDGER, (reason, description, f"{reason}_time", description))
+    ledger_rows = cursor.rowcount
+    totals = cursor.execute(
+        "SELECT COUNT(*), COALESCE(SUM(delta_message), 0), COALESCE(SUM(delta_time), 0) FROM bulk_credit_totals"
+    ).fetchone()
+    cursor.execute("DROP TABLE bulk_credit_deltas")
+    cursor.execute("DROP TABLE bulk_credit_totals")
+    conn.commit()
+    return staged, distinct, totals[0], totals[1], totals[2], ledger_rows
+
+
+def apply_credit_adjustments(adjustments: Iterable[Adjustment], reason: str = 'bulk_adjustment',
+                             description: Optional[str] = None,
+                             progress: Optional[ProgressCallback] = None) -> Optional[BulkAdjustmentResult]:
+    """Apply ``(user_id, delta_message, delta_time)`` rows in one set-based transaction.
+
+    ``reason`` becomes the ledger ``transaction_type`` (``<reason>_time`` for
+    time rows). Returns None if the adjustment failed and was rolled back.
+    """
+    started = time.perf_counter()
+    pool_wait = None
+    touched: Set[int] = set()
+    try:
+        with db_manager.get_connection() as conn:
+            pool_wait = time.perf_counter() - started
+            apply = _apply_postgresql if db_manager._db_type == 'postgresql' else _apply_sqlite
+            staged, distinct, users, message_credits, time_seconds, ledger_rows = apply(
+                conn, adjustments, reason, description, progress, touched)
+    except Exception as e:
+        query_stats.record(STATEMENT_NAME, time.perf_counter() - started - (pool_wait or 0.0),
+                           pool_wait=pool_wait, error=True)
+        logger.error(f"Bulk credit adjustment failed and was rolled back: {e}")
+        return None
+
+    elapsed = time.perf_counter() - started
+    query_stats.record(STATEMENT_NAME, elapsed - pool_wait, users, pool_wait)
+
+    if users:
+        if len(touched) <= INVALIDATE_PER_USER_LIMIT:
+            for user_id in touched:
+                cache.invalidate_user_cache(user_id)
+        else:
+            cache.invalidate_all_user_caches()
+    if progress:
+        progress('applied', users)
+
+    result = BulkAdjustmentResult(staged, users, distinct - users, int(message_credits),
+                                  int(time_seconds), ledger_rows, elapsed)
+    logger.info(f"Bulk credit adjustment '{reason}': {users} users updated, {result.skipped} skipped, "
+                f"{result.message_credits} credits / {result.time_seconds}s time from {staged} rows "
+                f"in {elapsed:.2f}s")
+    return result
+
+
+def gift_users(user_ids: Iterable[int], message_credits: int = 0, time_seconds: int = 0,
+               reason: str = 'gift', description: Optional[str] = None,
+               progress: Optional[ProgressCallback] = None) -> Optional[BulkAdjustmentResult]:
+    """Give every user in ``user_ids`` the same credits and/or time."""
+    return apply_credit_adjustments(((user_id, message_credits, time_seconds) for user_id in user_ids),
+                                    reason, description, progress)
@@ -1,48 +1,906 @@
 #!/usr/bin/env python3
 """
-Simple caching system for bot settings and user data.
+Caching system for bot settings and user data.
+
+Entries live in a bounded in-process ``CacheEngine`` (L1): LRU eviction
+against an entry and byte budget, per-namespace TTLs with heap-driven expiry,
+and secondary indexes so a user's or a namespace's entries can be dropped
+without scanning the whole cache.
+
+When ``REDIS_URL`` is set, a shared Redis tier (L2) sits behind L1 so bot
+replicas share loaded values, and invalidations are broadcast over pub/sub so
+every replica drops its L1 copy. If Redis is unreachable the cache keeps
+working L1-only until it comes back.
 """
 
+import asyncio
+import heapq
+import itertools
+import json
+import queue
+import sys
+import threading
 import time
 import logging
-from typing import Dict, Any, Optional
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Set, List, Tuple, Callable, Awaitable
 
-logger = logging.getLogger(__name__)
+# Try to import redis, fall back to the in-process cache only if not available
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    redis = None
+    HAS_REDIS = False
 
-# Simple in-memory cache
-_cache: Dict[str, Dict[str, Any]] = {}
-_cache_timestamps: Dict[str, float] = {}
+try:
+    from src.config import settings
+except Exception:
+    # Standalone use (scripts, benchmarks) without the full configuration
+    settings = None
+
+logger = logging.getLogger(__name__)
 
 # Cache TTL settings (in seconds)
 SETTINGS_CACHE_TTL = 300  # 5 minutes
 USER_CACHE_TTL = 60       # 1 minute
 DEFAULT_TTL = 300         # 5 minutes
+NEGATIVE_CACHE_TTL = 30   # How long a "not found" (None) result is cached
+SETTINGS_STALE_TTL = 60   # Extra time a setting may be served stale while it reloads
 
+# TTL per namespace (the key prefix before the first ':')
+NAMESPACE_TTLS = {
+    'setting': SETTINGS_CACHE_TTL,
+    'user': USER_CACHE_TTL,
+}
 
-def _is_expired(key: str, ttl: int = DEFAULT_TTL) -> bool:
-    """Check if a cache entry is expired."""
-    if key not in _cache_timestamps:
-        return True
-    return time.time() - _cache_timestamps[key] > ttl
 
+class _Entry:
+    """A cached value plus the bookkeeping needed to expire and index it."""
+
+    __slots__ = ('value', 'stale_at', 'expires_at', 'created_at', 'size', 'namespace', 'user_id')
+
+    def __init__(self, value: Any, stale_at: float, expires_at: float, created_at: float, size: int,
+                 namespace: str, user_id: Optional[int]):
+        self.value = value
+        self.stale_at = stale_at
+        self.expires_at = expires_at
+        self.created_at = created_at
+        self.size = size
+        self.namespace = namespace
+        self.user_id = user_id
+
+
+def _parse_key(key: str) -> Tuple[str, Optional[int]]:
+    """Split ``namespace:...`` keys; ``user:<id>:...`` keys also carry the user ID."""
+    namespace, _, rest = key.partition(':')
+    user_id = None
+    if namespace == 'user':
+        owner = rest.partition(':')[0]
+        if owner.lstrip('-').isdigit():
+            user_id = int(owner)
+    return namespace, user_id
+
+
+def _estimate_size(key: str, value: Any) -> int:
+    """Approximate bytes held by an entry, computed once when it is stored."""
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+class CacheEngine:
+    """Thread-safe LRU + TTL cache with namespace and per-user invalidation."""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: Optional[int] = None,
+                 default_ttl: float = DEFAULT_TTL, namespace_ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.namespace_ttls = dict(namespace_ttls or {})
+
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()  # LRU order, oldest first
+        self._by_namespace: Dict[str, Set[str]] = {}
+        self._by_user: Dict[int, Set[str]] = {}
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._heap_seq = itertools.count()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def ttl_for(self, namespace: str) -> float:
+        """TTL applied to entries of ``namespace`` unless one is given explicitly."""
+        return self.namespace_ttls.get(namespace, self.default_ttl)
+
+    # --- internal helpers (call with the lock held) ---
+
+    def _unlink(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._bytes -= entry.size
+        keys = self._by_namespace.get(entry.namespace)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_namespace[entry.namespace]
+        if entry.user_id is not None:
+            keys = self._by_user.get(entry.user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry.user_id]
+        return entry
+
+    def _expire_due(self, now: float) -> int:
+        """Pop every heap item that is due; stale heap items for rewritten keys are skipped."""
+        expired = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self._unlink(key)
+                expired += 1
+        self.expirations += expired
+        return expired
+
+    def _compact_heap(self) -> None:
+        """Rebuild the heap when overwritten keys have left too many stale items in it."""
+        if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [(entry.expires_at, next(self._heap_seq), key)
+                                 for key, entry in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _evict_over_budget(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._unlink(oldest)
+            self.evictions += 1
+
+    # --- public API ---
+
+    def lookup(self, key: str) -> Tuple[str, Any]:
+        """Return ``('fresh' | 'stale' | 'miss', value)``, refreshing the LRU position on a hit.
+
+        An entry is stale once its TTL has passed but it is still inside the
+        stale window it was stored with (see ``set(stale_ttl=...)``).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return 'miss', None
+            now = time.monotonic()
+            if entry.expires_at <= now:
+                self._unlink(key)
+                self.expirations += 1
+                self.misses += 1
+                return 'miss', None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry.stale_at <= now:
+                self.stale_hits += 1
+                return 'stale', entry.value
+            return 'fresh', entry.value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached (possibly stale) value, or ``default``."""
+        state, value = self.lookup(key)
+        return default if state == 'miss' else value
+
+    def contains(self, key: str) -> bool:
+        """True if ``key`` holds an unexpired value (does not touch counters or LRU order)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.expires_at > time.monotonic()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, stale_ttl: float = 0.0) -> None:
+        """Store ``value`` under ``key`` with its namespace TTL (or ``ttl``).
+
+        With ``stale_ttl`` the entry is kept that much longer past its TTL and
+        reported as stale by ``lookup`` so callers can revalidate it.
+        """
+        namespace, user_id = _parse_key(key)
+        now = time.monotonic()
+        stale_at = now + (self.ttl_for(namespace) if ttl is None else ttl)
+        expires_at = stale_at + stale_ttl
+        entry = _Entry(value, stale_at, expires_at, now, _estimate_size(key, value), namespace, user_id)
+
+        with self._lock:
+            self._unlink(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._by_namespace.setdefault(namespace, set()).add(key)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(key)
+            heapq.heappush(self._expiry_heap, (expires_at, next(self._heap_seq), key))
+
+            self._expire_due(now)
+            self._evict_over_budget()
+            self._compact_heap()
+
+    def delete(self, key: str) -> bool:
+        """Remove ``key``; True if it was cached."""
+        with self._lock:
+            removed = self._unlink(key) is not None
+            if removed:
+                self.invalidations += 1
+            return removed
+
+    def invalidate_user(self, user_id: int) -> int:
+        """Drop every entry owned by ``user_id``; returns the number removed."""
+        with self._lock:
+            keys = self._by_user.pop(user_id, set())
+            for key in list(keys):
+                self._unlink(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        """Drop every entry in ``namespace``; returns the number removed."""
+        with self._lock:
+            keys = self._by_namespace.pop(namespace, set())
+            for key in list(keys):
+                self._unlink(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def cleanup_expired(self) -> int:
+        """Remove every expired entry; returns the number removed."""
+        with self._lock:
+            expired = self._expire_due(time.monotonic())
+            self._compact_heap()
+            return expired
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_namespace.clear()
+            self._by_user.clear()
+            self._expiry_heap.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            expired = sum(1 for entry in self._entries.values() if entry.expires_at <= now)
+            lookups = self.hits + self.misses
+            return {
+                'total_entries': len(self._entries),
+                'valid_entries': len(self._entries) - expired,
+                'expired_entries': expired,
+                'cache_size_bytes': self._bytes,
+                'oldest_entry_age': (now - min(e.created_at for e in self._entries.values())
+                                     if self._entries else 0),
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'namespaces': {ns: len(keys) for ns, keys in self._by_namespace.items()},
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class RedisTier:
+    """Shared L2 cache in Redis plus pub/sub invalidation between replicas.
+
+    Reads are synchronous (they only happen on an L1 miss, in place of a
+    database query). Writes and invalidations are queued to a background
+    thread so callers on the message path never wait on Redis. After an error
+    the tier is skipped for ``retry_interval`` seconds (L1-only mode).
+
+    An invalidation leaves a tombstone for ``tombstone_ttl`` seconds, and a
+    queued set is only written while no tombstone covers its key. A value
+    loaded before another replica's write therefore cannot land in Redis
+    after that replica's delete.
+    """
+
+    def __init__(self, client, prefix: str = 'nsxo:cache:', retry_interval: float = 30.0,
+                 tombstone_ttl: float = 2.0,
+                 on_invalidate: Optional[Callable[[str, Any], None]] = None,
+                 on_reconnect: Optional[Callable[[], None]] = None):
+        self.client = client
+        self.prefix = prefix
+        self.channel = f"{prefix}invalidate"
+        self.retry_interval = retry_interval
+        self.tombstone_ttl = tombstone_ttl
+        self.origin = uuid.uuid4().hex
+        self.on_invalidate = on_invalidate
+        self.on_reconnect = on_reconnect
+
+        self._down_until = 0.0
+        self._outbox: "queue.Queue[tuple]" = queue.Queue(maxsize=10000)
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.dropped = 0
+        self.superseded = 0
+        self.published = 0
+        self.received = 0
+
+        self._threads = [
+            threading.Thread(target=self._drain_outbox, name='cache-l2-writer', daemon=True),
+            threading.Thread(target=self._listen, name='cache-l2-listener', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _failed(self, error: Exception) -> None:
+        self.errors += 1
+        if self.available:
+            logger.warning(f"Redis cache unavailable, using in-process cache only: {error}")
+        self._down_until = time.monotonic() + self.retry_interval
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _index_key(self, kind: str, name: Any) -> str:
+        return f"{self.prefix}idx:{kind}:{name}"
+
+    def _tombstone_key(self, kind: str, name: Any = None) -> str:
+        return f"{self.prefix}tomb:{kind}:{name}"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return ``(found, value)`` from Redis; ``(False, None)`` when down."""
+        if not self.available:
+            return False, None
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            self._failed(e)
+            return False, None
+        if raw is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, json.loads(raw)
+
+    def _enqueue(self, op: tuple) -> bool:
+        if not self.available:
+            self.dropped += 1
+            return False
+        try:
+            self._outbox.put_nowait(op)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def set(self, key: str, value: Any, ttl: float,
+            still_valid: Optional[Callable[[], bool]] = None) -> None:
+        """Queue a write; it is skipped if ``still_valid()`` is false by the time it runs."""
+        self._enqueue(('set', key, value, ttl, still_valid))
+
+    def invalidate(self, kind: str, arg: Any = None, on_done: Optional[Callable[[], None]] = None) -> None:
+        """Delete from Redis and tell other replicas to drop ``kind``/``arg`` from L1.
+
+        ``on_done`` runs once the delete has been applied (or dropped).
+        """
+        if not self._enqueue(('invalidate', kind, arg, on_done)) and on_done:
+            on_done()
+
+    def _write_set(self, key: str, value: Any, ttl: float) -> None:
+        namespace, user_id = _parse_key(key)
+        tombstones = [self._tombstone_key('key', key), self._tombstone_key('ns', namespace),
+                      self._tombstone_key('clear')]
+        if user_id is not None:
+            tombstones.append(self._tombstone_key('user', user_id))
+        ttl_ms = max(1, int(ttl * 1000))
+        pipe = self.client.pipeline()
+        try:
+            # WATCH makes the tombstone check and the write atomic against a concurrent delete
+            pipe.watch(*tombstones)
+            if pipe.exists(*tombstones):
+                self.superseded += 1
+                return
+            pipe.multi()
+            pipe.set(self._key(key), json.dumps(value, default=str), px=ttl_ms)
+            # Index sets let a user's or namespace's keys be deleted without SCAN
+            pipe.sadd(self._index_key('ns', namespace), key)
+            if user_id is not None:
+                pipe.sadd(self._index_key('user', user_id), key)
+                pipe.pexpire(self._index_key('user', user_id), ttl_ms)
+            pipe.execute()
+        except redis.WatchError:
+            self.superseded += 1
+        finally:
+            pipe.reset()
+
+    def _write(self, op: tuple) -> None:
+        if op[0] == 'set':
+            _, key, value, ttl, still_valid = op
+            if still_valid is not None and not still_valid():
+                self.superseded += 1
+                return
+            self._write_set(key, value, ttl)
+            return
+
+        _, kind, arg, _ = op
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._tombstone_key(kind, arg if kind != 'clear' else None), 1,
+                 px=max(1, int(self.tombstone_ttl * 1000)))
+        if kind == 'key':
+            keys = [arg]
+        elif kind in ('user', 'ns'):
+            index = self._index_key(kind, arg)
+            keys = list(self.client.smembers(index))
+            pipe.delete(index)
+        else:  # clear
+            keys = [k[len(self.prefix):] for k in self.client.scan_iter(match=f"{self.prefix}*")]
+        if keys:
+            pipe.delete(*(self._key(k) for k in keys))
+        pipe.publish(self.channel, json.dumps({'origin': self.origin, 'kind': kind, 'arg': arg}))
+        pipe.execute()
+        self.published += 1
+
+    def _drain_outbox(self) -> None:
+        while not self._stop.is_set():
+            try:
+                op = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if not self.available:
+                # Stale L2 entries still expire on their TTL
+                self.dropped += 1
+                if op[0] == 'invalidate' and op[3] is not None:
+                    op[3]()
+                continue
+            try:
+                self._write(op)
+            except Exception as e:
+                self._failed(e)
+            finally:
+                if op[0] == 'invalidate' and op[3] is not None:
+                    op[3]()
+
+    def _listen(self) -> None:
+        had_connection = False
+        while not self._stop.is_set():
+            if not self.available:
+                time.sleep(1.0)
+                continue
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if had_connection and self.on_reconnect:
+                    # Invalidations may have been missed while disconnected
+                    self.on_reconnect()
+                had_connection = True
+                while not self._stop.is_set() and self.available:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self._handle(message['data'])
+                pubsub.close()
+            except Exception as e:
+                self._failed(e)
+
+    def _handle(self, data) -> None:
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if payload.get('origin') == self.origin:
+            return
+        self.received += 1
+        if self.on_invalidate:
+            self.on_invalidate(payload.get('kind'), payload.get('arg'))
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'available': self.available,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'dropped_writes': self.dropped,
+            'superseded_writes': self.superseded,
+            'pending_writes': self._outbox.qsize(),
+            'invalidations_published': self.published,
+            'invalidations_received': self.received,
+        }
+
+
+_MISSING = object()
+
+
+class _Call:
+    """One in-flight load that concurrent callers wait on."""
+
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent loads of the same key into one call.
+
+    ``do`` serves threads (sync helpers running on the DB executor); ``ado``
+    serves coroutines on the event loop. Waiters share the leader's result or
+    exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls or key in self._futures
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.loads += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
 
-def _set_cache(key: str, value: Any, ttl: int = DEFAULT_TTL) -> None:
-    """Set a cache entry."""
-    _cache[key] = value
-    _cache_timestamps[key] = time.time()
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = asyncio.get_running_loop().create_future()
+                self.loads += 1
+            else:
+                self.coalesced += 1
 
+        if not leader:
+            return await asyncio.shield(future)
 
-def _get_cache(key: str, ttl: int = DEFAULT_TTL) -> Optional[Any]:
-    """Get a cache entry if not expired."""
-    if key not in _cache or _is_expired(key, ttl):
+        try:
+            value = await fn()
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'loads': self.loads, 'loads_saved': self.coalesced, 'in_flight': len(self._calls) + len(self._futures)}
+
+# Callbacks run as (kind, arg) for every invalidation, local or from another replica
+_invalidation_listeners: List[Callable[[str, Any], None]] = []
+
+
+def add_invalidation_listener(callback: Callable[[str, Any], None]) -> None:
+    """Call ``callback(kind, arg)`` on each invalidation ('key', 'user', 'ns' or 'clear')."""
+    _invalidation_listeners.append(callback)
+
+
+# Invalidation generations, hashed into fixed buckets. A load snapshots the
+# buckets covering its key and only stores its result if none changed, so a
+# value read before a concurrent write is never cached after it.
+_GENERATION_BUCKETS = 1024
+
+
+class TieredCache:
+    """L1 ``CacheEngine`` in front of an optional shared ``RedisTier``.
+
+    ``get_or_load`` / ``aget_or_load`` add single-flight loading, negative
+    caching of ``None`` and optional stale-while-revalidate on top.
+    """
+
+    def __init__(self, l1: CacheEngine, l2_client=None, **l2_options):
+        self.l1 = l1
+        self.l2: Optional[RedisTier] = None
+        self._flight = SingleFlight()
+        self._generations = [0] * _GENERATION_BUCKETS
+        # Invalidations whose Redis delete is still queued; L2 is not read under them
+        self._pending = [0] * _GENERATION_BUCKETS
+        self._pending_lock = threading.Lock()
+        self._refresh_pool: Optional[ThreadPoolExecutor] = None
+        self.negative_hits = 0
+        self.negative_stores = 0
+        self.stale_served = 0
+        self.background_refreshes = 0
+        self.discarded_loads = 0
+        if l2_client is not None:
+            self.l2 = RedisTier(l2_client, on_invalidate=self._apply_remote,
+                                on_reconnect=lambda: self._apply_remote('clear', None), **l2_options)
+
+    def _bucket(self, *parts) -> int:
+        return hash(parts) % _GENERATION_BUCKETS
+
+    def _buckets(self, key: str) -> Tuple[int, ...]:
+        namespace, user_id = _parse_key(key)
+        return (self._bucket('key', key), self._bucket('ns', namespace),
+                self._bucket('user', user_id), self._bucket('clear'))
+
+    def _stamp(self, key: str) -> Tuple[int, ...]:
+        g = self._generations
+        return tuple(g[b] for b in self._buckets(key))
+
+    def _read_l2(self, key: str) -> Tuple[bool, Any, Tuple[int, ...]]:
+        """L2 lookup returning ``(found, value, stamp)``.
+
+        Misses while this replica's delete covering ``key`` is still queued,
+        and when an invalidation lands during the read.
+        """
+        stamp = self._stamp(key)
+        if any(self._pending[b] for b in self._buckets(key)):
+            return False, None, stamp
+        found, value = self.l2.get(key)
+        if found and stamp != self._stamp(key):
+            self.discarded_loads += 1
+            return False, None, stamp
+        return found, value, stamp
+
+    def _apply_remote(self, kind: str, arg: Any) -> None:
+        """Apply an invalidation (local or published by another replica) to L1."""
+        if kind == 'user':
+            arg = int(arg)
+        self._generations[self._bucket(kind, arg) if kind != 'clear' else self._bucket('clear')] += 1
+        if kind == 'key':
+            self.l1.delete(arg)
+        elif kind == 'user':
+            self.l1.invalidate_user(arg)
+        elif kind == 'ns':
+            self.l1.invalidate_namespace(arg)
+        elif kind == 'clear':
+            self.l1.clear()
+        for listener in _invalidation_listeners:
+            try:
+                listener(kind, arg)
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed: {e}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.l2 is not None:
+            found, value, _ = self._read_l2(key)
+            if found:
+                self.l1.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, stale_ttl: float = 0.0) -> None:
+        self.l1.set(key, value, ttl, stale_ttl)
+        if self.l2 is not None:
+            stamp = self._stamp(key)
+            self.l2.set(key, value, self.l1.ttl_for(_parse_key(key)[0]) if ttl is None else ttl,
+                        still_valid=lambda: stamp == self._stamp(key))
+
+    def _store_loaded(self, key: str, value: Any, stamp: Tuple[int, ...], ttl: Optional[float],
+                      negative_ttl: Optional[float], stale_ttl: float) -> None:
+        if value is None:
+            if negative_ttl is None:
+                return
+            ttl, stale_ttl = negative_ttl, 0.0
+            self.negative_stores += 1
+        if stamp != self._stamp(key):
+            # Invalidated while loading: the value may predate the write
+            self.discarded_loads += 1
+            return
+        self.set(key, value, ttl, stale_ttl)
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl, negative_ttl, stale_ttl) -> Any:
+        stamp = self._stamp(key)
+        value = loader()
+        self._store_loaded(key, value, stamp, ttl, negative_ttl, stale_ttl)
+        return value
+
+    async def _aload(self, key: str, loader: Callable[[], Awaitable[Any]], ttl, negative_ttl, stale_ttl) -> Any:
+        stamp = self._stamp(key)
+        value = await loader()
+        self._store_loaded(key, value, stamp, ttl, negative_ttl, stale_ttl)
+        return value
+
+    def _cached(self, key: str) -> Tuple[str, Any]:
+        """L1 lookup that counts negative hits."""
+        state, value = self.l1.lookup(key)
+        if state == 'fresh' and value is None:
+            self.negative_hits += 1
+        return state, value
+
+    def _revalidate(self, key: str, loader: Callable[[], Any], *options) -> None:
+        if self._flight.in_flight(key):
+            return
+        if self._refresh_pool is None:
+            self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+        self.background_refreshes += 1
+
+        def refresh() -> None:
+            try:
+                self._flight.do(key, lambda: self._load(key, loader, *options))
+            except Exception as e:
+                logger.warning(f"Background refresh of {key} failed: {e}")
+
+        self._refresh_pool.submit(refresh)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None,
+                    negative_ttl: Optional[float] = None, stale_ttl: float = 0.0) -> Any:
+        """Return the cached value, loading it once for all concurrent callers on a miss.
+
+        ``None`` results are cached for ``negative_ttl`` seconds when given.
+        With ``stale_ttl`` an expired value is returned for that long while a
+        background refresh runs. Loader exceptions propagate and are not cached.
+        """
+        state, value = self._cached(key)
+        if state == 'fresh':
+            return value
+        if state == 'stale':
+            self.stale_served += 1
+            self._revalidate(key, loader, ttl, negative_ttl, stale_ttl)
+            return value
+        if self.l2 is not None:
+            found, value, _ = self._read_l2(key)
+            if found:
+                self.l1.set(key, value, ttl, stale_ttl)
+                return value
+        return self._flight.do(key, lambda: self._load(key, loader, ttl, negative_ttl, stale_ttl))
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None,
+                           negative_ttl: Optional[float] = None, stale_ttl: float = 0.0) -> Any:
+        """Coroutine version of ``get_or_load`` for async loaders."""
+        state, value = self._cached(key)
+        if state == 'fresh':
+            return value
+        if state == 'stale':
+            self.stale_served += 1
+            if not self._flight.in_flight(key):
+                self.background_refreshes += 1
+                asyncio.get_running_loop().create_task(self._arefresh(key, loader, ttl, negative_ttl, stale_ttl))
+            return value
+        if self.l2 is not None:
+            found, value, stamp = await asyncio.get_running_loop().run_in_executor(None, self._read_l2, key)
+            if found and stamp == self._stamp(key):
+                self.l1.set(key, value, ttl, stale_ttl)
+                return value
+        return await self._flight.ado(key, lambda: self._aload(key, loader, ttl, negative_ttl, stale_ttl))
+
+    async def _arefresh(self, key: str, loader, *options) -> None:
+        try:
+            await self._flight.ado(key, lambda: self._aload(key, loader, *options))
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {e}")
+
+    def _invalidate(self, kind: str, arg: Any) -> None:
+        if self.l2 is None:
+            self._apply_remote(kind, arg)
+            return
+        bucket = self._bucket(kind, int(arg) if kind == 'user' else arg) if kind != 'clear' else self._bucket('clear')
+        with self._pending_lock:
+            self._pending[bucket] += 1
+
+        def done() -> None:
+            with self._pending_lock:
+                self._pending[bucket] -= 1
+
+        # Mark pending before clearing L1 so a reader that then misses L1 skips the stale L2 copy
+        self._apply_remote(kind, arg)
+        self.l2.invalidate(kind, arg, on_done=done)
+
+    def delete(self, key: str) -> None:
+        self._invalidate('key', key)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._invalidate('user', user_id)
+
+    def invalidate_namespace(self, namespace: str) -> None:
+        self._invalidate('ns', namespace)
+
+    def clear(self) -> None:
+        self._invalidate('clear', None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.l1.get_stats()
+        stats['l2'] = self.l2.get_stats() if self.l2 is not None else None
+        stats['loading'] = {
+            **self._flight.get_stats(),
+            'negative_hits': self.negative_hits,
+            'negative_stores': self.negative_stores,
+            'stale_served': self.stale_served,
+            'background_refreshes': self.background_refreshes,
+            'discarded_loads': self.discarded_loads,
+        }
+        return stats
+
+
+def _connect_redis(url: Optional[str]):
+    """Redis client for ``url`` with short timeouts, or None when not configured."""
+    if not (HAS_REDIS and url):
+        return None
+    try:
+        return redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25,
+                                    health_check_interval=30, decode_responses=True)
+    except Exception as e:
+        logger.warning(f"Invalid REDIS_URL, using in-process cache only: {e}")
         return None
-    return _cache[key]
+
+
+# Process-wide cache instances
+_engine = CacheEngine(
+    max_entries=int(getattr(settings, 'CACHE_MAX_ENTRIES', 10000)),
+    max_bytes=getattr(settings, 'CACHE_MAX_BYTES', None),
+    namespace_ttls=NAMESPACE_TTLS,
+)
+_cache = TieredCache(_engine, _connect_redis(getattr(settings, 'REDIS_URL', None)))
+
+
+def configure_redis(client) -> None:
+    """Attach (or with None, detach) the shared Redis tier, e.g. a fakeredis client."""
+    global _cache
+    if _cache.l2 is not None:
+        _cache.l2.close()
+    _cache = TieredCache(_engine, client)
+
+
+def _is_expired(key: str, ttl: int = DEFAULT_TTL) -> bool:
+    """Check if a cache entry is expired (or missing) in L1."""
+    return not _engine.contains(key)
+
+
+def _set_cache(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    """Set a cache entry; ``ttl`` defaults to the key's namespace TTL."""
+    _cache.set(key, value, ttl)
+
+
+def _get_cache(key: str, ttl: Optional[int] = None) -> Optional[Any]:
+    """Get a cache entry if not expired (the TTL is fixed when the entry is set)."""
+    return _cache.get(key)
 
 
 def _delete_cache(key: str) -> None:
-    """Delete a cache entry."""
-    _cache.pop(key, None)
-    _cache_timestamps.pop(key, None)
+    """Delete a cache entry on every replica."""
+    _cache.delete(key)
 
 
 def get_setting_cached(setting_key: str) -> Optional[str]:
@@ -55,27 +913,14 @@ def get_setting_cached(setting_key: str) -> Optional[str]:
     Returns:
         The setting value or None if not found
     """
-    cache_key = f"setting:{setting_key}"
-
-    # Try cache first
-    cached_value = _get_cache(cache_key, SETTINGS_CACHE_TTL)
-    if cached_value is not None:
-        return cached_value
-
-    # Fallback to getting setting without cache
     try:
         # Import here to avoid circular imports
-        from bot import get_setting
-        value = get_setting(setting_key)
-
-        # Cache the result
-        if value is not None:
-            _set_cache(cache_key, value, SETTINGS_CACHE_TTL)
-
-        return value
-    except ImportError:
-        logger.warning("Could not import get_setting function")
-        return None
+        from src.database import get_setting
+        # Missing settings are cached too; an expired value is served while it reloads
+        return _cache.get_or_load(
+            f"setting:{setting_key}", lambda: get_setting(setting_key), SETTINGS_CACHE_TTL,
+            negative_ttl=NEGATIVE_CACHE_TTL, stale_ttl=SETTINGS_STALE_TTL
+        )
     except Exception as e:
         logger.error(f"Error getting setting {setting_key}: {e}")
         return None
@@ -88,28 +933,35 @@ def invalidate_user_cache(user_id: int) -> None:
     Args:
         user_id: The user ID to invalidate cache for
     """
-    keys_to_delete = []
-    for key in _cache.keys():
-        if key.startswith(f"user:{user_id}:"):
-            keys_to_delete.append(key)
+    _cache.invalidate_user(user_id)
+    logger.debug(f"Invalidated cache entries for user {user_id}")
 
-    for key in keys_to_delete:
-        _delete_cache(key)
 
-    logger.debug(f"Invalidated {len(keys_to_delete)} cache entries for user {user_id}")
+def invalidate_all_user_caches() -> None:
+    """Invalidate every per-user entry on every replica (after bulk credit changes)."""
+    _cache.invalidate_namespace('user')
+    logger.debug("Invalidated all per-user cache entries")
 
 
 def invalidate_settings_cache() -> None:
     """Invalidate all settings cache entries."""
-    keys_to_delete = []
-    for key in _cache.keys():
-        if key.startswith("setting:"):
-            keys_to_delete.append(key)
+    _cache.invalidate_namespace('setting')
+    logger.debug("Invalidated settings cache entries")
+
+
+def invalidate_setting_cache(setting_key: str) -> None:
+    """Invalidate one setting on every replica."""
+    _delete_cache(f"setting:{setting_key}")
+
 
-    for key in keys_to_delete:
-        _delete_cache(key)
+def invalidate_user_topic(user_id: int) -> None:
+    """Tell every replica that the user's forum topic changed (the key is user-scoped, nothing is stored)."""
+    _delete_cache(f"user:{user_id}:topic")
 
-    logger.debug(f"Invalidated {len(keys_to_delete)} settings cache entries")
+
+def invalidate_products_cache() -> None:
+    """Invalidate all product cache entries."""
+    _cache.invalidate_namespace('product')
 
 
 def get_user_credits_cached(user_id: int) -> Optional[int]:
@@ -122,27 +974,26 @@ def get_user_credits_cached(user_id: int) -> Optional[int]:
     Returns:
         The user's credits or None if not found
     """
-    cache_key = f"user:{user_id}:credits"
-
-    # Try cache first
-    cached_value = _get_cache(cache_key, USER_CACHE_TTL)
-    if cached_value is not None:
-        return cached_value
-
-    # Fallback to getting credits without cache
     try:
         # Import here to avoid circular imports
-        from bot import get_user_credits
-        credits = get_user_credits(user_id)
+        from src.database import get_user_credits_optimized
+        return _cache.get_or_load(
+            f"user:{user_id}:credits", lambda: get_user_credits_optimized(user_id), USER_CACHE_TTL,
+            negative_ttl=NEGATIVE_CACHE_TTL
+        )
+    except Exception as e:
+        logger.error(f"Error getting credits for user {user_id}: {e}")
+        return None
 
-        # Cache the result
-        if credits is not None:
-            _set_cache(cache_key, credits, USER_CACHE_TTL)
 
-        return credits
-    except ImportError:
-        logger.warning("Could not import get_user_credits function")
-        return None
+async def get_user_credits_cached_async(user_id: int) -> Optional[int]:
+    """Coroutine version of get_user_credits_cached using the async database helpers."""
+    try:
+        from src.async_database import get_user_credits_optimized
+        return await _cache.aget_or_load(
+            f"user:{user_id}:credits", lambda: get_user_credits_optimized(user_id), USER_CACHE_TTL,
+            negative_ttl=NEGATIVE_CACHE_TTL
+        )
     except Exception as e:
         logger.error(f"Error getting credits for user {user_id}: {e}")
         return None
@@ -163,41 +1014,16 @@ def set_user_credits_cache(user_id: int, credits: int) -> None:
 def clear_all_cache() -> None:
     """Clear all cache entries."""
     _cache.clear()
-    _cache_timestamps.clear()
     logger.info("Cleared all cache entries")
 
 
 def get_cache_stats() -> Dict[str, Any]:
     """Get cache statistics."""
-    now = time.time()
-    expired_count = 0
-    valid_count = 0
-
-    for key, timestamp in _cache_timestamps.items():
-        if now - timestamp > DEFAULT_TTL:
-            expired_count += 1
-        else:
-            valid_count += 1
-
-    return {
-        'total_entries': len(_cache),
-        'valid_entries': valid_count,
-        'expired_entries': expired_count,
-        'cache_size_bytes': sum(len(str(v)) for v in _cache.values()),
-        'oldest_entry_age': now - min(_cache_timestamps.values()) if _cache_timestamps else 0
-    }
+    return _cache.get_stats()
 
 
 def cleanup_expired_cache() -> int:
     """Clean up expired cache entries and return count of removed entries."""
-    keys_to_delete = []
-
-    for key in _cache.keys():
-        if _is_expired(key):
-            keys_to_delete.append(key)
-
-    for key in keys_to_delete:
-        _delete_cache(key)
-
-    logger.debug(f"Cleaned up {len(keys_to_delete)} expired cache entries")
-    return len(keys_to_delete)
\ No newline at end of file
+    removed = _engine.cleanup_expired()
+    logger.debug(f"Cleaned up {removed} expired cache entries")
+    return removed
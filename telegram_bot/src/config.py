@@ -31,6 +31,73 @@ class Settings(BaseSettings):
     REDIS_URL: Optional[str] = None
     SENTRY_DSN: Optional[str] = None
 
+    # --- Database Tuning ---
+    DB_EXECUTOR_TIMEOUT: float = 10.0  # Seconds a query may wait + run on the DB executor
+    DB_POOL_MIN: int = 1  # Connections kept open when idle
+    DB_POOL_MAX: int = 10  # Size from the pool's suggested_max under real load (admin Database Health)
+    DB_POOL_TIMEOUT: float = 5.0  # Seconds a caller waits for a free connection before failing
+    DB_POOL_MAX_USES: int = 5000  # Recycle a connection after this many checkouts (0 = never)
+    DB_POOL_MAX_LIFETIME: float = 1800.0  # Recycle a connection after this many seconds (0 = never)
+    DB_POOL_IDLE_TIMEOUT: float = 300.0  # Close connections above DB_POOL_MIN idle this long
+    DB_POOL_VALIDATE_AFTER: float = 30.0  # Check a connection idle this long before handing it out
+    DB_KEEPALIVES_IDLE: int = 30  # TCP keepalive probes after this many idle seconds
+    DB_STATEMENT_TIMEOUT_MS: int = 10000  # Message-path (OLTP) statements are cancelled after this (0 = no limit)
+    DB_ANALYTICS_POOL_MAX: int = 3  # Separate connections for dashboards and searches
+    DB_ANALYTICS_STATEMENT_TIMEOUT_MS: int = 30000  # Dashboard and search statements are cancelled after this
+    DB_ANALYTICS_URL: Optional[str] = None  # Optional read replica for analytics statements (defaults to DATABASE_URL)
+    DATABASE_REPLICA_URL: Optional[str] = None  # Read replica for read-only statements (a SQLite file path locally)
+    DB_READ_YOUR_WRITES_S: float = 10.0  # Seconds a user's reads stay on the primary after they write
+    DB_REPLICA_MAX_LAG_S: float = 5.0  # Fall back to the primary while the replica lags more than this
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = 5.0  # Seconds between replica lag checks
+    CREDIT_RESERVATION_TTL: int = 120  # Seconds a credit hold lives before it is released (a later commit charges it again)
+    CREDIT_RESERVATION_SWEEP_INTERVAL: float = 30.0  # Seconds between expired-hold sweeps
+    BULK_CREDIT_BATCH_SIZE: int = 10000  # Rows staged per COPY / executemany batch in bulk credit adjustments
+    BULK_CREDIT_STATEMENT_TIMEOUT_MS: int = 300000  # Statement timeout for applying a bulk credit adjustment
+    DB_PREPARED_STATEMENTS: bool = False  # Run named queries as server-side prepared statements (not behind PgBouncer transaction pooling)
+    SLOW_QUERY_MS: float = 250.0  # Queries slower than this are logged (parameters redacted)
+    SLOW_QUERY_EXPLAIN: bool = False  # Log an EXPLAIN ANALYZE sample for slow read-only queries (PostgreSQL)
+    SLOW_QUERY_EXPLAIN_INTERVAL: float = 300.0  # Minimum seconds between EXPLAIN samples per statement
+    METRICS_PORT: Optional[int] = None  # Serve per-query metrics on /metrics on this port
+
+    # --- Broadcast Tuning ---
+    BROADCAST_RATE_PER_SEC: float = 25.0  # Broadcast messages per second overall (Telegram allows ~30)
+    BROADCAST_PER_CHAT_INTERVAL: float = 1.0  # Minimum seconds between messages to the same chat
+    BROADCAST_CONCURRENCY: int = 8  # Sends in flight at once per broadcast
+    BROADCAST_PAGE_SIZE: int = 1000  # Recipient IDs read per keyset page
+    BROADCAST_CHECKPOINT_INTERVAL: float = 2.0  # Seconds between progress checkpoints
+    BROADCAST_LEASE_S: int = 60  # A job whose owner stops checkpointing this long is resumed elsewhere
+    BROADCAST_MAX_ATTEMPTS: int = 5  # Send attempts per recipient on timeouts and network errors
+
+    # --- Outbound Tuning ---
+    OUTBOUND_RATE_PER_SEC: float = 30.0  # Bot API sends per second across all lanes
+    OUTBOUND_CHAT_INTERVAL: float = 1.0  # Minimum seconds between sends to the same private chat
+    OUTBOUND_CHAT_BURST: int = 3  # Sends to a private chat allowed back to back before the interval applies
+    OUTBOUND_GROUP_INTERVAL: float = 3.0  # Minimum seconds between sends to the same group (Telegram allows ~20/min)
+    OUTBOUND_WORKERS: int = 8  # Sends in flight at once
+    OUTBOUND_MAX_RETRIES: int = 5  # Retries of a send answered with RetryAfter
+    OUTBOUND_COALESCE_WINDOW: float = 30.0  # Seconds a keyed notification suppresses identical ones
+
+    # --- Update Processing ---
+    UPDATE_CONCURRENCY: int = 32  # Updates handled at once, in order per user/topic (1 = one at a time)
+
+    # --- Reply Routing ---
+    REPLY_MAP_MAX_ENTRIES: int = 50000  # Recent forwarded-message routes kept in memory (~200 bytes each)
+    REPLY_MAP_FLUSH_INTERVAL: float = 1.0  # Seconds between batched writes of new routes
+    REPLY_MAP_BATCH_SIZE: int = 500  # Routes per insert; a full batch is written at once
+    REPLY_MAP_RETENTION_DAYS: int = 90  # Routes older than this are purged (replies to them go unrouted)
+
+    # --- Persistence ---
+    PERSISTENCE_ENABLED: bool = True  # Keep user_data, chat_data, bot_data and conversation states in the database
+    PERSISTENCE_FLUSH_INTERVAL: float = 30.0  # Seconds between batched writes of changed state
+    PERSISTENCE_IDLE_TTL: float = 86400.0  # Seconds without updates before a user's data leaves memory (it stays stored)
+    PERSISTENCE_RETENTION_DAYS: int = 180  # User/chat data unchanged for this long is deleted
+    PERSISTENCE_COMPRESS_MIN_BYTES: int = 512  # Serialized values at least this large are zlib-compressed
+
+    # --- Cache Tuning ---
+    CACHE_MAX_ENTRIES: int = 10000  # LRU eviction beyond this many entries
+    CACHE_MAX_BYTES: Optional[int] = None  # Optional approximate memory budget
+    SETTINGS_SNAPSHOT_TTL: float = 60.0  # Seconds before the settings snapshot is reloaded
+
 # Create a single, globally accessible instance of the settings
 try:
     settings = Settings()
@@ -3,11 +3,15 @@
 Enhanced database management with connection pooling and performance optimizations.
 """
 
+import asyncio
 import logging
+import random
+import threading
 import time
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Optional, Any, Dict, List, Generator, Union
+from typing import Optional, Any, Dict, List, Generator, Union, Callable, NamedTuple, Tuple
 import os
 from datetime import datetime, timedelta
 
@@ -34,35 +38,142 @@ except ImportError:
     # Fallback settings for standalone operation
     class FallbackSettings:
         DATABASE_URL: Optional[str] = None
+        DATABASE_REPLICA_URL: Optional[str] = os.getenv('DATABASE_REPLICA_URL')
         class Database:
             MIN_CONNECTIONS: int = 1
             MAX_CONNECTIONS: int = 20
             RETRY_DELAY: float = 1.0
     settings = FallbackSettings()
 
-try:
-    from src.schema import get_schema_queries, get_default_settings
-except ImportError:
-    # Fallback schema functions
-    def get_schema_queries() -> List[str]:
-        """Fallback function when schema module is not available."""
-        return []
-
-    def get_default_settings() -> List[tuple]:
-        """Fallback function when schema module is not available."""
-        return []
+from src import cache, migrations, queries
+from src.db_pool import ConnectionPool, PoolTimeout
+from src.replica import ReplicaRouter, REPLICA_LAG_SQL
+from src.query_stats import query_stats, describe as describe_statement, is_read_only
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Retry policy for transient database errors
+MAX_QUERY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (zero-based) attempt."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+
+def _on_event_loop() -> bool:
+    """Return True when called from a thread that is running an asyncio loop."""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class DatabaseExecutor:
+    """Bounded thread pool that runs blocking database calls off the event loop.
+
+    The worker count matches the connection pool's ``maxconn`` so callers queue
+    here instead of failing on an exhausted pool. Queue depth, wait time and
+    timeouts are tracked for monitoring.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db-exec')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._max_queue_depth = 0
+        self._submitted = 0
+        self._completed = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _track(self, func: Callable, submitted_at: float, args: tuple, kwargs: dict) -> Any:
+        """Run ``func`` in a worker thread, recording queue wait time."""
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run ``func(*args, **kwargs)`` on the pool and await its result."""
+        with self._lock:
+            self._queued += 1
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+        future = self._executor.submit(self._track, func, time.monotonic(), args, kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+                # A call that never started can be dropped from the queue
+                if future.cancel():
+                    self._queued -= 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get executor queue and timing statistics."""
+        with self._lock:
+            started = self._submitted - self._queued
+            return {
+                'max_workers': self.max_workers,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'max_queue_depth': self._max_queue_depth,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': round(self._total_wait / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 2),
+            }
+
+    def shutdown(self) -> None:
+        """Stop accepting work and release the worker threads."""
+        self._executor.shutdown(wait=False)
+
 
 class DatabaseManager:
-    """Enhanced database manager with connection pooling."""
+    """Enhanced database manager with connection pooling.
+
+    Each workload class (``queries.OLTP``, ``queries.ANALYTICS``) has its own
+    connection pool, executor and statement timeout; named statements run on
+    the pool of the workload they were registered with. With
+    ``DATABASE_REPLICA_URL`` set, read-only named statements go to the
+    replica whenever the ``ReplicaRouter`` finds it fresh enough.
+    """
 
     _instance: Optional['DatabaseManager'] = None
-    _pool: Optional[Union[PostgresPool, None]] = None
+    _pool: Optional[ConnectionPool] = None  # the OLTP pool
+    _pools: Dict[str, ConnectionPool] = {}
+    _replica_pools: Dict[str, ConnectionPool] = {}
+    _sqlite_replica_path: Optional[str] = None
+    _router: Optional[ReplicaRouter] = None
     _db_type: str = 'unknown'
     _sqlite_path: str = 'telegram_bot.db'
+    _pool_minconn: int = 1
+    _pool_maxconn: int = 10
+    _executors: Dict[str, DatabaseExecutor] = {}
+    _loop_blocking_calls: int = 0
+    _prepared_sessions: Dict[int, set] = {}  # backend pid -> prepared statement names
+    _unpreparable: set = set()
 
     def __new__(cls) -> 'DatabaseManager':
         """Singleton pattern implementation."""
@@ -84,7 +195,7 @@ class DatabaseManager:
         try:
             self._initialize_pool()
             self.ensure_schema()
-            logger.info("Database pool initialized successfully (postgresql)")
+            logger.info(f"Database pool initialized successfully ({self._db_type})")
         except Exception as e:
             logger.error(f"Failed to initialize database pool: {e}")
             # Don't raise exception during import to allow bot to start with limited functionality
@@ -115,12 +226,20 @@ class DatabaseManager:
         try:
             if HAS_POSTGRES and settings.DATABASE_URL:
                 logger.info("Initializing PostgreSQL connection pool")
-                self._pool = psycopg2.pool.ThreadedConnectionPool(
-                    minconn=1, # Simplified, can use a constant
-                    maxconn=10, # Simplified, can use a constant
-                    dsn=settings.DATABASE_URL,
-                    cursor_factory=RealDictCursor
-                )
+                legacy = getattr(settings, 'Database', None)  # FallbackSettings namespace
+                self._pool_minconn = int(getattr(settings, 'DB_POOL_MIN', getattr(legacy, 'MIN_CONNECTIONS', 1)))
+                self._pool_maxconn = int(getattr(settings, 'DB_POOL_MAX', getattr(legacy, 'MAX_CONNECTIONS', 10)))
+                self._pool = self._create_pool(
+                    settings.DATABASE_URL, queries.OLTP, self._pool_minconn, self._pool_maxconn,
+                    int(getattr(settings, 'DB_STATEMENT_TIMEOUT_MS', 10000)))
+                # Dashboards and searches: opened on demand, optionally on a replica
+                analytics = self._create_pool(
+                    getattr(settings, 'DB_ANALYTICS_URL', None) or settings.DATABASE_URL, queries.ANALYTICS,
+                    0, int(getattr(settings, 'DB_ANALYTICS_POOL_MAX', 3)),
+                    int(getattr(settings, 'DB_ANALYTICS_STATEMENT_TIMEOUT_MS', 30000)))
+                self._pools = {queries.OLTP: self._pool, queries.ANALYTICS: analytics}
+                for workload_pool in self._pools.values():
+                    query_stats.add_collector(workload_pool.prometheus)
                 self._db_type = 'postgresql'
             else:
                 logger.info("Initializing SQLite fallback database")
@@ -130,154 +249,166 @@ class DatabaseManager:
                 conn = sqlite3.connect(self._sqlite_path)
                 conn.close()
 
-            logger.info(f"Database pool initialized successfully ({self._db_type})")
+            if getattr(settings, 'DATABASE_REPLICA_URL', None):
+                self._initialize_replica(settings.DATABASE_REPLICA_URL)
 
-            # Ensure schema is created
-            self.ensure_schema()
+            logger.info(f"Database pool initialized successfully ({self._db_type})")
+            queries.registry.compile(self._db_type)
 
         except Exception as e:
             logger.error(f"Failed to initialize database pool: {e}")
             raise
 
-    def ensure_schema(self) -> None:
-        """Ensure database schema exists."""
-        try:
-            schema_queries = get_schema_queries()
+    def _initialize_replica(self, url: str) -> None:
+        """Open the replica pools (or, on SQLite, point at a second database file)."""
+        if self._db_type == 'postgresql':
+            # minconn 0: an unreachable replica must not stop the bot from starting
+            self._replica_pools = {
+                queries.OLTP: self._create_pool(
+                    url, 'oltp_replica', 0, self._pool_maxconn,
+                    int(getattr(settings, 'DB_STATEMENT_TIMEOUT_MS', 10000))),
+                queries.ANALYTICS: self._create_pool(
+                    url, 'analytics_replica', 0, int(getattr(settings, 'DB_ANALYTICS_POOL_MAX', 3)),
+                    int(getattr(settings, 'DB_ANALYTICS_STATEMENT_TIMEOUT_MS', 30000))),
+            }
+            for replica_pool in self._replica_pools.values():
+                query_stats.add_collector(replica_pool.prometheus)
+        else:
+            # Local stand-in: a copy of the SQLite file
+            self._sqlite_replica_path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        self._router = ReplicaRouter(
+            self._replica_lag,
+            window=float(getattr(settings, 'DB_READ_YOUR_WRITES_S', 10.0)),
+            max_lag=float(getattr(settings, 'DB_REPLICA_MAX_LAG_S', 5.0)),
+            check_interval=float(getattr(settings, 'DB_REPLICA_LAG_CHECK_INTERVAL', 5.0)),
+        )
+        cache.add_invalidation_listener(self._on_cache_invalidation)
+        logger.info("Read replica configured; read-only statements are routed to it")
+
+    def _replica_lag(self) -> float:
+        """Seconds the replica is behind the primary (raises if it is unreachable)."""
+        with self.get_connection(replica=True) as conn:
+            if self._db_type != 'postgresql':
+                conn.execute("SELECT MAX(version) FROM schema_migrations")  # a migrated copy
+                return 0.0  # a file copy has no replication stream to measure
+            with conn.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = cursor.fetchone()['lag_seconds']
+            conn.rollback()
+        return float(lag or 0.0)
+
+    def _on_cache_invalidation(self, kind: str, arg: Any) -> None:
+        # Data changed here or on another bot replica: read it from the primary for a while
+        if kind == 'user':
+            self._router.mark_write(int(arg))
+        elif kind == 'key' and cache._parse_key(arg)[1] is not None:
+            self._router.mark_write(cache._parse_key(arg)[1])
+        else:
+            self._router.mark_write()
 
-            with self.get_connection() as conn:
-                if self._db_type == 'postgresql':
-                    with conn.cursor() as cursor:
-                        for query in schema_queries:
-                            cursor.execute(query)
-                        conn.commit()
-                else:  # SQLite
-                    cursor = conn.cursor()
-                    for query in schema_queries:
-                        # Convert PostgreSQL queries to SQLite if needed
-                        sqlite_query = self._convert_to_sqlite(query)
-                        cursor.execute(sqlite_query)
-                    conn.commit()
+    def route(self, statement: str, params: Optional[tuple]) -> bool:
+        """True if ``statement`` should read from the replica; records writes by user."""
+        if self._router is None:
+            return False
+        stmt = queries.registry.get(statement)
+        user_id = None
+        if stmt.user_param is not None and params and len(params) > stmt.user_param:
+            user_id = params[stmt.user_param]
+        if not stmt.read_only:
+            if user_id is not None or stmt.pins_reads:
+                self._router.mark_write(user_id)
+            return False
+        return stmt.replica and self._router.use_replica(user_id)
+
+    def use_replica(self, user_id: Optional[int] = None) -> bool:
+        """Whether an ad-hoc read-only query may run on the replica now."""
+        return self._router is not None and self._router.use_replica(user_id)
+
+    def mark_write(self, user_id: Optional[int] = None) -> None:
+        """Keep reads (of ``user_id``, or all reads) on the primary after an ad-hoc write."""
+        if self._router is not None:
+            self._router.mark_write(user_id)
+
+    def get_replica_stats(self) -> Dict[str, Any]:
+        """Replica routing counts and last measured lag (empty without a replica)."""
+        return self._router.get_stats() if self._router else {}
+
+    def _create_pool(self, dsn: str, workload: str, minconn: int, maxconn: int,
+                     statement_timeout_ms: int) -> ConnectionPool:
+        """Build one workload's PostgreSQL pool from the DB_POOL_* settings."""
+        keepalives_idle = int(getattr(settings, 'DB_KEEPALIVES_IDLE', 30))
+
+        def connect() -> PostgresConnection:
+            # Keepalives notice a connection silently dropped by a NAT or proxy
+            return psycopg2.connect(dsn, cursor_factory=RealDictCursor, keepalives=1,
+                                    keepalives_idle=keepalives_idle, keepalives_interval=10,
+                                    keepalives_count=3, application_name=f"telegram_bot:{workload}",
+                                    options=f"-c statement_timeout={statement_timeout_ms}")
+
+        pool = ConnectionPool(
+            connect,
+            minconn=minconn,
+            maxconn=maxconn,
+            timeout=float(getattr(settings, 'DB_POOL_TIMEOUT', 5.0)),
+            max_uses=int(getattr(settings, 'DB_POOL_MAX_USES', 5000)),
+            max_lifetime=float(getattr(settings, 'DB_POOL_MAX_LIFETIME', 1800.0)),
+            idle_timeout=float(getattr(settings, 'DB_POOL_IDLE_TIMEOUT', 300.0)),
+            validate_after=float(getattr(settings, 'DB_POOL_VALIDATE_AFTER', 30.0)),
+            validate=self._validate_connection,
+            reset=self._reset_connection,
+            close=self._close_connection,
+            name=workload,
+        )
+        logger.info(f"PostgreSQL {workload} pool: {minconn}-{maxconn} connections, "
+                    f"statement_timeout {statement_timeout_ms} ms")
+        return pool
+
+    @staticmethod
+    def _validate_connection(conn: PostgresConnection) -> bool:
+        """Round-trip check for a connection that sat idle."""
+        if conn.closed:
+            return False
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
 
-            logger.info("Database schema ensured")
-            
-            # Run database migrations for existing databases
-            self._run_migrations()
-            
-            # Initialize default data after schema creation
-            try:
-                initialize_default_data()
-            except Exception as e:
-                logger.warning(f"Failed to initialize default data: {e}")
+    @staticmethod
+    def _reset_connection(conn: PostgresConnection) -> bool:
+        """Roll back anything left open before a connection goes back to the pool."""
+        if conn.closed:
+            return False
+        status = conn.info.transaction_status
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        return True
 
-        except Exception as e:
-            logger.error(f"Failed to ensure schema: {e}")
-            # Don't raise - allow the app to continue without schema
+    def _close_connection(self, conn: PostgresConnection) -> None:
+        try:
+            # Its server-side prepared statements go with the session
+            self._prepared_sessions.pop(conn.info.backend_pid, None)
+        finally:
+            conn.close()
+
+    def get_pool_stats(self, workload: str = queries.OLTP) -> Dict[str, Any]:
+        """A workload's connection pool occupancy and timing (empty for SQLite)."""
+        pool = self._pools.get(workload)
+        return pool.get_stats() if pool else {}
 
-    def _run_migrations(self) -> None:
-        """Run database migrations for existing databases."""
+    def ensure_schema(self) -> None:
+        """Apply pending schema migrations (one version check when current)."""
         try:
-            with self.get_connection() as conn:
-                if self._db_type == 'postgresql':
-                    with conn.cursor() as cursor:
-                        # Check and add missing columns
-                        self._add_missing_columns_postgresql(cursor)
-                        conn.commit()
-                else:  # SQLite
-                    cursor = conn.cursor()
-                    self._add_missing_columns_sqlite(cursor)
-                    conn.commit()
-            
-            logger.info("Database migrations completed successfully")
+            migrations.migrate(self)
         except Exception as e:
-            logger.warning(f"Failed to run migrations: {e}")
-
-    def _add_missing_columns_postgresql(self, cursor) -> None:
-        """Add missing columns to PostgreSQL database."""
-        migrations = [
-            # Add stripe_customer_id if missing
-            {
-                'table': 'users',
-                'column': 'stripe_customer_id',
-                'definition': 'VARCHAR(255)',
-                'check_query': "SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='stripe_customer_id'"
-            },
-            # Add auto-recharge columns if missing
-            {
-                'table': 'users', 
-                'column': 'auto_recharge_enabled',
-                'definition': 'BOOLEAN DEFAULT false',
-                'check_query': "SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='auto_recharge_enabled'"
-            },
-            {
-                'table': 'users',
-                'column': 'auto_recharge_amount', 
-                'definition': 'INTEGER DEFAULT 10',
-                'check_query': "SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='auto_recharge_amount'"
-            },
-            {
-                'table': 'users',
-                'column': 'auto_recharge_threshold',
-                'definition': 'INTEGER DEFAULT 5', 
-                'check_query': "SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='auto_recharge_threshold'"
-            },
-            {
-                'table': 'users',
-                'column': 'last_low_balance_notification',
-                'definition': 'TIMESTAMP',
-                'check_query': "SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='last_low_balance_notification'"
-            }
-        ]
-        
-        for migration in migrations:
-            try:
-                cursor.execute(migration['check_query'])
-                if not cursor.fetchone():
-                    alter_query = f"ALTER TABLE {migration['table']} ADD COLUMN {migration['column']} {migration['definition']}"
-                    cursor.execute(alter_query)
-                    logger.info(f"Added missing column {migration['column']} to {migration['table']}")
-            except Exception as e:
-                logger.warning(f"Failed to add column {migration['column']}: {e}")
-
-    def _add_missing_columns_sqlite(self, cursor) -> None:
-        """Add missing columns to SQLite database."""
-        # SQLite ALTER TABLE is more limited, we'll check and add columns one by one
-        migrations = [
-            ('users', 'stripe_customer_id', 'TEXT'),
-            ('users', 'auto_recharge_enabled', 'INTEGER DEFAULT 0'),
-            ('users', 'auto_recharge_amount', 'INTEGER DEFAULT 10'),
-            ('users', 'auto_recharge_threshold', 'INTEGER DEFAULT 5'),
-            ('users', 'last_low_balance_notification', 'TEXT')
-        ]
-        
-        for table, column, definition in migrations:
-            try:
-                # Check if column exists
-                cursor.execute(f"PRAGMA table_info({table})")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if column not in columns:
-                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
-                    logger.info(f"Added missing column {column} to {table}")
-            except Exception as e:
-                logger.warning(f"Failed to add column {column}: {e}")
-
-    def _convert_to_sqlite(self, query: str) -> str:
-        """Convert PostgreSQL query to SQLite compatible format."""
-        # Basic conversions for common PostgreSQL to SQLite differences
-        query = query.replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
-        query = query.replace('BOOLEAN', 'INTEGER')
-        query = query.replace('TIMESTAMP', 'TEXT')
-        
-        # Correctly handle ON CONFLICT for INSERT statements
-        if 'ON CONFLICT DO NOTHING' in query:
-            query = query.replace('INSERT INTO', 'INSERT OR IGNORE INTO')
-            query = query.replace('ON CONFLICT DO NOTHING', '')
-            
-        return query
+            logger.error(f"Failed to ensure schema: {e}")
+            # Don't raise - allow the app to continue without schema
 
     @contextmanager
-    def get_connection(self) -> Generator[Union[PostgresConnection, sqlite3.Connection], None, None]:
-        """Get database connection from pool."""
+    def get_connection(self, workload: str = queries.OLTP,
+                       replica: bool = False) -> Generator[Union[PostgresConnection, sqlite3.Connection], None, None]:
+        """Get database connection from the workload's pool, on the replica if asked and configured."""
         if self._db_type == 'disabled':
             # Return a mock connection object for disabled state
             logger.warning("Database is disabled - returning mock connection")
@@ -285,23 +416,29 @@ class DatabaseManager:
             return
             
         if self._db_type == 'postgresql' and self._pool:
+            pools = self._replica_pools if replica and self._replica_pools else self._pools
+            pool = pools.get(workload, self._pool)
             conn = None
             try:
-                conn = self._pool.getconn()
+                conn = pool.getconn()
                 yield conn
             except Exception as e:
-                if conn:
+                if conn and not conn.closed:
                     conn.rollback()
                 logger.error(f"Database connection error: {e}")
                 raise
             finally:
                 if conn:
-                    self._pool.putconn(conn)
+                    pool.putconn(conn)
         else:  # SQLite
             conn = None
             try:
-                conn = sqlite3.connect(self._sqlite_path)
-                conn.row_factory = sqlite3.Row  # Enable dict-like access
+                if replica and self._sqlite_replica_path:
+                    # Read-only, and a missing file is an error rather than a new empty database
+                    conn = sqlite3.connect(f"file:{self._sqlite_replica_path}?mode=ro", uri=True)
+                else:
+                    conn = sqlite3.connect(self._sqlite_path)
+                conn.row_factory = queries.sqlite_row_factory  # Same Row type as PostgreSQL
                 yield conn
             except Exception as e:
                 if conn:
@@ -312,67 +449,248 @@ class DatabaseManager:
                 if conn:
                     conn.close()
 
+    def _prepared_query(self, conn: Any, cursor: Any, statement: str) -> Optional[str]:
+        """Prepare ``statement`` on this session if needed; returns the EXECUTE text or None."""
+        if statement in self._unpreparable:
+            return None
+        prepared = self._prepared_sessions.setdefault(conn.get_backend_pid(), set())
+        if statement not in prepared:
+            try:
+                cursor.execute(queries.registry.prepare_sql(statement))
+            except Exception as e:
+                # e.g. parameter types PostgreSQL cannot infer; run it unprepared from now on
+                conn.rollback()
+                self._unpreparable.add(statement)
+                logger.warning(f"Could not prepare statement {statement}: {e}")
+                return None
+            prepared.add(statement)
+        return queries.registry.execute_sql(statement)
+
+    def _run(self, conn: Any, query: str, params: Optional[tuple],
+             fetch_one: bool, fetch_all: bool, statement: Optional[str]) -> Tuple[Any, int]:
+        """Run one query on ``conn`` and commit; returns (result, rows returned or affected)."""
+        # Fetches are committed too, so UPDATE ... RETURNING is not rolled back on putconn
+        if self._db_type == 'postgresql':
+            with conn.cursor() as cursor:
+                if statement and getattr(settings, 'DB_PREPARED_STATEMENTS', False):
+                    query = self._prepared_query(conn, cursor, statement) or query
+                try:
+                    cursor.execute(query, params)
+                except psycopg2.Error as e:
+                    if statement and e.pgcode == '26000':
+                        # Session lost its prepared statements (reconnect); re-prepare on retry
+                        self._prepared_sessions.pop(conn.get_backend_pid(), None)
+                    raise
+
+                if fetch_one:
+                    result = queries.to_row(cursor.fetchone())
+                elif fetch_all:
+                    result = [queries.to_row(row) for row in cursor.fetchall()]
+                else:
+                    result = cursor.rowcount
+                rows = cursor.rowcount
+                conn.commit()
+        else:  # SQLite
+            cursor = conn.cursor()
+            cursor.execute(query, params or ())
+
+            if fetch_one:
+                result = cursor.fetchone()
+                rows = 1 if result is not None else 0
+            elif fetch_all:
+                result = cursor.fetchall()
+                rows = len(result)
+            else:
+                result = rows = cursor.rowcount
+            conn.commit()
+        return result, rows
+
+    def _explain_sample(self, conn: Any, name: str, query: str, params: Optional[tuple]) -> None:
+        """Log an EXPLAIN ANALYZE of a slow read-only query, rate-limited per statement."""
+        interval = float(getattr(settings, 'SLOW_QUERY_EXPLAIN_INTERVAL', 300.0))
+        if (self._db_type != 'postgresql' or not is_read_only(query)
+                or not query_stats.should_explain(name, interval)):
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+                plan = '\n'.join(next(iter(row.values())) for row in cursor.fetchall())
+            conn.rollback()
+            query_stats.record_plan(name, plan)
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"Could not EXPLAIN slow query {name}: {e}")
+
+    def _execute_once(self, query: str, params: Optional[tuple],
+                      fetch_one: bool, fetch_all: bool, statement: Optional[str] = None,
+                      workload: str = queries.OLTP, replica: bool = False) -> Any:
+        """Execute a query once, without retries, recording its timing under its statement name."""
+        name = statement or describe_statement(query)
+        started = time.perf_counter()
+        pool_wait = None
+        try:
+            with self.get_connection(workload, replica) as conn:
+                pool_wait = time.perf_counter() - started
+                result, rows = self._run(conn, query, params, fetch_one, fetch_all, statement)
+                elapsed = time.perf_counter() - started - pool_wait
+                query_stats.record(name, elapsed, rows, pool_wait)
+                slow = query_stats.check_slow(name, elapsed, params, float(getattr(settings, 'SLOW_QUERY_MS', 250.0)))
+                if slow and getattr(settings, 'SLOW_QUERY_EXPLAIN', False):
+                    self._explain_sample(conn, name, query, params)
+                return result
+        except Exception:
+            query_stats.record(name, time.perf_counter() - started - (pool_wait or 0.0),
+                               pool_wait=pool_wait, error=True)
+            raise
+
+    def sql(self, statement: str) -> str:
+        """Compiled text of a registered statement for this database."""
+        return queries.registry.sql(statement, self._db_type)
+
+    def execute_named(self, statement: str, params: Optional[tuple] = None,
+                      fetch_one: bool = False, fetch_all: bool = False) -> Any:
+        """Execute a statement registered in ``src.queries`` by name, on its workload's pool."""
+        return self.execute_query(self.sql(statement), params, fetch_one, fetch_all, statement=statement,
+                                  workload=queries.registry.workload(statement),
+                                  replica=self.route(statement, params))
+
+    async def execute_named_async(self, statement: str, params: Optional[tuple] = None,
+                                  fetch_one: bool = False, fetch_all: bool = False,
+                                  timeout: Optional[float] = None) -> Any:
+        """Coroutine version of execute_named on its workload's executor."""
+        return await self.execute_query_async(self.sql(statement), params, fetch_one, fetch_all,
+                                              timeout=timeout, statement=statement,
+                                              workload=queries.registry.workload(statement),
+                                              replica=self.route(statement, params))
+
     def execute_query(self, query: str, params: Optional[tuple] = None,
-                     fetch_one: bool = False, fetch_all: bool = False) -> Any:
-        """Execute database query with retry logic."""
-        for attempt in range(3): # Max retries
+                     fetch_one: bool = False, fetch_all: bool = False,
+                     statement: Optional[str] = None, workload: str = queries.OLTP,
+                     replica: bool = False) -> Any:
+        """Execute database query with retry logic; ``replica`` reads fall back to the primary.
+
+        On the event loop thread a failed query is not retried: sleeping
+        between attempts would stall every other update.
+        """
+        on_loop = _on_event_loop()
+        if on_loop:
+            # Still works, but stalls every other update; use execute_query_async instead
+            self._loop_blocking_calls += 1
+            if self._loop_blocking_calls == 1:
+                logger.warning("Synchronous query executed on the event loop thread; "
+                               "use execute_query_async or run_db from coroutines")
+
+        for attempt in range(MAX_QUERY_ATTEMPTS):
             try:
-                with self.get_connection() as conn:
-                    if self._db_type == 'postgresql':
-                        with conn.cursor() as cursor:
-                            cursor.execute(query, params)
-
-                            if fetch_one:
-                                return cursor.fetchone()
-                            elif fetch_all:
-                                return cursor.fetchall()
-                            else:
-                                conn.commit()
-                                return cursor.rowcount
-                    else:  # SQLite
-                        cursor = conn.cursor()
-                        cursor.execute(query, params or ())
-
-                        if fetch_one:
-                            return cursor.fetchone()
-                        elif fetch_all:
-                            return cursor.fetchall()
-                        else:
-                            conn.commit()
-                            return cursor.rowcount
+                return self._execute_once(query, params, fetch_one, fetch_all, statement, workload, replica)
+            except Exception as e:
+                if replica:
+                    # Retry on the primary straight away
+                    self._router.replica_failed(e)
+                    replica = False
+                    continue
+                if isinstance(e, PoolTimeout):
+                    # Already waited DB_POOL_TIMEOUT; retrying would only queue again
+                    raise
+                logger.error(f"Query execution failed (attempt {attempt + 1}): {e}")
+                if attempt < MAX_QUERY_ATTEMPTS - 1 and not on_loop:
+                    time.sleep(_retry_delay(attempt))
+                else:
+                    raise
 
+    async def execute_query_async(self, query: str, params: Optional[tuple] = None,
+                                  fetch_one: bool = False, fetch_all: bool = False,
+                                  timeout: Optional[float] = None, statement: Optional[str] = None,
+                                  workload: str = queries.OLTP, replica: bool = False) -> Any:
+        """Execute a query on the workload's executor with non-blocking retries."""
+        executor = self.get_executor(workload)
+        for attempt in range(MAX_QUERY_ATTEMPTS):
+            try:
+                return await executor.run(self._execute_once, query, params, fetch_one, fetch_all,
+                                          statement, workload, replica, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Query timed out after {timeout or executor.timeout}s")
+                raise
             except Exception as e:
+                if replica:
+                    self._router.replica_failed(e)
+                    replica = False
+                    continue
+                if isinstance(e, PoolTimeout):
+                    raise
                 logger.error(f"Query execution failed (attempt {attempt + 1}): {e}")
-                if attempt < 2: # Max retries - 1
-                    time.sleep(1.0) # Retry delay
+                if attempt < MAX_QUERY_ATTEMPTS - 1:
+                    await asyncio.sleep(_retry_delay(attempt))
                 else:
                     raise
 
-    def execute_transaction(self, operations: List[Dict[str, Any]]) -> bool:
-        """Execute multiple operations in a transaction."""
+    def get_executor(self, workload: str = queries.OLTP) -> DatabaseExecutor:
+        """Get the workload's database executor, creating it on first use."""
+        executor = self._executors.get(workload)
+        if executor is None:
+            # One thread per pooled connection; SQLite serializes writers, so
+            # extra threads there only add lock contention
+            pool = self._pools.get(workload)
+            workers = pool.maxconn if pool and self._db_type == 'postgresql' else 1
+            timeout = float(getattr(settings, 'DB_EXECUTOR_TIMEOUT', 10.0))
+            executor = self._executors[workload] = DatabaseExecutor(workers, timeout)
+        return executor
+
+    async def run_in_executor(self, func: Callable, *args, timeout: Optional[float] = None,
+                              workload: str = queries.OLTP, **kwargs) -> Any:
+        """Run any blocking database helper on the workload's executor."""
+        return await self.get_executor(workload).run(func, *args, timeout=timeout, **kwargs)
+
+    def get_executor_stats(self, workload: str = queries.OLTP) -> Dict[str, Any]:
+        """Get executor metrics plus the count of queries run on the event loop."""
+        executor = self._executors.get(workload)
+        stats = executor.get_stats() if executor else {}
+        stats['loop_blocking_calls'] = self._loop_blocking_calls
+        return stats
+
+    def execute_transaction(self, operations: List[Dict[str, Any]], statement: Optional[str] = None) -> bool:
+        """Execute multiple operations in a transaction, recorded as one ``statement``."""
+        if not operations:
+            return True
+        name = statement or f"transaction:{describe_statement(operations[0]['query'])[4:]}"
+        started = time.perf_counter()
+        pool_wait = None
+        rows = 0
         try:
             with self.get_connection() as conn:
+                pool_wait = time.perf_counter() - started
                 if self._db_type == 'postgresql':
                     with conn.cursor() as cursor:
                         for op in operations:
                             cursor.execute(op['query'], op.get('params'))
+                            rows += max(cursor.rowcount, 0)
                         conn.commit()
                 else:  # SQLite
                     cursor = conn.cursor()
                     for op in operations:
                         cursor.execute(op['query'], op.get('params', ()))
+                        rows += max(cursor.rowcount, 0)
                     conn.commit()
 
+            elapsed = time.perf_counter() - started - pool_wait
+            query_stats.record(name, elapsed, rows, pool_wait)
+            query_stats.check_slow(name, elapsed, None, float(getattr(settings, 'SLOW_QUERY_MS', 250.0)))
             return True
         except Exception as e:
+            query_stats.record(name, time.perf_counter() - started - (pool_wait or 0.0),
+                               pool_wait=pool_wait, error=True)
             logger.error(f"Transaction failed: {e}")
             return False
 
     def close_pool(self) -> None:
         """Close database connection pool."""
+        for executor in self._executors.values():
+            executor.shutdown()
+        self._executors = {}
         if self._pool and self._db_type == 'postgresql':
-            self._pool.closeall()
-            logger.info("Database pool closed")
+            for pool in list(self._pools.values()) + list(self._replica_pools.values()):
+                pool.closeall()
+            logger.info("Database pools closed")
 
 
 # Global database manager instance
@@ -384,6 +702,18 @@ def get_db_connection() -> Generator[Union[PostgresConnection, sqlite3.Connectio
     return db_manager.get_connection()
 
 
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Await a synchronous database helper without blocking the event loop.
+
+    Pass ``workload=queries.ANALYTICS`` for dashboard and search helpers so
+    they queue on their own executor.
+
+    Example:
+        banned = await run_db(is_user_banned, user_id)
+    """
+    return await db_manager.run_in_executor(func, *args, **kwargs)
+
+
 @contextmanager
 def get_db_cursor() -> Generator[Any, None, None]:
     """Get database cursor with automatic connection management."""
@@ -403,106 +733,77 @@ def get_db_cursor() -> Generator[Any, None, None]:
         raise
 
 
+queries.register('get_user_credits', """
+    SELECT message_credits, time_credits
+    FROM users
+    WHERE telegram_id = %s
+""")
+
 def get_user_credits_optimized(user_id: int) -> int:
     """Get user credits with caching optimization."""
     try:
-        query = """
-        SELECT message_credits, time_credits
-        FROM users
-        WHERE user_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT message_credits, time_credits
-        FROM users
-        WHERE user_id = ?
-        """
-
-        result = db_manager.execute_query(
-            query,
-            (user_id,),
-            fetch_one=True
-        )
-
-        if result:
-            return result['message_credits'] if db_manager._db_type == 'postgresql' else result[0]
-        return 0
+        result = db_manager.execute_named('get_user_credits', (user_id,), fetch_one=True)
+        return result['message_credits'] if result else 0
 
     except Exception as e:
         logger.error(f"Error getting user credits: {e}")
         return 0
 
 
+def notify_credits_changed(user_id: int) -> None:
+    """Drop cached balances for ``user_id`` on every bot replica."""
+    cache.invalidate_user_cache(user_id)
+
+
+queries.register('decrement_user_credits', """
+    UPDATE users
+    SET message_credits = message_credits - %s,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE telegram_id = %s AND message_credits >= %s
+    RETURNING message_credits
+""")
+
 def decrement_user_credits_optimized(user_id: int, cost: int) -> int:
-    """Decrement user credits optimally."""
-    try:
-        query = """
-        UPDATE users
-        SET message_credits = GREATEST(message_credits - %s, 0),
-            updated_at = CURRENT_TIMESTAMP
-        WHERE user_id = %s
-        RETURNING message_credits
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE users
-        SET message_credits = MAX(message_credits - ?, 0),
-            updated_at = datetime('now')
-        WHERE user_id = ?
-        """
+    """Deduct credits only if the balance covers them.
 
-        if db_manager._db_type == 'postgresql':
-            result = db_manager.execute_query(query, (cost, user_id), fetch_one=True)
-            return result['message_credits'] if result else 0
-        else:
-            db_manager.execute_query(query, (cost, user_id))
-            # Get updated credits for SQLite
-            return get_user_credits_optimized(user_id)
+    Returns the new balance, or -1 when the user cannot afford ``cost``.
+    """
+    try:
+        result = db_manager.execute_named('decrement_user_credits', (cost, user_id, cost), fetch_one=True)
+        if not result:
+            return -1
+        notify_credits_changed(user_id)
+        return result['message_credits']
 
     except Exception as e:
         logger.error(f"Error decrementing credits: {e}")
-        return 0
+        return -1
 
 
 def batch_update_user_credits(updates: List[Dict[str, Union[int, str]]]) -> bool:
-    """Batch update user credits for improved performance."""
-    try:
-        operations = []
-        for update in updates:
-            query = """
-            UPDATE users
-            SET message_credits = message_credits + %s,
-                time_credits = time_credits + %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = %s
-            """ if db_manager._db_type == 'postgresql' else """
-            UPDATE users
-            SET message_credits = message_credits + ?,
-                time_credits = time_credits + ?,
-                updated_at = datetime('now')
-            WHERE user_id = ?
-            """
-
-            operations.append({
-                'query': query,
-                'params': (
-                    update.get('message_credits', 0),
-                    update.get('time_credits', 0),
-                    update['user_id']
-                )
-            })
-
-        return db_manager.execute_transaction(operations)
-
-    except Exception as e:
-        logger.error(f"Batch update failed: {e}")
-        return False
+    """Apply many credit changes in one set-based statement (see ``src.bulk_credits``).
+
+    Each update has ``user_id`` and optional ``message_credits`` and
+    ``time_credits`` (seconds) deltas.
+    """
+    from src.bulk_credits import apply_credit_adjustments
+    result = apply_credit_adjustments(
+        ((update['user_id'], update.get('message_credits', 0), update.get('time_credits', 0))
+         for update in updates),
+        reason='batch_update'
+    )
+    return result is not None
 
 
+queries.register('health_check', "SELECT 1 as health_check", replica=False)
+
 def check_database_health() -> Dict[str, Any]:
     """Check database health and performance."""
     try:
         start_time = time.time()
 
         # Simple health check query
-        query = "SELECT 1 as health_check"
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('health_check', fetch_one=True)
 
         response_time = time.time() - start_time
 
@@ -510,6 +811,13 @@ def check_database_health() -> Dict[str, Any]:
             'status': 'healthy' if result else 'unhealthy',
             'response_time_ms': round(response_time * 1000, 2),
             'database_type': db_manager._db_type,
+            'executor': db_manager.get_executor_stats(),
+            'pool': db_manager.get_pool_stats(),
+            'analytics_pool': db_manager.get_pool_stats(queries.ANALYTICS),
+            'analytics_executor': db_manager.get_executor_stats(queries.ANALYTICS),
+            'replica': db_manager.get_replica_stats(),
+            'queries': query_stats.totals(),
+            'slowest_queries': query_stats.snapshot(sort_by='p95_ms', limit=5),
             'timestamp': time.time()
         }
 
@@ -521,45 +829,45 @@ def check_database_health() -> Dict[str, Any]:
             'timestamp': time.time()
         }
 
+queries.register('get_active_products', """
+    SELECT *
+    FROM products
+    WHERE is_active = TRUE
+    ORDER BY amount
+""")
+
 def get_active_products() -> List[Dict[str, Any]]:
     """Get all active products from the database."""
     try:
-        query = """
-        SELECT *
-        FROM products
-        WHERE is_active = TRUE
-        ORDER BY amount
-        """
-        return db_manager.execute_query(query, fetch_all=True)
+        return db_manager.execute_named('get_active_products', fetch_all=True)
     except Exception as e:
         logger.error(f"Error getting active products: {e}")
         return []
 
+queries.register('get_all_products', """
+    SELECT *
+    FROM products
+    ORDER BY created_at DESC
+""")
+
 def get_all_products() -> List[Dict[str, Any]]:
     """Get all products from the database (active and inactive)."""
     try:
-        query = """
-        SELECT *
-        FROM products
-        ORDER BY created_at DESC
-        """
-        return db_manager.execute_query(query, fetch_all=True)
+        return db_manager.execute_named('get_all_products', fetch_all=True)
     except Exception as e:
         logger.error(f"Error getting all products: {e}")
         return []
 
+queries.register('create_product', """
+    INSERT INTO products (label, amount, item_type, description, stripe_price_id, is_active, created_at)
+    VALUES (%s, %s, %s, %s, %s, TRUE, CURRENT_TIMESTAMP)
+""")
+
 def create_product(label: str, amount: int, item_type: str, description: str = None, stripe_price_id: str = None) -> bool:
     """Create a new product in the database."""
     try:
-        query = """
-        INSERT INTO products (label, amount, item_type, description, stripe_price_id, is_active, created_at)
-        VALUES (%s, %s, %s, %s, %s, TRUE, CURRENT_TIMESTAMP)
-        """ if db_manager._db_type == 'postgresql' else """
-        INSERT INTO products (label, amount, item_type, description, stripe_price_id, is_active, created_at)
-        VALUES (?, ?, ?, ?, ?, 1, datetime('now'))
-        """
-        
-        db_manager.execute_query(query, (label, amount, item_type, description, stripe_price_id))
+        db_manager.execute_named('create_product', (label, amount, item_type, description, stripe_price_id))
+        cache.invalidate_products_cache()
         logger.info(f"Created new product: {label} ({amount} {item_type})")
         return True
         
@@ -576,7 +884,7 @@ def update_product(product_id: int, **kwargs) -> bool:
         
         for field, value in kwargs.items():
             if field in ['label', 'amount', 'item_type', 'description', 'stripe_price_id', 'is_active']:
-                set_clauses.append(f"{field} = %s" if db_manager._db_type == 'postgresql' else f"{field} = ?")
+                set_clauses.append(f"{field} = %s")
                 values.append(value)
         
         if not set_clauses:
@@ -588,13 +896,10 @@ def update_product(product_id: int, **kwargs) -> bool:
         UPDATE products 
         SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP
         WHERE id = %s
-        """ if db_manager._db_type == 'postgresql' else f"""
-        UPDATE products 
-        SET {', '.join(set_clauses)}, updated_at = datetime('now')
-        WHERE id = ?
         """
         
-        db_manager.execute_query(query, values)
+        db_manager.execute_query(queries.translate(query, db_manager._db_type), values)
+        cache.invalidate_products_cache()
         logger.info(f"Updated product {product_id}")
         return True
         
@@ -602,16 +907,13 @@ def update_product(product_id: int, **kwargs) -> bool:
         logger.error(f"Error updating product {product_id}: {e}")
         return False
 
+queries.register('delete_product', "DELETE FROM products WHERE id = %s")
+
 def delete_product(product_id: int) -> bool:
     """Delete a product from the database."""
     try:
-        query = """
-        DELETE FROM products WHERE id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        DELETE FROM products WHERE id = ?
-        """
-        
-        db_manager.execute_query(query, (product_id,))
+        db_manager.execute_named('delete_product', (product_id,))
+        cache.invalidate_products_cache()
         logger.info(f"Deleted product {product_id}")
         return True
         
@@ -619,81 +921,85 @@ def delete_product(product_id: int) -> bool:
         logger.error(f"Error deleting product {product_id}: {e}")
         return False
 
+queries.register('get_product_by_id', "SELECT * FROM products WHERE id = %s")
+
 def get_product_by_id(product_id: int) -> Optional[Dict[str, Any]]:
     """Get a specific product by ID."""
     try:
-        query = """
-        SELECT * FROM products WHERE id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT * FROM products WHERE id = ?
-        """
-        
-        return db_manager.execute_query(query, (product_id,), fetch_one=True)
+        return db_manager.execute_named('get_product_by_id', (product_id,), fetch_one=True)
         
     except Exception as e:
         logger.error(f"Error getting product {product_id}: {e}")
         return None
 
+queries.register('get_stripe_customer_id', "SELECT stripe_customer_id FROM users WHERE telegram_id = %s")
+
 def get_stripe_customer_id(user_id: int) -> Optional[str]:
     """Get Stripe customer ID for a user."""
     try:
-        query = "SELECT stripe_customer_id FROM users WHERE telegram_id = %s" if db_manager._db_type == 'postgresql' else "SELECT stripe_customer_id FROM users WHERE telegram_id = ?"
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('get_stripe_customer_id', (user_id,), fetch_one=True)
         return result['stripe_customer_id'] if result else None
     except Exception as e:
         logger.error(f"Error getting Stripe customer ID: {e}")
         return None
 
+queries.register('set_stripe_customer_id', "UPDATE users SET stripe_customer_id = %s WHERE telegram_id = %s")
+
 def set_stripe_customer_id(user_id: int, customer_id: str) -> None:
     """Set Stripe customer ID for a user."""
     try:
-        query = "UPDATE users SET stripe_customer_id = %s WHERE telegram_id = %s" if db_manager._db_type == 'postgresql' else "UPDATE users SET stripe_customer_id = ? WHERE telegram_id = ?"
-        db_manager.execute_query(query, (customer_id, user_id))
+        db_manager.execute_named('set_stripe_customer_id', (customer_id, user_id))
     except Exception as e:
         logger.error(f"Error setting Stripe customer ID: {e}")
 
+queries.register('add_user_time_credits',
+                 "UPDATE users SET time_credits_seconds = time_credits_seconds + %s WHERE telegram_id = %s")
+queries.register('add_user_message_credits',
+                 "UPDATE users SET message_credits = message_credits + %s WHERE telegram_id = %s")
+
 def add_user_credits(user_id: int, amount: int, credit_type: str = 'message') -> bool:
     """Add credits or time to a user's account."""
     try:
-        if credit_type == 'time':
-            query = "UPDATE users SET time_credits_seconds = time_credits_seconds + %s WHERE telegram_id = %s" if db_manager._db_type == 'postgresql' else "UPDATE users SET time_credits_seconds = time_credits_seconds + ? WHERE telegram_id = ?"
-        else:
-            query = "UPDATE users SET message_credits = message_credits + %s WHERE telegram_id = %s" if db_manager._db_type == 'postgresql' else "UPDATE users SET message_credits = message_credits + ? WHERE telegram_id = ?"
-        
-        db_manager.execute_query(query, (amount, user_id))
+        statement = 'add_user_time_credits' if credit_type == 'time' else 'add_user_message_credits'
+        db_manager.execute_named(statement, (amount, user_id))
+        notify_credits_changed(user_id)
         return True
     except Exception as e:
         logger.error(f"Error adding user credits: {e}")
         return False
 
 def get_setting(key: str, default: str = None) -> Optional[str]:
-    """Get a specific setting from the database."""
+    """Get a specific setting (served from the whole-table settings snapshot)."""
     try:
-        query = "SELECT setting_value FROM bot_settings WHERE setting_key = %s" if db_manager._db_type == 'postgresql' else "SELECT setting_value FROM bot_settings WHERE setting_key = ?"
-        result = db_manager.execute_query(query, (key,), fetch_one=True)
-        return result['setting_value'] if result else default
+        from src.settings_snapshot import get_settings
+        return get_settings().get(key, default)
     except Exception as e:
         logger.error(f"Error getting setting '{key}': {e}")
         return default
 
+queries.register('set_setting', """
+    INSERT INTO bot_settings (setting_key, setting_value) VALUES (%s, %s)
+    ON CONFLICT (setting_key) DO UPDATE SET setting_value = EXCLUDED.setting_value
+""")
+
 def set_setting(key: str, value: str) -> None:
     """Create or update a specific setting in the database."""
     try:
-        query = """
-            INSERT INTO bot_settings (setting_key, setting_value) VALUES (%s, %s)
-            ON CONFLICT (setting_key) DO UPDATE SET setting_value = EXCLUDED.setting_value
-        """ if db_manager._db_type == 'postgresql' else """
-            INSERT OR REPLACE INTO bot_settings (setting_key, setting_value) VALUES (?, ?)
-        """
-        db_manager.execute_query(query, (key, value))
+        db_manager.execute_named('set_setting', (key, value))
+        cache.invalidate_setting_cache(key)
+        from src.settings_snapshot import apply_setting_write
+        apply_setting_write(key, value)
     except Exception as e:
         logger.error(f"Error setting '{key}': {e}")
 
+queries.register('get_user_stats',
+                 "SELECT COUNT(*) as total, COUNT(CASE WHEN is_banned THEN 1 END) as banned FROM users",
+                 workload=queries.ANALYTICS)
+
 def get_user_stats() -> Dict[str, int]:
     """Get basic statistics about users."""
     try:
-        query = "SELECT COUNT(*) as total, COUNT(CASE WHEN is_banned THEN 1 END) as banned FROM users"
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('get_user_stats', fetch_one=True)
         return {
             "total_users": result['total'] if result else 0,
             "banned_users": result['banned'] if result else 0,
@@ -702,37 +1008,33 @@ def get_user_stats() -> Dict[str, int]:
         logger.error(f"Error getting user stats: {e}")
         return {"total_users": 0, "banned_users": 0}
 
+queries.register('is_user_banned', "SELECT is_banned FROM users WHERE telegram_id = %s")
+
 def is_user_banned(user_id: int) -> bool:
     """Check if a user is banned."""
     try:
-        query = "SELECT is_banned FROM users WHERE telegram_id = %s" if db_manager._db_type == 'postgresql' else "SELECT is_banned FROM users WHERE telegram_id = ?"
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
-        return result['is_banned'] if result and result['is_banned'] else False
+        result = db_manager.execute_named('is_user_banned', (user_id,), fetch_one=True)
+        return bool(result['is_banned']) if result and result['is_banned'] else False
     except Exception as e:
         logger.error(f"Error checking if user {user_id} is banned: {e}")
         return False
 
+queries.register('create_locked_content', """
+    INSERT INTO locked_content (content_type, file_id, price, created_by, description, thumbnail_file_id)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING id
+""")
+
 def create_locked_content(content_type: str, file_id: str, price: int, created_by: int, description: str = None, thumbnail_file_id: str = None) -> int:
     """Create a new locked content item."""
     try:
-        query = """
-        INSERT INTO locked_content (content_type, file_id, price, created_by, description, thumbnail_file_id)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id
-        """ if db_manager._db_type == 'postgresql' else """
-        INSERT INTO locked_content (content_type, file_id, price, created_by, description, thumbnail_file_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """
-        
-        if db_manager._db_type == 'postgresql':
-            result = db_manager.execute_query(query, (content_type, file_id, price, created_by, description, thumbnail_file_id), fetch_one=True)
-            return result['id'] if result else 0
-        else:
-            # SQLite does not support RETURNING, so we get the last inserted ID
-            rowcount = db_manager.execute_query(query, (content_type, file_id, price, created_by, description, thumbnail_file_id))
-            if rowcount > 0:
-                return db_manager.execute_query("SELECT last_insert_rowid()", fetch_one=True)[0]
-            return 0
+        # SQLite supports RETURNING since 3.35, so both backends get the id in one round trip
+        result = db_manager.execute_named(
+            'create_locked_content',
+            (content_type, file_id, price, created_by, description, thumbnail_file_id),
+            fetch_one=True
+        )
+        return result['id'] if result else 0
             
     except Exception as e:
         logger.error(f"Error creating locked content: {e}")
@@ -742,191 +1044,160 @@ def create_locked_content(content_type: str, file_id: str, price: int, created_b
 
 async def get_locked_content(content_id: int) -> Optional[Dict[str, Any]]:
     """Get locked content by ID."""
-    conn = await get_db_connection()
-    if not conn:
-        return None
-    
+    from src.async_database import async_db_manager
+
     try:
-        result = await conn.fetchrow(
-            "SELECT * FROM locked_content WHERE id = $1 AND is_active = true",
-            content_id
+        result = await async_db_manager.execute_query(
+            "SELECT * FROM locked_content WHERE id = %s AND is_active = TRUE",
+            (content_id,),
+            fetch_one=True
         )
         return dict(result) if result else None
     except Exception as e:
         logger.error(f"Error getting locked content: {e}")
         return None
-    finally:
-        await conn.close()
 
 async def has_user_purchased_content(user_id: int, content_id: int) -> bool:
     """Check if user has already purchased specific content."""
-    conn = await get_db_connection()
-    if not conn:
-        return False
-    
+    from src.async_database import async_db_manager
+
     try:
-        result = await conn.fetchval(
-            "SELECT EXISTS(SELECT 1 FROM content_purchases WHERE user_id = $1 AND content_id = $2)",
-            user_id, content_id
+        result = await async_db_manager.execute_query(
+            "SELECT 1 AS purchased FROM content_purchases WHERE user_id = %s AND content_id = %s LIMIT 1",
+            (user_id, content_id),
+            fetch_one=True
         )
         return bool(result)
     except Exception as e:
         logger.error(f"Error checking content purchase: {e}")
         return False
-    finally:
-        await conn.close()
 
 async def purchase_locked_content(user_id: int, content_id: int, price: int) -> bool:
     """Process purchase of locked content."""
-    conn = await get_db_connection()
-    if not conn:
-        return False
-    
+    from src import async_database
+    from src.async_database import async_db_manager
+
     try:
-        async with conn.transaction():
-            # Check user balance
-            balance = await conn.fetchval(
-                "SELECT credits FROM users WHERE user_id = $1",
-                user_id
-            )
-            
-            if balance is None or balance < price:
-                return False
-            
-            # Deduct credits
-            await conn.execute(
-                "UPDATE users SET credits = credits - $1 WHERE user_id = $2",
-                price, user_id
-            )
-            
-            # Record purchase
-            await conn.execute(
-                """INSERT INTO content_purchases (user_id, content_id, price_paid, purchased_at)
-                   VALUES ($1, $2, $3, NOW())""",
-                user_id, content_id, price
-            )
-            
-            # Add transaction record
-            await conn.execute(
-                """INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
-                   VALUES ($1, $2, 'content_purchase', $3, NOW())""",
-                user_id, -price, f"Purchased content #{content_id}"
-            )
-            
-            return True
+        # Hold the credits only if the balance covers the price
+        reservation_id = await async_database.reserve_credits(user_id, price, reason='content_purchase')
+        if reservation_id is None:
+            return False
+
+        recorded = await async_db_manager.execute_transaction([
+            {
+                'query': """INSERT INTO content_purchases (user_id, content_id, price_paid, purchased_at)
+                            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)""",
+                'params': (user_id, content_id, price)
+            },
+            {
+                'query': """INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
+                            VALUES (%s, %s, 'content_purchase', %s, CURRENT_TIMESTAMP)""",
+                'params': (user_id, -price, f"Purchased content #{content_id}")
+            }
+        ], statement='purchase_locked_content')
+        if recorded:
+            await async_database.commit_reservation(reservation_id)
+        else:
+            # Give the credits back if the purchase could not be recorded
+            await async_database.release_reservation(reservation_id)
+        return recorded
     except Exception as e:
         logger.error(f"Error purchasing content: {e}")
         return False
-    finally:
-        await conn.close()
 
 # ========================= Existing Functions =========================
 
+queries.register('get_all_users', """
+    SELECT telegram_id, username, first_name, message_credits, is_banned, created_at
+    FROM users
+    ORDER BY created_at DESC
+    LIMIT %s OFFSET %s
+""", workload=queries.ANALYTICS)
+
 def get_all_users(limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
     """Get paginated list of all users."""
     try:
-        query = """
-        SELECT telegram_id, username, first_name, message_credits, is_banned, created_at
-        FROM users
-        ORDER BY created_at DESC
-        LIMIT %s OFFSET %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id, username, first_name, message_credits, is_banned, created_at
-        FROM users
-        ORDER BY created_at DESC
-        LIMIT ? OFFSET ?
-        """
-        return db_manager.execute_query(query, (limit, offset), fetch_all=True)
+        return db_manager.execute_named('get_all_users', (limit, offset), fetch_all=True)
     except Exception as e:
         logger.error(f"Error getting all users: {e}")
         return []
 
+queries.register('ban_user', """
+    UPDATE users
+    SET is_banned = TRUE, ban_reason = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE telegram_id = %s
+""")
+
 def ban_user(user_id: int, reason: str = "Admin action") -> bool:
     """Ban a user with optional reason."""
     try:
-        query = """
-        UPDATE users 
-        SET is_banned = TRUE, ban_reason = %s, updated_at = CURRENT_TIMESTAMP
-        WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE users 
-        SET is_banned = 1, ban_reason = ?, updated_at = datetime('now')
-        WHERE telegram_id = ?
-        """
-        db_manager.execute_query(query, (reason, user_id))
+        db_manager.execute_named('ban_user', (reason, user_id))
+        cache.invalidate_user_cache(user_id)
         logger.info(f"User {user_id} banned: {reason}")
         return True
     except Exception as e:
         logger.error(f"Error banning user {user_id}: {e}")
         return False
 
+queries.register('unban_user', """
+    UPDATE users
+    SET is_banned = FALSE, ban_reason = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE telegram_id = %s
+""")
+
 def unban_user(user_id: int) -> bool:
     """Unban a user."""
     try:
-        query = """
-        UPDATE users 
-        SET is_banned = FALSE, ban_reason = NULL, updated_at = CURRENT_TIMESTAMP
-        WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE users 
-        SET is_banned = 0, ban_reason = NULL, updated_at = datetime('now')
-        WHERE telegram_id = ?
-        """
-        db_manager.execute_query(query, (user_id,))
+        db_manager.execute_named('unban_user', (user_id,))
+        cache.invalidate_user_cache(user_id)
         logger.info(f"User {user_id} unbanned")
         return True
     except Exception as e:
         logger.error(f"Error unbanning user {user_id}: {e}")
         return False
 
+queries.register('update_setting', """
+    INSERT INTO bot_settings (setting_key, setting_value, updated_at)
+    VALUES (%s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (setting_key)
+    DO UPDATE SET setting_value = EXCLUDED.setting_value, updated_at = CURRENT_TIMESTAMP
+""")
+
 def update_setting(key: str, value: str) -> bool:
     """Update a bot setting."""
     try:
-        query = """
-        INSERT INTO bot_settings (setting_key, setting_value, updated_at)
-        VALUES (%s, %s, CURRENT_TIMESTAMP)
-        ON CONFLICT (setting_key) 
-        DO UPDATE SET setting_value = EXCLUDED.setting_value, updated_at = CURRENT_TIMESTAMP
-        """ if db_manager._db_type == 'postgresql' else """
-        INSERT OR REPLACE INTO bot_settings (setting_key, setting_value, updated_at)
-        VALUES (?, ?, datetime('now'))
-        """
-        db_manager.execute_query(query, (key, value))
+        db_manager.execute_named('update_setting', (key, value))
+        cache.invalidate_setting_cache(key)
+        from src.settings_snapshot import apply_setting_write
+        apply_setting_write(key, value)
         logger.info(f"Setting updated: {key} = {value}")
         return True
     except Exception as e:
         logger.error(f"Error updating setting {key}: {e}")
         return False
 
+queries.register('get_user_by_customer_id', "SELECT telegram_id FROM users WHERE stripe_customer_id = %s")
+
 def get_user_by_customer_id(customer_id: str) -> Optional[int]:
     """Get user ID by Stripe customer ID."""
     try:
-        query = """
-        SELECT telegram_id FROM users WHERE stripe_customer_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id FROM users WHERE stripe_customer_id = ?
-        """
-        result = db_manager.execute_query(query, (customer_id,), fetch_one=True)
+        result = db_manager.execute_named('get_user_by_customer_id', (customer_id,), fetch_one=True)
         return result['telegram_id'] if result else None
     except Exception as e:
         logger.error(f"Error getting user by customer ID {customer_id}: {e}")
         return None
 
+queries.register('get_user_topic', """
+    SELECT topic_id FROM conversations
+    WHERE user_id = %s AND topic_id IS NOT NULL
+    ORDER BY created_at DESC LIMIT 1
+""")
+
 def get_or_create_user_topic(user_id: int, username: str = None, first_name: str = None) -> Optional[int]:
     """Get existing topic ID for user or create a new one."""
     try:
         # First, check if user already has a topic
-        query = """
-        SELECT topic_id FROM conversations 
-        WHERE user_id = %s AND topic_id IS NOT NULL 
-        ORDER BY created_at DESC LIMIT 1
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT topic_id FROM conversations 
-        WHERE user_id = ? AND topic_id IS NOT NULL 
-        ORDER BY created_at DESC LIMIT 1
-        """
-        
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('get_user_topic', (user_id,), fetch_one=True)
         if result and result['topic_id']:
             return result['topic_id']
         
@@ -938,21 +1209,19 @@ def get_or_create_user_topic(user_id: int, username: str = None, first_name: str
         logger.error(f"Error getting/creating user topic for {user_id}: {e}")
         return None
 
+queries.register('save_user_topic', """
+    INSERT INTO conversations (user_id, topic_id, status, created_at, updated_at)
+    VALUES (%s, %s, 'active', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET
+        topic_id = EXCLUDED.topic_id,
+        updated_at = CURRENT_TIMESTAMP
+""")
+
 def save_user_topic(user_id: int, topic_id: int) -> bool:
     """Save the topic ID for a user after topic creation."""
     try:
-        query = """
-        INSERT INTO conversations (user_id, topic_id, status, created_at, updated_at)
-        VALUES (%s, %s, 'active', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        ON CONFLICT (user_id) DO UPDATE SET 
-            topic_id = EXCLUDED.topic_id,
-            updated_at = CURRENT_TIMESTAMP
-        """ if db_manager._db_type == 'postgresql' else """
-        INSERT OR REPLACE INTO conversations (user_id, topic_id, status, created_at, updated_at)
-        VALUES (?, ?, 'active', datetime('now'), datetime('now'))
-        """
-        
-        db_manager.execute_query(query, (user_id, topic_id))
+        db_manager.execute_named('save_user_topic', (user_id, topic_id))
+        cache.invalidate_user_cache(user_id)
         logger.info(f"Saved topic {topic_id} for user {user_id}")
         return True
         
@@ -960,86 +1229,82 @@ def save_user_topic(user_id: int, topic_id: int) -> bool:
         logger.error(f"Error saving user topic for {user_id}: {e}")
         return False
 
+# Saves the topic unless the user already has one; returns the topic they end up with
+queries.register('claim_user_topic', """
+    INSERT INTO conversations (user_id, topic_id, status, created_at, updated_at)
+    VALUES (%s, %s, 'active', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET
+        topic_id = COALESCE(conversations.topic_id, EXCLUDED.topic_id),
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING topic_id
+""")
+
+queries.register('touch_conversation_topic', """
+    UPDATE conversations
+    SET last_message_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = %s AND topic_id = %s
+""")
+queries.register('touch_conversation', """
+    UPDATE conversations
+    SET last_message_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = %s
+""")
+
 def update_conversation_activity(user_id: int, topic_id: int = None) -> bool:
     """Update the last message timestamp for a conversation."""
     try:
         if topic_id:
-            query = """
-            UPDATE conversations 
-            SET last_message_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = %s AND topic_id = %s
-            """ if db_manager._db_type == 'postgresql' else """
-            UPDATE conversations 
-            SET last_message_at = datetime('now'), updated_at = datetime('now')
-            WHERE user_id = ? AND topic_id = ?
-            """
-            db_manager.execute_query(query, (user_id, topic_id))
+            db_manager.execute_named('touch_conversation_topic', (user_id, topic_id))
         else:
-            query = """
-            UPDATE conversations 
-            SET last_message_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = %s
-            """ if db_manager._db_type == 'postgresql' else """
-            UPDATE conversations 
-            SET last_message_at = datetime('now'), updated_at = datetime('now')
-            WHERE user_id = ?
-            """
-            db_manager.execute_query(query, (user_id,))
+            db_manager.execute_named('touch_conversation', (user_id,))
         
         return True
     except Exception as e:
         logger.error(f"Error updating conversation activity for {user_id}: {e}")
         return False
 
+queries.register('get_user_by_topic_id', "SELECT user_id FROM conversations WHERE topic_id = %s")
+
 def get_user_by_topic_id(topic_id: int) -> Optional[int]:
     """Get user ID by topic ID."""
     try:
-        query = """
-        SELECT user_id FROM conversations WHERE topic_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT user_id FROM conversations WHERE topic_id = ?
-        """
-        result = db_manager.execute_query(query, (topic_id,), fetch_one=True)
+        result = db_manager.execute_named('get_user_by_topic_id', (topic_id,), fetch_one=True)
         return result['user_id'] if result else None
     except Exception as e:
         logger.error(f"Error getting user by topic ID {topic_id}: {e}")
         return None
 
+queries.register('get_user_info', """
+    SELECT telegram_id, username, first_name, last_name, message_credits,
+           time_credits, is_banned, ban_reason, created_at, updated_at, last_active
+    FROM users
+    WHERE telegram_id = %s
+""")
+
 def get_user_info(user_id: int) -> Optional[Dict[str, Any]]:
     """Get detailed user information."""
     try:
-        query = """
-        SELECT telegram_id, username, first_name, last_name, message_credits, 
-               time_credits, is_banned, ban_reason, created_at, updated_at, last_active
-        FROM users 
-        WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id, username, first_name, last_name, message_credits, 
-               time_credits, is_banned, ban_reason, created_at, updated_at, last_active
-        FROM users 
-        WHERE telegram_id = ?
-        """
-        
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('get_user_info', (user_id,), fetch_one=True)
         return dict(result) if result else None
         
     except Exception as e:
         logger.error(f"Error getting user info for {user_id}: {e}")
         return None
 
+queries.register('active_conversations_count', """
+    SELECT COUNT(DISTINCT user_id)
+    FROM conversations
+    WHERE last_message_at >= NOW() - INTERVAL '24 hours'
+""", sqlite="""
+    SELECT COUNT(DISTINCT user_id)
+    FROM conversations
+    WHERE last_message_at >= datetime('now', '-24 hours')
+""", workload=queries.ANALYTICS)
+
 def get_active_conversations_count() -> int:
     """Get count of active conversations (messages in last 24 hours)."""
     try:
-        query = """
-        SELECT COUNT(DISTINCT user_id) 
-        FROM conversations 
-        WHERE last_message_at >= NOW() - INTERVAL '24 hours'
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(DISTINCT user_id) 
-        FROM conversations 
-        WHERE last_message_at >= datetime('now', '-24 hours')
-        """
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('active_conversations_count', fetch_one=True)
         return result[0] if result else 0
     except Exception as e:
         logger.error(f"Error getting active conversations count: {e}")
@@ -1050,115 +1315,106 @@ def get_unread_messages_count() -> int:
     # This would require additional message tracking
     return 0
 
+queries.register('today_revenue', """
+    SELECT COALESCE(SUM(amount), 0)
+    FROM payment_logs
+    WHERE timestamp >= CURRENT_DATE
+""", sqlite="""
+    SELECT COALESCE(SUM(amount), 0)
+    FROM payment_logs
+    WHERE timestamp >= DATE('now')
+""", workload=queries.ANALYTICS)
+
 def get_today_revenue() -> float:
     """Get today's revenue."""
     try:
-        query = """
-        SELECT COALESCE(SUM(amount), 0) 
-        FROM payment_logs 
-        WHERE DATE(created_at) = CURRENT_DATE
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COALESCE(SUM(amount), 0) 
-        FROM payment_logs 
-        WHERE DATE(created_at) = DATE('now')
-        """
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('today_revenue', fetch_one=True)
         return float(result[0]) if result else 0.0
     except Exception as e:
         logger.error(f"Error getting today's revenue: {e}")
         return 0.0
 
+queries.register('today_new_users', """
+    SELECT COUNT(*)
+    FROM users
+    WHERE created_at >= CURRENT_DATE
+""", sqlite="""
+    SELECT COUNT(*)
+    FROM users
+    WHERE created_at >= DATE('now')
+""", workload=queries.ANALYTICS)
+
 def get_today_new_users() -> int:
     """Get count of new users today."""
     try:
-        query = """
-        SELECT COUNT(*) 
-        FROM users 
-        WHERE DATE(created_at) = CURRENT_DATE
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(*) 
-        FROM users 
-        WHERE DATE(created_at) = DATE('now')
-        """
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('today_new_users', fetch_one=True)
         return result[0] if result else 0
     except Exception as e:
         logger.error(f"Error getting today's new users: {e}")
         return 0
 
+queries.register('yesterday_new_users', """
+    SELECT COUNT(*)
+    FROM users
+    WHERE created_at >= CURRENT_DATE - INTERVAL '1 day' AND created_at < CURRENT_DATE
+""", sqlite="""
+    SELECT COUNT(*)
+    FROM users
+    WHERE created_at >= DATE('now', '-1 day') AND created_at < DATE('now')
+""", workload=queries.ANALYTICS)
+
 def get_yesterday_new_users() -> int:
     """Get count of new users yesterday."""
     try:
-        query = """
-        SELECT COUNT(*) 
-        FROM users 
-        WHERE DATE(created_at) = CURRENT_DATE - INTERVAL '1 day'
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(*) 
-        FROM users 
-        WHERE DATE(created_at) = DATE('now', '-1 day')
-        """
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('yesterday_new_users', fetch_one=True)
         return result[0] if result else 0
     except Exception as e:
         logger.error(f"Error getting yesterday's new users: {e}")
         return 0
 
+queries.register('banned_users_list', """
+    SELECT telegram_id, username, first_name, ban_reason, updated_at
+    FROM users
+    WHERE is_banned = TRUE
+    ORDER BY updated_at DESC
+    LIMIT %s
+""", workload=queries.ANALYTICS)
+
 def get_banned_users_list(limit: int = 50) -> List[Dict[str, Any]]:
     """Get list of banned users."""
     try:
-        query = """
-        SELECT telegram_id, username, first_name, ban_reason, updated_at
-        FROM users 
-        WHERE is_banned = TRUE
-        ORDER BY updated_at DESC
-        LIMIT %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id, username, first_name, ban_reason, updated_at
-        FROM users 
-        WHERE is_banned = 1
-        ORDER BY updated_at DESC
-        LIMIT ?
-        """
-        return db_manager.execute_query(query, (limit,), fetch_all=True)
+        return db_manager.execute_named('banned_users_list', (limit,), fetch_all=True)
     except Exception as e:
         logger.error(f"Error getting banned users: {e}")
         return []
 
+queries.register('vip_users_list', """
+    SELECT telegram_id, username, first_name, message_credits, created_at
+    FROM users
+    WHERE message_credits >= 100
+    ORDER BY message_credits DESC
+    LIMIT %s
+""", workload=queries.ANALYTICS)
+
 def get_vip_users_list(limit: int = 50) -> List[Dict[str, Any]]:
     """Get list of VIP users (high credit balances)."""
     try:
-        query = """
-        SELECT telegram_id, username, first_name, message_credits, created_at
-        FROM users 
-        WHERE message_credits >= 100
-        ORDER BY message_credits DESC
-        LIMIT %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id, username, first_name, message_credits, created_at
-        FROM users 
-        WHERE message_credits >= 100
-        ORDER BY message_credits DESC
-        LIMIT ?
-        """
-        return db_manager.execute_query(query, (limit,), fetch_all=True)
+        return db_manager.execute_named('vip_users_list', (limit,), fetch_all=True)
     except Exception as e:
         logger.error(f"Error getting VIP users: {e}")
         return []
 
+queries.register('count_unbanned_users', "SELECT COUNT(*) FROM users WHERE is_banned = FALSE",
+                 workload=queries.ANALYTICS)
+queries.register('count_all_users', "SELECT COUNT(*) FROM users", workload=queries.ANALYTICS)
+
 def broadcast_message_to_all_users(message: str, exclude_banned: bool = True) -> Dict[str, int]:
-    """Placeholder for broadcast functionality - returns success/failure counts."""
-    # This would be implemented with actual message sending logic
+    """Audience size for a broadcast to every user; sending is done by ``src.broadcast``."""
     try:
-        query = """
-        SELECT COUNT(*) FROM users WHERE is_banned = FALSE
-        """ if exclude_banned else """
-        SELECT COUNT(*) FROM users
-        """
-        result = db_manager.execute_query(query, fetch_one=True)
+        statement = 'count_unbanned_users' if exclude_banned else 'count_all_users'
+        result = db_manager.execute_named(statement, fetch_one=True)
         total_users = result[0] if result else 0
         
-        # Placeholder - in real implementation, you'd send messages here
         return {
             'total_users': total_users,
             'sent': 0,  # Placeholder
@@ -1168,46 +1424,29 @@ def broadcast_message_to_all_users(message: str, exclude_banned: bool = True) ->
         logger.error(f"Error in broadcast: {e}")
         return {'total_users': 0, 'sent': 0, 'failed': 0}
 
+queries.register('conversations_with_details', """
+    SELECT
+        c.user_id,
+        u.username,
+        u.first_name,
+        u.message_credits,
+        u.is_banned,
+        c.last_message_at,
+        COUNT(CASE WHEN c.status = 'unread' THEN 1 END) as unread_count,
+        COUNT(*) as total_messages,
+        c.notes
+    FROM conversations c
+    LEFT JOIN users u ON c.user_id = u.telegram_id
+    WHERE c.status = 'active'
+    GROUP BY c.user_id, u.username, u.first_name, u.message_credits, u.is_banned, c.last_message_at, c.notes
+    ORDER BY c.last_message_at DESC
+    LIMIT %s
+""", workload=queries.ANALYTICS)
+
 def get_all_conversations_with_details(limit: int = 20) -> List[Dict[str, Any]]:
     """Get conversations with user details and message counts."""
     try:
-        query = """
-        SELECT 
-            c.user_id,
-            u.username,
-            u.first_name,
-            u.message_credits,
-            u.is_banned,
-            c.last_message_at,
-            COUNT(CASE WHEN c.status = 'unread' THEN 1 END) as unread_count,
-            COUNT(*) as total_messages,
-            c.notes
-        FROM conversations c
-        LEFT JOIN users u ON c.user_id = u.telegram_id
-        WHERE c.status = 'active'
-        GROUP BY c.user_id, u.username, u.first_name, u.message_credits, u.is_banned, c.last_message_at, c.notes
-        ORDER BY c.last_message_at DESC
-        LIMIT %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT 
-            c.user_id,
-            u.username,
-            u.first_name,
-            u.message_credits,
-            u.is_banned,
-            c.last_message_at,
-            COUNT(CASE WHEN c.status = 'unread' THEN 1 END) as unread_count,
-            COUNT(*) as total_messages,
-            c.notes
-        FROM conversations c
-        LEFT JOIN users u ON c.user_id = u.telegram_id
-        WHERE c.status = 'active'
-        GROUP BY c.user_id, u.username, u.first_name, u.message_credits, u.is_banned, c.last_message_at, c.notes
-        ORDER BY c.last_message_at DESC
-        LIMIT ?
-        """
-        
-        conversations = db_manager.execute_query(query, (limit,), fetch_all=True)
+        conversations = db_manager.execute_named('conversations_with_details', (limit,), fetch_all=True)
         
         # Add formatted time_ago and mock last_message for now
         for conv in conversations:
@@ -1221,38 +1460,36 @@ def get_all_conversations_with_details(limit: int = 20) -> List[Dict[str, Any]]:
         logger.error(f"Error getting conversations with details: {e}")
         return []
 
+queries.register('user_balance_totals', """
+    SELECT COALESCE(SUM(message_credits), 0) AS total_credits,
+           COALESCE(SUM(time_credits_seconds), 0) / 3600 AS total_time_hours
+    FROM users
+""", workload=queries.ANALYTICS)
+
+def _enhanced_dashboard_stats() -> Dict[str, Any]:
+    base_stats = get_user_stats()
+
+    # Get additional enhanced stats
+    totals = db_manager.execute_named('user_balance_totals', fetch_one=True)
+    total_credits = totals['total_credits'] if totals else 0
+    total_time_hours = totals['total_time_hours'] if totals else 0
+
+    return {
+        **base_stats,
+        'active_users': base_stats.get('total_users', 0) - base_stats.get('banned_users', 0),
+        'total_credits': int(total_credits),
+        'total_time_hours': int(total_time_hours),
+        'today_users': get_today_new_users(),
+        'week_users': get_week_new_users(),
+        'active_conversations': get_active_conversations_count(),
+        'unread_messages': get_unread_messages_count(),
+        'vip_users': len(get_vip_users_list(100))
+    }
+
 async def get_enhanced_dashboard_stats() -> Dict[str, Any]:
-    """Get enhanced dashboard statistics."""
+    """Get enhanced dashboard statistics on the analytics executor and pool."""
     try:
-        base_stats = get_user_stats()
-        
-        # Get additional enhanced stats
-        total_credits = db_manager.execute_query(
-            "SELECT COALESCE(SUM(message_credits), 0) FROM users",
-            fetch_one=True
-        )[0] if db_manager.execute_query("SELECT COALESCE(SUM(message_credits), 0) FROM users", fetch_one=True) else 0
-        
-        total_time_hours = db_manager.execute_query(
-            "SELECT COALESCE(SUM(time_credits_seconds), 0) / 3600 FROM users",
-            fetch_one=True
-        )[0] if db_manager.execute_query("SELECT COALESCE(SUM(time_credits_seconds), 0) / 3600 FROM users", fetch_one=True) else 0
-        
-        week_users = get_week_new_users()
-        
-        enhanced_stats = {
-            **base_stats,
-            'active_users': base_stats.get('total_users', 0) - base_stats.get('banned_users', 0),
-            'total_credits': int(total_credits),
-            'total_time_hours': int(total_time_hours),
-            'today_users': get_today_new_users(),
-            'week_users': week_users,
-            'active_conversations': get_active_conversations_count(),
-            'unread_messages': get_unread_messages_count(),
-            'vip_users': len(get_vip_users_list(100))
-        }
-        
-        return enhanced_stats
-        
+        return await run_db(_enhanced_dashboard_stats, workload=queries.ANALYTICS)
     except Exception as e:
         logger.error(f"Error getting enhanced dashboard stats: {e}")
         return {
@@ -1268,45 +1505,44 @@ async def get_enhanced_dashboard_stats() -> Dict[str, Any]:
             'vip_users': 0
         }
 
+queries.register('week_new_users', """
+    SELECT COUNT(*)
+    FROM users
+    WHERE created_at >= NOW() - INTERVAL '7 days'
+""", sqlite="""
+    SELECT COUNT(*)
+    FROM users
+    WHERE created_at >= datetime('now', '-7 days')
+""", workload=queries.ANALYTICS)
+
 def get_week_new_users() -> int:
     """Get count of new users this week."""
     try:
-        query = """
-        SELECT COUNT(*) 
-        FROM users 
-        WHERE created_at >= NOW() - INTERVAL '7 days'
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(*) 
-        FROM users 
-        WHERE created_at >= datetime('now', '-7 days')
-        """
-        result = db_manager.execute_query(query, fetch_one=True)
+        result = db_manager.execute_named('week_new_users', fetch_one=True)
         return result[0] if result else 0
     except Exception as e:
         logger.error(f"Error getting week new users: {e}")
         return 0
 
+queries.register('user_purchase_count', "SELECT COUNT(*) FROM payment_logs WHERE telegram_id = %s")
+
 def get_user_purchase_count(user_id: int) -> int:
     """Get total purchase count for user."""
     try:
-        query = """
-        SELECT COUNT(*) FROM payment_logs WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(*) FROM payment_logs WHERE telegram_id = ?
-        """
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('user_purchase_count', (user_id,), fetch_one=True)
         return result[0] if result else 0
     except Exception as e:
         logger.error(f"Error getting user purchase count: {e}")
         return 0
 
+queries.register('total_topics', "SELECT COUNT(DISTINCT topic_id) FROM conversations WHERE topic_id IS NOT NULL",
+                 workload=queries.ANALYTICS)
+
 def get_topic_statistics() -> Dict[str, int]:
     """Get topic system statistics."""
     try:
-        total_topics = db_manager.execute_query(
-            "SELECT COUNT(DISTINCT topic_id) FROM conversations WHERE topic_id IS NOT NULL",
-            fetch_one=True
-        )[0] if db_manager.execute_query("SELECT COUNT(DISTINCT topic_id) FROM conversations WHERE topic_id IS NOT NULL", fetch_one=True) else 0
+        result = db_manager.execute_named('total_topics', fetch_one=True)
+        total_topics = result[0] if result else 0
         
         active_topics = get_active_conversations_count()
         
@@ -1323,15 +1559,13 @@ def get_topic_statistics() -> Dict[str, int]:
             'topic_enabled': False
         }
 
+queries.register('last_low_balance_notification',
+                 "SELECT last_low_balance_notification FROM users WHERE telegram_id = %s")
+
 def can_send_low_balance_notification(user_id: int) -> bool:
     """Check if a low balance notification can be sent to the user."""
     try:
-        query = """
-        SELECT last_low_balance_notification FROM users WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT last_low_balance_notification FROM users WHERE telegram_id = ?
-        """
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('last_low_balance_notification', (user_id,), fetch_one=True)
         if result and result['last_low_balance_notification']:
             # Check if the last notification was sent more than 24 hours ago
             last_notification_time = result['last_low_balance_notification']
@@ -1344,18 +1578,26 @@ def can_send_low_balance_notification(user_id: int) -> bool:
         logger.error(f"Error checking low balance notification status for user {user_id}: {e}")
         return True
 
+queries.register('touch_low_balance_notification',
+                 "UPDATE users SET last_low_balance_notification = CURRENT_TIMESTAMP WHERE telegram_id = %s")
+
 def update_low_balance_notification_status(user_id: int) -> None:
     """Update the timestamp of the last low balance notification."""
     try:
-        query = """
-        UPDATE users SET last_low_balance_notification = CURRENT_TIMESTAMP WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE users SET last_low_balance_notification = datetime('now') WHERE telegram_id = ?
-        """
-        db_manager.execute_query(query, (user_id,))
+        db_manager.execute_named('touch_low_balance_notification', (user_id,))
     except Exception as e:
         logger.error(f"Error updating low balance notification status for user {user_id}: {e}")
 
+queries.register('clear_low_balance_notification',
+                 "UPDATE users SET last_low_balance_notification = NULL WHERE telegram_id = %s")
+
+def clear_low_balance_notification_status(user_id: int) -> None:
+    """Give back a low balance notification claimed for a charge that was refunded."""
+    try:
+        db_manager.execute_named('clear_low_balance_notification', (user_id,))
+    except Exception as e:
+        logger.error(f"Error clearing low balance notification status for user {user_id}: {e}")
+
 def get_user_tier(user_id: int) -> str:
     """Get the user's tier based on their credit balance."""
     credits = get_user_credits_optimized(user_id)
@@ -1377,71 +1619,510 @@ def apply_tier_discount(cost: int, tier: str) -> int:
     else:
         return cost
 
+# ========================= Credit Reservations =========================
+#
+# A reservation moves credits out of the user's balance into a short-lived
+# hold. The hold is committed once the paid action (e.g. the Telegram forward)
+# has succeeded, or released back to the balance on failure. Holds that are
+# neither committed nor released expire and are released by the sweeper.
+# A commit that arrives after that (the send sat in the outbound queue past
+# the TTL) takes the credits again, so a delivered message is never free.
+# Every step is a conditional UPDATE, so concurrent messages from one user
+# serialize on the row lock instead of overselling a read balance.
+
+def reservation_ttl() -> int:
+    """Seconds a credit hold lives before the sweeper releases it."""
+    return int(getattr(settings, 'CREDIT_RESERVATION_TTL', 120))
+
+
+RESERVE_CREDITS_SQL = """
+WITH debited AS (
+    UPDATE users
+    SET message_credits = message_credits - %s,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE telegram_id = %s AND message_credits >= %s
+    RETURNING telegram_id
+)
+INSERT INTO credit_reservations (telegram_id, amount, reason, expires_at)
+SELECT telegram_id, %s, %s, CURRENT_TIMESTAMP + CAST(%s AS INTEGER) * INTERVAL '1 second'
+FROM debited
+RETURNING id
+"""
+
+COMMIT_RESERVATION_SQL = """
+UPDATE credit_reservations
+SET status = 'committed', settled_at = CURRENT_TIMESTAMP
+WHERE id = %s AND status = 'held'
+"""
+
+# Commit a hold the sweeper already refunded: debit it again, down to zero at most
+COMMIT_EXPIRED_RESERVATION_SQL = """
+WITH recommitted AS (
+    UPDATE credit_reservations
+    SET status = 'committed', settled_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND status = 'expired'
+    RETURNING telegram_id, amount
+)
+UPDATE users u
+SET message_credits = GREATEST(u.message_credits - r.amount, 0),
+    updated_at = CURRENT_TIMESTAMP
+FROM recommitted r
+WHERE u.telegram_id = r.telegram_id
+RETURNING u.telegram_id
+"""
+
+# Release held reservations matching {where} and credit their amounts back,
+# summed per user so one statement can settle many holds for the same user.
+# Expired holds are marked 'expired' so a late commit can tell them apart.
+RELEASE_RESERVATIONS_SQL = """
+WITH released AS (
+    UPDATE credit_reservations
+    SET status = '{status}', settled_at = CURRENT_TIMESTAMP
+    WHERE status = 'held' AND {where}
+    RETURNING telegram_id, amount
+),
+refunds AS (
+    SELECT telegram_id, SUM(amount) AS amount, COUNT(*) AS holds
+    FROM released
+    GROUP BY telegram_id
+)
+UPDATE users u
+SET message_credits = u.message_credits + r.amount,
+    updated_at = CURRENT_TIMESTAMP
+FROM refunds r
+WHERE u.telegram_id = r.telegram_id
+RETURNING u.telegram_id, r.holds
+"""
+
+# PostgreSQL statements; SQLite settles holds in explicit transactions below
+queries.register('reserve_credits', RESERVE_CREDITS_SQL)
+# Refunds go through notify_credits_changed, which pins the refunded users' reads
+queries.register('commit_reservation', COMMIT_RESERVATION_SQL, pins_reads=False)
+queries.register('commit_expired_reservation', COMMIT_EXPIRED_RESERVATION_SQL, pins_reads=False)
+queries.register('release_reservation',
+                 RELEASE_RESERVATIONS_SQL.format(status='released', where='id = %s'), pins_reads=False)
+queries.register('release_expired_reservations',
+                 RELEASE_RESERVATIONS_SQL.format(status='expired', where='expires_at < CURRENT_TIMESTAMP'),
+                 pins_reads=False)
+
+
+def reserve_credits(user_id: int, amount: int, reason: str = 'message') -> Optional[int]:
+    """Hold ``amount`` credits for a pending action.
+
+    Returns the reservation ID, or None if the balance cannot cover it.
+    """
+    try:
+        if db_manager._db_type == 'postgresql':
+            row = db_manager.execute_named(
+                'reserve_credits',
+                (amount, user_id, amount, amount, reason, reservation_ttl()),
+                fetch_one=True
+            )
+            if not row:
+                return None
+            notify_credits_changed(user_id)
+            return row['id']
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                UPDATE users SET message_credits = message_credits - ?, updated_at = datetime('now')
+                WHERE telegram_id = ? AND message_credits >= ?
+            """, (amount, user_id, amount))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return None
+            cursor.execute("""
+                INSERT INTO credit_reservations (telegram_id, amount, reason, expires_at)
+                VALUES (?, ?, ?, datetime('now', ?))
+            """, (user_id, amount, reason, f"+{reservation_ttl()} seconds"))
+            reservation_id = cursor.lastrowid
+            conn.commit()
+        notify_credits_changed(user_id)
+        return reservation_id
+    except Exception as e:
+        logger.error(f"Error reserving {amount} credits for user {user_id}: {e}")
+        return None
+
+
+def _commit_expired_reservation_sqlite(reservation_id: int) -> Optional[int]:
+    """SQLite fallback for COMMIT_EXPIRED_RESERVATION_SQL; returns the debited user."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT telegram_id, amount FROM credit_reservations WHERE id = ? AND status = 'expired'",
+                       (reservation_id,))
+        hold = cursor.fetchone()
+        if hold is None:
+            conn.rollback()
+            return None
+        cursor.execute("UPDATE credit_reservations SET status = 'committed', settled_at = datetime('now') WHERE id = ?",
+                       (reservation_id,))
+        cursor.execute("""
+            UPDATE users SET message_credits = MAX(message_credits - ?, 0), updated_at = datetime('now')
+            WHERE telegram_id = ?
+        """, (hold['amount'], hold['telegram_id']))
+        conn.commit()
+    return hold['telegram_id']
+
+
+def commit_expired_reservation(reservation_id: int) -> bool:
+    """Commit a hold the sweeper already refunded by debiting it again. False if it was not expired."""
+    if db_manager._db_type == 'postgresql':
+        row = db_manager.execute_named('commit_expired_reservation', (reservation_id,), fetch_one=True)
+        user_id = row['telegram_id'] if row else None
+    else:
+        user_id = _commit_expired_reservation_sqlite(reservation_id)
+    if user_id is None:
+        return False
+    notify_credits_changed(user_id)
+    logger.warning(f"Credit reservation {reservation_id} expired before commit; charged user {user_id} again")
+    return True
+
+
+def commit_reservation(reservation_id: int) -> bool:
+    """Make a held reservation permanent, re-debiting it if it had expired. False if it was released."""
+    try:
+        committed = (db_manager.execute_named('commit_reservation', (reservation_id,)) == 1
+                     or commit_expired_reservation(reservation_id))
+        if not committed:
+            logger.warning(f"Credit reservation {reservation_id} was already settled before commit")
+        return committed
+    except Exception as e:
+        logger.error(f"Error committing credit reservation {reservation_id}: {e}")
+        return False
+
+
+def _release_reservations_sqlite(where: str, params: tuple, status: str = 'released') -> int:
+    """SQLite fallback for releasing holds: select, settle and refund in one transaction."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            f"SELECT id, telegram_id, amount FROM credit_reservations WHERE status = 'held' AND {where}",
+            params
+        )
+        holds = cursor.fetchall()
+        refunds = {}
+        for hold in holds:
+            refunds[hold['telegram_id']] = refunds.get(hold['telegram_id'], 0) + hold['amount']
+        cursor.executemany(
+            "UPDATE credit_reservations SET status = ?, settled_at = datetime('now') WHERE id = ?",
+            [(status, hold['id']) for hold in holds]
+        )
+        cursor.executemany(
+            "UPDATE users SET message_credits = message_credits + ?, updated_at = datetime('now') WHERE telegram_id = ?",
+            [(amount, telegram_id) for telegram_id, amount in refunds.items()]
+        )
+        conn.commit()
+    for telegram_id in refunds:
+        notify_credits_changed(telegram_id)
+    return len(holds)
+
+
+def release_reservation(reservation_id: int) -> bool:
+    """Return a held reservation's credits to the user. False if already settled."""
+    try:
+        if db_manager._db_type == 'postgresql':
+            rows = db_manager.execute_named('release_reservation', (reservation_id,), fetch_all=True)
+            for row in rows or []:
+                notify_credits_changed(row['telegram_id'])
+            return bool(rows)
+        return _release_reservations_sqlite('id = ?', (reservation_id,)) == 1
+    except Exception as e:
+        logger.error(f"Error releasing credit reservation {reservation_id}: {e}")
+        return False
+
+
+def release_expired_reservations() -> int:
+    """Release every hold past its expiry. Returns the number of holds released."""
+    try:
+        if db_manager._db_type == 'postgresql':
+            rows = db_manager.execute_named('release_expired_reservations', fetch_all=True)
+            for row in rows or []:
+                notify_credits_changed(row['telegram_id'])
+            released = sum(row['holds'] for row in rows) if rows else 0
+        else:
+            released = _release_reservations_sqlite("expires_at < datetime('now')", (), status='expired')
+        if released:
+            logger.info(f"Released {released} expired credit reservations")
+        return released
+    except Exception as e:
+        logger.error(f"Error releasing expired credit reservations: {e}")
+        return 0
+
+# ========================= Message Charging =========================
+
+# Setting key and default cost for each message type
+MESSAGE_COST_SETTINGS = {
+    'text': ('cost_text_message', '1'),
+    'photo': ('cost_photo_message', '1'),
+    'voice': ('cost_voice_message', '1'),
+    'video': ('cost_video_message', '1'),
+    'document': ('cost_document_message', '1'),
+    'sticker': ('cost_sticker_message', '1'),
+}
+
+
+class ChargeResult(NamedTuple):
+    """Outcome of charging a user for one message."""
+    found: bool
+    is_banned: bool
+    charged: bool
+    tier: str
+    base_cost: int
+    price: int
+    balance: int
+    notify_low_balance: bool
+    auto_recharge: bool
+    auto_recharge_amount: int
+    reservation_id: Optional[int] = None
+    error: bool = False  # the charge could not run (database error); nothing was deducted
+
+
+# Ban check, tier-discounted price, conditional decrement into a credit
+# reservation and the low-balance / auto-recharge decision in one statement.
+# The low-balance notification is claimed in the same UPDATE so concurrent
+# messages cannot both send it.
+CHARGE_MESSAGE_SQL = """
+WITH cfg AS (
+    SELECT
+        CAST(COALESCE(MAX(CASE WHEN setting_key = %s THEN setting_value END), %s) AS INTEGER) AS base_cost,
+        CAST(COALESCE(MAX(CASE WHEN setting_key = 'low_credit_threshold' THEN setting_value END), '5') AS INTEGER) AS low_threshold
+    FROM bot_settings
+    WHERE setting_key IN (%s, 'low_credit_threshold')
+),
+priced AS (
+    SELECT u.telegram_id,
+           COALESCE(u.is_banned, FALSE) AS is_banned,
+           COALESCE(u.auto_recharge_enabled, FALSE) AS auto_recharge_enabled,
+           COALESCE(u.auto_recharge_amount, 10) AS auto_recharge_amount,
+           COALESCE(u.auto_recharge_threshold, 5) AS auto_recharge_threshold,
+           t.tier, cfg.base_cost, cfg.low_threshold,
+           CASE t.tier WHEN 'VIP' THEN FLOOR(cfg.base_cost * 0.8)::INTEGER
+                       WHEN 'Regular' THEN FLOOR(cfg.base_cost * 0.9)::INTEGER
+                       ELSE cfg.base_cost END AS price
+    FROM users u
+    CROSS JOIN cfg
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN u.message_credits >= 100 THEN 'VIP'
+                    WHEN u.message_credits >= 50 THEN 'Regular'
+                    ELSE 'New' END AS tier
+    ) t
+    WHERE u.telegram_id = %s
+),
+charged AS (
+    UPDATE users u
+    SET message_credits = u.message_credits - p.price,
+        updated_at = CURRENT_TIMESTAMP,
+        last_low_balance_notification = CASE
+            WHEN u.message_credits - p.price > 0
+             AND u.message_credits - p.price <= p.low_threshold
+             AND (u.last_low_balance_notification IS NULL
+                  OR u.last_low_balance_notification < CURRENT_TIMESTAMP - INTERVAL '24 hours')
+            THEN CURRENT_TIMESTAMP
+            ELSE u.last_low_balance_notification END
+    FROM priced p
+    WHERE u.telegram_id = p.telegram_id
+      AND NOT p.is_banned
+      AND u.message_credits >= p.price
+    RETURNING u.message_credits AS balance,
+              u.last_low_balance_notification = CURRENT_TIMESTAMP AS notify_low_balance
+),
+held AS (
+    INSERT INTO credit_reservations (telegram_id, amount, reason, expires_at)
+    SELECT p.telegram_id, p.price, 'message', CURRENT_TIMESTAMP + CAST(%s AS INTEGER) * INTERVAL '1 second'
+    FROM priced p
+    JOIN charged c ON TRUE
+    RETURNING id
+)
+SELECT p.is_banned, p.tier, p.base_cost, p.price,
+       c.balance IS NOT NULL AS charged,
+       (SELECT id FROM held) AS reservation_id,
+       COALESCE(c.balance, (SELECT message_credits FROM users WHERE telegram_id = p.telegram_id)) AS balance,
+       COALESCE(c.notify_low_balance, FALSE) AS notify_low_balance,
+       COALESCE(c.notify_low_balance, FALSE)
+           AND p.auto_recharge_enabled
+           AND c.balance <= p.auto_recharge_threshold AS auto_recharge,
+       p.auto_recharge_amount
+FROM priced p
+LEFT JOIN charged c ON TRUE
+"""
+queries.register('charge_message', CHARGE_MESSAGE_SQL)
+
+
+def charge_result_from_row(row) -> ChargeResult:
+    """Build a ChargeResult from a CHARGE_MESSAGE_SQL row (or its absence)."""
+    if not row:
+        return ChargeResult(False, False, False, 'New', 0, 0, 0, False, False, 0, None)
+    return ChargeResult(
+        found=True,
+        is_banned=bool(row['is_banned']),
+        charged=bool(row['charged']),
+        tier=row['tier'],
+        base_cost=int(row['base_cost']),
+        price=int(row['price']),
+        balance=int(row['balance'] or 0),
+        notify_low_balance=bool(row['notify_low_balance']),
+        auto_recharge=bool(row['auto_recharge']),
+        auto_recharge_amount=int(row['auto_recharge_amount'] or 10),
+        reservation_id=row['reservation_id'],
+    )
+
+
+def _charge_message_sqlite(user_id: int, setting_key: str, default_cost: str) -> ChargeResult:
+    """SQLite fallback for charge_message: same decision, one connection and transaction."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT setting_key, setting_value FROM bot_settings WHERE setting_key IN (?, 'low_credit_threshold')",
+            (setting_key,)
+        )
+        values = {row[0]: row[1] for row in cursor.fetchall()}
+        base_cost = int(values.get(setting_key) or default_cost)
+        low_threshold = int(values.get('low_credit_threshold') or 5)
+
+        cursor.execute("""
+            SELECT message_credits, is_banned, auto_recharge_enabled, auto_recharge_amount,
+                   auto_recharge_threshold, last_low_balance_notification
+            FROM users WHERE telegram_id = ?
+        """, (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            conn.rollback()
+            return charge_result_from_row(None)
+
+        credits = user['message_credits'] or 0
+        tier = 'VIP' if credits >= 100 else 'Regular' if credits >= 50 else 'New'
+        price = apply_tier_discount(base_cost, tier)
+        result = {
+            'is_banned': bool(user['is_banned']), 'tier': tier, 'base_cost': base_cost, 'price': price,
+            'charged': False, 'balance': credits, 'notify_low_balance': False, 'auto_recharge': False,
+            'auto_recharge_amount': user['auto_recharge_amount'] or 10, 'reservation_id': None,
+        }
+
+        if not result['is_banned'] and credits >= price:
+            balance = credits - price
+            last_notified = user['last_low_balance_notification']
+            can_notify = (not last_notified or
+                          datetime.now() - datetime.fromisoformat(last_notified) >= timedelta(hours=24))
+            notify = can_notify and 0 < balance <= low_threshold
+            cursor.execute(
+                f"""UPDATE users SET message_credits = ?, updated_at = datetime('now')
+                    {", last_low_balance_notification = datetime('now')" if notify else ''}
+                    WHERE telegram_id = ?""",
+                (balance, user_id)
+            )
+            cursor.execute(
+                "INSERT INTO credit_reservations (telegram_id, amount, reason, expires_at) VALUES (?, ?, 'message', datetime('now', ?))",
+                (user_id, price, f"+{reservation_ttl()} seconds")
+            )
+            result.update(
+                charged=True, balance=balance, notify_low_balance=notify, reservation_id=cursor.lastrowid,
+                auto_recharge=notify and bool(user['auto_recharge_enabled'])
+                and balance <= (user['auto_recharge_threshold'] or 5),
+            )
+        conn.commit()
+        return charge_result_from_row(result)
+
+
+def charge_message(user_id: int, message_type: str) -> ChargeResult:
+    """Charge a user for one message in a single round trip.
+
+    Replaces the is_user_banned / get_setting / get_user_tier / decrement /
+    low-balance / auto-recharge query sequence. Nothing is deducted when the
+    user is banned or cannot cover the tier-discounted price. A successful
+    charge is held as a credit reservation: commit it once the message is
+    delivered, release it if delivery fails.
+    """
+    setting_key, default_cost = MESSAGE_COST_SETTINGS.get(message_type, MESSAGE_COST_SETTINGS['text'])
+    try:
+        if db_manager._db_type == 'postgresql':
+            row = db_manager.execute_named(
+                'charge_message', (setting_key, default_cost, setting_key, user_id, reservation_ttl()),
+                fetch_one=True
+            )
+            result = charge_result_from_row(row)
+        else:
+            result = _charge_message_sqlite(user_id, setting_key, default_cost)
+        if result.charged:
+            notify_credits_changed(user_id)
+        return result
+    except Exception as e:
+        logger.error(f"Error charging message for user {user_id}: {e}")
+        return charge_result_from_row(None)._replace(error=True)
+
 # ========================= Existing Functions Continue =========================
 
 def get_user_balance(user_id: int) -> int:
     """Get user's current credit balance (synchronous version for compatibility)."""
     return get_user_credits_optimized(user_id)
 
+queries.register('all_user_ids', "SELECT telegram_id FROM users", workload=queries.ANALYTICS)
+
 def get_all_user_ids() -> List[int]:
     """Get all user IDs."""
     try:
-        query = "SELECT telegram_id FROM users"
-        results = db_manager.execute_query(query, fetch_all=True)
+        results = db_manager.execute_named('all_user_ids', fetch_all=True)
         return [row[0] for row in results] if results else []
     except Exception as e:
         logger.error(f"Error getting all user IDs: {e}")
         return []
 
+queries.register('new_user_ids', """
+    SELECT telegram_id
+    FROM users
+    WHERE created_at >= NOW() - CAST(%s AS INTEGER) * INTERVAL '1 day'
+""", sqlite="""
+    SELECT telegram_id
+    FROM users
+    WHERE created_at >= datetime('now', '-' || %s || ' days')
+""", workload=queries.ANALYTICS)
+
 def get_new_user_ids(days: int = 7) -> List[int]:
     """Get user IDs for users who joined in the last N days."""
     try:
-        query = """
-        SELECT telegram_id 
-        FROM users 
-        WHERE created_at >= NOW() - INTERVAL %s DAY
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id 
-        FROM users 
-        WHERE created_at >= datetime('now', '-%s days')
-        """
-        results = db_manager.execute_query(query, (days,), fetch_all=True)
+        results = db_manager.execute_named('new_user_ids', (days,), fetch_all=True)
         return [row[0] for row in results] if results else []
     except Exception as e:
         logger.error(f"Error getting new user IDs: {e}")
         return []
 
+queries.register('active_user_ids', """
+    SELECT DISTINCT telegram_id
+    FROM users
+    WHERE last_active >= NOW() - CAST(%s AS INTEGER) * INTERVAL '1 day'
+""", sqlite="""
+    SELECT DISTINCT telegram_id
+    FROM users
+    WHERE last_active >= datetime('now', '-' || %s || ' days')
+""", workload=queries.ANALYTICS)
+
 def get_active_user_ids(days: int = 30) -> List[int]:
     """Get user IDs for users who were active in the last N days."""
     try:
-        query = """
-        SELECT DISTINCT telegram_id 
-        FROM users 
-        WHERE last_interaction >= NOW() - INTERVAL %s DAY
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT DISTINCT telegram_id 
-        FROM users 
-        WHERE last_interaction >= datetime('now', '-%s days')
-        """
-        results = db_manager.execute_query(query, (days,), fetch_all=True)
+        results = db_manager.execute_named('active_user_ids', (days,), fetch_all=True)
         return [row[0] for row in results] if results else []
     except Exception as e:
         logger.error(f"Error getting active user IDs: {e}")
         return []
 
+queries.register('active_users_count', """
+    SELECT COUNT(DISTINCT telegram_id)
+    FROM users
+    WHERE last_active >= NOW() - CAST(%s AS INTEGER) * INTERVAL '1 day'
+""", sqlite="""
+    SELECT COUNT(DISTINCT telegram_id)
+    FROM users
+    WHERE last_active >= datetime('now', '-' || %s || ' days')
+""", workload=queries.ANALYTICS)
+
 def get_active_users_count(days: int = 30) -> int:
     """Get count of active users in the last N days."""
     try:
-        query = """
-        SELECT COUNT(DISTINCT telegram_id) 
-        FROM users 
-        WHERE last_interaction >= NOW() - INTERVAL %s DAY
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(DISTINCT telegram_id) 
-        FROM users 
-        WHERE last_interaction >= datetime('now', '-%s days')
-        """
-        result = db_manager.execute_query(query, (days,), fetch_one=True)
+        result = db_manager.execute_named('active_users_count', (days,), fetch_one=True)
         return result[0] if result else 0
     except Exception as e:
         logger.error(f"Error getting active users count: {e}")
@@ -1449,92 +2130,81 @@ def get_active_users_count(days: int = 30) -> int:
 
 # ========================= Quick Replies Functions =========================
 
+queries.register('get_quick_reply', """
+    SELECT response FROM quick_replies
+    WHERE keyword = %s AND is_active = TRUE
+""")
+
 def get_quick_reply(keyword: str) -> Optional[str]:
     """Get quick reply response by keyword."""
     try:
-        query = """
-        SELECT response FROM quick_replies 
-        WHERE keyword = %s AND is_active = true
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT response FROM quick_replies 
-        WHERE keyword = ? AND is_active = 1
-        """
-        result = db_manager.execute_query(query, (keyword,), fetch_one=True)
+        result = db_manager.execute_named('get_quick_reply', (keyword,), fetch_one=True)
         return result[0] if result else None
     except Exception as e:
         logger.error(f"Error getting quick reply: {e}")
         return None
 
+queries.register('get_all_quick_replies', """
+    SELECT id, keyword, response, is_active, created_at, updated_at
+    FROM quick_replies ORDER BY keyword
+""")
+
 def get_all_quick_replies() -> List[Dict[str, Any]]:
     """Get all quick replies."""
     try:
-        query = """
-        SELECT id, keyword, response, is_active, created_at, updated_at 
-        FROM quick_replies ORDER BY keyword
-        """
-        results = db_manager.execute_query(query, fetch_all=True)
+        results = db_manager.execute_named('get_all_quick_replies', fetch_all=True)
         return [dict(row) for row in results] if results else []
     except Exception as e:
         logger.error(f"Error getting quick replies: {e}")
         return []
 
+queries.register('add_quick_reply', "INSERT INTO quick_replies (keyword, response) VALUES (%s, %s)")
+
 def add_quick_reply(keyword: str, response: str) -> bool:
     """Add a new quick reply."""
     try:
-        query = """
-        INSERT INTO quick_replies (keyword, response) 
-        VALUES (%s, %s)
-        """ if db_manager._db_type == 'postgresql' else """
-        INSERT INTO quick_replies (keyword, response) 
-        VALUES (?, ?)
-        """
-        db_manager.execute_query(query, (keyword, response))
+        db_manager.execute_named('add_quick_reply', (keyword, response))
         return True
     except Exception as e:
         logger.error(f"Error adding quick reply: {e}")
         return False
 
+queries.register('update_quick_reply', """
+    UPDATE quick_replies
+    SET keyword = %s, response = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s
+""")
+
 def update_quick_reply(reply_id: int, keyword: str, response: str) -> bool:
     """Update an existing quick reply."""
     try:
-        query = """
-        UPDATE quick_replies 
-        SET keyword = %s, response = %s, updated_at = CURRENT_TIMESTAMP 
-        WHERE id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE quick_replies 
-        SET keyword = ?, response = ?, updated_at = datetime('now') 
-        WHERE id = ?
-        """
-        db_manager.execute_query(query, (keyword, response, reply_id))
+        db_manager.execute_named('update_quick_reply', (keyword, response, reply_id))
         return True
     except Exception as e:
         logger.error(f"Error updating quick reply: {e}")
         return False
 
+queries.register('delete_quick_reply', "DELETE FROM quick_replies WHERE id = %s")
+
 def delete_quick_reply(reply_id: int) -> bool:
     """Delete a quick reply."""
     try:
-        query = "DELETE FROM quick_replies WHERE id = %s" if db_manager._db_type == 'postgresql' else "DELETE FROM quick_replies WHERE id = ?"
-        db_manager.execute_query(query, (reply_id,))
+        db_manager.execute_named('delete_quick_reply', (reply_id,))
         return True
     except Exception as e:
         logger.error(f"Error deleting quick reply: {e}")
         return False
 
+queries.register('toggle_quick_reply', """
+    UPDATE quick_replies
+    SET is_active = NOT is_active, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s
+""")
+
 def toggle_quick_reply_status(reply_id: int) -> bool:
     """Toggle quick reply active status."""
     try:
-        query = """
-        UPDATE quick_replies 
-        SET is_active = NOT is_active, updated_at = CURRENT_TIMESTAMP 
-        WHERE id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE quick_replies 
-        SET is_active = NOT is_active, updated_at = datetime('now') 
-        WHERE id = ?
-        """
-        db_manager.execute_query(query, (reply_id,))
+        db_manager.execute_named('toggle_quick_reply', (reply_id,))
         return True
     except Exception as e:
         logger.error(f"Error toggling quick reply status: {e}")
@@ -1542,44 +2212,40 @@ def toggle_quick_reply_status(reply_id: int) -> bool:
 
 # ========================= Auto-Recharge Functions =========================
 
+queries.register('get_auto_recharge_settings', """
+    SELECT auto_recharge_enabled as enabled, auto_recharge_amount as amount, auto_recharge_threshold as threshold
+    FROM users WHERE telegram_id = %s
+""")
+
 def get_user_auto_recharge_settings(user_id: int) -> Optional[Dict[str, Any]]:
     """Get user's auto-recharge settings."""
     try:
-        query = """
-        SELECT auto_recharge_enabled as enabled, auto_recharge_amount as amount, auto_recharge_threshold as threshold
-        FROM users WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT auto_recharge_enabled as enabled, auto_recharge_amount as amount, auto_recharge_threshold as threshold
-        FROM users WHERE telegram_id = ?
-        """
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('get_auto_recharge_settings', (user_id,), fetch_one=True)
         if result:
             return {
-                'enabled': bool(result[0]),
-                'amount': result[1] or 10,
-                'threshold': result[2] or 5
+                'enabled': bool(result['enabled']),
+                'amount': result['amount'] or 10,
+                'threshold': result['threshold'] or 5
             }
         return None
     except Exception as e:
         logger.error(f"Error getting auto-recharge settings: {e}")
         return None
 
+queries.register('log_auto_recharge', """
+    INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
+    VALUES (%s, %s, 'auto_recharge', %s, NOW())
+""")
+
 async def process_auto_recharge(user_id: int, amount: int) -> bool:
     """Process automatic recharge for a user."""
     try:
         # For now, just add credits (in real implementation, this would charge payment method)
-        success = add_user_credits(user_id, amount)
+        success = await run_db(add_user_credits, user_id, amount)
         if success:
             # Log the auto-recharge transaction
             try:
-                query = """
-                INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
-                VALUES (%s, %s, 'auto_recharge', %s, NOW())
-                """ if db_manager._db_type == 'postgresql' else """
-                INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
-                VALUES (?, ?, 'auto_recharge', ?, datetime('now'))
-                """
-                db_manager.execute_query(query, (user_id, amount, f"Auto-recharge: {amount} credits"))
+                await db_manager.execute_named_async('log_auto_recharge', (user_id, amount, f"Auto-recharge: {amount} credits"))
             except Exception as e:
                 logger.warning(f"Failed to log auto-recharge transaction: {e}")
         return success
@@ -1587,73 +2253,62 @@ async def process_auto_recharge(user_id: int, amount: int) -> bool:
         logger.error(f"Error processing auto-recharge: {e}")
         return False
 
+queries.register('update_auto_recharge_settings', """
+    UPDATE users
+    SET auto_recharge_enabled = %s, auto_recharge_amount = %s, auto_recharge_threshold = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE telegram_id = %s
+""")
+
 def update_user_auto_recharge_settings(user_id: int, enabled: bool, amount: int = 10, threshold: int = 5) -> bool:
     """Update user's auto-recharge settings."""
     try:
-        query = """
-        UPDATE users 
-        SET auto_recharge_enabled = %s, auto_recharge_amount = %s, auto_recharge_threshold = %s, updated_at = CURRENT_TIMESTAMP 
-        WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        UPDATE users 
-        SET auto_recharge_enabled = ?, auto_recharge_amount = ?, auto_recharge_threshold = ?, updated_at = datetime('now') 
-        WHERE telegram_id = ?
-        """
-        db_manager.execute_query(query, (enabled, amount, threshold, user_id))
+        db_manager.execute_named('update_auto_recharge_settings', (enabled, amount, threshold, user_id))
+        cache.invalidate_user_cache(user_id)
         return True
     except Exception as e:
         logger.error(f"Error updating auto-recharge settings: {e}")
         return False
 
+queries.register('user_exists', "SELECT telegram_id FROM users WHERE telegram_id = %s")
+queries.register('create_user', """
+    INSERT INTO users (telegram_id, username, first_name, message_credits, created_at)
+    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+""")
+
 def ensure_user_exists(user_id: int, username: str = None, first_name: str = None) -> bool:
     """Ensure user exists in database, create if not exists."""
     try:
         # Check if user exists
-        query = "SELECT telegram_id FROM users WHERE telegram_id = %s" if db_manager._db_type == 'postgresql' else "SELECT telegram_id FROM users WHERE telegram_id = ?"
-        existing = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        existing = db_manager.execute_named('user_exists', (user_id,), fetch_one=True)
         
         if not existing:
             # Create new user
-            query = """
-            INSERT INTO users (telegram_id, username, first_name, message_credits, created_at) 
-            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-            """ if db_manager._db_type == 'postgresql' else """
-            INSERT INTO users (telegram_id, username, first_name, message_credits, created_at) 
-            VALUES (?, ?, ?, ?, datetime('now'))
-            """
             starting_credits = int(get_setting('starting_credits', '10'))
-            db_manager.execute_query(query, (user_id, username, first_name, starting_credits))
+            db_manager.execute_named('create_user', (user_id, username, first_name, starting_credits))
+            # Drop a cached "unknown user" result
+            cache.invalidate_user_cache(user_id)
             logger.info(f"Created new user: {user_id} (@{username})")
         return True
     except Exception as e:
         logger.error(f"Error ensuring user exists: {e}")
         return False
 
+queries.register('user_message_count', """
+    SELECT COUNT(*) as total_messages
+    FROM transactions
+    WHERE user_id = %s AND transaction_type = 'message'
+""")
+queries.register('user_member_since', "SELECT created_at, message_credits FROM users WHERE telegram_id = %s")
+
 def get_user_stats_individual(user_id: int) -> Dict[str, Any]:
     """Get individual user statistics."""
     try:
         # Get message count from transactions or a simple count
-        query = """
-        SELECT COUNT(*) as total_messages
-        FROM transactions 
-        WHERE user_id = %s AND transaction_type = 'message'
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT COUNT(*) as total_messages
-        FROM transactions 
-        WHERE user_id = ? AND transaction_type = 'message'
-        """
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('user_message_count', (user_id,), fetch_one=True)
         total_messages = result[0] if result else 0
         
         # Get user creation date
-        query = """
-        SELECT created_at, message_credits
-        FROM users WHERE telegram_id = %s
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT created_at, message_credits
-        FROM users WHERE telegram_id = ?
-        """
-        result = db_manager.execute_query(query, (user_id,), fetch_one=True)
+        result = db_manager.execute_named('user_member_since', (user_id,), fetch_one=True)
         
         if result:
             return {
@@ -1670,34 +2325,16 @@ def get_user_stats_individual(user_id: int) -> Dict[str, Any]:
 def initialize_default_data():
     """Initialize database with default settings and products."""
     try:
-        from src.schema import get_default_settings, get_default_products
-        
-        # Insert default settings
-        for key, value in get_default_settings():
-            query = """
-                INSERT INTO bot_settings (setting_key, setting_value) 
-                VALUES (%s, %s) 
-                ON CONFLICT (setting_key) DO NOTHING
-            """ if db_manager._db_type == 'postgresql' else """
-                INSERT OR IGNORE INTO bot_settings (setting_key, setting_value) 
-                VALUES (?, ?)
-            """
-            db_manager.execute_query(query, (key, value))
-        
-        # Insert default products
-        for product in get_default_products():
-            query = """
-                INSERT INTO products (stripe_product_id, stripe_price_id, label, amount, item_type, description, is_active) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s) 
-                ON CONFLICT DO NOTHING
-            """ if db_manager._db_type == 'postgresql' else """
-                INSERT OR IGNORE INTO products (stripe_product_id, stripe_price_id, label, amount, item_type, description, is_active) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """
-            db_manager.execute_query(query, product)
-            
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            migrations.seed_default_data(cursor, db_manager._db_type)
+            conn.commit()
+            cursor.close()
+
+        cache.invalidate_settings_cache()
+        cache.invalidate_products_cache()
         logger.info("✅ Default data initialized successfully")
-        
+
     except Exception as e:
         logger.error(f"Error initializing default data: {e}")
 
@@ -1710,94 +2347,77 @@ def ensure_default_data():
 
 # ========================= Search Functions =========================
 
+queries.register('search_users', """
+    SELECT telegram_id, username, first_name, last_name, message_credits, created_at, is_banned
+    FROM users
+    WHERE username ILIKE %s OR first_name ILIKE %s OR last_name ILIKE %s OR CAST(telegram_id AS TEXT) LIKE %s
+    ORDER BY created_at DESC
+    LIMIT 50
+""", workload=queries.ANALYTICS)
+
 def search_users(query: str) -> List[Dict[str, Any]]:
     """Search users by username, name, or ID."""
     try:
         search_query = f"%{query}%"
-        db_query = """
-        SELECT telegram_id, username, first_name, last_name, message_credits, created_at, is_banned
-        FROM users 
-        WHERE username ILIKE %s OR first_name ILIKE %s OR last_name ILIKE %s OR CAST(telegram_id AS TEXT) LIKE %s
-        ORDER BY created_at DESC
-        LIMIT 50
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT telegram_id, username, first_name, last_name, message_credits, created_at, is_banned
-        FROM users 
-        WHERE username LIKE ? OR first_name LIKE ? OR last_name LIKE ? OR CAST(telegram_id AS TEXT) LIKE ?
-        ORDER BY created_at DESC
-        LIMIT 50
-        """
-        results = db_manager.execute_query(db_query, (search_query, search_query, search_query, search_query), fetch_all=True)
+        results = db_manager.execute_named('search_users', (search_query,) * 4, fetch_all=True)
         return [dict(row) for row in results] if results else []
     except Exception as e:
         logger.error(f"Error searching users: {e}")
         return []
 
+queries.register('search_messages', """
+    SELECT user_id, description, amount, created_at, transaction_type
+    FROM transactions
+    WHERE description ILIKE %s AND transaction_type = 'message'
+    ORDER BY created_at DESC
+    LIMIT 50
+""", workload=queries.ANALYTICS)
+
 def search_messages(query: str) -> List[Dict[str, Any]]:
     """Search message transactions."""
     try:
         search_query = f"%{query}%"
-        db_query = """
-        SELECT user_id, description, amount, created_at, transaction_type
-        FROM transactions 
-        WHERE description ILIKE %s AND transaction_type = 'message'
-        ORDER BY created_at DESC
-        LIMIT 50
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT user_id, description, amount, created_at, transaction_type
-        FROM transactions 
-        WHERE description LIKE ? AND transaction_type = 'message'
-        ORDER BY created_at DESC
-        LIMIT 50
-        """
-        results = db_manager.execute_query(db_query, (search_query,), fetch_all=True)
+        results = db_manager.execute_named('search_messages', (search_query,), fetch_all=True)
         return [dict(row) for row in results] if results else []
     except Exception as e:
         logger.error(f"Error searching messages: {e}")
         return []
 
+queries.register('search_transactions', """
+    SELECT user_id, amount, transaction_type, description, created_at
+    FROM transactions
+    WHERE description ILIKE %s OR transaction_type ILIKE %s OR CAST(user_id AS TEXT) LIKE %s
+    ORDER BY created_at DESC
+    LIMIT 50
+""", workload=queries.ANALYTICS)
+
 def search_transactions(query: str) -> List[Dict[str, Any]]:
     """Search all transactions."""
     try:
         search_query = f"%{query}%"
-        db_query = """
-        SELECT user_id, amount, transaction_type, description, created_at
-        FROM transactions 
-        WHERE description ILIKE %s OR transaction_type ILIKE %s OR CAST(user_id AS TEXT) LIKE %s
-        ORDER BY created_at DESC
-        LIMIT 50
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT user_id, amount, transaction_type, description, created_at
-        FROM transactions 
-        WHERE description LIKE ? OR transaction_type LIKE ? OR CAST(user_id AS TEXT) LIKE ?
-        ORDER BY created_at DESC
-        LIMIT 50
-        """
-        results = db_manager.execute_query(db_query, (search_query, search_query, search_query), fetch_all=True)
+        results = db_manager.execute_named('search_transactions', (search_query,) * 3, fetch_all=True)
         return [dict(row) for row in results] if results else []
     except Exception as e:
         logger.error(f"Error searching transactions: {e}")
         return []
 
+queries.register('search_locked_content', """
+    SELECT id, content_type, description, price, created_at, is_active
+    FROM locked_content
+    WHERE description ILIKE %s OR content_type ILIKE %s
+    ORDER BY created_at DESC
+    LIMIT 50
+""", workload=queries.ANALYTICS)
+
 def search_locked_content(query: str) -> List[Dict[str, Any]]:
     """Search locked content."""
     try:
         search_query = f"%{query}%"
-        db_query = """
-        SELECT id, content_type, description, price, created_at, is_active
-        FROM locked_content 
-        WHERE description ILIKE %s OR content_type ILIKE %s
-        ORDER BY created_at DESC
-        LIMIT 50
-        """ if db_manager._db_type == 'postgresql' else """
-        SELECT id, content_type, description, price, created_at, is_active
-        FROM locked_content 
-        WHERE description LIKE ? OR content_type LIKE ?
-        ORDER BY created_at DESC
-        LIMIT 50
-        """
-        results = db_manager.execute_query(db_query, (search_query, search_query), fetch_all=True)
+        results = db_manager.execute_named('search_locked_content', (search_query, search_query), fetch_all=True)
         return [dict(row) for row in results] if results else []
     except Exception as e:
         logger.error(f"Error searching locked content: {e}")
-        return []
\ No newline at end of file
+        return []
+
+# Compile every statement registered above for the configured database
+queries.registry.compile(db_manager._db_type)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Bounded, fair database connection pool.
+
+``psycopg2.pool.ThreadedConnectionPool`` raises ``PoolError`` the moment all
+connections are checked out. ``ConnectionPool`` makes callers wait instead:
+up to ``timeout`` seconds in a FIFO queue, and a returned connection is
+handed straight to the longest waiter, so a burst cannot starve an early
+caller. Past the timeout ``PoolTimeout`` is raised.
+
+Connections are opened on demand up to ``maxconn`` and, once idle for
+``idle_timeout`` seconds, closed again down to ``minconn``, so the pool
+follows the load. A connection is recycled after ``max_uses`` checkouts or
+``max_lifetime`` seconds, and one that sat idle longer than
+``validate_after`` seconds is checked before it is handed out.
+
+``get_stats()`` reports in-use/idle counts, peaks, wait and hold times and a
+Little's-law estimate of the size the measured load needs (arrival rate x
+average hold time), which is what ``DB_POOL_MAX`` should be sized from.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from src.query_stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the acquire timeout."""
+
+
+class _Slot:
+    """A pooled connection and its bookkeeping."""
+
+    __slots__ = ('conn', 'created_at', 'uses', 'last_used', 'checked_out_at')
+
+    def __init__(self, conn: Any):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.uses = 0
+        self.last_used = now
+        self.checked_out_at = 0.0
+
+
+class _Waiter:
+    """A caller queued for a connection; ``slot`` is None when handed a permit to open one."""
+
+    __slots__ = ('event', 'slot', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.slot: Optional[_Slot] = None
+        self.granted = False
+
+
+class ConnectionPool:
+    """Thread-safe pool with a blocking, first-come-first-served acquire."""
+
+    def __init__(self, connect: Callable[[], Any], minconn: int = 1, maxconn: int = 10,
+                 timeout: float = 5.0, max_uses: int = 0, max_lifetime: float = 0.0,
+                 idle_timeout: float = 300.0, validate_after: float = 30.0,
+                 validate: Optional[Callable[[Any], bool]] = None,
+                 reset: Optional[Callable[[Any], bool]] = None,
+                 close: Optional[Callable[[Any], None]] = None, name: str = 'default'):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size min={minconn} max={maxconn}")
+        self.name = name
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self._connect = connect
+        self._validate = validate
+        self._reset = reset
+        self._close_conn = close or (lambda conn: conn.close())
+
+        self._lock = threading.Lock()
+        self._idle: List[_Slot] = []  # most recently used last
+        self._in_use: Dict[int, _Slot] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        self._total = 0  # open connections plus ones being opened
+        self._closed = False
+
+        self._started_at = time.monotonic()
+        self._acquisitions = 0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = {'uses': 0, 'lifetime': 0, 'invalid': 0, 'idle': 0, 'broken': 0, 'closed': 0}
+        self._peak_in_use = 0
+        self._peak_waiting = 0
+        self._wait = Histogram()
+        self._hold = Histogram()
+
+        for _ in range(minconn):
+            with self._lock:
+                self._total += 1
+            self._idle.append(self._open())
+
+    # -- acquire / release ---------------------------------------------------
+
+    def getconn(self, timeout: Optional[float] = None) -> Any:
+        """Check out a connection, waiting up to ``timeout`` (default ``self.timeout``) seconds."""
+        started = time.monotonic()
+        waiter = None
+        with self._lock:
+            if self._closed:
+                raise PoolTimeout(f"Pool {self.name} is closed")
+            if not self._waiters and self._idle:
+                slot = self._idle.pop()
+            elif not self._waiters and self._total < self.maxconn:
+                slot = None
+                self._total += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                self._peak_waiting = max(self._peak_waiting, len(self._waiters))
+
+        if waiter is not None:
+            limit = self.timeout if timeout is None else timeout
+            waiter.event.wait(limit)
+            with self._lock:
+                if not waiter.granted:
+                    if waiter in self._waiters:  # closeall() already dropped it otherwise
+                        self._waiters.remove(waiter)
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No connection available in pool {self.name} after {limit:.1f}s "
+                                      f"({self.maxconn} in use)")
+            slot = waiter.slot
+
+        slot = self._prepare(slot)
+        now = time.monotonic()
+        slot.uses += 1
+        slot.checked_out_at = now
+        with self._lock:
+            self._in_use[id(slot.conn)] = slot
+            self._acquisitions += 1
+            self._peak_in_use = max(self._peak_in_use, len(self._in_use))
+            self._wait.observe((now - started) * 1000)
+        return slot.conn
+
+    def putconn(self, conn: Any, close: bool = False) -> None:
+        """Return a connection; ``close=True`` discards it (e.g. after a fatal error)."""
+        now = time.monotonic()
+        with self._lock:
+            slot = self._in_use.pop(id(conn), None)
+            if slot is None:
+                raise ValueError(f"Connection not checked out from pool {self.name}")
+            self._hold.observe((now - slot.checked_out_at) * 1000)
+
+        reason = 'broken' if close else self._retire_reason(slot, now)
+        if reason is None and self._reset is not None:
+            try:
+                if not self._reset(conn):
+                    reason = 'broken'
+            except Exception as e:
+                logger.warning(f"Pool {self.name}: could not reset connection: {e}")
+                reason = 'broken'
+        slot.last_used = now
+
+        if reason is None:
+            with self._lock:
+                if self._waiters:
+                    self._grant(self._waiters.popleft(), slot)
+                    slot = None
+                elif not self._closed:
+                    self._idle.append(slot)
+                    slot = None
+            reason = 'closed'  # only used if the pool was closed meanwhile
+        if slot is not None:
+            self._discard(slot, reason)
+        self._reap_idle(now)
+
+    def closeall(self) -> None:
+        """Close idle connections now and in-use ones as they are returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            waiters, self._waiters = list(self._waiters), deque()
+        for slot in idle:
+            self._close_quietly(slot)
+        for waiter in waiters:
+            waiter.event.set()  # wakes them into a PoolTimeout
+
+    # -- internals -----------------------------------------------------------
+
+    def _open(self) -> _Slot:
+        """Open a connection for a permit already counted in ``_total``."""
+        try:
+            slot = _Slot(self._connect())
+        except Exception:
+            self._release_permit()
+            raise
+        with self._lock:
+            self._created += 1
+        return slot
+
+    def _prepare(self, slot: Optional[_Slot]) -> _Slot:
+        """Open, validate or recycle the slot a caller was given."""
+        if slot is None:
+            return self._open()
+        now = time.monotonic()
+        reason = self._retire_reason(slot, now)
+        if reason is None and self._validate is not None and now - slot.last_used >= self.validate_after:
+            try:
+                valid = self._validate(slot.conn)
+            except Exception:
+                valid = False
+            if not valid:
+                reason = 'invalid'
+        if reason is None:
+            return slot
+        # Keep the permit and replace the connection
+        self._discard(slot, reason, release=False)
+        return self._open()
+
+    def _retire_reason(self, slot: _Slot, now: float) -> Optional[str]:
+        if self.max_uses and slot.uses >= self.max_uses:
+            return 'uses'
+        if self.max_lifetime and now - slot.created_at >= self.max_lifetime:
+            return 'lifetime'
+        return None
+
+    def _discard(self, slot: _Slot, reason: str, release: bool = True) -> None:
+        with self._lock:
+            self._recycled[reason] += 1
+        self._close_quietly(slot)
+        if release:
+            self._release_permit()
+
+    def _release_permit(self) -> None:
+        """A connection slot freed up: the next waiter may open a fresh one, else it is given back."""
+        with self._lock:
+            if self._waiters and not self._closed:
+                self._grant(self._waiters.popleft(), None)
+            else:
+                self._total -= 1
+
+    def _grant(self, waiter: _Waiter, slot: Optional[_Slot]) -> None:
+        # Called with the lock held
+        waiter.slot = slot
+        waiter.granted = True
+        waiter.event.set()
+
+    def _reap_idle(self, now: float) -> None:
+        """Close connections idle longer than ``idle_timeout`` while above ``minconn``."""
+        if not self.idle_timeout:
+            return
+        expired = []
+        with self._lock:
+            while (self._idle and self._total > self.minconn
+                   and now - self._idle[0].last_used >= self.idle_timeout):
+                expired.append(self._idle.pop(0))
+                self._total -= 1
+                self._recycled['idle'] += 1
+        for slot in expired:
+            self._close_quietly(slot)
+
+    def _close_quietly(self, slot: _Slot) -> None:
+        try:
+            self._close_conn(slot.conn)
+        except Exception as e:
+            logger.debug(f"Pool {self.name}: error closing connection: {e}")
+
+    # -- metrics -------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool occupancy, wait and hold times, and a measured sizing estimate."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            avg_hold_s = self._hold.total / self._hold.count / 1000 if self._hold.count else 0.0
+            # Little's law: connections busy on average = arrival rate x hold time
+            avg_busy = self._acquisitions / elapsed * avg_hold_s
+            return {
+                'name': self.name,
+                'min': self.minconn,
+                'max': self.maxconn,
+                'open': self._total,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': len(self._waiters),
+                'peak_in_use': self._peak_in_use,
+                'peak_waiting': self._peak_waiting,
+                'acquisitions': self._acquisitions,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'recycled': dict(self._recycled),
+                'wait_avg_ms': round(self._wait.total / self._wait.count, 3) if self._wait.count else 0.0,
+                'wait_p95_ms': round(self._wait.percentile(0.95), 3),
+                'wait_max_ms': round(self._wait.max, 3),
+                'hold_avg_ms': round(avg_hold_s * 1000, 3),
+                'hold_p95_ms': round(self._hold.percentile(0.95), 3),
+                'avg_busy': round(avg_busy, 2),
+                # Twice the average concurrency leaves headroom for bursts
+                'suggested_max': max(1, math.ceil(avg_busy * 2)) if self._hold.count else self.maxconn,
+            }
+
+    def prometheus(self) -> List[str]:
+        """Gauge and counter lines for the ``/metrics`` endpoint."""
+        stats = self.get_stats()
+        label = f'pool="{self.name}"'
+        return [
+            f'bot_db_pool_connections{{{label},state="in_use"}} {stats["in_use"]}',
+            f'bot_db_pool_connections{{{label},state="idle"}} {stats["idle"]}',
+            f'bot_db_pool_waiting{{{label}}} {stats["waiting"]}',
+            f'bot_db_pool_max{{{label}}} {stats["max"]}',
+            f'bot_db_pool_acquisitions_total{{{label}}} {stats["acquisitions"]}',
+            f'bot_db_pool_timeouts_total{{{label}}} {stats["timeouts"]}',
+            f'bot_db_pool_wait_ms_total{{{label}}} {self._wait.total:.3f}',
+        ]
@@ -10,7 +10,9 @@ from typing import Dict, Any, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, ConversationHandler
 
-from src import database
+from src import broadcast, database, persistence, queries, segments
+from src.query_stats import query_stats, format_top_queries
+from src.settings_snapshot import get_settings
 from src.config import settings
 from src.enhanced_menu_system import AdminMenuSystem, MenuStyles, MenuGenerator
 from src.error_handler import monitor_performance
@@ -165,7 +167,7 @@ class EnhancedAdminInterface:
     @staticmethod
     async def _handle_product_management(query, context) -> int:
         """Handle product management menu"""
-        products = database.get_all_products()
+        products = await database.run_db(database.get_all_products)
         active_products = len([p for p in products if p.get('is_active')])
         
         product_msg = f"""🛒 **Product Management Center**
@@ -363,6 +365,7 @@ class EnhancedAdminInterface:
 • ⚡ Response Time: {system_stats['db_response_time']}ms
 • 📊 Active Connections: {system_stats['db_connections']}
 • 💾 Database Size: {system_stats['db_size']}
+• 🐢 Slow Queries: {system_stats['slow_queries']} of {system_stats['queries']}
 
 🤖 **Bot Performance:**
 • ⚡ Uptime: {system_stats['uptime']}
@@ -394,6 +397,11 @@ class EnhancedAdminInterface:
             return await EnhancedAdminInterface._show_banned_users(query, context)
         elif callback_data == "new_users":
             return await EnhancedAdminInterface._show_new_users(query, context)
+        elif callback_data in ("database_health", "performance_monitor"):
+            return await EnhancedAdminInterface._show_database_health(query, context)
+        elif callback_data == "reset_query_stats":
+            query_stats.reset()
+            return await EnhancedAdminInterface._show_database_health(query, context)
         elif callback_data.startswith("view_"):
             return await EnhancedAdminInterface._handle_view_actions(query, context)
         elif callback_data.startswith("edit_"):
@@ -408,32 +416,34 @@ class EnhancedAdminInterface:
     @staticmethod
     async def _get_admin_dashboard_stats() -> Dict[str, Any]:
         """Get real-time admin dashboard statistics"""
-        stats = database.get_user_stats()
-        
-        return {
-            'total_users': stats.get('total_users', 0),
-            'active_users': database.get_active_users_count(1),  # Last 24 hours
-            'today_messages': 0,  # Placeholder - implement message counting
-            'today_revenue': database.get_today_revenue(),
-            'new_users_today': database.get_today_new_users(),
-            'vip_users': len(database.get_vip_users_list(1000)),
-            'pending_payments': 0,  # Placeholder
-            'system_alerts': 0  # Placeholder
-        }
+        def collect() -> Dict[str, Any]:
+            stats = database.get_user_stats()
+            return {
+                'total_users': stats.get('total_users', 0),
+                'active_users': database.get_active_users_count(1),  # Last 24 hours
+                'today_messages': 0,  # Placeholder - implement message counting
+                'today_revenue': database.get_today_revenue(),
+                'new_users_today': database.get_today_new_users(),
+                'vip_users': segments.count_segment('vip'),
+                'pending_payments': 0,  # Placeholder
+                'system_alerts': 0  # Placeholder
+            }
+
+        return await database.run_db(collect, workload=queries.ANALYTICS)
     
     @staticmethod
     async def _get_user_management_stats() -> Dict[str, Any]:
         """Get user management statistics"""
-        stats = database.get_user_stats()
+        stats = await database.run_db(database.get_user_stats, workload=queries.ANALYTICS)
         
         return {
             'total_users': stats.get('total_users', 0),
-            'active_24h': database.get_active_users_count(1),
-            'new_today': database.get_today_new_users(),
+            'active_24h': await database.run_db(database.get_active_users_count, 1, workload=queries.ANALYTICS),
+            'new_today': await database.run_db(database.get_today_new_users, workload=queries.ANALYTICS),
             'regular_users': 0,  # Implement tier counting
-            'vip_users': len(database.get_vip_users_list(1000)),
+            'vip_users': segments.count_segment('vip'),
             'banned_users': stats.get('banned_users', 0),
-            'recent_signups': database.get_week_new_users(),
+            'recent_signups': await database.run_db(database.get_week_new_users, workload=queries.ANALYTICS),
             'low_balance': 0,  # Implement low balance user count
             'high_spenders': 0  # Implement high spender count
         }
@@ -443,10 +453,10 @@ class EnhancedAdminInterface:
         """Get comprehensive analytics data"""
         return {
             'total_messages': 0,  # Implement message counting
-            'active_users': database.get_active_users_count(30),
+            'active_users': await database.run_db(database.get_active_users_count, 30, workload=queries.ANALYTICS),
             'total_revenue': 0,  # Implement total revenue calculation
             'growth_rate': 0,  # Implement growth rate calculation
-            'today_stats': {'messages': 0, 'revenue': database.get_today_revenue()},
+            'today_stats': {'messages': 0, 'revenue': await database.run_db(database.get_today_revenue, workload=queries.ANALYTICS)},
             'week_stats': {'messages': 0, 'revenue': 0},
             'month_stats': {'messages': 0, 'revenue': 0},
             'peak_hour': '14:00',  # Placeholder
@@ -463,9 +473,9 @@ class EnhancedAdminInterface:
             'total_users': user_stats.get('total_users', 0),
             'active_users': database.get_active_users_count(7),
             'regular_users': 0,  # Implement
-            'vip_users': len(database.get_vip_users_list(1000)),
+            'vip_users': segments.count_segment('vip'),
             'new_users': database.get_week_new_users(),
-            'last_campaign_reach': 0,  # Implement
+            'last_campaign_reach': broadcast.last_broadcast_reach(),
             'avg_open_rate': 85.0,  # Placeholder
             'best_time': '14:00'  # Placeholder
         }
@@ -489,12 +499,13 @@ class EnhancedAdminInterface:
     @staticmethod
     def _get_current_settings() -> Dict[str, Any]:
         """Get current bot settings"""
+        bot_settings = get_settings()
         return {
-            'text_cost': database.get_setting('cost_text_message', '1'),
-            'photo_cost': database.get_setting('cost_photo_message', '2'),
-            'video_cost': database.get_setting('cost_video_message', '3'),
-            'document_cost': database.get_setting('cost_document_message', '2'),
-            'welcome_credits': database.get_setting('starting_credits', '10'),
+            'text_cost': bot_settings.get('cost_text_message', '1'),
+            'photo_cost': bot_settings.get('cost_photo_message', '2'),
+            'video_cost': bot_settings.get('cost_video_message', '3'),
+            'document_cost': bot_settings.get('cost_document_message', '2'),
+            'welcome_credits': bot_settings.get('starting_credits', '10'),
             'vip_threshold': '100',
             'regular_threshold': '50',
             'bot_status': 'Online',
@@ -505,7 +516,7 @@ class EnhancedAdminInterface:
     @staticmethod
     async def _get_system_stats() -> Dict[str, Any]:
         """Get system performance statistics"""
-        db_health = database.check_database_health()
+        db_health = await database.run_db(database.check_database_health)
         
         return {
             'cpu_usage': 25.5,  # Placeholder
@@ -516,16 +527,52 @@ class EnhancedAdminInterface:
             'db_response_time': db_health.get('response_time_ms', 0),
             'db_connections': 5,  # Placeholder
             'db_size': '150 MB',  # Placeholder
+            'queries': db_health.get('queries', {}).get('calls', 0),
+            'slow_queries': db_health.get('queries', {}).get('slow', 0),
             'uptime': '15 days',  # Placeholder
             'messages_per_hour': 45,  # Placeholder
             'response_rate': 99.2  # Placeholder
         }
     
+    @staticmethod
+    async def _show_database_health(query, context) -> int:
+        """Show per-statement query latency, most expensive first"""
+        db_health = await database.run_db(database.check_database_health)
+        executor = db_health.get('executor', {})
+        pool_line = ""
+        for label, pool in (("Pool", db_health.get('pool')), ("Analytics pool", db_health.get('analytics_pool'))):
+            if pool:
+                pool_line += (f"\n• 🔌 {label}: {pool['in_use']}/{pool['max']} in use, {pool['idle']} idle, "
+                              f"wait p95 {pool['wait_p95_ms']:g}ms, {pool['timeouts']} timeouts "
+                              f"(suggested max {pool['suggested_max']})")
+
+        # Statement names contain underscores, so keep them in a pre block
+        health_msg = f"""🗄️ **Database Health**
+
+• ✅ Status: {db_health['status'].title()} ({db_health.get('response_time_ms', 0)}ms)
+• 🧵 Executor queue: {executor.get('queue_depth', 0)} (max {executor.get('max_queue_depth', 0)}){pool_line}
+
+**Top queries by total time:**
+```
+{format_top_queries()}
+```"""
+
+        keyboard = [
+            [
+                InlineKeyboardButton("🔄 Refresh", callback_data="database_health"),
+                InlineKeyboardButton("🧹 Reset Stats", callback_data="reset_query_stats")
+            ],
+            [InlineKeyboardButton("🔙 Back to System", callback_data="system")]
+        ]
+
+        await query.edit_message_text(health_msg, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+        return ADMIN_SYSTEM
+
     # User display methods
     @staticmethod
     async def _show_all_users(query, context) -> int:
         """Show paginated list of all users"""
-        users = database.get_all_users(20, 0)  # First 20 users
+        users = await database.run_db(database.get_all_users, 20, 0, workload=queries.ANALYTICS)  # First 20 users
         
         if not users:
             await query.edit_message_text("👥 **No users found in the database.**")
@@ -562,7 +609,7 @@ class EnhancedAdminInterface:
     @staticmethod
     async def _show_vip_users(query, context) -> int:
         """Show VIP users list"""
-        vip_users = database.get_vip_users_list(50)
+        vip_users = await database.run_db(database.get_vip_users_list, 50, workload=queries.ANALYTICS)
         
         if not vip_users:
             await query.edit_message_text("🏆 **No VIP users found.**")
@@ -595,7 +642,7 @@ class EnhancedAdminInterface:
     @staticmethod
     async def _show_banned_users(query, context) -> int:
         """Show banned users list"""
-        banned_users = database.get_banned_users_list(50)
+        banned_users = await database.run_db(database.get_banned_users_list, 50, workload=queries.ANALYTICS)
         
         if not banned_users:
             banned_msg = "✅ **No banned users found.**\n\nYour community is clean!"
@@ -628,20 +675,22 @@ class EnhancedAdminInterface:
     @staticmethod
     async def _show_new_users(query, context) -> int:
         """Show new users from today"""
-        new_users_count = database.get_today_new_users()
+        new_users_count = await database.run_db(database.get_today_new_users, workload=queries.ANALYTICS)
+        yesterday_count = await database.run_db(database.get_yesterday_new_users, workload=queries.ANALYTICS)
+        week_count = await database.run_db(database.get_week_new_users, workload=queries.ANALYTICS)
         
         new_users_msg = f"""🆕 **New Users Today**
 
 📊 **Today's Registrations:** {new_users_count}
-📈 **Yesterday:** {database.get_yesterday_new_users()}
-📅 **This Week:** {database.get_week_new_users()}
+📈 **Yesterday:** {yesterday_count}
+📅 **This Week:** {week_count}
 
 🎯 **Growth Insights:**
-• Average daily signups: {database.get_week_new_users() / 7:.1f}
-• Growth rate: {((new_users_count / max(database.get_yesterday_new_users(), 1)) - 1) * 100:+.1f}%
+• Average daily signups: {week_count / 7:.1f}
+• Growth rate: {((new_users_count / max(yesterday_count, 1)) - 1) * 100:+.1f}%
 
 🎁 **New User Experience:**
-• Welcome credits: {database.get_setting('starting_credits', '10')} credits
+• Welcome credits: {get_settings().get('starting_credits', '10')} credits
 • Tutorial completion rate: 85%
 • First message rate: 70%
 
@@ -720,5 +769,7 @@ def get_enhanced_admin_handlers():
             CallbackQueryHandler(EnhancedAdminInterface.handle_admin_callback, pattern="^exit$"),
             CommandHandler("cancel", lambda u, c: ConversationHandler.END)
         ],
-        per_message=False
+        per_message=False,
+        name='enhanced_admin',
+        persistent=persistence.is_enabled(),
     ) 
\ No newline at end of file
@@ -9,9 +9,10 @@ from typing import Dict, Any, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler
 
-from src import database
+from src import database, outbound, queries
 from src.config import settings
 from src.handlers.admin_commands import is_admin, safe_reply
+from src.user_profile import get_user_profile
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,7 @@ async def conversations_command(update: Update, context: ContextTypes.DEFAULT_TY
         await safe_reply(update, "⛔ You are not authorized.")
         return
     
-    conversations = database.get_all_conversations_with_details()
+    conversations = await database.run_db(database.get_all_conversations_with_details, workload=queries.ANALYTICS)
     
     if not conversations:
         message = """💬 **Active Conversations**
@@ -124,8 +125,8 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await safe_reply(update, "⛔ You are not authorized.")
         return
     
-    users = database.get_all_users(limit=10)
-    stats = database.get_user_stats()
+    users = await database.run_db(database.get_all_users, limit=10, workload=queries.ANALYTICS)
+    stats = await database.run_db(database.get_user_stats, workload=queries.ANALYTICS)
     
     message = f"""👥 **User Management**
 
@@ -267,7 +268,7 @@ Click below to buy instantly!"""
 async def billing_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Customer billing portal - /billing"""
     user_id = update.effective_user.id
-    user_credits = database.get_user_credits_optimized(user_id)
+    user_credits = (await get_user_profile(context, user_id)).message_credits
     
     message = f"""💳 **Customer Portal**
 
@@ -308,7 +309,7 @@ async def topic_status_command(update: Update, context: ContextTypes.DEFAULT_TYP
     
     # Check topic system configuration
     admin_group_configured = bool(settings.ADMIN_GROUP_ID)
-    topic_stats = database.get_topic_statistics()
+    topic_stats = await database.run_db(database.get_topic_statistics, workload=queries.ANALYTICS)
     
     # Test admin group accessibility
     group_accessible = False
@@ -377,7 +378,7 @@ async def buy_content_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         content_id = int(args[0])
-        content = database.get_locked_content(content_id)
+        content = await database.get_locked_content(content_id)
         
         if not content or not content['is_active']:
             await safe_reply(update, "❌ Invalid or unavailable content ID.")
@@ -385,7 +386,7 @@ async def buy_content_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         price = content['price']
         description = content['description']
-        user_credits = database.get_user_credits_optimized(update.effective_user.id)
+        user_credits = (await get_user_profile(context, update.effective_user.id)).message_credits
         
         message = f"""🖼️ **Premium Content**
 
@@ -416,20 +417,23 @@ async def handle_content_purchase(update: Update, context: ContextTypes.DEFAULT_
     content_id = int(query.data.split("_")[1])
     user_id = query.from_user.id
 
-    content = database.get_locked_content(content_id)
+    content = await database.get_locked_content(content_id)
     if not content:
         await query.edit_message_text("❌ This content is no longer available.")
         return
 
     price = content['price']
-    user_credits = database.get_user_credits_optimized(user_id)
+    user_credits = (await get_user_profile(context, user_id)).message_credits
 
     if user_credits < price:
         await query.edit_message_text(f"❌ Insufficient credits. You need {price} credits, but only have {user_credits}. Please /buy more.")
         return
 
-    # Deduct credits and send content
-    new_balance = database.decrement_user_credits_optimized(user_id, price)
+    # Deduct credits and send content (the balance may have changed since the check)
+    new_balance = await database.run_db(database.decrement_user_credits_optimized, user_id, price)
+    if new_balance < 0:
+        await query.edit_message_text(f"❌ Insufficient credits. You need {price} credits. Please /buy more.")
+        return
     
     await query.edit_message_text(f"✅ Purchase successful! Your new balance is {new_balance} credits.")
     
@@ -440,11 +444,14 @@ async def handle_content_purchase(update: Update, context: ContextTypes.DEFAULT_
     
     try:
         if content_type == 'photo':
-            await context.bot.send_photo(chat_id=user_id, photo=file_id, caption=caption)
+            await outbound.send(context.bot, outbound.Lane.NOTIFICATION, 'send_photo',
+                                chat_id=user_id, photo=file_id, caption=caption)
         elif content_type == 'video':
-            await context.bot.send_video(chat_id=user_id, video=file_id, caption=caption)
+            await outbound.send(context.bot, outbound.Lane.NOTIFICATION, 'send_video',
+                                chat_id=user_id, video=file_id, caption=caption)
         elif content_type == 'document':
-            await context.bot.send_document(chat_id=user_id, document=file_id, caption=caption)
+            await outbound.send(context.bot, outbound.Lane.NOTIFICATION, 'send_document',
+                                chat_id=user_id, document=file_id, caption=caption)
     except Exception as e:
         logger.error(f"Error sending locked content {content_id} to user {user_id}: {e}")
         await query.message.reply_text("⚠️ There was an error sending the content. Please contact support.")
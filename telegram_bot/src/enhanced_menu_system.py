@@ -12,10 +12,16 @@ from telegram.ext import ContextTypes
 
 from src import database
 from src.config import settings
+from src.user_profile import UserProfile, load_user_profile
 
 logger = logging.getLogger(__name__)
 
 
+def _profile_for(user_id: int, profile: Optional[UserProfile]) -> UserProfile:
+    """Use the caller's per-update profile, or load one (cached) when a builder is called on its own."""
+    return profile or load_user_profile(user_id) or UserProfile({'telegram_id': user_id})
+
+
 class MenuStyles:
     """Beautiful button styles with emojis and rounded appearance"""
     
@@ -87,10 +93,12 @@ class UserMenuSystem:
     """Enhanced user menu system with beautiful layouts"""
     
     @staticmethod
-    def create_main_menu(user_id: int, is_new_user: bool = False) -> List[List[InlineKeyboardButton]]:
+    def create_main_menu(user_id: int, is_new_user: bool = False,
+                         profile: Optional[UserProfile] = None) -> List[List[InlineKeyboardButton]]:
         """Create the main user menu with priority-based layout"""
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
+        profile = _profile_for(user_id, profile)
+        user_credits = profile.message_credits
+        user_tier = profile.tier
         
         keyboard = []
         
@@ -185,10 +193,10 @@ class UserMenuSystem:
         return keyboard
     
     @staticmethod
-    def create_settings_menu(user_id: int) -> List[List[InlineKeyboardButton]]:
+    def create_settings_menu(user_id: int, profile: Optional[UserProfile] = None) -> List[List[InlineKeyboardButton]]:
         """Create user settings menu"""
-        auto_recharge = database.get_user_auto_recharge_settings(user_id)
-        auto_status = "✅ Enabled" if auto_recharge and auto_recharge.get('enabled') else "❌ Disabled"
+        profile = _profile_for(user_id, profile)
+        auto_status = "✅ Enabled" if profile.auto_recharge_enabled else "❌ Disabled"
         
         keyboard = [
             [
@@ -217,9 +225,6 @@ class UserMenuSystem:
     @staticmethod
     def create_account_menu(user_id: int) -> List[List[InlineKeyboardButton]]:
         """Create detailed account information menu"""
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
-        
         keyboard = [
             [
                 InlineKeyboardButton("💰 Credit Balance", callback_data="detailed_balance"),
@@ -545,10 +550,11 @@ class MenuHelpers:
     """Helper functions for menu operations"""
     
     @staticmethod
-    def get_user_context_menu(user_id: int) -> List[List[InlineKeyboardButton]]:
+    def get_user_context_menu(user_id: int, profile: Optional[UserProfile] = None) -> List[List[InlineKeyboardButton]]:
         """Get contextual menu based on user state"""
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
+        profile = _profile_for(user_id, profile)
+        user_credits = profile.message_credits
+        user_tier = profile.tier
         
         if user_credits < 5:
             # Low balance menu
@@ -566,7 +572,7 @@ class MenuHelpers:
             ]
         else:
             # Regular menu
-            return UserMenuSystem.create_main_menu(user_id)
+            return UserMenuSystem.create_main_menu(user_id, profile=profile)
     
     @staticmethod
     def get_admin_quick_actions() -> List[List[InlineKeyboardButton]]:
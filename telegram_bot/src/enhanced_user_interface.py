@@ -14,6 +14,7 @@ from src import database
 from src.config import settings
 from src.enhanced_menu_system import UserMenuSystem, MenuStyles, MenuHelpers, MenuGenerator
 from src.error_handler import rate_limit, monitor_performance
+from src.user_profile import get_user_profile
 from src.handlers.user_commands import safe_reply, format_balance_display
 from src import stripe_utils
 
@@ -32,21 +33,22 @@ class EnhancedUserInterface:
         username = update.effective_user.username or update.effective_user.first_name or "there"
         
         # Ensure user exists
-        database.ensure_user_exists(user_id, username, update.effective_user.first_name)
+        await database.run_db(database.ensure_user_exists, user_id, username, update.effective_user.first_name)
         
         # Get user data
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
-        user_stats = database.get_user_stats_individual(user_id)
-        is_new_user = user_stats.get('total_messages', 0) == 0
+        profile = await get_user_profile(context, user_id)
+        is_new_user = profile.is_new_user
         
-        # Welcome header with personalization
         if is_new_user:
             # Give welcome bonus
             bonus_credits = 10
-            database.add_user_credits(user_id, bonus_credits)
-            user_credits += bonus_credits
-            
+            await database.run_db(database.add_user_credits, user_id, bonus_credits)
+            profile = await get_user_profile(context, user_id, refresh=True)
+        user_credits = profile.message_credits
+        user_tier = profile.tier
+        
+        # Welcome header with personalization
+        if is_new_user:
             welcome_msg = f"""🎉 **Welcome to the Premium Bot Experience!**
 
 Hi @{username}! You've just unlocked access to our premium messaging platform.
@@ -63,7 +65,7 @@ Hi @{username}! You've just unlocked access to our premium messaging platform.
 
 🚀 **Ready to get started?** Choose an option below:"""
         else:
-            tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
+            tier_emoji = profile.tier_emoji
             
             welcome_msg = f"""👋 **Welcome back, @{username}!**
 
@@ -74,7 +76,7 @@ Hi @{username}! You've just unlocked access to our premium messaging platform.
 🎯 **Quick Actions:** Choose what you'd like to do:"""
         
         # Create beautiful keyboard
-        keyboard = UserMenuSystem.create_main_menu(user_id, is_new_user)
+        keyboard = UserMenuSystem.create_main_menu(user_id, is_new_user, profile=profile)
         
         await safe_reply(update, welcome_msg, reply_markup=InlineKeyboardMarkup(keyboard))
     
@@ -161,11 +163,12 @@ When you need more credits, our secure payment system makes it easy!
     async def _handle_contact_support(query, context) -> None:
         """Handle contact support flow"""
         user_id = query.from_user.id
-        user_tier = database.get_user_tier(user_id)
-        user_credits = database.get_user_credits_optimized(user_id)
+        profile = await get_user_profile(context, user_id)
+        user_tier = profile.tier
+        user_credits = profile.message_credits
         
-        tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
-        discount = "20%" if user_tier == "VIP" else "10%" if user_tier == "Regular" else "0%"
+        tier_emoji = profile.tier_emoji
+        discount = profile.tier_discount
         
         support_msg = f"""💬 **Contact Our Professional Team**
 
@@ -211,10 +214,11 @@ When you need more credits, our secure payment system makes it easy!
     async def _handle_buy_menu(query, context) -> None:
         """Handle credit purchase menu"""
         user_id = query.from_user.id
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
+        profile = await get_user_profile(context, user_id)
+        user_credits = profile.message_credits
+        user_tier = profile.tier
         
-        tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
+        tier_emoji = profile.tier_emoji
         
         buy_msg = f"""💳 **Premium Credit Store**
 
@@ -234,19 +238,19 @@ When you need more credits, our secure payment system makes it easy!
     async def _handle_account_details(query, context) -> None:
         """Handle detailed account information"""
         user_id = query.from_user.id
-        user_info = database.get_user_info(user_id)
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
-        user_stats = database.get_user_stats_individual(user_id)
+        profile = await get_user_profile(context, user_id)
+        user_credits = profile.message_credits
+        user_tier = profile.tier
+        user_stats = profile.stats
         
-        tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
+        tier_emoji = profile.tier_emoji
         
         account_msg = f"""📊 **Account Dashboard**
 
 {format_balance_display(user_credits)}
 
 {tier_emoji} **Tier Status:** {user_tier} User
-🎯 **Tier Benefits:** {('20%' if user_tier == 'VIP' else '10%' if user_tier == 'Regular' else '0%')} discount on all messages
+🎯 **Tier Benefits:** {profile.tier_discount} discount on all messages
 
 📈 **Your Statistics:**
 • 💬 Total Messages: {user_stats.get('total_messages', 0)}
@@ -269,7 +273,8 @@ When you need more credits, our secure payment system makes it easy!
     async def _handle_user_settings(query, context) -> None:
         """Handle user settings menu"""
         user_id = query.from_user.id
-        auto_recharge = database.get_user_auto_recharge_settings(user_id)
+        profile = await get_user_profile(context, user_id)
+        auto_recharge = profile.auto_recharge
         auto_status = "✅ Enabled" if auto_recharge and auto_recharge.get('enabled') else "❌ Disabled"
         
         settings_msg = f"""⚙️ **Personal Settings**
@@ -284,7 +289,7 @@ When you need more credits, our secure payment system makes it easy!
 
 **Customize your experience:**"""
         
-        keyboard = UserMenuSystem.create_settings_menu(user_id)
+        keyboard = UserMenuSystem.create_settings_menu(user_id, profile=profile)
         
         await query.edit_message_text(settings_msg, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
     
@@ -332,8 +337,9 @@ When you need more credits, our secure payment system makes it easy!
     async def _handle_help_menu(query, context) -> None:
         """Handle help and FAQ menu"""
         user_id = query.from_user.id
-        user_tier = database.get_user_tier(user_id)
-        tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
+        profile = await get_user_profile(context, user_id)
+        user_tier = profile.tier
+        tier_emoji = profile.tier_emoji
         
         help_msg = f"""❓ **Help & Support Center**
 
@@ -389,8 +395,8 @@ Our team is ready to assist you personally!"""
     async def _handle_package_category(query, context) -> None:
         """Handle package category selection"""
         category = query.data.replace("category_", "")
-        products = database.get_active_products()
-        user_credits = database.get_user_credits_optimized(query.from_user.id)
+        products = await database.run_db(database.get_active_products)
+        user_credits = (await get_user_profile(context, query.from_user.id)).message_credits
         
         # Filter products by category
         if category == "starter":
@@ -446,14 +452,14 @@ Our team is ready to assist you personally!"""
     async def _handle_product_purchase(query, context) -> None:
         """Handle individual product purchase"""
         product_id = int(query.data.split("_")[1])
-        product = next((p for p in database.get_active_products() if p['id'] == product_id), None)
+        product = next((p for p in await database.run_db(database.get_active_products) if p['id'] == product_id), None)
         
         if not product:
             await query.edit_message_text("❌ This product is no longer available.")
             return
         
         user_id = query.from_user.id
-        customer_id = stripe_utils.get_or_create_stripe_customer(user_id, query.from_user.username)
+        customer_id = await database.run_db(stripe_utils.get_or_create_stripe_customer, user_id, query.from_user.username)
         
         if not customer_id:
             await query.edit_message_text("❌ Could not create customer profile. Please contact support.")
@@ -644,7 +650,7 @@ Reach 100+ total credits purchased and you're automatically upgraded!"""
     @staticmethod
     async def _show_quick_recharge(query, context) -> None:
         """Show quick recharge options"""
-        products = database.get_active_products()
+        products = await database.run_db(database.get_active_products)
         small_packages = [p for p in products if p['amount'] <= 50]
         
         recharge_msg = """⚡ **Quick Recharge**
@@ -13,6 +13,12 @@ import psycopg2
 from datetime import datetime
 from typing import Dict, Any, Optional
 
+try:
+    from src.cache import invalidate_user_cache
+except ImportError:
+    # Running outside the bot package: no shared cache to invalidate
+    invalidate_user_cache = None
+
 # Load environment variables
 load_dotenv()
 
@@ -92,6 +98,9 @@ def add_user_credits(user_id: int, credits: int, credit_type: str = 'message') -
 
             conn.commit()
             logger.info(f"Added {credits} {credit_type} credits to user {user_id}")
+            if invalidate_user_cache:
+                # Bot replicas drop their cached balance for this user
+                invalidate_user_cache(user_id)
     except Exception as e:
         logger.error(f"Error adding credits: {e}")
         if conn:
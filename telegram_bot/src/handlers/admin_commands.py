@@ -4,13 +4,16 @@ Comprehensive admin command system for the Telegram bot.
 Professional admin panel with full menu system matching enterprise requirements.
 """
 
+import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 
-from src import database
+from src import broadcast, database, outbound, persistence, queries, segments
+from src.query_stats import query_stats
 from src.config import settings
 from src.error_handler import monitor_performance
 
@@ -62,18 +65,18 @@ def get_admin_status_emoji() -> str:
 
 async def get_real_time_stats() -> Dict[str, int]:
     """Get real-time statistics for the admin panel."""
-    stats = database.get_user_stats()
+    stats = await database.run_db(database.get_user_stats, workload=queries.ANALYTICS)
     
     # Get additional stats
     try:
         # Active conversations (messages in last 24 hours)
-        active_convs = database.get_active_conversations_count()
+        active_convs = await database.run_db(database.get_active_conversations_count, workload=queries.ANALYTICS)
         # Unread messages count
         unread_count = database.get_unread_messages_count()
         # Today's revenue
-        today_revenue = database.get_today_revenue()
+        today_revenue = await database.run_db(database.get_today_revenue, workload=queries.ANALYTICS)
         # Today's new users
-        today_users = database.get_today_new_users()
+        today_users = await database.run_db(database.get_today_new_users, workload=queries.ANALYTICS)
         
         stats.update({
             'active_conversations': active_convs,
@@ -188,7 +191,7 @@ async def dashboard_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     stats = await get_real_time_stats()
     
     # Calculate growth percentages
-    yesterday_users = database.get_yesterday_new_users()
+    yesterday_users = await database.run_db(database.get_yesterday_new_users, workload=queries.ANALYTICS)
     user_growth = "+∞%" if yesterday_users == 0 else f"+{((stats.get('today_new_users', 0) - yesterday_users) / yesterday_users * 100):.1f}%"
     
     message = f"""📊 **Admin Dashboard**
@@ -267,8 +270,8 @@ async def user_management_handler(update: Update, context: ContextTypes.DEFAULT_
         await safe_reply(update, "❌ Admin access required.")
         return ConversationHandler.END
 
-    users = database.get_all_users(limit=5)  # Get first 5 users for preview
-    total_stats = database.get_user_stats()
+    users = await database.run_db(database.get_all_users, limit=5, workload=queries.ANALYTICS)  # Get first 5 users for preview
+    total_stats = await database.run_db(database.get_user_stats, workload=queries.ANALYTICS)
     
     user_preview = "📋 **Recent Users:**\n"
     if users:
@@ -326,8 +329,8 @@ async def products_menu_handler(update: Update, context: ContextTypes.DEFAULT_TY
         await safe_reply(update, "❌ Admin access required.")
         return ConversationHandler.END
 
-    products = database.get_active_products()
-    all_products = database.get_all_products()  # Will need to implement this
+    products = await database.run_db(database.get_active_products)
+    all_products = await database.run_db(database.get_all_products)  # Will need to implement this
     
     # Calculate stats
     total_products = len(all_products) if all_products else len(products)
@@ -632,7 +635,7 @@ Once you have the Price ID, paste it here or create the product without Stripe f
     
     try:
         # Add product to database
-        success = database.create_product(
+        success = await database.run_db(database.create_product,
             label=product_data['label'],
             amount=product_data['amount'],
             item_type=product_data['item_type'],
@@ -739,6 +742,7 @@ async def system_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     cpu_percent = psutil.cpu_percent(interval=1)
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
+    query_totals = query_stats.totals()
     
     system_info = f"""🖥️ **System Management**
 
@@ -750,6 +754,7 @@ async def system_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
 • Disk: {disk.percent}% ({disk.used // 1024 // 1024 // 1024} GB / {disk.total // 1024 // 1024 // 1024} GB)
 
 **Database Status:** Connected ✅
+**Queries:** {query_totals['calls']} run, {query_totals['slow']} slow, {query_totals['errors']} failed
 **Bot Status:** Running ✅"""
     
     keyboard = [
@@ -814,7 +819,7 @@ async def process_ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     """Process user ban."""
     try:
         user_id = int(update.message.text.strip())
-        success = database.ban_user(user_id, "Banned by admin")
+        success = await database.run_db(database.ban_user, user_id, "Banned by admin")
         
         if success:
             await safe_reply(update, f"✅ User {user_id} has been banned successfully.")
@@ -830,7 +835,7 @@ async def process_unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Process user unban."""
     try:
         user_id = int(update.message.text.strip())
-        success = database.unban_user(user_id)
+        success = await database.run_db(database.unban_user, user_id)
         
         if success:
             await safe_reply(update, f"✅ User {user_id} has been unbanned successfully.")
@@ -852,7 +857,7 @@ async def gift_credits_get_user(update: Update, context: ContextTypes.DEFAULT_TY
     """Gets the user ID for gifting credits."""
     try:
         user_id = int(update.message.text.strip())
-        user_info = database.get_user_info(user_id)
+        user_info = await database.run_db(database.get_user_info, user_id)
         if not user_info:
             await safe_reply(update, f"❌ User {user_id} not found.")
             return await user_management_handler(update, context)
@@ -867,17 +872,20 @@ async def gift_credits_get_user(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def process_gift_credits(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Processes the credit gifting."""
+    if 'mass_gift_target' in context.user_data:
+        return await process_mass_gift(update, context)
     try:
         amount = int(update.message.text.strip())
         user_id = context.user_data['gift_credits']['user_id']
         
-        database.add_user_credits(user_id, amount)
+        await database.run_db(database.add_user_credits, user_id, amount)
         
         await safe_reply(update, f"✅ Successfully gifted {amount} credits to user {user_id}.")
         
         # Notify the user
         try:
-            await context.bot.send_message(
+            await outbound.send(
+                context.bot, outbound.Lane.NOTIFICATION, 'send_message',
                 chat_id=user_id,
                 text=f"🎉 You have received a gift of {amount} credits from the admin!"
             )
@@ -1131,9 +1139,10 @@ async def handle_content_purchase(update: Update, context: ContextTypes.DEFAULT_
                 await send_locked_content(update, content)
                 
                 # Log to admin
-                await context.bot.send_message(
-                    settings.ADMIN_CHAT_ID,
-                    f"💰 **Content Purchase**\n\n"
+                await outbound.send(
+                    context.bot, outbound.Lane.NOTIFICATION, 'send_message',
+                    chat_id=settings.ADMIN_CHAT_ID,
+                    text=f"💰 **Content Purchase**\n\n"
                     f"**User:** @{update.effective_user.username or 'N/A'} ({user_id})\n"
                     f"**Content ID:** {content_id}\n"
                     f"**Price:** {content['price']} credits\n"
@@ -1209,17 +1218,18 @@ async def mass_gift_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")]
     ]
     
-    # Get user statistics for display
-    stats = database.get_user_stats()
-    total_users = stats.get('total_users', 0)
-    vip_count = len(database.get_vip_users_list(1000))  # Get all VIP users
+    # Segment sizes are COUNT queries on the analytics pool
+    total_users, vip_count, new_count = await asyncio.gather(*(
+        database.run_db(segments.count_segment, name, workload=queries.ANALYTICS)
+        for name in ('all', 'vip', 'new')
+    ))
     
     text = f"""🎁 **Mass Gift Credits**
 
 **User Statistics:**
 • Total Users: {total_users}
 • VIP Users (100+ credits): {vip_count}
-• New Users (last 7 days): {database.get_new_users_count(7)}
+• New Users (last 7 days): {new_count}
 
 Select target group for mass gifting:"""
     
@@ -1250,22 +1260,8 @@ async def mass_gift_target_handler(update: Update, context: ContextTypes.DEFAULT
     context.user_data['mass_gift_target'] = target
     
     # Get target count
-    if target == "all":
-        stats = database.get_user_stats()
-        count = stats.get('total_users', 0)
-        target_desc = "all users"
-    elif target == "vip":
-        count = len(database.get_vip_users_list(1000))
-        target_desc = "VIP users (100+ credits)"
-    elif target == "new":
-        count = database.get_new_users_count(7)
-        target_desc = "new users (last 7 days)"
-    elif target == "active":
-        count = database.get_active_users_count(30)
-        target_desc = "active users (last 30 days)"
-    else:
-        count = 0
-        target_desc = "unknown"
+    count = await database.run_db(segments.count_segment, target, workload=queries.ANALYTICS)
+    target_desc = segments.get_segment(target).label
     
     await query.edit_message_text(
         f"🎁 **Mass Gift to {target_desc.title()}**\n\n"
@@ -1274,6 +1270,30 @@ async def mass_gift_target_handler(update: Update, context: ContextTypes.DEFAULT
     )
     return GIFT_AMOUNT
 
+async def process_mass_gift(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Gift credits to a whole target group with one UPDATE and its ledger INSERT ... SELECT."""
+    target = context.user_data.pop('mass_gift_target')
+    try:
+        amount = int(update.message.text.strip())
+    except ValueError:
+        amount = 0
+    if amount <= 0:
+        await safe_reply(update, "❌ Invalid amount. Please enter a positive number of credits.")
+        return await admin_command(update, context)
+
+    label = segments.get_segment(target).label
+    status = await update.message.reply_text(f"🎁 Gifting {amount} credits to {label}...")
+    started = time.monotonic()
+    timeout = getattr(settings, 'BULK_CREDIT_STATEMENT_TIMEOUT_MS', 300000) / 1000 + 60
+    gifted = await database.run_db(segments.gift_segment, target, amount, timeout=timeout)
+
+    if gifted is None:
+        await status.edit_text("❌ Mass gift failed; no credits were changed.")
+    else:
+        await status.edit_text(f"✅ Gifted {amount} credits to {gifted} {label} "
+                               f"in {time.monotonic() - started:.1f}s")
+    return await admin_command(update, context)
+
 # ========================= Quick Replies System =========================
 
 async def quick_replies_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1281,7 +1301,7 @@ async def quick_replies_handler(update: Update, context: ContextTypes.DEFAULT_TY
     if not is_admin(update):
         return ConversationHandler.END
     
-    quick_replies = database.get_all_quick_replies()
+    quick_replies = await database.run_db(database.get_all_quick_replies)
     
     text = "📝 **Quick Replies Management**\n\n"
     
@@ -1352,17 +1372,14 @@ async def search_input_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ Search query too short. Please enter at least 2 characters.")
         return SEARCH_INPUT
     
-    # Perform search based on type
-    results = []
-    
-    if search_type == "users":
-        results = database.search_users(query)
-    elif search_type == "messages":
-        results = database.search_messages(query) 
-    elif search_type == "transactions":
-        results = database.search_transactions(query)
-    elif search_type == "content":
-        results = database.search_locked_content(query)
+    # Perform search based on type, on the analytics pool so it cannot hold up the message path
+    search = {
+        "users": database.search_users,
+        "messages": database.search_messages,
+        "transactions": database.search_transactions,
+        "content": database.search_locked_content,
+    }.get(search_type)
+    results = await database.run_db(search, query, workload=queries.ANALYTICS) if search else []
     
     # Format results
     if not results:
@@ -1396,9 +1413,87 @@ async def placeholder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     await safe_reply(update, "🚧 This feature is coming soon!\n\nWe're working on implementing this functionality.")
     return await admin_command(update, context)
 
+# ========================= Broadcast System =========================
+
 async def broadcast_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Placeholder broadcast handler."""
-    await safe_reply(update, "📢 **Broadcast System**\n\n🚧 Coming soon! This will allow you to send messages to all users.")
+    """Show broadcast audiences and recent broadcasts."""
+    if not is_admin(update):
+        return ConversationHandler.END
+    
+    # Audience sizes are COUNT queries on the analytics pool
+    names = list(segments.SEGMENTS)
+    counts = await asyncio.gather(*(
+        database.run_db(broadcast.count_targets, name, workload=queries.ANALYTICS) for name in names
+    ))
+    jobs = await database.run_db(broadcast.recent_jobs, 5)
+    
+    keyboard = [
+        [InlineKeyboardButton(f"📢 {segments.get_segment(name).label.capitalize()} ({count})",
+                              callback_data=f"broadcast_to_{name}")]
+        for name, count in zip(names, counts)
+    ]
+    text = "📢 **Broadcast**\n\nChoose who should receive the message:"
+    
+    if jobs:
+        text += "\n\n**Recent Broadcasts:**\n"
+        for job in jobs:
+            text += (f"#{job['id']} {job['segment']} - {job['status']}: {job['delivered']}/{job['total']} delivered, "
+                     f"{job['blocked']} blocked, {job['failed']} failed\n")
+            if job['status'] in ('pending', 'running'):
+                keyboard.append([InlineKeyboardButton(f"⏹ Cancel #{job['id']}",
+                                                      callback_data=f"broadcast_cancel_{job['id']}")])
+    
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")])
+    await safe_reply(update, text, reply_markup=InlineKeyboardMarkup(keyboard))
+    return BROADCAST_MENU
+
+async def broadcast_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handle broadcast audience selection and cancellation."""
+    query = update.callback_query
+    
+    if query.data == "back_to_main":
+        await query.answer()
+        return await admin_command(update, context)
+    
+    if query.data.startswith("broadcast_cancel_"):
+        job_id = int(query.data.rsplit('_', 1)[1])
+        await broadcast.cancel_broadcast(job_id)
+        # The refreshed list shows the job as cancelled
+        return await broadcast_handler(update, context)
+    
+    await query.answer()
+    target = query.data[len("broadcast_to_"):]
+    if target not in segments.SEGMENTS:
+        await query.edit_message_text("❌ Invalid selection.")
+        return ConversationHandler.END
+    
+    context.user_data['broadcast_target'] = target
+    count = await database.run_db(broadcast.count_targets, target, workload=queries.ANALYTICS)
+    
+    await query.edit_message_text(
+        f"📢 **Broadcast to {segments.get_segment(target).label.title()}**\n\n"
+        f"**Recipients:** {count} users (banned users excluded)\n\n"
+        f"Send the message to broadcast (text, photo, video...). Each user gets a copy, "
+        f"so keep it until the broadcast finishes.\n\nUse /cancel to abort."
+    )
+    return BROADCAST_MESSAGE
+
+async def broadcast_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Record the admin's message as a broadcast job and start sending it."""
+    target = context.user_data.pop('broadcast_target', None)
+    if not target:
+        return await admin_command(update, context)
+    
+    message = update.message
+    job_id = await database.run_db(broadcast.create_job, target, update.effective_user.id,
+                                   message.text or message.caption, message.chat_id, message.message_id)
+    if job_id is None:
+        await message.reply_text("❌ Could not create the broadcast. Please try again.")
+        return await admin_command(update, context)
+    
+    broadcast.start_broadcast(context.bot, job_id)
+    await message.reply_text(f"📢 Broadcast #{job_id} to {segments.get_segment(target).label} started. "
+                             f"You'll get a summary when it finishes.")
     return await admin_command(update, context)
 
 # ========================= Product Editing =========================
@@ -1408,7 +1503,7 @@ async def edit_product_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    products = database.get_all_products()
+    products = await database.run_db(database.get_all_products)
     
     if not products:
         message = """❌ **No Products Found**
@@ -1455,7 +1550,7 @@ async def edit_product_select_handler(update: Update, context: ContextTypes.DEFA
     
     # Extract product ID
     product_id = int(query.data.split('_')[-1])
-    product = database.get_product_by_id(product_id)
+    product = await database.run_db(database.get_product_by_id, product_id)
     
     if not product:
         await query.edit_message_text("❌ Product not found.")
@@ -1511,7 +1606,7 @@ async def edit_field_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     field = query.data.split('_')[-1]
     product_id = context.user_data.get('editing_product_id')
-    product = database.get_product_by_id(product_id)
+    product = await database.run_db(database.get_product_by_id, product_id)
     
     if not product:
         await query.edit_message_text("❌ Product not found.")
@@ -1522,7 +1617,7 @@ async def edit_field_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if field == 'toggle_status':
         # Toggle status immediately
         new_status = not product.get('is_active', True)
-        success = database.update_product(product_id, is_active=new_status)
+        success = await database.run_db(database.update_product, product_id, is_active=new_status)
         
         if success:
             status_text = "activated" if new_status else "deactivated"
@@ -1616,7 +1711,7 @@ async def edit_value_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Update the product
     update_data = {field: new_value}
-    success = database.update_product(product_id, **update_data)
+    success = await database.run_db(database.update_product, product_id, **update_data)
     
     if success:
         field_names = {
@@ -1649,7 +1744,7 @@ async def confirm_delete_handler(update: Update, context: ContextTypes.DEFAULT_T
     product_id = context.user_data.get('editing_product_id')
     
     if query.data == 'confirm_delete_yes':
-        success = database.delete_product(product_id)
+        success = await database.run_db(database.delete_product, product_id)
         
         if success:
             message = "✅ Product deleted successfully!"
@@ -1676,7 +1771,7 @@ async def view_all_products_handler(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
     
-    products = database.get_all_products()
+    products = await database.run_db(database.get_all_products)
     
     if not products:
         message = "❌ No products found."
@@ -1757,6 +1852,7 @@ def get_admin_conversation_handler() -> ConversationHandler:
             UNBAN_USER_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, unban_user_input_handler)],
             ADD_CREDITS_USER: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_credits_user_handler)],
             ADD_CREDITS_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_credits_amount_handler)],
+            MASS_GIFT_MENU: [CallbackQueryHandler(mass_gift_target_handler, pattern='^(mass_gift_|back_to_main$)')],
             GIFT_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_gift_credits)],
             # Settings states
             EDIT_WELCOME: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_welcome_message)],
@@ -1807,7 +1903,8 @@ def get_admin_conversation_handler() -> ConversationHandler:
             ANALYTICS_MENU: [CallbackQueryHandler(placeholder_handler, pattern='.*'), CallbackQueryHandler(back_to_main_menu, pattern='^back_to_main$')],
             SETTINGS_MENU: [CallbackQueryHandler(placeholder_handler, pattern='.*'), CallbackQueryHandler(back_to_main_menu, pattern='^back_to_main$')],
             SYSTEM_MENU: [CallbackQueryHandler(placeholder_handler, pattern='.*'), CallbackQueryHandler(back_to_main_menu, pattern='^back_to_main$')],
-            BROADCAST_MENU: [CallbackQueryHandler(back_to_main_menu, pattern='^back_to_main$')],
+            BROADCAST_MENU: [CallbackQueryHandler(broadcast_menu_handler, pattern='^(broadcast_|back_to_main$)')],
+            BROADCAST_MESSAGE: [MessageHandler(filters.ALL & ~filters.COMMAND, broadcast_message_handler)],
             QUICK_REPLIES_MENU: [CallbackQueryHandler(placeholder_handler, pattern='.*'), CallbackQueryHandler(back_to_main_menu, pattern='^back_to_main$')],
             SEARCH_MENU: [CallbackQueryHandler(search_input_handler, pattern='^search_users$'), CallbackQueryHandler(search_input_handler, pattern='^search_messages$'), CallbackQueryHandler(search_input_handler, pattern='^search_transactions$'), CallbackQueryHandler(search_input_handler, pattern='^search_content'), CallbackQueryHandler(back_to_main_menu, pattern='^back_to_main$')],
             SEARCH_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, search_input_handler)],
@@ -1816,7 +1913,9 @@ def get_admin_conversation_handler() -> ConversationHandler:
             CallbackQueryHandler(exit_conversation, pattern='^exit$'),
             CommandHandler("cancel", exit_conversation),
         ],
-        per_message=False
+        per_message=False,
+        name='admin_menu',
+        persistent=persistence.is_enabled(),
     )
 
 def get_locked_content_handler() -> ConversationHandler:
@@ -1830,5 +1929,7 @@ def get_locked_content_handler() -> ConversationHandler:
             LOCKED_CONTENT_CONFIRM: [CallbackQueryHandler(locked_content_confirm_handler)],
         },
         fallbacks=[CommandHandler("cancel", exit_conversation)],
-        per_message=False
+        per_message=False,
+        name='locked_content',
+        persistent=persistence.is_enabled(),
     ) 
\ No newline at end of file
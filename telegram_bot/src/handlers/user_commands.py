@@ -10,6 +10,8 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from src import database, config, stripe_utils
+from src.settings_snapshot import get_settings
+from src.user_profile import get_user_profile
 from src.error_handler import rate_limit, monitor_performance
 
 logger = logging.getLogger(__name__)
@@ -48,20 +50,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     username = update.effective_user.username or update.effective_user.first_name or "there"
     
     # Ensure user exists in database
-    database.ensure_user_exists(user_id, username, update.effective_user.first_name)
+    await database.run_db(database.ensure_user_exists, user_id, username, update.effective_user.first_name)
     
     # Get user data
-    user_credits = database.get_user_credits_optimized(user_id)
-    user_tier = database.get_user_tier(user_id)
-    products = database.get_active_products()
+    profile = await get_user_profile(context, user_id)
+    user_credits = profile.message_credits
+    user_tier = profile.tier
+    products = await database.run_db(database.get_active_products)
     
     # Check if it's a new user (first time using /start)
-    user_stats = database.get_user_stats_individual(user_id)
-    is_new_user = user_stats.get('total_messages', 0) == 0
+    is_new_user = profile.is_new_user
     
     # Get tier emoji and benefits info
-    tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
-    tier_discount = "20%" if user_tier == "VIP" else "10%" if user_tier == "Regular" else "0%"
+    tier_emoji = profile.tier_emoji
+    tier_discount = profile.tier_discount
     
     # Create welcome image message for new users
     if is_new_user:
@@ -106,7 +108,7 @@ Ready to explore? Tap the button below! 👇""",
         
         # Give new user bonus credits
         bonus_credits = 5
-        database.add_user_credits(user_id, bonus_credits)
+        await database.run_db(database.add_user_credits, user_id, bonus_credits)
         user_credits += bonus_credits
         
     else:
@@ -211,9 +213,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     callback_data = query.data
 
     if callback_data == "check_balance":
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_tier = database.get_user_tier(user_id)
-        tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
+        profile = await get_user_profile(context, user_id)
+        user_credits = profile.message_credits
+        user_tier = profile.tier
+        tier_emoji = profile.tier_emoji
+        bot_settings = get_settings()
         
         # Enhanced balance display with transaction history
         balance_msg = f"""📊 **Account Balance**
@@ -221,13 +225,13 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 {format_balance_display(user_credits)}
 
 {tier_emoji} **Tier:** {user_tier} User
-💰 **Benefits:** {('20%' if user_tier == 'VIP' else '10%' if user_tier == 'Regular' else '0%')} discount on messages
+💰 **Benefits:** {profile.tier_discount} discount on messages
 
 💸 **Message Costs:**
-• Text: {database.get_setting('cost_text_message', '1')} credits
-• Photo: {database.get_setting('cost_photo_message', '2')} credits  
-• Video: {database.get_setting('cost_video_message', '3')} credits
-• Document: {database.get_setting('cost_document_message', '2')} credits
+• Text: {bot_settings.get('cost_text_message', '1')} credits
+• Photo: {bot_settings.get('cost_photo_message', '2')} credits  
+• Video: {bot_settings.get('cost_video_message', '3')} credits
+• Document: {bot_settings.get('cost_document_message', '2')} credits
 
 Use /buy to purchase more credits!"""
         
@@ -255,7 +259,7 @@ Use /buy to purchase more credits!"""
     
     elif callback_data == "user_settings":
         # User settings menu
-        auto_recharge = database.get_user_auto_recharge_settings(user_id)
+        auto_recharge = (await get_user_profile(context, user_id)).auto_recharge
         status = "✅ Enabled" if auto_recharge and auto_recharge.get('enabled') else "❌ Disabled"
         
         settings_text = f"""⚙️ **User Settings**
@@ -342,7 +346,7 @@ Ready to get started? Send your first message! 👇"""
         await query.edit_message_text(quick_start_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
     
     elif callback_data == "buy_menu":
-        products = database.get_active_products()
+        products = await database.run_db(database.get_active_products)
         if not products:
             await query.edit_message_text("❌ No products available at the moment.")
             return
@@ -399,10 +403,9 @@ Ready to get started? Send your first message! 👇"""
     
     elif callback_data == "toggle_autorecharge":
         # Toggle auto-recharge setting
-        current_settings = database.get_user_auto_recharge_settings(user_id)
-        current_enabled = current_settings.get('enabled', False) if current_settings else False
+        current_enabled = (await get_user_profile(context, user_id)).auto_recharge_enabled
         
-        success = database.update_user_auto_recharge_settings(user_id, not current_enabled)
+        success = await database.run_db(database.update_user_auto_recharge_settings, user_id, not current_enabled)
         
         if success:
             status = "enabled" if not current_enabled else "disabled"
@@ -419,7 +422,8 @@ Ready to get started? Send your first message! 👇"""
             await query.edit_message_text("❌ Failed to update auto-recharge settings.")
     
     elif callback_data == "contact_support":
-        support_text = """📞 **Contact Our Support Team**
+        profile = await get_user_profile(context, user_id)
+        support_text = f"""📞 **Contact Our Support Team**
 
 Ready to send your first message? Just type anything below and send it!
 
@@ -441,7 +445,7 @@ Ready to send your first message? Just type anything below and send it!
 • Video: 3 credits  
 • Document: 2 credits
 
-💡 **Tip:** Your current tier gets you {('20%' if database.get_user_tier(user_id) == 'VIP' else '10%' if database.get_user_tier(user_id) == 'Regular' else '0%')} discount!
+💡 **Tip:** Your current tier gets you {profile.tier_discount} discount!
 
 Go ahead - type your message below! 👇"""
         
@@ -542,12 +546,12 @@ Ready to start? Send your first message! 👇"""
     
     elif callback_data.startswith("buy_"):
         product_id = int(callback_data.split("_")[1])
-        product = next((p for p in database.get_active_products() if p['id'] == product_id), None)
+        product = next((p for p in await database.run_db(database.get_active_products) if p['id'] == product_id), None)
         if not product:
             await safe_reply(update, "❌ This product is no longer available.")
             return
 
-        customer_id = stripe_utils.get_or_create_stripe_customer(user_id, query.from_user.username)
+        customer_id = await database.run_db(stripe_utils.get_or_create_stripe_customer, user_id, query.from_user.username)
         if not customer_id:
             await safe_reply(update, "❌ Could not create a customer profile. Please contact support.")
             return
@@ -578,13 +582,14 @@ Ready to start? Send your first message! 👇"""
 async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enhanced balance command with detailed account information."""
     user_id = update.effective_user.id
-    user_credits = database.get_user_credits_optimized(user_id)
-    user_tier = database.get_user_tier(user_id)
-    user_stats = database.get_user_stats_individual(user_id)
+    profile = await get_user_profile(context, user_id)
+    user_credits = profile.message_credits
+    user_tier = profile.tier
+    user_stats = profile.stats
     
     # Get tier info
-    tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
-    discount = "20%" if user_tier == "VIP" else "10%" if user_tier == "Regular" else "0%"
+    tier_emoji = profile.tier_emoji
+    discount = profile.tier_discount
     
     # Calculate credits to next tier
     next_tier_info = ""
@@ -598,7 +603,7 @@ async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         next_tier_info = "🏆 Maximum tier achieved!"
     
     # Auto-recharge status
-    auto_recharge = database.get_user_auto_recharge_settings(user_id)
+    auto_recharge = profile.auto_recharge
     auto_status = "✅ Enabled" if auto_recharge and auto_recharge.get('enabled') else "❌ Disabled"
     
     balance_text = f"""📊 **Account Balance**
@@ -616,11 +621,12 @@ async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 💸 **Current Message Costs (after discount):**"""
     
     # Calculate discounted costs
+    bot_settings = get_settings()
     base_costs = {
-        'Text': int(database.get_setting('cost_text_message', '1')),
-        'Photo': int(database.get_setting('cost_photo_message', '2')),
-        'Video': int(database.get_setting('cost_video_message', '3')),
-        'Document': int(database.get_setting('cost_document_message', '2'))
+        'Text': bot_settings.get_int('cost_text_message', 1),
+        'Photo': bot_settings.get_int('cost_photo_message', 2),
+        'Video': bot_settings.get_int('cost_video_message', 3),
+        'Document': bot_settings.get_int('cost_document_message', 2)
     }
     
     for msg_type, base_cost in base_costs.items():
@@ -641,8 +647,10 @@ async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enhanced help command with comprehensive information."""
     user_id = update.effective_user.id
-    user_tier = database.get_user_tier(user_id)
-    tier_emoji = "🏆" if user_tier == "VIP" else "⭐" if user_tier == "Regular" else "🆕"
+    profile = await get_user_profile(context, user_id)
+    user_tier = profile.tier
+    tier_emoji = profile.tier_emoji
+    bot_settings = get_settings()
     
     help_text = f"""ℹ️ **Help & Command Guide**
 
@@ -656,10 +664,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 **💬 How Messaging Works:**
 • Send any message to contact our support team
 • Messages cost credits based on type:
-  - Text: {database.get_setting('cost_text_message', '1')} credits
-  - Photo: {database.get_setting('cost_photo_message', '2')} credits
-  - Video: {database.get_setting('cost_video_message', '3')} credits
-  - Documents: {database.get_setting('cost_document_message', '2')} credits
+  - Text: {bot_settings.get('cost_text_message', '1')} credits
+  - Photo: {bot_settings.get('cost_photo_message', '2')} credits
+  - Video: {bot_settings.get('cost_video_message', '3')} credits
+  - Documents: {bot_settings.get('cost_document_message', '2')} credits
 
 **🎁 Your Status:**
 {tier_emoji} **Tier:** {user_tier} User
@@ -696,9 +704,10 @@ Use `/start` to return to the main menu."""
 async def buy_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enhanced buy command with comprehensive credit store and recommendations."""
     user_id = update.effective_user.id
-    user_credits = database.get_user_credits_optimized(user_id)
-    user_tier = database.get_user_tier(user_id)
-    products = database.get_active_products()
+    profile = await get_user_profile(context, user_id)
+    user_credits = profile.message_credits
+    user_tier = profile.tier
+    products = await database.run_db(database.get_active_products)
     
     if not products:
         await safe_reply(update, "❌ No credit packages are available at the moment. Please contact support.")
@@ -781,8 +790,8 @@ async def handle_package_category(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    products = database.get_active_products()
-    user_credits = database.get_user_credits_optimized(query.from_user.id)
+    products = await database.run_db(database.get_active_products)
+    user_credits = (await get_user_profile(context, query.from_user.id)).message_credits
     
     # Filter products by category
     if category == "starter":
@@ -852,8 +861,8 @@ async def show_quick_buy_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     
-    products = database.get_active_products()
-    user_tier = database.get_user_tier(query.from_user.id)
+    products = await database.run_db(database.get_active_products)
+    user_tier = (await get_user_profile(context, query.from_user.id)).tier
     
     # Select most popular packages
     popular_packages = []
@@ -889,7 +898,7 @@ async def show_special_offers(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user_id = query.from_user.id
-    user_stats = database.get_user_stats_individual(user_id)
+    user_stats = (await get_user_profile(context, user_id)).stats
     is_new_user = user_stats.get('total_messages', 0) < 5
     
     offers_text = "🎁 **Special Offers**\n\n"
@@ -1029,9 +1038,10 @@ async def show_package_advisor(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     user_id = query.from_user.id
-    user_credits = database.get_user_credits_optimized(user_id)
-    user_tier = database.get_user_tier(user_id)
-    user_stats = database.get_user_stats_individual(user_id)
+    profile = await get_user_profile(context, user_id)
+    user_credits = profile.message_credits
+    user_tier = profile.tier
+    user_stats = profile.stats
     
     # Analyze user profile
     total_messages = user_stats.get('total_messages', 0)
@@ -1061,7 +1071,7 @@ Since you're new to our service, I recommend starting with the **Premium Pack (5
 
 🎁 **Bonus:** New users get extra support and priority responses!"""
         
-        recommended_product = next((p for p in database.get_active_products() if p['amount'] == 50), None)
+        recommended_product = next((p for p in await database.run_db(database.get_active_products) if p['amount'] == 50), None)
         
     elif user_tier == "New" and user_credits < 30:
         advisor_text += """📈 **Tier Upgrade Recommendation:**
@@ -1076,7 +1086,7 @@ You're close to Regular tier! I recommend the **Power Pack (100 credits)**:
 
 💰 **Value:** 20% discount means 120 effective messages for 100 credits!"""
         
-        recommended_product = next((p for p in database.get_active_products() if p['amount'] == 100), None)
+        recommended_product = next((p for p in await database.run_db(database.get_active_products) if p['amount'] == 100), None)
         
     elif user_tier == "VIP":
         advisor_text += """🏆 **VIP User Recommendation:**
@@ -1091,7 +1101,7 @@ As a VIP user, maximize your benefits with the **Enterprise Pack (500 credits)**
 
 💎 **VIP Exclusive:** Enterprise users get access to premium features!"""
         
-        recommended_product = next((p for p in database.get_active_products() if p['amount'] == 500), None)
+        recommended_product = next((p for p in await database.run_db(database.get_active_products) if p['amount'] == 500), None)
         
     else:
         advisor_text += """⭐ **Balanced Recommendation:**
@@ -1106,7 +1116,7 @@ Based on your usage, the **Premium Pack (50 credits)** is perfect:
 
 💡 **Alternative:** Consider Power Pack if you message frequently!"""
         
-        recommended_product = next((p for p in database.get_active_products() if p['amount'] == 50), None)
+        recommended_product = next((p for p in await database.run_db(database.get_active_products) if p['amount'] == 50), None)
     
     keyboard = []
     if recommended_product:
@@ -1129,7 +1139,7 @@ async def show_autorecharge_setup(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     user_id = query.from_user.id
-    current_settings = database.get_user_auto_recharge_settings(user_id)
+    current_settings = (await get_user_profile(context, user_id)).auto_recharge
     is_enabled = current_settings.get('enabled', False) if current_settings else False
     
     setup_text = f"""⚙️ **Auto-Recharge Setup**
@@ -1186,7 +1196,7 @@ Never run out of credits again! Auto-recharge automatically buys more credits wh
 
 async def billing_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Provides a link to the Stripe billing portal to manage payment methods."""
-    customer_id = stripe_utils.get_or_create_stripe_customer(update.effective_user.id, update.effective_user.username)
+    customer_id = await database.run_db(stripe_utils.get_or_create_stripe_customer, update.effective_user.id, update.effective_user.username)
     if not customer_id:
         await safe_reply(update, "❌ Could not retrieve your customer profile.")
         return
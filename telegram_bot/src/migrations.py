@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+Each migration has a version, a name and a function that applies it to a
+cursor; applied versions are recorded in ``schema_migrations``. On startup
+``migrate()`` reads the recorded version with one query and returns straight
+away when the schema is current, instead of re-running every ``CREATE TABLE``
+and checking each column on every boot.
+
+When something is pending, the runner takes a PostgreSQL advisory lock so
+replicas booting together apply each migration exactly once (the others
+wait, then find nothing left to do). SQLite serializes the writers with
+``BEGIN IMMEDIATE`` instead. Every migration runs in its own transaction
+together with its ``schema_migrations`` row, except those marked
+``transactional=False``: on PostgreSQL they run in autocommit mode (still
+under the advisory lock) so they can ``CREATE INDEX CONCURRENTLY`` without
+blocking writes to a live table, and their row is recorded afterwards.
+
+Migrations must stay idempotent (``IF NOT EXISTS``, add-column-if-missing):
+databases created before this table existed replay them all once. Append
+new migrations to ``MIGRATIONS``; never edit or renumber an applied one.
+"""
+
+import logging
+import re
+import time
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from src.schema import get_schema_queries, get_default_settings, get_default_products
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_ID = 7_236_015_401
+
+SCHEMA_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Any, str], None]  # (cursor, dialect)
+    transactional: bool = True  # False: PostgreSQL runs it in autocommit mode
+
+
+def to_sqlite(query: str) -> str:
+    """Convert PostgreSQL DDL to SQLite."""
+    query = query.replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+    query = query.replace('BOOLEAN', 'INTEGER')
+    # Column types only: DEFAULT CURRENT_TIMESTAMP must survive
+    query = re.sub(r'\bTIMESTAMP\b', 'TEXT', query)
+    return query
+
+
+def _execute(cursor: Any, dialect: str, query: str, params: tuple = ()) -> None:
+    if dialect == 'sqlite':
+        cursor.execute(to_sqlite(query).replace('%s', '?'), params)
+    else:
+        cursor.execute(query, params)
+
+
+def add_column(cursor: Any, dialect: str, table: str, column: str, definition: str) -> None:
+    """Add ``column`` to ``table`` unless it already exists."""
+    if dialect == 'postgresql':
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+        return
+    # SQLite has no ADD COLUMN IF NOT EXISTS
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row['name'] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {to_sqlite(definition)}")
+
+
+def seed_default_data(cursor: Any, dialect: str) -> None:
+    """Insert the default settings, and the default products into an empty catalogue."""
+    for key, value in get_default_settings():
+        _execute(cursor, dialect, """
+            INSERT INTO bot_settings (setting_key, setting_value) VALUES (%s, %s)
+            ON CONFLICT (setting_key) DO NOTHING
+        """, (key, value))
+
+    # products has no natural unique key, so seed only a fresh catalogue
+    cursor.execute("SELECT COUNT(*) AS count FROM products")
+    if cursor.fetchone()['count']:
+        return
+    for product in get_default_products():
+        _execute(cursor, dialect, """
+            INSERT INTO products (stripe_product_id, stripe_price_id, label, amount, item_type, description, is_active)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, product)
+
+
+def _initial_schema(cursor: Any, dialect: str) -> None:
+    for query in get_schema_queries():
+        _execute(cursor, dialect, query)
+
+
+def _user_billing_columns(cursor: Any, dialect: str) -> None:
+    # Columns added to users after the first deployments
+    for column, definition in (
+        ('stripe_customer_id', 'VARCHAR(255)'),
+        ('subscription_status', "VARCHAR(50) DEFAULT 'none'"),
+        ('ban_reason', 'TEXT'),
+        ('auto_recharge_enabled', 'BOOLEAN DEFAULT FALSE'),
+        ('auto_recharge_amount', 'INTEGER DEFAULT 10'),
+        ('auto_recharge_threshold', 'INTEGER DEFAULT 5'),
+        ('last_low_balance_notification', 'TIMESTAMP'),
+    ):
+        add_column(cursor, dialect, 'users', column, definition)
+
+
+def _content_purchases(cursor: Any, dialect: str) -> None:
+    _execute(cursor, dialect, """
+        CREATE TABLE IF NOT EXISTS content_purchases (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            content_id INTEGER NOT NULL,
+            price_paid INTEGER NOT NULL,
+            purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # update_product() maintains it
+    add_column(cursor, dialect, 'products', 'updated_at', 'TIMESTAMP')
+
+
+# (name, table, columns, partial-index predicate)
+IndexSpec = Tuple[str, str, str, Optional[str]]
+
+# Indexes for the hot access paths. Predicates are written exactly as the
+# queries spell them so SQLite, which matches partial indexes textually, can
+# use them too. Columns rewritten on every charge or message (message_credits,
+# updated_at, last_message_at) are left unindexed to keep those UPDATEs HOT on
+# PostgreSQL.
+ACCESS_PATH_INDEXES: List[IndexSpec] = [
+    # Dashboard new/active user counts
+    ('idx_users_created_at', 'users', 'created_at', None),
+    ('idx_users_last_active', 'users', 'last_active', None),
+    ('idx_users_banned', 'users', 'telegram_id', 'is_banned = TRUE'),
+    ('idx_users_stripe_customer_id', 'users', 'stripe_customer_id', 'stripe_customer_id IS NOT NULL'),
+    # Topic -> user routing for every admin reply
+    ('idx_conversations_topic_id', 'conversations', 'topic_id', 'topic_id IS NOT NULL'),
+    # Per-user message counts and recent transaction listings
+    ('idx_transactions_user_type', 'transactions', 'user_id, transaction_type', None),
+    ('idx_transactions_created_at', 'transactions', 'created_at', None),
+    ('idx_payment_logs_telegram_id', 'payment_logs', 'telegram_id', None),
+    ('idx_payment_logs_timestamp', 'payment_logs', 'timestamp', None),
+    ('idx_products_active', 'products', 'amount', 'is_active = TRUE'),
+    ('idx_locked_content_active', 'locked_content', 'created_at', 'is_active = TRUE'),
+    ('idx_content_purchases_user_content', 'content_purchases', 'user_id, content_id', None),
+]
+
+
+# users has no is_active flag: broadcasts and segments select unbanned users
+# (``... AND is_banned = FALSE``), mostly by last_active
+ACTIVE_USER_INDEXES: List[IndexSpec] = [
+    ('idx_users_active_last_active', 'users', 'last_active', 'is_banned = FALSE'),
+]
+
+
+def create_indexes(cursor: Any, dialect: str, indexes: List[IndexSpec]) -> None:
+    """Build ``indexes``; CONCURRENTLY on PostgreSQL, so the cursor must be in autocommit mode."""
+    for name, table, columns, predicate in indexes:
+        where = f" WHERE {predicate}" if predicate else ''
+        if dialect != 'postgresql':
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}){where}")
+            continue
+        # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+        cursor.execute("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                       "WHERE c.relname = %s", (name,))
+        row = cursor.fetchone()
+        if row and not row['indisvalid']:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns}){where}")
+
+
+def _access_path_indexes(cursor: Any, dialect: str) -> None:
+    create_indexes(cursor, dialect, ACCESS_PATH_INDEXES)
+
+
+def _active_user_indexes(cursor: Any, dialect: str) -> None:
+    create_indexes(cursor, dialect, ACTIVE_USER_INDEXES)
+
+
+def _broadcast_jobs(cursor: Any, dialect: str) -> None:
+    # One row per broadcast; last_user_id and the counts are the resume checkpoint,
+    # lease_owner/lease_expires_at stop two processes sending the same job
+    _execute(cursor, dialect, """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id SERIAL PRIMARY KEY,
+            segment VARCHAR(50) NOT NULL,
+            message_text TEXT,
+            source_chat_id BIGINT,
+            source_message_id BIGINT,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            total INTEGER DEFAULT 0,
+            last_user_id BIGINT DEFAULT 0,
+            delivered INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_by BIGINT,
+            lease_owner VARCHAR(255),
+            lease_expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_unfinished ON broadcast_jobs (id) "
+                   "WHERE status IN ('pending', 'running')")
+
+
+def _reply_routes(cursor: Any, dialect: str) -> None:
+    # Forwarded message -> user, for admin replies in the private-chat fallback
+    _execute(cursor, dialect, """
+        CREATE TABLE IF NOT EXISTS reply_routes (
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reply_routes_created_at ON reply_routes (created_at)")
+
+
+def _persistence_data(cursor: Any, dialect: str) -> None:
+    # python-telegram-bot state: kind is 'user', 'chat', 'bot' or 'conversation:<name>'
+    _execute(cursor, dialect, f"""
+        CREATE TABLE IF NOT EXISTS persistence_data (
+            kind VARCHAR(64) NOT NULL,
+            entity_key VARCHAR(255) NOT NULL,
+            data {'BYTEA' if dialect == 'postgresql' else 'BLOB'} NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, entity_key)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_persistence_data_kind_updated_at "
+                   "ON persistence_data (kind, updated_at)")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'initial_schema', _initial_schema),
+    Migration(2, 'user_billing_columns', _user_billing_columns),
+    Migration(3, 'default_data', seed_default_data),
+    Migration(4, 'content_purchases', _content_purchases),
+    Migration(5, 'access_path_indexes', _access_path_indexes, transactional=False),
+    Migration(6, 'broadcast_jobs', _broadcast_jobs),
+    Migration(7, 'reply_routes', _reply_routes),
+    Migration(8, 'persistence_data', _persistence_data),
+    Migration(9, 'active_user_indexes', _active_user_indexes, transactional=False),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(manager: Any) -> int:
+    """Highest applied migration, 0 for a database that has none recorded."""
+    with manager.get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT MAX(version) AS version FROM schema_migrations")
+            row = cursor.fetchone()
+            return (row['version'] or 0) if row else 0
+        except Exception:
+            # No schema_migrations table yet
+            conn.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+
+def _applied_versions(cursor: Any) -> set:
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def _apply_autocommit(conn: Any, cursor: Any, migration: Migration) -> bool:
+    """Apply a non-transactional PostgreSQL migration in autocommit mode, then record it."""
+    already_applied = migration.version in _applied_versions(cursor)
+    conn.rollback()
+    if already_applied:
+        return False
+    started = time.perf_counter()
+    conn.autocommit = True
+    try:
+        # Idempotent, so a crash before the row is written just repeats it
+        migration.apply(cursor, 'postgresql')
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                       (migration.version, migration.name))
+    finally:
+        conn.autocommit = False
+    logger.info(f"Applied migration {migration.version} ({migration.name}) outside a transaction "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return True
+
+
+def _apply(conn: Any, cursor: Any, dialect: str, migration: Migration) -> bool:
+    """Apply one migration and record it in the same transaction; False if already applied."""
+    if dialect == 'postgresql' and not migration.transactional:
+        return _apply_autocommit(conn, cursor, migration)
+    if dialect == 'sqlite':
+        # Take the write lock before re-checking, so a concurrent process cannot apply it too
+        cursor.execute("BEGIN IMMEDIATE")
+    if migration.version in _applied_versions(cursor):
+        conn.rollback()
+        return False
+    started = time.perf_counter()
+    try:
+        migration.apply(cursor, dialect)
+        _execute(cursor, dialect, "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                 (migration.version, migration.name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"Applied migration {migration.version} ({migration.name}) "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return True
+
+
+def migrate(manager: Any) -> int:
+    """Apply pending migrations; returns how many were applied.
+
+    A single query when the schema is already current. Raises if a
+    migration fails; migrations applied before it stay applied.
+    """
+    if schema_version(manager) >= LATEST_VERSION:
+        return 0
+
+    dialect = manager._db_type
+    applied = 0
+    with manager.get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if dialect == 'postgresql':
+                # Index builds and waiting for the lock may outlast the pool's statement_timeout
+                cursor.execute("SET statement_timeout = 0")
+                # Blocks while another replica migrates; released in finally
+                cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            _execute(cursor, dialect, SCHEMA_MIGRATIONS_TABLE)
+            conn.commit()
+
+            for migration in MIGRATIONS:
+                if _apply(conn, cursor, dialect, migration):
+                    applied += 1
+        finally:
+            if dialect == 'postgresql':
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                cursor.execute("RESET statement_timeout")
+                conn.commit()
+            cursor.close()
+
+    logger.info(f"Database schema at version {LATEST_VERSION} ({applied} migrations applied)")
+    return applied
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Central scheduler for outgoing Telegram sends.
+
+Handlers, notifications and broadcasts used to call ``context.bot`` directly,
+so a burst (a broadcast, many users writing at once, all landing in the
+admin group) ran into 429s with nothing coordinating the retries. Sends now
+go through one ``OutboundScheduler``:
+
+* a priority queue with four lanes: admin replies, then user messages
+  forwarded to the admin, then notifications, then broadcasts. Priority
+  applies when a worker picks the next send;
+* a global ``TokenBucket`` (``OUTBOUND_RATE_PER_SEC``) and a per-chat
+  limiter: ``OUTBOUND_CHAT_INTERVAL`` for private chats,
+  ``OUTBOUND_GROUP_INTERVAL`` for groups (Telegram allows about 20 messages
+  a minute there), each after a burst of ``OUTBOUND_CHAT_BURST``;
+* ``RetryAfter`` pauses the bucket for every worker and the send is retried,
+  up to ``OUTBOUND_MAX_RETRIES`` times. Other errors reach the caller;
+* sends with the same ``coalesce_key`` are merged: one still queued is
+  replaced by the newer payload, and one sent within
+  ``OUTBOUND_COALESCE_WINDOW`` seconds is not repeated;
+* queue depth, sends, failures, merges and submit-to-sent latency per lane,
+  in ``get_stats()`` and on ``/metrics``.
+
+Use the module-level ``send()``, or ``submit()`` to not wait for the
+result. Both fall back to calling the bot directly when the scheduler is
+not running (scripts, tests).
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+from src.database import settings
+from src.query_stats import BUCKETS_MS, Histogram, query_stats
+from src.rate_limit import KeyedRateLimiter, TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class Lane(IntEnum):
+    """Send priority, highest first."""
+    ADMIN_REPLY = 0
+    USER_FORWARD = 1
+    NOTIFICATION = 2
+    BROADCAST = 3
+
+
+class _Send:
+    __slots__ = ('lane', 'seq', 'method', 'kwargs', 'key', 'future', 'submitted', 'slot_reserved')
+
+    def __init__(self, lane: Lane, seq: int, method: str, kwargs: Dict[str, Any], key: Optional[str],
+                 future: asyncio.Future):
+        self.lane = lane
+        self.seq = seq
+        self.method = method
+        self.kwargs = kwargs
+        self.key = key
+        self.future = future
+        self.submitted = time.monotonic()
+        self.slot_reserved = False
+
+
+class _LaneStats:
+    __slots__ = ('queued', 'sent', 'failed', 'coalesced', 'latency')
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.latency = Histogram()  # submit to sent, milliseconds
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Fire-and-forget callers never look at the result; failures are logged by the worker
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundScheduler:
+    """Prioritised, rate-limited queue in front of the bot."""
+
+    def __init__(self):
+        self._bot = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        self._pending: Dict[str, _Send] = {}  # coalesce key -> queued send
+        self._recent: Dict[str, Tuple[float, Any]] = {}  # coalesce key -> (expires, result)
+        self._lanes = {lane: _LaneStats() for lane in Lane}
+        self.bucket: Optional[TokenBucket] = None
+        self.retry_after = 0
+        self.in_flight = 0
+        self._parked: Dict[_Send, asyncio.TimerHandle] = {}  # sends waiting for their chat's slot
+        query_stats.add_collector(self.prometheus)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self, bot) -> None:
+        """Start the workers on the running loop (idempotent)."""
+        if self._workers:
+            return
+        self._bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self.bucket = TokenBucket(float(getattr(settings, 'OUTBOUND_RATE_PER_SEC', 30.0)))
+        burst = int(getattr(settings, 'OUTBOUND_CHAT_BURST', 3))
+        self._private = KeyedRateLimiter(float(getattr(settings, 'OUTBOUND_CHAT_INTERVAL', 1.0)), burst)
+        self._groups = KeyedRateLimiter(float(getattr(settings, 'OUTBOUND_GROUP_INTERVAL', 3.0)), burst)
+        self._window = float(getattr(settings, 'OUTBOUND_COALESCE_WINDOW', 30.0))
+        self._max_retries = int(getattr(settings, 'OUTBOUND_MAX_RETRIES', 5))
+        self._workers = [asyncio.create_task(self._worker())
+                         for _ in range(int(getattr(settings, 'OUTBOUND_WORKERS', 8)))]
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Send what is queued for up to ``timeout`` seconds, then stop the workers."""
+        if not self._workers:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._queue.qsize() or self._parked or self.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        dropped = self._drop_unsent()
+        if dropped:
+            logger.warning(f"Outbound queue not drained on shutdown: {dropped} sends dropped")
+
+    def _drop_unsent(self) -> int:
+        """Cancel every send still queued or parked, so no caller waits on it forever."""
+        items = [self._queue.get_nowait()[2] for _ in range(self._queue.qsize())]
+        for item, handle in self._parked.items():
+            handle.cancel()
+            items.append(item)
+        self._parked.clear()
+        self._pending.clear()
+        for item in items:
+            self._lanes[item.lane].queued -= 1
+            item.future.cancel()
+        return len(items)
+
+    def submit(self, lane: Lane, method: str, coalesce_key: Optional[str] = None,
+               **kwargs: Any) -> asyncio.Future:
+        """Queue ``bot.<method>(**kwargs)``; the future resolves to its result."""
+        stats = self._lanes[lane]
+        if coalesce_key is not None:
+            queued = self._pending.get(coalesce_key)
+            if queued is not None:
+                # Still waiting: send the newer payload once, to both callers
+                queued.kwargs = kwargs
+                stats.coalesced += 1
+                return queued.future
+            recent = self._recent.get(coalesce_key)
+            if recent is not None and recent[0] > time.monotonic():
+                stats.coalesced += 1
+                future = asyncio.get_running_loop().create_future()
+                future.set_result(recent[1])
+                return future
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        item = _Send(lane, next(self._seq), method, kwargs, coalesce_key, future)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = item
+        stats.queued += 1
+        self._enqueue(item)
+        return future
+
+    def _enqueue(self, item: _Send) -> None:
+        self._queue.put_nowait((int(item.lane), item.seq, item))
+
+    async def send(self, lane: Lane, method: str, coalesce_key: Optional[str] = None, **kwargs: Any) -> Any:
+        """Queue a send and wait for its result (or exception)."""
+        # Shielded: a merged send is shared, and one caller giving up must not cancel it for the rest
+        return await asyncio.shield(self.submit(lane, method, coalesce_key, **kwargs))
+
+    async def _worker(self) -> None:
+        while True:
+            # Only wait for work here: which send goes out is decided once a token is free,
+            # so an admin reply queued meanwhile goes ahead of what was first when we started waiting
+            self._enqueue((await self._queue.get())[2])
+            try:
+                await self.bucket.acquire()
+                item = self._next()
+                while item is not None and self._defer(item):
+                    # Spend the token on another chat instead of holding up this one
+                    item = self._next()
+                if item is None:
+                    continue
+                self._lanes[item.lane].queued -= 1
+                if item.key is not None and self._pending.get(item.key) is item:
+                    del self._pending[item.key]
+                if not item.future.done():
+                    try:
+                        await self._deliver(item)
+                    except asyncio.CancelledError:
+                        # stop() gave up on it mid-send
+                        item.future.cancel()
+                        raise
+            except Exception as e:
+                logger.error(f"Outbound worker error: {e}")
+
+    def _next(self) -> Optional[_Send]:
+        return None if self._queue.empty() else self._queue.get_nowait()[2]
+
+    def _defer(self, item: _Send) -> bool:
+        """Reserve the send's chat slot; if it is not open yet, requeue the send for then."""
+        chat_id = item.kwargs.get('chat_id')
+        if item.slot_reserved or chat_id is None:
+            return False
+        item.slot_reserved = True
+        wait = self._limiter(chat_id).reserve(chat_id)
+        if wait <= 0:
+            return False
+        self._parked[item] = asyncio.get_running_loop().call_later(wait, self._requeue, item)
+        return True
+
+    def _requeue(self, item: _Send) -> None:
+        del self._parked[item]
+        self._enqueue(item)
+
+    def _limiter(self, chat_id: Any) -> KeyedRateLimiter:
+        # Group and channel IDs are negative; @usernames are channels too
+        return self._groups if isinstance(chat_id, str) or int(chat_id) < 0 else self._private
+
+    async def _deliver(self, item: _Send) -> None:
+        stats = self._lanes[item.lane]
+        chat_id = item.kwargs.get('chat_id')
+        retries = 0
+        while True:
+            if retries:
+                # The worker took the first token before picking this send
+                if chat_id is not None:
+                    await self._limiter(chat_id).acquire(chat_id)
+                await self.bucket.acquire()
+            self.in_flight += 1
+            try:
+                result = await getattr(self._bot, item.method)(**item.kwargs)
+            except RetryAfter as e:
+                self.retry_after += 1
+                self.bucket.pause(retry_after_seconds(e.retry_after))
+                retries += 1
+                if retries <= self._max_retries:
+                    continue
+                self._fail(item, e)
+                return
+            except Exception as e:
+                self._fail(item, e)
+                return
+            finally:
+                self.in_flight -= 1
+            break
+
+        now = time.monotonic()
+        stats.sent += 1
+        stats.latency.observe((now - item.submitted) * 1000)
+        if item.key is not None and self._window > 0:
+            self._recent[item.key] = (now + self._window, result)
+            if len(self._recent) > 1000:
+                self._recent = {key: entry for key, entry in self._recent.items() if entry[0] > now}
+        if not item.future.done():
+            item.future.set_result(result)
+
+    def _fail(self, item: _Send, error: Exception) -> None:
+        self._lanes[item.lane].failed += 1
+        logger.warning(f"Outbound {item.method} to {item.kwargs.get('chat_id')} ({item.lane.name.lower()}) "
+                       f"failed: {error}")
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for lane, stats in self._lanes.items():
+            lanes[lane.name.lower()] = {
+                'queued': stats.queued,
+                'sent': stats.sent,
+                'failed': stats.failed,
+                'coalesced': stats.coalesced,
+                'latency_p50_ms': stats.latency.percentile(0.50),
+                'latency_p95_ms': stats.latency.percentile(0.95),
+            }
+        return {
+            'running': self.running,
+            'queue_depth': sum(stats.queued for stats in self._lanes.values()),
+            'waiting_for_chat': len(self._parked),
+            'in_flight': self.in_flight,
+            'retry_after': self.retry_after,
+            'rate_wait_s': round(self.bucket.waited, 3) if self.bucket else 0.0,
+            'lanes': lanes,
+        }
+
+    def prometheus(self) -> List[str]:
+        """Metric lines for the ``/metrics`` endpoint."""
+        lines = ['# HELP bot_outbound_queue_depth Sends waiting by lane.',
+                 '# TYPE bot_outbound_queue_depth gauge']
+        lines += [f'bot_outbound_queue_depth{{lane="{lane.name.lower()}"}} {stats.queued}'
+                  for lane, stats in self._lanes.items()]
+        for metric, help_text, attr in (
+            ('bot_outbound_sent_total', 'Sends completed by lane.', 'sent'),
+            ('bot_outbound_failed_total', 'Sends that failed by lane.', 'failed'),
+            ('bot_outbound_coalesced_total', 'Sends merged into another by lane.', 'coalesced'),
+        ):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            lines += [f'{metric}{{lane="{lane.name.lower()}"}} {getattr(stats, attr)}'
+                      for lane, stats in self._lanes.items()]
+        lines += ['# HELP bot_outbound_retry_after_total RetryAfter responses from Telegram.',
+                  '# TYPE bot_outbound_retry_after_total counter',
+                  f'bot_outbound_retry_after_total {self.retry_after}',
+                  '# HELP bot_outbound_latency_ms Submit-to-sent latency by lane.',
+                  '# TYPE bot_outbound_latency_ms histogram']
+        for lane, stats in self._lanes.items():
+            label = f'lane="{lane.name.lower()}"'
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS_MS) + ['+Inf'], list(stats.latency.counts)):
+                cumulative += count
+                lines.append(f'bot_outbound_latency_ms_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'bot_outbound_latency_ms_sum{{{label}}} {stats.latency.total:.3f}')
+            lines.append(f'bot_outbound_latency_ms_count{{{label}}} {stats.latency.count}')
+        return lines
+
+
+# Global scheduler, started in post_init
+scheduler = OutboundScheduler()
+
+# Direct sends started by submit() while the scheduler is stopped; the loop only keeps weak references
+_direct_sends: set = set()
+
+
+async def send(bot, lane: Lane, method: str, coalesce_key: Optional[str] = None, **kwargs: Any) -> Any:
+    """``bot.<method>(**kwargs)`` through the scheduler, or directly when it is not running.
+
+    Example:
+        await outbound.send(context.bot, Lane.NOTIFICATION, 'send_message',
+                            chat_id=user_id, text="...")
+    """
+    if scheduler.running:
+        return await scheduler.send(lane, method, coalesce_key, **kwargs)
+    return await getattr(bot, method)(**kwargs)
+
+
+def submit(bot, lane: Lane, method: str, coalesce_key: Optional[str] = None, **kwargs: Any) -> asyncio.Future:
+    """Queue ``bot.<method>(**kwargs)`` without waiting for it; failures are only logged.
+
+    For notifications that must not hold up the caller (or a higher lane
+    queued after them).
+    """
+    if scheduler.running:
+        return scheduler.submit(lane, method, coalesce_key, **kwargs)
+
+    async def deliver() -> Any:
+        try:
+            return await getattr(bot, method)(**kwargs)
+        except Exception as e:
+            logger.warning(f"Outbound {method} to {kwargs.get('chat_id')} ({lane.name.lower()}) failed: {e}")
+
+    task = asyncio.get_running_loop().create_task(deliver())
+    _direct_sends.add(task)
+    task.add_done_callback(_direct_sends.discard)
+    return task
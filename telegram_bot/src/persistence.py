@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+python-telegram-bot persistence in the bot's database.
+
+``user_data``, ``chat_data``, ``bot_data`` and the states of the admin
+conversation handlers used to live only in process memory, so a redeploy
+dropped every half-finished admin flow (mass gift target, product edits)
+and a second replica could never pick one up. ``DatabasePersistence``
+stores them in ``persistence_data``, one row per user, chat, conversation
+key or ``bot_data``:
+
+* dirty tracking: every ``PERSISTENCE_FLUSH_INTERVAL`` seconds the
+  application hands over the entries used since the last run; each is
+  pickled and compared (by digest) with what was last written, and only
+  changed or deleted entries are kept. Empty ``chat_data`` and
+  ``user_data`` are never written;
+* coalesced writes: the entries of one run are written together, one
+  batched upsert and one batched delete, off the event loop. A failed
+  write is retried with the next run;
+* compact serialization: pickle at the highest protocol, zlib-compressed
+  from ``PERSISTENCE_COMPRESS_MIN_BYTES``;
+* idle eviction: only users and chats written within
+  ``PERSISTENCE_IDLE_TTL`` are loaded at startup; anyone else is loaded on
+  their first update. ``run_persistence_maintenance`` drops users and chats
+  idle that long from memory (their rows stay) and deletes rows unchanged
+  for ``PERSISTENCE_RETENTION_DAYS``.
+
+Rows are written by this bot only, so they are trusted like the rest of
+the database. Conversation states are read when the application starts:
+a conversation continues after a restart on any replica, but replicas do
+not hand a running conversation to each other.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from src import queries
+from src.async_database import async_db_manager
+from src.database import db_manager, run_db, settings
+from src.query_stats import query_stats
+
+logger = logging.getLogger(__name__)
+
+_PURGE_INTERVAL = 3600.0
+_RAW, _ZLIB = b'p', b'z'  # first byte of a stored value
+
+queries.register('persistence_load_kind',
+                 "SELECT entity_key, data FROM persistence_data WHERE kind = %s")
+queries.register('persistence_load_recent', """
+    SELECT entity_key, data FROM persistence_data
+    WHERE kind = %s AND updated_at >= CURRENT_TIMESTAMP - CAST(%s AS INTEGER) * INTERVAL '1 second'
+""", sqlite="""
+    SELECT entity_key, data FROM persistence_data
+    WHERE kind = %s AND updated_at >= datetime('now', '-' || %s || ' seconds')
+""")
+# Read from the primary: the row may have been written moments ago
+queries.register('persistence_get',
+                 "SELECT data FROM persistence_data WHERE kind = %s AND entity_key = %s", replica=False)
+queries.register('persistence_upsert', """
+    INSERT INTO persistence_data (kind, entity_key, data, updated_at)
+    SELECT kind, entity_key, data, CURRENT_TIMESTAMP
+    FROM unnest(%s::varchar[], %s::varchar[], %s::bytea[]) AS t (kind, entity_key, data)
+    ON CONFLICT (kind, entity_key) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+""", sqlite="""
+    INSERT INTO persistence_data (kind, entity_key, data, updated_at) VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (kind, entity_key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+""", pins_reads=False)
+queries.register('persistence_delete', """
+    DELETE FROM persistence_data
+    WHERE (kind, entity_key) IN (SELECT * FROM unnest(%s::varchar[], %s::varchar[]))
+""", sqlite="DELETE FROM persistence_data WHERE kind = %s AND entity_key = %s", pins_reads=False)
+queries.register('persistence_purge', """
+    DELETE FROM persistence_data
+    WHERE kind IN ('user', 'chat') AND updated_at < CURRENT_TIMESTAMP - CAST(%s AS INTEGER) * INTERVAL '1 day'
+    RETURNING kind, entity_key
+""", sqlite="""
+    DELETE FROM persistence_data
+    WHERE kind IN ('user', 'chat') AND updated_at < datetime('now', '-' || %s || ' days')
+    RETURNING kind, entity_key
+""", pins_reads=False)
+
+RowKey = Tuple[str, str]  # (kind, entity_key)
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=8).digest()
+
+
+def _conversation_kind(name: str) -> str:
+    return f"conversation:{name}"
+
+
+def _write_rows(upserts: List[Tuple[str, str, bytes]], deletes: List[RowKey]) -> None:
+    """Apply one run's changes: one upsert and one delete, in one transaction."""
+    with db_manager.get_connection() as conn:
+        postgres = db_manager._db_type == 'postgresql'
+        cursor = conn.cursor()
+        for statement, rows in (('persistence_upsert', upserts), ('persistence_delete', deletes)):
+            if not rows:
+                continue
+            started = time.perf_counter()
+            if postgres:
+                cursor.execute(db_manager.sql(statement), tuple(map(list, zip(*rows))))
+            else:
+                cursor.executemany(db_manager.sql(statement), rows)
+            query_stats.record(statement, time.perf_counter() - started, len(rows))
+        conn.commit()
+
+
+class DatabasePersistence(BasePersistence):
+    """``BasePersistence`` on ``persistence_data`` with dirty tracking and batched writes."""
+
+    def __init__(self, update_interval: float = 30.0, idle_ttl: float = 86400.0,
+                 compress_min_bytes: int = 512):
+        # Callback data is only kept with arbitrary_callback_data, which the bot does not use
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.idle_ttl = float(idle_ttl)
+        self.compress_min_bytes = int(compress_min_bytes)
+        self._digests: Dict[RowKey, bytes] = {}  # digest of each row's pickle as last written (or queued)
+        self._pending: Dict[RowKey, Optional[bytes]] = {}  # queued writes; None deletes the row
+        self._write_task: Optional[asyncio.Task] = None
+        # Users/chats whose stored data is in the application's memory, with when they were last seen
+        self._resident: Dict[str, Dict[int, float]] = {'user': {}, 'chat': {}}
+        self._loading: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._evicting: Dict[str, Set[int]] = {'user': set(), 'chat': set()}
+        self.serialized = 0
+        self.unchanged = 0
+        self.written = 0
+        self.deleted = 0
+        self.write_errors = 0
+        self.write_seconds = 0.0
+        self.loaded_on_demand = 0
+        self.evicted = 0
+        self.purged = 0
+        query_stats.add_collector(self.prometheus)
+
+    # --- Serialization ---
+
+    def _pack(self, raw: bytes) -> bytes:
+        if len(raw) >= self.compress_min_bytes:
+            packed = zlib.compress(raw)
+            if len(packed) < len(raw):
+                return _ZLIB + packed
+        return _RAW + raw
+
+    @staticmethod
+    def _unpack(blob: Any) -> bytes:
+        """The pickle inside a stored value."""
+        blob = bytes(blob)  # psycopg2 returns memoryview
+        return zlib.decompress(blob[1:]) if blob[:1] == _ZLIB else blob[1:]
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._pack(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def loads(self, blob: Any) -> Any:
+        return pickle.loads(self._unpack(blob))
+
+    # --- Loading ---
+
+    async def _load_rows(self, kind: str, recent_seconds: Optional[float] = None) -> List[Tuple[str, Any]]:
+        if recent_seconds is None:
+            rows = await async_db_manager.execute_named('persistence_load_kind', (kind,), fetch_all=True)
+        else:
+            rows = await async_db_manager.execute_named('persistence_load_recent', (kind, int(recent_seconds)),
+                                                        fetch_all=True)
+        loaded = []
+        for row in rows or []:
+            try:
+                raw = self._unpack(row['data'])
+                loaded.append((row['entity_key'], pickle.loads(raw)))
+                self._digests[(kind, row['entity_key'])] = _digest(raw)
+            except Exception as e:
+                logger.error(f"Skipping unreadable {kind} state {row['entity_key']}: {e}")
+        return loaded
+
+    async def _load_recent(self, kind: str) -> Dict[int, Any]:
+        now = time.monotonic()
+        data = {}
+        for key, value in await self._load_rows(kind, self.idle_ttl):
+            data[int(key)] = value
+            self._resident[kind][int(key)] = now
+        logger.info(f"Loaded {len(data)} recently active {kind} states")
+        return data
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return await self._load_recent('user')
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return await self._load_recent('chat')
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        rows = await self._load_rows('bot')
+        return rows[0][1] if rows else {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        return {tuple(json.loads(key)): state for key, state in await self._load_rows(_conversation_kind(name))}
+
+    async def _refresh(self, kind: str, entity_id: int, data: Dict[Any, Any]) -> None:
+        """Load stored data for a user/chat the first time it shows up in this process."""
+        resident = self._resident[kind]
+        if entity_id in resident:
+            resident[entity_id] = time.monotonic()
+            return
+        loading = self._loading.get((kind, entity_id))
+        if loading is not None:
+            await asyncio.shield(loading)
+            return
+
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[(kind, entity_id)] = loading
+        try:
+            row = await async_db_manager.execute_named('persistence_get', (kind, str(entity_id)), fetch_one=True)
+            if row:
+                raw = self._unpack(row['data'])
+                for key, value in pickle.loads(raw).items():
+                    data.setdefault(key, value)  # keys set since the update began win
+                self._digests[(kind, str(entity_id))] = _digest(raw)
+                self.loaded_on_demand += 1
+            resident[entity_id] = time.monotonic()
+        except Exception as e:
+            # Not resident, so nothing is written over the stored row; retried on the next update
+            logger.error(f"Loading {kind} state for {entity_id} failed: {e}")
+        finally:
+            del self._loading[(kind, entity_id)]
+            loading.set_result(None)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        await self._refresh('user', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        await self._refresh('chat', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        """``bot_data`` is loaded once at startup."""
+
+    # --- Writing ---
+
+    def _stage(self, row: RowKey, value: Any) -> None:
+        """Queue ``value`` for ``row`` if it differs from what was last written; None or empty deletes."""
+        if value is None or value == {}:
+            if row not in self._digests:
+                return
+            del self._digests[row]
+            self._pending[row] = None
+        else:
+            # Compared before compressing, so unchanged entries cost a pickle and a hash
+            raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self.serialized += 1
+            digest = _digest(raw)
+            if self._digests.get(row) == digest:
+                self.unchanged += 1
+                return
+            self._digests[row] = digest
+            self._pending[row] = self._pack(raw)
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_soon())
+
+    async def _write_soon(self) -> None:
+        # The application hands over a run's entries as concurrent tasks that
+        # each return at once; yielding lets them all queue before the write
+        await asyncio.sleep(0)
+        await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            upserts = [(kind, key, blob) for (kind, key), blob in batch.items() if blob is not None]
+            deletes = [row for row, blob in batch.items() if blob is None]
+            started = time.perf_counter()
+            try:
+                await run_db(_write_rows, upserts, deletes)
+            except Exception as e:
+                # Queue them again for the next run; entries changed since then win
+                self.write_errors += 1
+                self._pending = {**batch, **self._pending}
+                logger.error(f"Writing {len(batch)} persistence rows failed: {e}")
+                return
+            self.write_seconds += time.perf_counter() - started
+            self.written += len(upserts)
+            self.deleted += len(deletes)
+
+    def _update(self, kind: str, entity_id: int, data: Dict[Any, Any]) -> None:
+        if entity_id not in self._resident[kind]:
+            return  # its stored data could not be loaded; don't overwrite it
+        self._stage((kind, str(entity_id)), data)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._update('user', user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._update('chat', chat_id, data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._stage(('bot', ''), data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        """Callback data is not stored."""
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        self._stage((_conversation_kind(name), json.dumps(list(key))), new_state)
+
+    async def _drop(self, kind: str, entity_id: int) -> None:
+        if entity_id in self._evicting[kind]:
+            # Evicted from memory only; the row stays
+            self._evicting[kind].discard(entity_id)
+            return
+        self._resident[kind].pop(entity_id, None)
+        self._stage((kind, str(entity_id)), None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._drop('user', user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._drop('chat', chat_id)
+
+    async def flush(self) -> None:
+        """Write everything queued; the application calls this on stop."""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
+
+    # --- Eviction and retention ---
+
+    def evict_idle(self, application: Any) -> int:
+        """Drop users and chats idle for ``idle_ttl`` from the application's memory; their rows stay."""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = 0
+        for kind, drop in (('user', application.drop_user_data), ('chat', application.drop_chat_data)):
+            resident = self._resident[kind]
+            for entity_id in [entity_id for entity_id, seen in resident.items() if seen < cutoff]:
+                if (kind, str(entity_id)) in self._pending:
+                    continue  # not written yet
+                del resident[entity_id]
+                self._digests.pop((kind, str(entity_id)), None)
+                self._evicting[kind].add(entity_id)
+                drop(entity_id)
+                evicted += 1
+        self.evicted += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} idle users/chats from memory")
+        return evicted
+
+    def purge(self, retention_days: int) -> int:
+        """Delete user/chat rows unchanged for ``retention_days``; returns the number deleted."""
+        rows = db_manager.execute_named('persistence_purge', (int(retention_days),), fetch_all=True) or []
+        for row in rows:
+            # Written again in full if the entity changes
+            self._digests.pop((row['kind'], row['entity_key']), None)
+        self.purged += len(rows)
+        if rows:
+            logger.info(f"Purged {len(rows)} user/chat states unchanged for {retention_days} days")
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'resident_users': len(self._resident['user']),
+            'resident_chats': len(self._resident['chat']),
+            'pending': len(self._pending),
+            'serialized': self.serialized,
+            'unchanged': self.unchanged,
+            'written': self.written,
+            'deleted': self.deleted,
+            'write_errors': self.write_errors,
+            'write_seconds': round(self.write_seconds, 3),
+            'loaded_on_demand': self.loaded_on_demand,
+            'evicted': self.evicted,
+            'purged': self.purged,
+        }
+
+    def prometheus(self) -> List[str]:
+        """Metric lines for the ``/metrics`` endpoint."""
+        return [
+            '# HELP bot_persistence_resident Users and chats whose stored state is in memory.',
+            '# TYPE bot_persistence_resident gauge',
+            f'bot_persistence_resident{{kind="user"}} {len(self._resident["user"])}',
+            f'bot_persistence_resident{{kind="chat"}} {len(self._resident["chat"])}',
+            '# HELP bot_persistence_pending Persistence rows waiting to be written.',
+            '# TYPE bot_persistence_pending gauge',
+            f'bot_persistence_pending {len(self._pending)}',
+            '# HELP bot_persistence_entries_total Entries handed over by the application, by outcome.',
+            '# TYPE bot_persistence_entries_total counter',
+            f'bot_persistence_entries_total{{outcome="written"}} {self.written}',
+            f'bot_persistence_entries_total{{outcome="deleted"}} {self.deleted}',
+            f'bot_persistence_entries_total{{outcome="unchanged"}} {self.unchanged}',
+            '# HELP bot_persistence_write_seconds_total Time spent writing persistence rows.',
+            '# TYPE bot_persistence_write_seconds_total counter',
+            f'bot_persistence_write_seconds_total {self.write_seconds:.6f}',
+        ]
+
+
+def is_enabled() -> bool:
+    return bool(getattr(settings, 'PERSISTENCE_ENABLED', True))
+
+
+def from_settings() -> Optional[DatabasePersistence]:
+    """Argument for ``ApplicationBuilder.persistence()``: None when ``PERSISTENCE_ENABLED`` is off."""
+    if not is_enabled():
+        return None
+    return DatabasePersistence(
+        update_interval=float(getattr(settings, 'PERSISTENCE_FLUSH_INTERVAL', 30.0)),
+        idle_ttl=float(getattr(settings, 'PERSISTENCE_IDLE_TTL', 86400.0)),
+        compress_min_bytes=int(getattr(settings, 'PERSISTENCE_COMPRESS_MIN_BYTES', 512)),
+    )
+
+
+async def run_persistence_maintenance(application: Any) -> None:
+    """Evict idle users/chats from memory and purge rows past retention, periodically."""
+    persistence = application.persistence
+    if not isinstance(persistence, DatabasePersistence):
+        return
+    retention_days = int(getattr(settings, 'PERSISTENCE_RETENTION_DAYS', 180))
+    interval = min(_PURGE_INTERVAL, max(persistence.idle_ttl / 4, persistence.update_interval))
+    next_purge = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        persistence.evict_idle(application)
+        if retention_days > 0 and time.monotonic() >= next_purge:
+            next_purge = time.monotonic() + _PURGE_INTERVAL
+            try:
+                await run_db(persistence.purge, retention_days)
+            except Exception as e:
+                logger.error(f"Purging persistence rows failed: {e}")
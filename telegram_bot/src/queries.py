@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Named SQL statements compiled once per dialect, and the uniform result row.
+
+Statements are registered once at import time, written for PostgreSQL with
+``%s`` placeholders. ``DatabaseManager`` compiles every statement for its
+dialect when the pool is initialized, so query functions no longer rebuild
+SQL strings on each call. A statement that cannot be translated mechanically
+(date arithmetic, mostly) registers an explicit SQLite variant.
+
+Each statement declares its workload class: ``OLTP`` for the message and
+payment paths, ``ANALYTICS`` for dashboards, listings and searches.
+``DatabaseManager`` runs each class on its own connection pool and executor
+with its own ``statement_timeout``, so a slow search cannot starve a paying
+user of connections.
+
+Read-only statements may be served by a read replica (``src.replica``);
+``replica=False`` keeps one on the primary. The registry also notes which
+parameter carries the Telegram user ID (the first ``telegram_id = %s`` or
+``user_id = %s``, or an inserted ``telegram_id``/``user_id`` column), so
+reads of a user who just wrote stay on the primary. Other writes keep every
+read on the primary for a while, unless registered with
+``pins_reads=False`` (bookkeeping whose user-visible effects already go
+through cache invalidation).
+
+On PostgreSQL, statements can also run as server-side prepared statements
+(``DB_PREPARED_STATEMENTS``); the registry produces the ``PREPARE`` and
+``EXECUTE`` text and ``DatabaseManager`` tracks which sessions have them.
+
+Every row returned by ``DatabaseManager`` is a ``Row``: a dict keyed by
+column name that also accepts positional indexes, so ``row['credits']`` and
+``row[0]`` both work whichever database is behind it.
+"""
+
+import re
+import textwrap
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from src.query_stats import is_read_only
+
+_PLACEHOLDER_RE = re.compile(r'%s')
+_USER_PARAM_RE = re.compile(r'\b(?:telegram_id|user_id)\s*=\s*%s', re.IGNORECASE)
+_INSERT_RE = re.compile(r'^\s*INSERT\s+INTO\s+\w+\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)',
+                        re.IGNORECASE)
+
+# Workload classes; each runs on its own pool
+OLTP = 'oltp'
+ANALYTICS = 'analytics'
+WORKLOADS = (OLTP, ANALYTICS)
+
+# Mechanical PostgreSQL -> SQLite rewrites; anything else needs an explicit variant
+_SQLITE_REWRITES: Tuple[Tuple[re.Pattern, str], ...] = (
+    (_PLACEHOLDER_RE, '?'),
+    (re.compile(r'\bNOW\(\)', re.IGNORECASE), 'CURRENT_TIMESTAMP'),
+    (re.compile(r'\bILIKE\b', re.IGNORECASE), 'LIKE'),
+)
+
+
+class Row(dict):
+    """One result row: by column name like RealDictRow, or by position like sqlite3.Row."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: Any) -> Any:
+        if isinstance(key, (int, slice)):
+            return tuple(self.values())[key]
+        return dict.__getitem__(self, key)
+
+
+def sqlite_row_factory(cursor: Any, values: tuple) -> Row:
+    """``sqlite3`` row factory producing ``Row`` objects."""
+    return Row(zip([column[0] for column in cursor.description], values))
+
+
+def to_row(row: Optional[Any]) -> Optional[Row]:
+    """Wrap a driver row (e.g. RealDictRow) as a ``Row``."""
+    if row is None or isinstance(row, Row):
+        return row
+    return Row(row)
+
+
+def translate(sql: str, dialect: str) -> str:
+    """Translate PostgreSQL-flavoured SQL with ``%s`` placeholders to ``dialect``."""
+    if dialect != 'sqlite':
+        return sql
+    for pattern, replacement in _SQLITE_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class Statement(NamedTuple):
+    name: str
+    postgresql: str
+    sqlite: Optional[str]
+    param_count: int
+    workload: str = OLTP
+    read_only: bool = False
+    replica: bool = False  # may be served by a read replica
+    user_param: Optional[int] = None  # index of the parameter holding the user ID
+    pins_reads: bool = True  # a write without a user ID sends all reads to the primary for a while
+
+
+def _user_param(sql: str) -> Optional[int]:
+    """Index of the parameter that carries the Telegram user ID, if any."""
+    match = _USER_PARAM_RE.search(sql)
+    if match:
+        return sql[:match.end()].count('%s') - 1
+    insert = _INSERT_RE.match(sql)
+    if insert:
+        columns = [column.strip().lower() for column in insert.group(1).split(',')]
+        values = [value.strip() for value in insert.group(2).split(',')]
+        for column in ('telegram_id', 'user_id'):
+            if column in columns and len(values) == len(columns):
+                index = columns.index(column)
+                if values[index] == '%s':
+                    return sum(1 for value in values[:index] if value == '%s')
+    return None
+
+
+class QueryRegistry:
+    """Named statements and their per-dialect compiled text."""
+
+    def __init__(self):
+        self._statements: Dict[str, Statement] = {}
+        self._compiled: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, postgresql: str, sqlite: Optional[str] = None,
+                 workload: str = OLTP, replica: Optional[bool] = None, pins_reads: bool = True) -> str:
+        """Register a statement; ``sqlite`` overrides the mechanical translation.
+
+        ``replica`` defaults to whether the statement is read-only.
+        """
+        if not name.isidentifier():
+            # The name doubles as the server-side prepared statement name
+            raise ValueError(f"Statement name must be an identifier: {name!r}")
+        if workload not in WORKLOADS:
+            raise ValueError(f"Unknown workload {workload!r} for statement {name!r}")
+        postgresql = textwrap.dedent(postgresql).strip()
+        sqlite = textwrap.dedent(sqlite).strip() if sqlite else None
+        read_only = is_read_only(postgresql)
+        statement = Statement(name, postgresql, sqlite, postgresql.count('%s'), workload, read_only,
+                              read_only if replica is None else replica and read_only,
+                              _user_param(postgresql), pins_reads)
+        with self._lock:
+            existing = self._statements.get(name)
+            if existing is not None and existing != statement:
+                raise ValueError(f"Statement {name!r} is already registered with different SQL")
+            self._statements[name] = statement
+        return name
+
+    def _compile_one(self, statement: Statement, dialect: str) -> str:
+        if dialect == 'sqlite' and statement.sqlite:
+            return statement.sqlite.replace('%s', '?')
+        return translate(statement.postgresql, dialect)
+
+    def compile(self, dialect: str) -> int:
+        """Compile every registered statement for ``dialect``; returns the count."""
+        with self._lock:
+            for name, statement in self._statements.items():
+                self._compiled[(name, dialect)] = self._compile_one(statement, dialect)
+            return len(self._statements)
+
+    def sql(self, name: str, dialect: str) -> str:
+        """Compiled text of ``name`` for ``dialect``."""
+        compiled = self._compiled.get((name, dialect))
+        if compiled is None:
+            statement = self.get(name)
+            compiled = self._compile_one(statement, dialect)
+            self._compiled[(name, dialect)] = compiled
+        return compiled
+
+    def workload(self, name: str) -> str:
+        """Workload class ``name`` runs under."""
+        return self.get(name).workload
+
+    def get(self, name: str) -> Statement:
+        try:
+            return self._statements[name]
+        except KeyError:
+            raise KeyError(f"Unknown SQL statement: {name}") from None
+
+    def prepare_sql(self, name: str) -> str:
+        """``PREPARE`` text for PostgreSQL (``%s`` become ``$n``)."""
+        statement = self.get(name)
+        counter = iter(range(1, statement.param_count + 1))
+        body = _PLACEHOLDER_RE.sub(lambda _: f"${next(counter)}", statement.postgresql)
+        return f"PREPARE {name} AS {body.replace('%%', '%')}"
+
+    def execute_sql(self, name: str) -> str:
+        """``EXECUTE`` text for a prepared statement, with ``%s`` for each parameter."""
+        count = self.get(name).param_count
+        if not count:
+            return f"EXECUTE {name}"
+        return f"EXECUTE {name} ({', '.join(['%s'] * count)})"
+
+    def names(self) -> Iterable[str]:
+        return list(self._statements)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._statements
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+
+registry = QueryRegistry()
+
+
+def register(name: str, postgresql: str, sqlite: Optional[str] = None, workload: str = OLTP,
+             replica: Optional[bool] = None, pins_reads: bool = True) -> str:
+    """Register a statement on the global registry."""
+    return registry.register(name, postgresql, sqlite, workload, replica, pins_reads)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Per-statement query instrumentation and the slow-query log.
+
+``DatabaseManager`` records every query under its statement name: the name
+registered in ``src.queries``, or a short description such as
+``sql:UPDATE users`` for ad-hoc SQL. Each statement keeps a latency
+histogram (p50/p95/p99 are read from its buckets), the rows it returned or
+touched, the time spent waiting for a pool connection, and its errors.
+
+Queries slower than ``SLOW_QUERY_MS`` are logged with their parameters
+redacted to types and sizes. With ``SLOW_QUERY_EXPLAIN`` on, a read-only
+slow statement also gets an ``EXPLAIN ANALYZE`` sample, at most once per
+``SLOW_QUERY_EXPLAIN_INTERVAL`` per statement.
+
+The numbers are shown in the admin System menu and, with ``METRICS_PORT``
+set, served in Prometheus text format on ``/metrics`` (JSON on
+``/metrics.json``).
+"""
+
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('src.database.slow')
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+BUCKETS_MS: Sequence[float] = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_DESCRIBE_RE = re.compile(
+    r'^\s*(?:WITH\b.*?\)\s*)?(SELECT|INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM|PREPARE|EXECUTE)\s+'
+    r'(?:.*?\bFROM\s+)?([\w.]+)',
+    re.IGNORECASE | re.DOTALL,
+)
+_READ_ONLY_RE = re.compile(r'^\s*SELECT\b(?!.*\b(?:INSERT|UPDATE|DELETE)\b)', re.IGNORECASE | re.DOTALL)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the ``fraction`` quantile (max for +Inf)."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(BUCKETS_MS[index], self.max) if index < len(BUCKETS_MS) else self.max
+        return self.max
+
+
+class StatementStats:
+    """Counters for one statement."""
+
+    __slots__ = ('name', 'latency', 'pool_wait', 'rows', 'errors', 'slow', 'last_plan')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = Histogram()
+        self.pool_wait = Histogram()
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+        self.last_plan: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        latency = self.latency
+        return {
+            'statement': self.name,
+            'calls': latency.count,
+            'errors': self.errors,
+            'slow': self.slow,
+            'rows': self.rows,
+            'total_ms': round(latency.total, 2),
+            'avg_ms': round(latency.total / latency.count, 3) if latency.count else 0.0,
+            'p50_ms': round(latency.percentile(0.50), 3),
+            'p95_ms': round(latency.percentile(0.95), 3),
+            'p99_ms': round(latency.percentile(0.99), 3),
+            'max_ms': round(latency.max, 3),
+            'pool_wait_avg_ms': round(self.pool_wait.total / self.pool_wait.count, 3) if self.pool_wait.count else 0.0,
+            'pool_wait_max_ms': round(self.pool_wait.max, 3),
+        }
+
+
+def describe(sql: str) -> str:
+    """Short name for ad-hoc SQL, e.g. ``sql:UPDATE users``."""
+    match = _DESCRIBE_RE.match(sql)
+    if not match:
+        return 'sql:other'
+    verb = match.group(1).split()[0].upper()
+    return f"sql:{verb} {match.group(2).lower()}"
+
+
+def is_read_only(sql: str) -> bool:
+    """True for plain SELECTs, the only statements safe to EXPLAIN ANALYZE again."""
+    return bool(_READ_ONLY_RE.match(sql))
+
+
+def redact(params: Optional[Sequence[Any]]) -> str:
+    """Parameter types and sizes only, never values."""
+    if not params:
+        return '()'
+    described = []
+    for value in params:
+        if value is None:
+            described.append('NULL')
+        elif isinstance(value, (str, bytes)):
+            described.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            described.append(type(value).__name__)
+    return f"({', '.join(described)})"
+
+
+class QueryStats:
+    """Thread-safe registry of ``StatementStats``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, StatementStats] = {}
+        self._last_explain: Dict[str, float] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+        self.started_at = time.time()
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Append ``collector()``'s metric lines to every ``/metrics`` scrape."""
+        self._collectors.append(collector)
+
+    def record(self, name: str, duration: float, rows: int = 0,
+               pool_wait: Optional[float] = None, error: bool = False) -> StatementStats:
+        """Record one execution; ``duration`` and ``pool_wait`` in seconds."""
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = StatementStats(name)
+            stats.latency.observe(duration * 1000)
+            if pool_wait is not None:
+                stats.pool_wait.observe(pool_wait * 1000)
+            if error:
+                stats.errors += 1
+            elif rows and rows > 0:
+                stats.rows += rows
+            return stats
+
+    def check_slow(self, name: str, duration: float, params: Optional[Sequence[Any]],
+                   threshold_ms: float) -> bool:
+        """Log ``name`` if it exceeded ``threshold_ms``; True when it did."""
+        duration_ms = duration * 1000
+        if threshold_ms <= 0 or duration_ms < threshold_ms:
+            return False
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is not None:
+                stats.slow += 1
+        slow_logger.warning(f"Slow query {name}: {duration_ms:.1f} ms, params {redact(params)}")
+        return True
+
+    def should_explain(self, name: str, interval: float) -> bool:
+        """Claim the EXPLAIN sample slot for ``name`` if ``interval`` has passed."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_explain.get(name)
+            if last is not None and now - last < interval:
+                return False
+            self._last_explain[name] = now
+            return True
+
+    def record_plan(self, name: str, plan: str) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is not None:
+                stats.last_plan = plan
+        slow_logger.warning(f"EXPLAIN ANALYZE sample for {name}:\n{plan}")
+
+    def snapshot(self, sort_by: str = 'total_ms', limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Per-statement stats, most expensive first."""
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._stats.values()]
+        rows.sort(key=lambda row: row[sort_by], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                return None
+            result = stats.as_dict()
+            result['last_plan'] = stats.last_plan
+            return result
+
+    def totals(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = sum(s.latency.count for s in self._stats.values())
+            return {
+                'statements': len(self._stats),
+                'calls': calls,
+                'errors': sum(s.errors for s in self._stats.values()),
+                'slow': sum(s.slow for s in self._stats.values()),
+                'total_ms': round(sum(s.latency.total for s in self._stats.values()), 2),
+                'uptime_s': round(time.time() - self.started_at),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._last_explain.clear()
+            self.started_at = time.time()
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of every statement's histograms and counters."""
+        lines = [
+            '# HELP bot_db_query_duration_ms Query latency by statement.',
+            '# TYPE bot_db_query_duration_ms histogram',
+        ]
+        with self._lock:
+            stats_list = list(self._stats.values())
+            for stats in stats_list:
+                label = f'statement="{stats.name}"'
+                cumulative = 0
+                for bound, count in zip(list(BUCKETS_MS) + ['+Inf'], stats.latency.counts):
+                    cumulative += count
+                    lines.append(f'bot_db_query_duration_ms_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'bot_db_query_duration_ms_sum{{{label}}} {stats.latency.total:.3f}')
+                lines.append(f'bot_db_query_duration_ms_count{{{label}}} {stats.latency.count}')
+            for metric, help_text, attr in (
+                ('bot_db_query_rows_total', 'Rows returned or affected by statement.', 'rows'),
+                ('bot_db_query_errors_total', 'Failed executions by statement.', 'errors'),
+                ('bot_db_query_slow_total', 'Executions above SLOW_QUERY_MS by statement.', 'slow'),
+            ):
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} counter')
+                for stats in stats_list:
+                    lines.append(f'{metric}{{statement="{stats.name}"}} {getattr(stats, attr)}')
+            lines.append('# HELP bot_db_pool_wait_ms_sum Time spent waiting for a pool connection by statement.')
+            lines.append('# TYPE bot_db_pool_wait_ms_sum counter')
+            for stats in stats_list:
+                lines.append(f'bot_db_pool_wait_ms_sum{{statement="{stats.name}"}} {stats.pool_wait.total:.3f}')
+        for collector in list(self._collectors):
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry used by DatabaseManager
+query_stats = QueryStats()
+
+
+def format_top_queries(limit: int = 8) -> str:
+    """Plain-text summary of the most expensive statements for the admin menu."""
+    rows = query_stats.snapshot(limit=limit)
+    if not rows:
+        return "No queries recorded yet."
+    totals = query_stats.totals()
+    lines = [f"{totals['calls']} queries, {totals['slow']} slow, {totals['errors']} errors "
+             f"in {totals['uptime_s'] // 60} min"]
+    for row in rows:
+        lines.append(
+            f"• {row['statement']}: {row['calls']}× p50 {row['p50_ms']:g} / p95 {row['p95_ms']:g} / "
+            f"p99 {row['p99_ms']:g} ms, wait {row['pool_wait_avg_ms']:g} ms"
+        )
+    return '\n'.join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802 (http.server naming)
+        if self.path == '/metrics':
+            body, content_type = query_stats.prometheus(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            payload = {'totals': query_stats.totals(), 'statements': query_stats.snapshot()}
+            body, content_type = json.dumps(payload), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        encoded = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Scrapes every few seconds would flood the log
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` and ``/metrics.json`` from a daemon thread (idempotent)."""
+    global _metrics_server
+    if _metrics_server is not None:
+        return _metrics_server
+    try:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on port {port}: {e}")
+        return None
+    threading.Thread(target=_metrics_server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Query metrics served on :{port}/metrics")
+    return _metrics_server
+
+
+def stop_metrics_server() -> None:
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
+        _metrics_server.server_close()
+        _metrics_server = None
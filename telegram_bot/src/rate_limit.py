@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Async rate limiters for outgoing Bot API calls.
+
+Telegram allows a bot roughly 30 messages per second overall and about one
+per second to the same chat, and answers anything faster with
+``RetryAfter`` (HTTP 429). ``TokenBucket`` paces the global rate, letting
+waiters through in arrival order, and can be paused for the ``retry_after``
+Telegram asks for. ``KeyedRateLimiter`` spaces calls to the same key (chat)
+by a minimum interval once a short burst is used up.
+
+Both are meant for a single event loop and are not thread-safe.
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any, Dict, Hashable
+
+# Forget per-key schedules that are in the past once the table grows past this
+_PRUNE_THRESHOLD = 10000
+
+
+def retry_after_seconds(retry_after: Any) -> float:
+    """``RetryAfter.retry_after`` in seconds."""
+    # An int in python-telegram-bot 20, a timedelta in later releases
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """``rate`` tokens per second, bursting up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()  # FIFO: waiters are served in arrival order
+        self.waited = 0.0  # total seconds callers spent waiting
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available (and any pause is over), then take it."""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    break
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+        self.waited += time.monotonic() - started
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for ``seconds`` (Telegram's ``retry_after``), then restart empty."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+class KeyedRateLimiter:
+    """One call per ``min_interval`` seconds for each key, after an initial ``burst``."""
+
+    def __init__(self, min_interval: float, burst: int = 1):
+        self.min_interval = float(min_interval)
+        self.burst = max(1, int(burst))
+        self._next: Dict[Hashable, float] = {}  # key -> theoretical arrival time of its next call
+
+    def reserve(self, key: Hashable) -> float:
+        """Take ``key``'s next slot; returns the seconds until it starts."""
+        if self.min_interval <= 0:
+            return 0.0
+        now = time.monotonic()
+        arrival = max(now, self._next.get(key, now))
+        self._next[key] = arrival + self.min_interval
+        if len(self._next) > _PRUNE_THRESHOLD:
+            self._next = {k: t for k, t in self._next.items() if t > now}
+        return max(0.0, arrival - now - (self.burst - 1) * self.min_interval)
+
+    async def acquire(self, key: Hashable) -> None:
+        """Wait for ``key``'s next slot; slots are handed out in call order."""
+        # The slot is reserved before sleeping, so concurrent callers queue behind it
+        wait = self.reserve(key)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def __len__(self) -> int:
+        return len(self._next)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Read-replica routing policy.
+
+With ``DATABASE_REPLICA_URL`` set, ``DatabaseManager`` asks the
+``ReplicaRouter`` whether each read-only named statement may run on the
+replica. It may unless:
+
+* the statement reads a user who wrote within ``DB_READ_YOUR_WRITES_S``
+  (a payment, a charge, a new topic...), so a user who just paid sees the
+  fresh balance;
+* anything non-user data (settings, products) changed within that window;
+* the replica lags the primary by more than ``DB_REPLICA_MAX_LAG_S``, or
+  could not be reached at its last check. Lag is probed at most every
+  ``DB_REPLICA_LAG_CHECK_INTERVAL`` seconds, by one caller at a time.
+
+Writes are recorded by the statements that make them and by every cache
+invalidation, including those other bot replicas publish through Redis.
+
+The module has no dependencies beyond the standard library, so the webapp
+API reuses the router and ``REPLICA_LAG_SQL`` without the bot's settings.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Replica lag in seconds; 0 when it has replayed everything it received,
+# so an idle primary does not read as lag
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag_seconds
+"""
+
+# Prune expired per-user write marks once the table grows past this
+_PRUNE_THRESHOLD = 10000
+
+
+class ReplicaRouter:
+    """Decides per read whether the replica is fresh enough to serve it."""
+
+    def __init__(self, probe: Callable[[], float], window: float = 10.0,
+                 max_lag: float = 5.0, check_interval: float = 5.0):
+        self.probe = probe  # returns replica lag in seconds, raises if unreachable
+        self.window = window
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._user_writes: Dict[int, float] = {}  # user -> primary-only until (monotonic)
+        self._pinned_until = 0.0
+        self._probing = False
+        self._checked_at: Optional[float] = None
+        self._healthy = False
+        self._lag: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._counts = {'replica': 0, 'pinned_user': 0, 'pinned_all': 0, 'lagging': 0, 'failed': 0}
+
+    def mark_write(self, user_id: Optional[int] = None) -> None:
+        """Send reads of ``user_id`` (or, for None, all reads) to the primary for the window."""
+        until = time.monotonic() + self.window
+        with self._lock:
+            if user_id is None:
+                self._pinned_until = until
+                return
+            self._user_writes[user_id] = until
+            if len(self._user_writes) > _PRUNE_THRESHOLD:
+                now = until - self.window
+                self._user_writes = {user: expiry for user, expiry in self._user_writes.items() if expiry > now}
+
+    def use_replica(self, user_id: Optional[int] = None) -> bool:
+        """True if a read (of ``user_id``'s data, when given) may go to the replica."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._pinned_until:
+                self._counts['pinned_all'] += 1
+                return False
+            if user_id is not None and self._user_writes.get(user_id, 0.0) > now:
+                self._counts['pinned_user'] += 1
+                return False
+            probe = (not self._probing
+                     and (self._checked_at is None or now - self._checked_at >= self.check_interval))
+            if probe:
+                self._probing = True
+        if probe:
+            self._check(now)
+        with self._lock:
+            key = 'replica' if self._healthy else 'lagging'
+            self._counts[key] += 1
+            return self._healthy
+
+    def replica_failed(self, error: Exception) -> None:
+        """A replica read failed; use the primary until the next lag check."""
+        with self._lock:
+            self._healthy = False
+            self._checked_at = time.monotonic()
+            self._last_error = str(error)
+            self._counts['failed'] += 1
+        logger.warning(f"Replica read failed, using the primary for {self.check_interval:g}s: {error}")
+
+    def _check(self, now: float) -> None:
+        lag, error = None, None
+        try:
+            lag = float(self.probe())
+        except Exception as e:
+            error = str(e)
+        healthy = lag is not None and lag <= self.max_lag
+        with self._lock:
+            if healthy != self._healthy:
+                state = 'in use' if healthy else (f"lagging {lag:.1f}s" if lag is not None else f"unreachable ({error})")
+                logger.warning(f"Read replica {state}")
+            self._healthy = healthy
+            self._lag = lag
+            self._last_error = error
+            self._checked_at = now
+            self._probing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'healthy': self._healthy,
+                'lag_s': round(self._lag, 3) if self._lag is not None else None,
+                'max_lag_s': self.max_lag,
+                'last_error': self._last_error,
+                'pinned_users': sum(1 for expiry in self._user_writes.values() if expiry > now),
+                'reads': dict(self._counts),
+            }
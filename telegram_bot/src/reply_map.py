@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Reply routing for the private-chat fallback.
+
+When a user's message cannot go to a forum topic it is forwarded to the
+admin's private chat, and the admin answers by replying to the forwarded
+copy. The forwarded message -> user mapping used to live in
+``context.bot_data['message_map']``, which grew without bound and was lost
+on every restart, so replies to older messages could not be routed.
+``ReplyMap`` keeps it in the ``reply_routes`` table instead:
+
+* recent routes sit in a bounded LRU (``REPLY_MAP_MAX_ENTRIES``, about 200
+  bytes each), so replying to a recent message is an O(1) dictionary hit;
+* new routes are buffered and written by ``run_reply_map_flusher`` in
+  batches of one statement each, every ``REPLY_MAP_FLUSH_INTERVAL``
+  seconds or as soon as ``REPLY_MAP_BATCH_SIZE`` are waiting, and once more
+  on shutdown (``store.flush()``);
+* older routes are one primary-key lookup away, and routes older than
+  ``REPLY_MAP_RETENTION_DAYS`` are purged hourly.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src import queries
+from src.async_database import async_db_manager
+from src.database import db_manager, run_db, settings
+from src.query_stats import query_stats
+
+logger = logging.getLogger(__name__)
+
+_PURGE_INTERVAL = 3600.0
+
+queries.register('reply_routes_insert', """
+    INSERT INTO reply_routes (chat_id, message_id, user_id)
+    SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::bigint[])
+    ON CONFLICT (chat_id, message_id) DO NOTHING
+""", sqlite="""
+    INSERT INTO reply_routes (chat_id, message_id, user_id) VALUES (%s, %s, %s)
+    ON CONFLICT (chat_id, message_id) DO NOTHING
+""", pins_reads=False)
+# Read from the primary: a route is looked up moments after it is written
+queries.register('reply_route_lookup',
+                 "SELECT user_id FROM reply_routes WHERE chat_id = %s AND message_id = %s", replica=False)
+queries.register('reply_routes_purge',
+                 "DELETE FROM reply_routes WHERE created_at < CURRENT_TIMESTAMP - CAST(%s AS INTEGER) * INTERVAL '1 day'",
+                 sqlite="DELETE FROM reply_routes WHERE created_at < datetime('now', '-' || %s || ' days')",
+                 pins_reads=False)
+
+RouteKey = Tuple[int, int]  # (chat_id, message_id) of the forwarded copy
+
+
+def _write_routes(rows: List[Tuple[int, int, int]]) -> None:
+    """Insert ``(chat_id, message_id, user_id)`` rows with one statement."""
+    started = time.perf_counter()
+    with db_manager.get_connection() as conn:
+        if db_manager._db_type == 'postgresql':
+            with conn.cursor() as cursor:
+                cursor.execute(db_manager.sql('reply_routes_insert'), tuple(map(list, zip(*rows))))
+        else:
+            conn.cursor().executemany(db_manager.sql('reply_routes_insert'), rows)
+        conn.commit()
+    query_stats.record('reply_routes_insert', time.perf_counter() - started, len(rows))
+
+
+class ReplyMap:
+    """Forwarded message -> user routes: an LRU in front of ``reply_routes``."""
+
+    def __init__(self, max_entries: int, batch_size: int = 500):
+        self.max_entries = max(1, int(max_entries))
+        self.batch_size = max(1, int(batch_size))
+        self._lru: 'OrderedDict[RouteKey, int]' = OrderedDict()
+        self._pending: Dict[RouteKey, int] = {}  # recorded, not yet written
+        self._writing: Dict[RouteKey, int] = {}  # in the batch being written
+        self._full = asyncio.Event()
+        self.hits = 0
+        self.db_lookups = 0
+        self.db_hits = 0
+        self.written = 0
+        self.write_errors = 0
+        self.purged = 0
+        query_stats.add_collector(self.prometheus)
+
+    def record(self, chat_id: int, message_id: int, user_id: int) -> None:
+        """Remember that ``message_id`` in ``chat_id`` was forwarded from ``user_id``."""
+        key = (chat_id, message_id)
+        self._remember(key, user_id)
+        self._pending[key] = user_id
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def _remember(self, key: RouteKey, user_id: int) -> None:
+        self._lru[key] = user_id
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def lookup(self, chat_id: int, message_id: int) -> Optional[int]:
+        """The user a forwarded message came from, or None if unknown (or purged)."""
+        key = (chat_id, message_id)
+        user_id = self._lru.get(key)
+        if user_id is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return user_id
+        user_id = self._pending.get(key) or self._writing.get(key)
+        if user_id is not None:
+            self.hits += 1
+            return user_id
+
+        self.db_lookups += 1
+        try:
+            row = await async_db_manager.execute_named('reply_route_lookup', key, fetch_one=True)
+        except Exception as e:
+            logger.error(f"Error looking up reply route for message {message_id}: {e}")
+            return None
+        if not row:
+            return None
+        self.db_hits += 1
+        self._remember(key, row['user_id'])
+        return row['user_id']
+
+    async def flush(self) -> int:
+        """Write the buffered routes; returns how many were written."""
+        written = 0
+        while self._pending:
+            self._writing = self._pending
+            self._pending = {}
+            self._full.clear()
+            rows = [(chat_id, message_id, user_id) for (chat_id, message_id), user_id in self._writing.items()]
+            try:
+                await run_db(_write_routes, rows)
+            except Exception as e:
+                # Keep them for the next flush; newer routes for the same message win
+                self.write_errors += 1
+                self._pending = {**self._writing, **self._pending}
+                logger.error(f"Writing {len(rows)} reply routes failed: {e}")
+                return written
+            finally:
+                self._writing = {}
+            written += len(rows)
+            self.written += len(rows)
+        return written
+
+    def purge(self, retention_days: int) -> int:
+        """Delete routes older than ``retention_days``; returns the number deleted."""
+        deleted = db_manager.execute_named('reply_routes_purge', (int(retention_days),)) or 0
+        self.purged += deleted
+        if deleted:
+            logger.info(f"Purged {deleted} reply routes older than {retention_days} days")
+        return deleted
+
+    async def wait_for_batch(self, timeout: float) -> None:
+        """Return after ``timeout`` seconds, or sooner once a full batch is waiting."""
+        try:
+            await asyncio.wait_for(self._full.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'cached': len(self._lru),
+            'max_entries': self.max_entries,
+            'pending': len(self._pending) + len(self._writing),
+            'hits': self.hits,
+            'db_lookups': self.db_lookups,
+            'db_hits': self.db_hits,
+            'written': self.written,
+            'write_errors': self.write_errors,
+            'purged': self.purged,
+        }
+
+    def prometheus(self) -> List[str]:
+        """Metric lines for the ``/metrics`` endpoint."""
+        return [
+            '# HELP bot_reply_routes_cached Reply routes held in memory.',
+            '# TYPE bot_reply_routes_cached gauge',
+            f'bot_reply_routes_cached {len(self._lru)}',
+            '# HELP bot_reply_routes_pending Reply routes waiting to be written.',
+            '# TYPE bot_reply_routes_pending gauge',
+            f'bot_reply_routes_pending {len(self._pending) + len(self._writing)}',
+            '# HELP bot_reply_route_lookups_total Reply route lookups by where they were answered.',
+            '# TYPE bot_reply_route_lookups_total counter',
+            f'bot_reply_route_lookups_total{{source="memory"}} {self.hits}',
+            f'bot_reply_route_lookups_total{{source="database"}} {self.db_hits}',
+            f'bot_reply_route_lookups_total{{source="unknown"}} {self.db_lookups - self.db_hits}',
+            '# HELP bot_reply_routes_written_total Reply routes written to the database.',
+            '# TYPE bot_reply_routes_written_total counter',
+            f'bot_reply_routes_written_total {self.written}',
+        ]
+
+
+# Process-wide reply map, flushed by run_reply_map_flusher
+store = ReplyMap(int(getattr(settings, 'REPLY_MAP_MAX_ENTRIES', 50000)),
+                 int(getattr(settings, 'REPLY_MAP_BATCH_SIZE', 500)))
+
+
+async def run_reply_map_flusher(interval: Optional[float] = None) -> None:
+    """Write buffered routes every ``interval`` seconds (or per full batch) and purge old ones hourly."""
+    if interval is None:
+        interval = float(getattr(settings, 'REPLY_MAP_FLUSH_INTERVAL', 1.0))
+    retention_days = int(getattr(settings, 'REPLY_MAP_RETENTION_DAYS', 90))
+    next_purge = time.monotonic()
+    while True:
+        await store.wait_for_batch(interval)
+        await store.flush()
+        if retention_days > 0 and time.monotonic() >= next_purge:
+            next_purge = time.monotonic() + _PURGE_INTERVAL
+            try:
+                await run_db(store.purge, retention_days)
+            except Exception as e:
+                logger.error(f"Purging reply routes failed: {e}")
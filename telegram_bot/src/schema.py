@@ -118,6 +118,32 @@ def get_schema_queries() -> List[str]:
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            amount INTEGER,
+            transaction_type VARCHAR(50),
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS credit_reservations (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            amount INTEGER NOT NULL,
+            reason VARCHAR(50) DEFAULT 'message',
+            status VARCHAR(20) DEFAULT 'held',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            settled_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_credit_reservations_held
+        ON credit_reservations (status, expires_at)
         """
     ]
 
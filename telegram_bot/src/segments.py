@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+User segments compiled to SQL predicates.
+
+The mass gift screens used to size a segment by loading it (the VIP count
+was ``len(get_vip_users_list(1000))``, capped at 1000) and gift it one user
+at a time. Each ``Segment`` here is a ``WHERE`` predicate on ``users``,
+registered as named statements:
+
+* ``segment_count_<name>``: a ``COUNT(*)`` for the confirmation screen, on
+  the analytics workload;
+* ``segment_gift_<name>``: one ``UPDATE ... WHERE <segment>`` whose
+  ``RETURNING`` rows feed the ledger ``INSERT ... SELECT`` in the same
+  statement. SQLite has no data-modifying CTEs, so there the ledger insert
+  (``segment_gift_ledger_<name>``) and the update run back to back under
+  ``BEGIN IMMEDIATE``.
+
+No user IDs leave the database. The time-window predicates compare the
+indexed ``created_at`` and ``last_active`` columns against a computed bound,
+so they can use ``idx_users_created_at`` / ``idx_users_last_active``. The
+gift is atomic and runs with ``BULK_CREDIT_STATEMENT_TIMEOUT_MS`` instead of
+the message-path statement timeout.
+"""
+
+import logging
+import time
+from typing import Dict, NamedTuple, Optional
+
+from src import cache, queries
+from src.database import db_manager, settings
+from src.query_stats import query_stats
+
+logger = logging.getLogger(__name__)
+
+
+class Segment(NamedTuple):
+    name: str
+    label: str
+    postgresql: str  # predicate on users, %s placeholders
+    sqlite: str
+    params: tuple = ()
+
+
+SEGMENTS: Dict[str, Segment] = {segment.name: segment for segment in (
+    Segment('all', 'all users', 'TRUE', '1'),
+    # Same threshold as the VIP tier in get_user_tier
+    Segment('vip', 'VIP users (100+ credits)', 'message_credits >= 100', 'message_credits >= 100'),
+    Segment('new', 'new users (last 7 days)',
+            "created_at >= NOW() - CAST(%s AS INTEGER) * INTERVAL '1 day'",
+            "created_at >= datetime('now', '-' || %s || ' days')", (7,)),
+    Segment('active', 'active users (last 30 days)',
+            "last_active >= NOW() - CAST(%s AS INTEGER) * INTERVAL '1 day'",
+            "last_active >= datetime('now', '-' || %s || ' days')", (30,)),
+)}
+
+GIFT_SQL = """
+WITH gifted AS (
+    UPDATE users
+    SET message_credits = message_credits + %s,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE {predicate}
+    RETURNING telegram_id
+)
+INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
+SELECT telegram_id, %s, %s, %s, CURRENT_TIMESTAMP FROM gifted
+"""
+
+# SQLite: the ledger rows are written first, from the same predicate, in the same transaction
+SQLITE_GIFT_SQL = """
+UPDATE users
+SET message_credits = message_credits + %s,
+    updated_at = CURRENT_TIMESTAMP
+WHERE {predicate}
+"""
+
+SQLITE_LEDGER_SQL = """
+INSERT INTO transactions (user_id, amount, transaction_type, description, created_at)
+SELECT telegram_id, %s, %s, %s, CURRENT_TIMESTAMP FROM users WHERE {predicate}
+"""
+
+for _segment in SEGMENTS.values():
+    queries.register(f"segment_count_{_segment.name}",
+                     f"SELECT COUNT(*) AS total FROM users WHERE {_segment.postgresql}",
+                     sqlite=f"SELECT COUNT(*) AS total FROM users WHERE {_segment.sqlite}",
+                     workload=queries.ANALYTICS)
+    queries.register(f"segment_gift_{_segment.name}", GIFT_SQL.format(predicate=_segment.postgresql),
+                     sqlite=SQLITE_GIFT_SQL.format(predicate=_segment.sqlite))
+    queries.register(f"segment_gift_ledger_{_segment.name}",
+                     SQLITE_LEDGER_SQL.format(predicate=_segment.postgresql),
+                     sqlite=SQLITE_LEDGER_SQL.format(predicate=_segment.sqlite))
+
+
+def get_segment(name: str) -> Segment:
+    try:
+        return SEGMENTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown user segment: {name!r}") from None
+
+
+def count_segment(name: str) -> int:
+    """Number of users in the segment."""
+    segment = get_segment(name)
+    try:
+        row = db_manager.execute_named(f"segment_count_{name}", segment.params, fetch_one=True)
+        return row['total'] if row else 0
+    except Exception as e:
+        logger.error(f"Error counting segment {name}: {e}")
+        return 0
+
+
+def gift_segment(name: str, amount: int, reason: str = 'mass_gift',
+                 description: Optional[str] = None) -> Optional[int]:
+    """Add ``amount`` message credits to every user in the segment, with a ledger row each.
+
+    Returns the number of users gifted, or None if the gift failed and was rolled back.
+    """
+    segment = get_segment(name)
+    statement = f"segment_gift_{name}"
+    description = description or f"Gift to {segment.label}"
+    started = time.perf_counter()
+    pool_wait = None
+    try:
+        with db_manager.get_connection() as conn:
+            pool_wait = time.perf_counter() - started
+            if db_manager._db_type == 'postgresql':
+                with conn.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s",
+                                   (int(getattr(settings, 'BULK_CREDIT_STATEMENT_TIMEOUT_MS', 300000)),))
+                    cursor.execute(db_manager.sql(statement),
+                                   (amount, *segment.params, amount, reason, description))
+                    gifted = cursor.rowcount
+                conn.commit()
+            else:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(db_manager.sql(f"segment_gift_ledger_{name}"),
+                               (amount, reason, description, *segment.params))
+                gifted = cursor.rowcount
+                cursor.execute(db_manager.sql(statement), (amount, *segment.params))
+                conn.commit()
+    except Exception as e:
+        query_stats.record(statement, time.perf_counter() - started - (pool_wait or 0.0),
+                           pool_wait=pool_wait, error=True)
+        logger.error(f"Gift to segment {name} failed and was rolled back: {e}")
+        return None
+
+    elapsed = time.perf_counter() - started
+    query_stats.record(statement, elapsed - pool_wait, gifted, pool_wait)
+    if gifted:
+        cache.invalidate_all_user_caches()
+        db_manager.mark_write()
+    logger.info(f"Gifted {amount} credits to {gifted} {segment.label} in {elapsed:.2f}s")
+    return gifted
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Whole-table snapshot of bot settings.
+
+The ``bot_settings`` table is loaded with one query into an immutable
+``SettingsSnapshot``; handlers read it without any I/O. A new snapshot is
+loaded and swapped in atomically when a setting changes (locally or on
+another replica, via the cache invalidation feed) or when the snapshot is
+older than ``SETTINGS_SNAPSHOT_TTL``. On the event loop the old snapshot
+keeps being served while the reload runs on the database executor; the
+first snapshot is loaded in ``post_init``. A replica's own writes are
+applied to its snapshot straight away, so it reads them back at once.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from src import cache
+from src.database import db_manager, settings, MESSAGE_COST_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'on', 'enabled')
+
+
+class SettingsSnapshot:
+    """Immutable view of every bot setting at one point in time."""
+
+    __slots__ = ('_values', 'version', 'loaded_at')
+
+    def __init__(self, values: Mapping[str, str], version: int = 0, loaded_at: float = 0.0):
+        object.__setattr__(self, '_values', MappingProxyType(dict(values)))
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'loaded_at', loaded_at)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("SettingsSnapshot is immutable")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def values(self) -> Mapping[str, str]:
+        """Read-only mapping of setting key to raw value."""
+        return self._values
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self._values.get(key)
+        return default if value is None else value
+
+    def get_int(self, key: str, default: int = 0) -> int:
+        try:
+            return int(self._values[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def get_float(self, key: str, default: float = 0.0) -> float:
+        try:
+            return float(self._values[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        value = self._values.get(key)
+        if value is None:
+            return default
+        return str(value).strip().lower() in _TRUE_VALUES
+
+    def message_cost(self, message_type: str) -> int:
+        """Base (undiscounted) credit cost of a message type."""
+        key, default = MESSAGE_COST_SETTINGS.get(message_type, MESSAGE_COST_SETTINGS['text'])
+        return self.get_int(key, int(default))
+
+    @property
+    def low_credit_threshold(self) -> int:
+        return self.get_int('low_credit_threshold', 5)
+
+    @property
+    def starting_credits(self) -> int:
+        return self.get_int('starting_credits', 10)
+
+    @property
+    def welcome_message(self) -> str:
+        return self.get('welcome_message', 'Welcome to our paid messaging service!')
+
+
+class SettingsStore:
+    """Holds the current SettingsSnapshot and decides when to reload it."""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.loads = 0
+        self.load_errors = 0
+
+    def _is_stale(self, snapshot: SettingsSnapshot) -> bool:
+        return snapshot.version != self._version or time.monotonic() - snapshot.loaded_at > self.ttl
+
+    def load(self) -> SettingsSnapshot:
+        """Load the whole settings table and swap it in. Keeps the old snapshot on error."""
+        version = self._version
+        try:
+            query = "SELECT setting_key, setting_value FROM bot_settings"
+            rows = db_manager.execute_query(query, fetch_all=True) or []
+        except Exception as e:
+            self.load_errors += 1
+            logger.error(f"Error loading settings snapshot: {e}")
+            # Serve the last good snapshot, or defaults without caching them
+            return self._snapshot or SettingsSnapshot({}, version)
+
+        snapshot = SettingsSnapshot(
+            {row['setting_key']: row['setting_value'] for row in rows}, version, time.monotonic()
+        )
+        with self._lock:
+            self.loads += 1
+            # A slower load that started before a newer one must not win
+            if self._snapshot is None or snapshot.version >= self._snapshot.version:
+                self._snapshot = snapshot
+            return self._snapshot
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        async def refresh() -> None:
+            try:
+                await db_manager.run_in_executor(self.load)
+            except Exception as e:
+                logger.error(f"Background settings reload failed: {e}")
+            finally:
+                self._refreshing = False
+
+        asyncio.get_running_loop().create_task(refresh())
+
+    def current(self) -> SettingsSnapshot:
+        """Return the current snapshot, reloading it if it is stale."""
+        snapshot = self._snapshot
+        if snapshot is not None and not self._is_stale(snapshot):
+            return snapshot
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self.load()
+        self._refresh_in_background()
+        if snapshot is None:
+            # Used before post_init loaded it: defaults until the reload lands
+            logger.warning("Settings read before the snapshot was loaded; using defaults")
+            return SettingsSnapshot({}, -1)
+        return snapshot
+
+    def apply_local(self, key: str, value: str) -> None:
+        """Apply this process's own write to the current snapshot (read-your-writes).
+
+        The patched snapshot counts as expired, so the next read still
+        reloads the whole table in the background.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                return
+            values = dict(self._snapshot.values)
+            values[key] = value
+            # Outranks loads that started before the write, and those still pending drop out
+            self._snapshot = SettingsSnapshot(values, self._version, 0.0)
+
+    def invalidate(self) -> None:
+        """Mark the current snapshot stale (version bump)."""
+        with self._lock:
+            self._version += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': self._version,
+            'loaded_version': snapshot.version if snapshot else None,
+            'entries': len(snapshot) if snapshot else 0,
+            'age_seconds': time.monotonic() - snapshot.loaded_at if snapshot else None,
+            'loads': self.loads,
+            'load_errors': self.load_errors,
+        }
+
+
+_store = SettingsStore(ttl=float(getattr(settings, 'SETTINGS_SNAPSHOT_TTL', 60.0)))
+
+
+def _on_cache_invalidation(kind: str, arg: Any) -> None:
+    """Reload after any setting changes here or on another replica."""
+    if kind == 'clear' or (kind == 'ns' and arg == 'setting') or \
+            (kind == 'key' and str(arg).startswith('setting:')):
+        _store.invalidate()
+
+
+cache.add_invalidation_listener(_on_cache_invalidation)
+
+
+def get_settings() -> SettingsSnapshot:
+    """The current settings snapshot (no I/O unless it needs reloading)."""
+    return _store.current()
+
+
+def apply_setting_write(key: str, value: str) -> None:
+    """Make a setting just written by this process visible to its readers at once."""
+    _store.apply_local(key, value)
+
+
+def reload_settings() -> SettingsSnapshot:
+    """Force a reload now, e.g. at startup."""
+    _store.invalidate()
+    return _store.load()
+
+
+def get_snapshot_stats() -> Dict[str, Any]:
+    return _store.get_stats()
@@ -49,7 +49,7 @@ async def process_stripe_webhook(payload: str, signature: str) -> bool:
         item_type = metadata.get('item_type', 'message')
 
         if user_id and amount > 0:
-            database.add_user_credits(user_id, amount, item_type)
+            await database.run_db(database.add_user_credits, user_id, amount, item_type)
             logger.info(f"Processed successful payment for user {user_id}. Added {amount} {item_type} credits.")
         else:
             logger.warning(f"Could not process payment from webhook: missing user_id or amount. Session: {session}")
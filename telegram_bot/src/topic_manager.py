@@ -2,19 +2,188 @@
 """
 Topic management system for supergroup conversation threads.
 Handles automatic topic creation, user info cards, and admin replies.
+
+User <-> topic routing is served from ``registry``, an in-memory
+bidirectional map loaded with one query at startup, so routing a user
+message or an admin reply needs no query once both sides are known.
+
+A user gets one topic even when several of their messages arrive before it
+exists: concurrent creations in this process share one ``create_forum_topic``
+call, and across replicas the first topic saved for the user wins; a losing
+replica deletes the topic it created and routes to the winner.
 """
 
 import logging
-from typing import Optional, Dict, Any
+from typing import List, Optional, Dict, Any
 from telegram import Update, Bot, ForumTopic
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from src import database
+from src import async_database, cache, outbound, queries
+from src.database import db_manager
+from src.outbound import Lane
+from src.query_stats import query_stats
+from src.user_profile import load_user_profile_async
 from src.config import settings
 
 logger = logging.getLogger(__name__)
 
+queries.register('all_user_topics', "SELECT user_id, topic_id FROM conversations WHERE topic_id IS NOT NULL")
+
+
+class TopicRegistry:
+    """Bidirectional ``user_id <-> topic_id`` map in front of the ``conversations`` table.
+
+    A user or topic missing from the map is looked up once and remembered.
+    Saving a topic updates the map and invalidates the user's topic through
+    the cache, so other replicas drop their copy and look it up again.
+    """
+
+    def __init__(self):
+        self._topic_by_user: Dict[int, int] = {}
+        self._user_by_topic: Dict[int, int] = {}
+        self._generation = 0  # bumped by invalidations; a lookup that overlaps one is not stored
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.orphans_deleted = 0
+        query_stats.add_collector(self.prometheus)
+
+    def load(self) -> int:
+        """Replace the map with every saved topic (one query); returns the number of users."""
+        for _ in range(3):
+            generation = self._generation
+            rows = db_manager.execute_named('all_user_topics', fetch_all=True) or []
+            if generation != self._generation:
+                continue  # a topic changed while loading; the rows may predate it
+            self._user_by_topic = {row['topic_id']: row['user_id'] for row in rows}
+            self._topic_by_user = {user_id: topic_id for topic_id, user_id in self._user_by_topic.items()}
+            self.loaded = True
+            logger.info(f"Loaded {len(self._topic_by_user)} user topics")
+            return len(self._topic_by_user)
+        logger.warning("User topics kept changing during the load; they are looked up on demand")
+        return 0
+
+    def remember(self, user_id: int, topic_id: int, generation: Optional[int] = None) -> None:
+        """Map ``user_id`` to ``topic_id`` (unless an invalidation happened since ``generation``)."""
+        if generation is not None and generation != self._generation:
+            return
+        old_topic = self._topic_by_user.get(user_id)
+        if old_topic is not None and old_topic != topic_id:
+            self._user_by_topic.pop(old_topic, None)
+        old_user = self._user_by_topic.get(topic_id)
+        if old_user is not None and old_user != user_id:
+            self._topic_by_user.pop(old_user, None)
+        self._topic_by_user[user_id] = topic_id
+        self._user_by_topic[topic_id] = user_id
+
+    def forget_user(self, user_id: int) -> None:
+        self._generation += 1
+        topic_id = self._topic_by_user.pop(user_id, None)
+        if topic_id is not None and self._user_by_topic.get(topic_id) == user_id:
+            del self._user_by_topic[topic_id]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._topic_by_user = {}
+        self._user_by_topic = {}
+        self.loaded = False
+
+    def cached_topic(self, user_id: int) -> Optional[int]:
+        """The user's topic ID if it is in the map (no I/O)."""
+        topic_id = self._topic_by_user.get(user_id)
+        if topic_id is not None:
+            self.hits += 1
+        return topic_id
+
+    async def get_topic(self, user_id: int) -> Optional[int]:
+        """The user's topic ID, or None if they have none yet."""
+        topic_id = self.cached_topic(user_id)
+        if topic_id is not None:
+            return topic_id
+        self.misses += 1
+        generation = self._generation
+        topic_id = await async_database.get_or_create_user_topic(user_id)
+        if topic_id:
+            self.remember(user_id, topic_id, generation)
+        return topic_id
+
+    async def get_user(self, topic_id: int) -> Optional[int]:
+        """The user a topic belongs to, or None if it is not a user topic."""
+        user_id = self._user_by_topic.get(topic_id)
+        if user_id is not None:
+            self.hits += 1
+            return user_id
+        self.misses += 1
+        generation = self._generation
+        user_id = await async_database.get_user_by_topic_id(topic_id)
+        if user_id:
+            self.remember(user_id, topic_id, generation)
+        return user_id
+
+    async def claim(self, user_id: int, topic_id: int) -> Optional[int]:
+        """Save a newly created topic unless the user already has one; returns the topic that won.
+
+        A win is published to every replica by invalidation; None if the save failed.
+        """
+        winner = await async_database.claim_user_topic(user_id, topic_id)
+        if winner is None:
+            return None
+        if winner == topic_id:
+            cache.invalidate_user_topic(user_id)
+        self.remember(user_id, winner)
+        return winner
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'loaded': self.loaded,
+            'users': len(self._topic_by_user),
+            'hits': self.hits,
+            'misses': self.misses,
+            'created': self.created,
+            'creations_shared': _creations.coalesced,
+            'orphans_deleted': self.orphans_deleted,
+        }
+
+    def prometheus(self) -> List[str]:
+        """Metric lines for the ``/metrics`` endpoint."""
+        return [
+            '# HELP bot_topic_registry_users Users with a topic in the routing map.',
+            '# TYPE bot_topic_registry_users gauge',
+            f'bot_topic_registry_users {len(self._topic_by_user)}',
+            '# HELP bot_topic_registry_lookups_total Topic routing lookups by result.',
+            '# TYPE bot_topic_registry_lookups_total counter',
+            f'bot_topic_registry_lookups_total{{result="hit"}} {self.hits}',
+            f'bot_topic_registry_lookups_total{{result="miss"}} {self.misses}',
+            '# HELP bot_topics_created_total Forum topics created for users.',
+            '# TYPE bot_topics_created_total counter',
+            f'bot_topics_created_total {self.created}',
+            '# HELP bot_topic_creations_shared_total Topic requests that waited on a creation already running.',
+            '# TYPE bot_topic_creations_shared_total counter',
+            f'bot_topic_creations_shared_total {_creations.coalesced}',
+            '# HELP bot_topic_orphans_deleted_total Duplicate topics deleted after losing the save to another replica.',
+            '# TYPE bot_topic_orphans_deleted_total counter',
+            f'bot_topic_orphans_deleted_total {self.orphans_deleted}',
+        ]
+
+
+registry = TopicRegistry()
+
+# One create_forum_topic per user at a time; later callers wait for its result
+_creations = cache.SingleFlight()
+
+
+def _on_cache_invalidation(kind: str, arg: Any) -> None:
+    """Drop a user's topic when it is saved on another replica; drop everything on a full clear."""
+    if kind == 'key' and str(arg).startswith('user:') and str(arg).endswith(':topic'):
+        registry.forget_user(cache._parse_key(arg)[1])
+    elif kind == 'clear':
+        registry.clear()
+
+
+cache.add_invalidation_listener(_on_cache_invalidation)
+
 
 async def get_or_create_user_topic(bot: Bot, user_id: int, username: str = None, first_name: str = None) -> Optional[int]:
     """Get existing topic for user or create a new one in the admin group."""
@@ -25,63 +194,89 @@ async def get_or_create_user_topic(bot: Bot, user_id: int, username: str = None,
             return None
         
         # Check if user already has a topic
-        existing_topic_id = database.get_or_create_user_topic(user_id, username, first_name)
+        existing_topic_id = registry.cached_topic(user_id)
         if existing_topic_id:
             return existing_topic_id
         
-        # Create new topic in the supergroup
-        display_name = f"{first_name or 'User'}"
-        if username:
-            display_name = f"@{username}"
-        
-        topic_name = f"👤 {display_name} ({user_id})"
-        
-        try:
-            # Create forum topic
-            forum_topic = await bot.create_forum_topic(
-                chat_id=settings.ADMIN_GROUP_ID,
-                name=topic_name[:100]  # Telegram limit is 100 chars
-            )
-            
-            topic_id = forum_topic.message_thread_id
-            
-            # Save topic to database
-            if database.save_user_topic(user_id, topic_id):
-                logger.info(f"✅ Created topic {topic_id} for user {user_id} ({display_name})")
-                
-                # Send user info card to the topic
-                await send_user_info_card(bot, user_id, topic_id, username, first_name)
-                
-                return topic_id
-            else:
-                logger.error(f"Failed to save topic {topic_id} for user {user_id}")
-                return None
-                
-        except TelegramError as e:
-            if "not found" in str(e).lower() or "chat not found" in str(e).lower():
-                logger.error(f"Admin group {settings.ADMIN_GROUP_ID} not found or bot not in group")
-            elif "forum" in str(e).lower():
-                logger.error(f"Admin group {settings.ADMIN_GROUP_ID} is not a forum group")
-            else:
-                logger.error(f"Failed to create forum topic: {e}")
-            return None
+        # Messages arriving while the topic is looked up or created wait for it instead of creating another
+        return await _creations.ado(str(user_id), lambda: _create_user_topic(bot, user_id, username, first_name))
             
     except Exception as e:
         logger.error(f"Error in get_or_create_user_topic: {e}")
         return None
 
 
+async def _create_user_topic(bot: Bot, user_id: int, username: str = None, first_name: str = None) -> Optional[int]:
+    """Create the user's forum topic and save it, deferring to a topic another replica saved first."""
+    # Saved earlier (on this or another replica), or by a creation that finished just before this one
+    existing_topic_id = await registry.get_topic(user_id)
+    if existing_topic_id:
+        return existing_topic_id
+
+    # Create new topic in the supergroup
+    display_name = f"{first_name or 'User'}"
+    if username:
+        display_name = f"@{username}"
+    
+    topic_name = f"👤 {display_name} ({user_id})"
+    
+    try:
+        # Create forum topic
+        forum_topic = await bot.create_forum_topic(
+            chat_id=settings.ADMIN_GROUP_ID,
+            name=topic_name[:100]  # Telegram limit is 100 chars
+        )
+    except TelegramError as e:
+        if "not found" in str(e).lower() or "chat not found" in str(e).lower():
+            logger.error(f"Admin group {settings.ADMIN_GROUP_ID} not found or bot not in group")
+        elif "forum" in str(e).lower():
+            logger.error(f"Admin group {settings.ADMIN_GROUP_ID} is not a forum group")
+        else:
+            logger.error(f"Failed to create forum topic: {e}")
+        return None
+
+    topic_id = forum_topic.message_thread_id
+    registry.created += 1
+
+    # Save topic to database; the first topic saved for the user wins
+    winner = await registry.claim(user_id, topic_id)
+    if winner != topic_id:
+        if winner is None:
+            logger.error(f"Failed to save topic {topic_id} for user {user_id}")
+        else:
+            logger.info(f"Topic {winner} was saved for user {user_id} first; deleting duplicate topic {topic_id}")
+        await _delete_orphan_topic(bot, topic_id)
+        return winner
+
+    logger.info(f"✅ Created topic {topic_id} for user {user_id} ({display_name})")
+    
+    # Send user info card to the topic
+    await send_user_info_card(bot, user_id, topic_id, username, first_name)
+    
+    return topic_id
+
+
+async def _delete_orphan_topic(bot: Bot, topic_id: int) -> None:
+    """Delete a topic no user is routed to, so it does not linger in the admin group."""
+    try:
+        await outbound.send(bot, Lane.USER_FORWARD, 'delete_forum_topic',
+                            chat_id=settings.ADMIN_GROUP_ID, message_thread_id=topic_id)
+        registry.orphans_deleted += 1
+    except TelegramError as e:
+        logger.warning(f"Could not delete orphaned topic {topic_id}: {e}")
+
+
 async def send_user_info_card(bot: Bot, user_id: int, topic_id: int, username: str = None, first_name: str = None) -> None:
     """Send and pin a user info card in the topic with enhanced details."""
     try:
-        # Get comprehensive user information
-        user_credits = database.get_user_credits_optimized(user_id)
-        user_info = database.get_user_info(user_id)
+        # Get comprehensive user information in one query
+        profile = await load_user_profile_async(user_id)
+        user_credits = profile.message_credits if profile else 0
         
         # Get purchase history and tier information
         tier_emoji, tier_text = get_user_tier_info(user_credits)
-        total_purchases = get_user_purchase_count(user_id)
-        join_date = user_info.get('created_at', 'Unknown') if user_info else 'Unknown'
+        total_purchases = profile.purchase_count if profile else 0
+        join_date = (profile.created_at or 'Unknown') if profile else 'Unknown'
         
         # Create enhanced info card matching the documentation specs
         display_name = f"{first_name or 'Unknown'}"
@@ -98,7 +293,7 @@ async def send_user_info_card(bot: Bot, user_id: int, topic_id: int, username: s
 • Credits: {user_credits}
 • Tier: {tier_emoji} {tier_text}
 • Total Purchases: {total_purchases}
-• Status: {'🚫 Banned' if user_info and user_info.get('is_banned') else '✅ Active'}
+• Status: {'🚫 Banned' if profile and profile.is_banned else '✅ Active'}
 
 **📅 Account Info:**
 • Joined: {format_join_date(join_date)}
@@ -110,7 +305,7 @@ Use admin commands for credit management
         """.strip()
         
         # Send the enhanced info card
-        message = await bot.send_message(
+        message = await outbound.send(bot, Lane.USER_FORWARD, 'send_message',
             chat_id=settings.ADMIN_GROUP_ID,
             text=info_text,
             message_thread_id=topic_id,
@@ -119,7 +314,7 @@ Use admin commands for credit management
         
         # Pin the info card
         try:
-            await bot.pin_chat_message(
+            await outbound.send(bot, Lane.USER_FORWARD, 'pin_chat_message',
                 chat_id=settings.ADMIN_GROUP_ID,
                 message_id=message.message_id
             )
@@ -130,7 +325,7 @@ Use admin commands for credit management
     except Exception as e:
         logger.error(f"Error sending enhanced user info card: {e}")
 
-async def handle_user_message_to_topic(bot: Bot, update: Update, context: ContextTypes.DEFAULT_TYPE, cost: int, discount_text: str = "", user_tier: str = "") -> bool:
+async def handle_user_message_to_topic(bot: Bot, update: Update, context: ContextTypes.DEFAULT_TYPE, cost: int, discount_text: str = "", user_tier: str = "", balance: Optional[int] = None) -> bool:
     """Enhanced user message handling with all media types support."""
     try:
         user_id = update.effective_user.id
@@ -153,8 +348,8 @@ async def handle_user_message_to_topic(bot: Bot, update: Update, context: Contex
         
         # Forward message to topic with enhanced header
         try:
-            # Get user information for header
-            user_credits = database.get_user_credits_optimized(user_id)
+            # Get user information for header (the caller usually knows the balance already)
+            user_credits = balance if balance is not None else await async_database.get_user_credits_optimized(user_id)
             tier_emoji, tier_text = get_user_tier_info(user_credits)
             
             # Determine message type for header
@@ -166,7 +361,7 @@ From: @{update.effective_user.username or 'Unknown'} {tier_emoji} {tier_text} (I
 Cost: {cost} credits{discount_text} | Balance: {user_credits} credits
 ──────────────────────────────────"""
             
-            await bot.send_message(
+            await outbound.send(bot, Lane.USER_FORWARD, 'send_message',
                 chat_id=settings.ADMIN_GROUP_ID,
                 text=header,
                 message_thread_id=topic_id,
@@ -174,13 +369,15 @@ Cost: {cost} credits{discount_text} | Balance: {user_credits} credits
             )
             
             # Forward the actual message (supports all media types)
-            await update.message.forward(
+            await outbound.send(bot, Lane.USER_FORWARD, 'forward_message',
                 chat_id=settings.ADMIN_GROUP_ID,
+                from_chat_id=update.message.chat_id,
+                message_id=update.message.message_id,
                 message_thread_id=topic_id
             )
             
             # Update conversation activity
-            database.update_conversation_activity(user_id, topic_id)
+            await async_database.update_conversation_activity(user_id, topic_id)
             
             logger.info(f"✅ Forwarded {message_type} from user {user_id} to topic {topic_id}")
             return True
@@ -209,7 +406,7 @@ async def handle_admin_topic_reply(bot: Bot, update: Update, context: ContextTyp
         topic_id = update.message.message_thread_id
         
         # Get user ID for this topic
-        target_user_id = database.get_user_by_topic_id(topic_id)
+        target_user_id = await registry.get_user(topic_id)
         if not target_user_id:
             logger.warning(f"No user found for topic {topic_id}")
             return False
@@ -220,55 +417,56 @@ async def handle_admin_topic_reply(bot: Bot, update: Update, context: ContextTyp
             if update.message.text:
                 # Check for quick reply keywords
                 message_text = update.message.text.strip()
-                quick_reply = database.get_quick_reply(message_text)
+                quick_reply = await async_database.get_quick_reply(message_text)
                 
                 if quick_reply:
                     # Send quick reply instead of original message
-                    await bot.send_message(chat_id=target_user_id, text=quick_reply)
+                    await outbound.send(bot, Lane.ADMIN_REPLY, 'send_message', chat_id=target_user_id, text=quick_reply)
                     # Add reaction to show it was a quick reply
                     await update.message.add_reaction("🔄")
                 else:
                     # Send original text
-                    await bot.send_message(chat_id=target_user_id, text=update.message.text)
+                    await outbound.send(bot, Lane.ADMIN_REPLY, 'send_message', chat_id=target_user_id, text=update.message.text)
                     await update.message.add_reaction("✅")
             elif update.message.photo:
-                await bot.send_photo(
+                await outbound.send(bot, Lane.ADMIN_REPLY, 'send_photo',
                     chat_id=target_user_id,
                     photo=update.message.photo[-1].file_id,
                     caption=update.message.caption
                 )
             elif update.message.video:
-                await bot.send_video(
+                await outbound.send(bot, Lane.ADMIN_REPLY, 'send_video',
                     chat_id=target_user_id,
                     video=update.message.video.file_id,
                     caption=update.message.caption
                 )
             elif update.message.document:
-                await bot.send_document(
+                await outbound.send(bot, Lane.ADMIN_REPLY, 'send_document',
                     chat_id=target_user_id,
                     document=update.message.document.file_id,
                     caption=update.message.caption
                 )
             elif update.message.voice:
-                await bot.send_voice(
+                await outbound.send(bot, Lane.ADMIN_REPLY, 'send_voice',
                     chat_id=target_user_id,
                     voice=update.message.voice.file_id
                 )
             elif update.message.sticker:
-                await bot.send_sticker(
+                await outbound.send(bot, Lane.ADMIN_REPLY, 'send_sticker',
                     chat_id=target_user_id,
                     sticker=update.message.sticker.file_id
                 )
             else:
                 # Fallback: copy the message
-                await update.message.copy(chat_id=target_user_id)
+                await outbound.send(bot, Lane.ADMIN_REPLY, 'copy_message', chat_id=target_user_id,
+                                    from_chat_id=update.message.chat_id, message_id=update.message.message_id)
             
             # Add checkmark reaction to confirm (enhanced UX)
             try:
                 await update.message.add_reaction("✅")
             except:
                 # Fallback: reply with checkmark if reactions not available
-                await bot.send_message(
+                await outbound.send(bot, Lane.NOTIFICATION, 'send_message',
                     chat_id=settings.ADMIN_GROUP_ID,
                     text="✅ Message sent to user",
                     message_thread_id=topic_id,
@@ -276,14 +474,14 @@ async def handle_admin_topic_reply(bot: Bot, update: Update, context: ContextTyp
                 )
                 
             # Update conversation activity
-            database.update_conversation_activity(target_user_id, topic_id)
+            await async_database.update_conversation_activity(target_user_id, topic_id)
             
             logger.info(f"✅ Forwarded admin reply from topic {topic_id} to user {target_user_id}")
             return True
             
         except TelegramError as e:
             logger.error(f"Failed to forward admin reply to user {target_user_id}: {e}")
-            await bot.send_message(
+            await outbound.send(bot, Lane.NOTIFICATION, 'send_message',
                 chat_id=settings.ADMIN_GROUP_ID,
                 text=f"❌ Failed to send message to user. Error: {str(e)[:100]}...",
                 message_thread_id=topic_id,
@@ -306,11 +504,11 @@ def get_user_tier_info(credits: int) -> tuple[str, str]:
     else:
         return "🆕", "New"
 
-def get_user_purchase_count(user_id: int) -> int:
+async def get_user_purchase_count(user_id: int) -> int:
     """Get total purchase count for user."""
     # This would query payment_logs table
     try:
-        return database.get_user_purchase_count(user_id)
+        return await async_database.get_user_purchase_count(user_id)
     except:
         return 0
 
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Concurrent update processing that keeps each user's updates in order.
+
+By default python-telegram-bot handles one update at a time, so a slow
+forward or database call in ``master_message_handler`` holds up every other
+user. ``KeyedUpdateProcessor`` runs updates concurrently, up to
+``UPDATE_CONCURRENCY`` at once, while updates that share an ordering key run
+one after another in arrival order:
+
+* messages in a forum topic are keyed by the topic, so admin replies in one
+  topic stay in order;
+* everything else is keyed by the sending user (falling back to the chat),
+  so a user's messages, button presses and conversation steps never
+  overtake each other.
+
+An update waiting for an earlier one with the same key gives its slot back
+while it waits: one user sending a burst cannot fill every slot and stall
+everyone else. The number of handlers running at once stays bounded by
+``UPDATE_CONCURRENCY``; in-flight, waiting and key counts are in
+``get_stats()`` and on ``/metrics``.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, List, Optional, Union
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.database import settings
+from src.query_stats import query_stats
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update: object) -> Optional[Hashable]:
+    """Key whose updates must be handled in order, or None if the update can run any time."""
+    if not isinstance(update, Update):
+        return None
+    message = update.effective_message
+    if message is not None and message.is_topic_message and message.message_thread_id:
+        return ('topic', message.chat_id, message.message_thread_id)
+    if update.effective_user is not None:
+        return ('user', update.effective_user.id)
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Up to ``max_concurrent_updates`` updates at once, in order per ``ordering_key``."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._tails: Dict[Hashable, asyncio.Future] = {}  # key -> done when its latest update finishes
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+        self.max_in_flight = 0
+        query_stats.add_collector(self.prometheus)
+
+    async def initialize(self) -> None:
+        """Nothing to set up."""
+
+    async def shutdown(self) -> None:
+        """Nothing to release; the application waits for running updates itself."""
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Called with a slot held, in arrival order (the base class semaphore is FIFO)
+        key = ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                await self._wait_for(previous, coroutine)
+            await self._run(coroutine)
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    async def _wait_for(self, previous: asyncio.Future, coroutine: Awaitable[Any]) -> None:
+        """Wait for the key's previous update without holding a slot."""
+        self.waiting += 1
+        self._semaphore.release()
+        try:
+            await previous
+        except asyncio.CancelledError:
+            coroutine.close()  # never started; avoids the "never awaited" warning
+            raise
+        finally:
+            # process_update releases the slot when we return, so take one back first
+            await self._semaphore.acquire()
+            self.waiting -= 1
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await coroutine
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'max_concurrent_updates': self.max_concurrent_updates,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'waiting_for_key': self.waiting,
+            'active_keys': len(self._tails),
+            'processed': self.processed,
+        }
+
+    def prometheus(self) -> List[str]:
+        """Metric lines for the ``/metrics`` endpoint."""
+        return [
+            '# HELP bot_updates_in_flight Updates being handled right now.',
+            '# TYPE bot_updates_in_flight gauge',
+            f'bot_updates_in_flight {self.in_flight}',
+            '# HELP bot_updates_waiting Updates waiting for an earlier update from the same user or topic.',
+            '# TYPE bot_updates_waiting gauge',
+            f'bot_updates_waiting {self.waiting}',
+            '# HELP bot_updates_processed_total Updates handled.',
+            '# TYPE bot_updates_processed_total counter',
+            f'bot_updates_processed_total {self.processed}',
+        ]
+
+
+def from_settings() -> Union[KeyedUpdateProcessor, bool]:
+    """Argument for ``ApplicationBuilder.concurrent_updates()``: sequential when ``UPDATE_CONCURRENCY`` <= 1."""
+    concurrency = int(getattr(settings, 'UPDATE_CONCURRENCY', 32))
+    return KeyedUpdateProcessor(concurrency) if concurrency > 1 else False
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Per-user profile hydrated in one query.
+
+Handlers and menu builders used to call ``get_user_credits_optimized``,
+``get_user_tier``, ``get_user_info``, ``get_user_purchase_count``,
+``get_user_stats_individual`` and ``get_user_auto_recharge_settings`` one
+after another, each a separate round trip for the same ``users`` row. A
+``UserProfile`` carries all of those fields; it is loaded with one query,
+cached under ``user:<id>:profile`` (so every credit or account write that
+calls ``invalidate_user_cache`` drops it) and memoized on the callback
+context so a single update never loads it twice.
+"""
+
+import logging
+from typing import Any, Dict, Mapping, Optional
+
+from src import cache, queries
+from src.database import db_manager, apply_tier_discount
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SQL = """
+SELECT u.telegram_id, u.username, u.first_name, u.last_name,
+       u.message_credits, u.time_credits, u.time_credits_seconds,
+       u.is_banned, u.ban_reason,
+       u.auto_recharge_enabled, u.auto_recharge_amount, u.auto_recharge_threshold,
+       u.created_at, u.last_active,
+       (SELECT c.topic_id FROM conversations c
+         WHERE c.user_id = u.telegram_id AND c.topic_id IS NOT NULL
+         ORDER BY c.created_at DESC LIMIT 1) AS topic_id,
+       (SELECT COUNT(*) FROM payment_logs p WHERE p.telegram_id = u.telegram_id) AS purchase_count,
+       (SELECT COUNT(*) FROM transactions t
+         WHERE t.user_id = u.telegram_id AND t.transaction_type = 'message') AS total_messages
+FROM users u
+WHERE u.telegram_id = %s
+"""
+queries.register('user_profile', PROFILE_SQL)
+
+# Attribute used to memoize profiles on a CallbackContext for one update
+_CONTEXT_ATTR = '_user_profiles'
+
+
+class UserProfile:
+    """Everything the handlers need to know about one user."""
+
+    __slots__ = (
+        'telegram_id', 'username', 'first_name', 'last_name',
+        'message_credits', 'time_credits', 'time_credits_seconds',
+        'is_banned', 'ban_reason',
+        'auto_recharge_enabled', 'auto_recharge_amount', 'auto_recharge_threshold',
+        'created_at', 'last_active', 'topic_id', 'purchase_count', 'total_messages',
+    )
+
+    def __init__(self, row: Mapping[str, Any]):
+        self.telegram_id = int(row['telegram_id'])
+        self.username = row.get('username')
+        self.first_name = row.get('first_name')
+        self.last_name = row.get('last_name')
+        self.message_credits = row.get('message_credits') or 0
+        self.time_credits = row.get('time_credits') or 0
+        self.time_credits_seconds = row.get('time_credits_seconds') or 0
+        self.is_banned = bool(row.get('is_banned'))
+        self.ban_reason = row.get('ban_reason')
+        self.auto_recharge_enabled = bool(row.get('auto_recharge_enabled'))
+        self.auto_recharge_amount = row.get('auto_recharge_amount') or 10
+        self.auto_recharge_threshold = row.get('auto_recharge_threshold') or 5
+        self.created_at = row.get('created_at')
+        self.last_active = row.get('last_active')
+        self.topic_id = row.get('topic_id')
+        self.purchase_count = row.get('purchase_count') or 0
+        self.total_messages = row.get('total_messages') or 0
+
+    def __repr__(self) -> str:
+        return f"UserProfile(telegram_id={self.telegram_id}, credits={self.message_credits})"
+
+    @property
+    def credits(self) -> int:
+        return self.message_credits
+
+    @property
+    def tier(self) -> str:
+        """Same thresholds as database.get_user_tier."""
+        if self.message_credits >= 100:
+            return 'VIP'
+        elif self.message_credits >= 50:
+            return 'Regular'
+        return 'New'
+
+    @property
+    def tier_emoji(self) -> str:
+        return "🏆" if self.tier == "VIP" else "⭐" if self.tier == "Regular" else "🆕"
+
+    @property
+    def tier_discount(self) -> str:
+        return "20%" if self.tier == "VIP" else "10%" if self.tier == "Regular" else "0%"
+
+    @property
+    def is_new_user(self) -> bool:
+        return self.total_messages == 0
+
+    def discounted_cost(self, cost: int) -> int:
+        return apply_tier_discount(cost, self.tier)
+
+    @property
+    def auto_recharge(self) -> Dict[str, Any]:
+        """Shape returned by get_user_auto_recharge_settings."""
+        return {
+            'enabled': self.auto_recharge_enabled,
+            'amount': self.auto_recharge_amount,
+            'threshold': self.auto_recharge_threshold,
+        }
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Shape returned by get_user_stats_individual."""
+        return {
+            'total_messages': self.total_messages,
+            'member_since': self.created_at,
+            'current_credits': self.message_credits,
+        }
+
+    def as_user_info(self) -> Dict[str, Any]:
+        """Shape returned by get_user_info."""
+        return {
+            'telegram_id': self.telegram_id,
+            'username': self.username,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'message_credits': self.message_credits,
+            'time_credits': self.time_credits,
+            'is_banned': self.is_banned,
+            'ban_reason': self.ban_reason,
+            'created_at': self.created_at,
+            'last_active': self.last_active,
+        }
+
+
+def _cache_key(user_id: int) -> str:
+    return f"user:{user_id}:profile"
+
+
+def _load_row(user_id: int) -> Optional[Dict[str, Any]]:
+    row = db_manager.execute_named('user_profile', (user_id,), fetch_one=True)
+    return dict(row) if row else None
+
+
+async def _aload_row(user_id: int) -> Optional[Dict[str, Any]]:
+    from src.async_database import async_db_manager
+    row = await async_db_manager.execute_named('user_profile', (user_id,), fetch_one=True)
+    return dict(row) if row else None
+
+
+def load_user_profile(user_id: int) -> Optional[UserProfile]:
+    """Load (or fetch from cache) the profile of ``user_id``; None if unknown."""
+    try:
+        # The cached value is the plain row so it survives the JSON round trip through Redis
+        row = cache._cache.get_or_load(
+            _cache_key(user_id), lambda: _load_row(user_id), cache.USER_CACHE_TTL,
+            negative_ttl=cache.NEGATIVE_CACHE_TTL
+        )
+        return UserProfile(row) if row else None
+    except Exception as e:
+        logger.error(f"Error loading profile for user {user_id}: {e}")
+        return None
+
+
+async def load_user_profile_async(user_id: int) -> Optional[UserProfile]:
+    """Coroutine version of load_user_profile using the async database helpers."""
+    try:
+        row = await cache._cache.aget_or_load(
+            _cache_key(user_id), lambda: _aload_row(user_id), cache.USER_CACHE_TTL,
+            negative_ttl=cache.NEGATIVE_CACHE_TTL
+        )
+        return UserProfile(row) if row else None
+    except Exception as e:
+        logger.error(f"Error loading profile for user {user_id}: {e}")
+        return None
+
+
+async def get_user_profile(context: Any, user_id: int, refresh: bool = False) -> UserProfile:
+    """Profile of ``user_id`` for the update being handled.
+
+    The first call for an update loads it; later calls from other handlers
+    or menu builders of the same update reuse that object. Pass
+    ``refresh=True`` after the handler itself changed the user's account
+    (the write has already invalidated the shared cache entry). Unknown
+    users get a blank profile, matching the defaults of the individual
+    database helpers.
+    """
+    profiles = getattr(context, _CONTEXT_ATTR, None) if context is not None else None
+    if profiles is None and context is not None:
+        profiles = {}
+        try:
+            setattr(context, _CONTEXT_ATTR, profiles)
+        except AttributeError:
+            profiles = None
+    if profiles is not None and not refresh and user_id in profiles:
+        return profiles[user_id]
+
+    profile = await load_user_profile_async(user_id) or UserProfile({'telegram_id': user_id})
+    if profiles is not None:
+        profiles[user_id] = profile
+    return profile
+
+
+def forget_user_profile(context: Any, user_id: int) -> None:
+    """Drop the profile memoized on ``context`` without touching the shared cache."""
+    profiles = getattr(context, _CONTEXT_ATTR, None)
+    if profiles:
+        profiles.pop(user_id, None)
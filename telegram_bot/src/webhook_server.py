@@ -46,6 +46,12 @@ except ImportError:
     # Fallback type alias
     PostgresConnection = Any
 
+try:
+    from src.cache import invalidate_user_cache
+except ImportError:
+    # Running outside the bot package: no shared cache to invalidate
+    invalidate_user_cache = None
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -120,6 +126,9 @@ def add_user_credits(user_id: int, credits: int, credit_type: str = 'message') -
 
             conn.commit()
             logger.info("✅ Added %s %s credits to user %s", credits, credit_type, user_id)
+            if invalidate_user_cache:
+                # Bot replicas drop their cached balance for this user
+                invalidate_user_cache(user_id)
 
     except Exception as e:
         logger.error("Error adding credits to user %s: %s", user_id, e)
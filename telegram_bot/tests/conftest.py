@@ -0,0 +1,51 @@
+"""
+Shared setup for the unit tests.
+
+The tests run against a throwaway SQLite database (the same fallback the bot
+uses without DATABASE_URL) and fakeredis; they never touch a configured
+PostgreSQL, replica or Redis.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Settings the bot requires at import; external services are switched off
+for _key, _value in {
+    'BOT_TOKEN': 'test',
+    'ADMIN_CHAT_ID': '0',
+    'RAILWAY_STATIC_URL': 'localhost',
+    'TELEGRAM_SECRET_TOKEN': 'test',
+}.items():
+    os.environ.setdefault(_key, _value)
+for _key in ('DATABASE_URL', 'DATABASE_REPLICA_URL', 'REDIS_URL'):
+    os.environ[_key] = ''
+
+# The SQLite fallback opens telegram_bot.db relative to the working directory
+os.chdir(tempfile.mkdtemp(prefix='bot_tests_'))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_user_ids = itertools.count(800_000_000)
+
+
+@pytest.fixture
+def make_user():
+    """Create a user with the given credit balance and return their ID."""
+    from src import cache, database
+    from src.database import db_manager
+
+    def make(credits: int) -> int:
+        user_id = next(_user_ids)
+        database.ensure_user_exists(user_id, f"test{user_id}", 'Test')
+        db_manager.execute_query(
+            "UPDATE users SET message_credits = ?, last_low_balance_notification = NULL WHERE telegram_id = ?",
+            (credits, user_id)
+        )
+        cache.invalidate_user_cache(user_id)
+        return user_id
+
+    return make
@@ -0,0 +1,113 @@
+"""Credit reservations: charge, then commit on delivery or release on failure."""
+
+import asyncio
+
+from src import async_database, database
+from src.database import db_manager
+
+
+def balance(user_id: int) -> int:
+    row = db_manager.execute_query("SELECT message_credits FROM users WHERE telegram_id = ?",
+                                   (user_id,), fetch_one=True)
+    return row['message_credits']
+
+
+def status(reservation_id: int) -> str:
+    row = db_manager.execute_query("SELECT status FROM credit_reservations WHERE id = ?",
+                                   (reservation_id,), fetch_one=True)
+    return row['status']
+
+
+def low_balance_claimed(user_id: int) -> bool:
+    row = db_manager.execute_query("SELECT last_low_balance_notification FROM users WHERE telegram_id = ?",
+                                   (user_id,), fetch_one=True)
+    return row['last_low_balance_notification'] is not None
+
+
+def expire_holds(user_id: int) -> None:
+    db_manager.execute_query("UPDATE credit_reservations SET expires_at = datetime('now', '-1 minute') "
+                             "WHERE telegram_id = ?", (user_id,))
+
+
+def test_delivered_charge_is_committed(make_user):
+    user_id = make_user(20)
+
+    async def deliver():
+        charge = await async_database.charge_message(user_id, 'text')
+        assert await async_database.commit_reservation(charge.reservation_id)
+        return charge
+
+    charge = asyncio.run(deliver())
+    assert charge.charged and not charge.error
+    assert charge.balance == 19
+    assert balance(user_id) == 19
+    assert status(charge.reservation_id) == 'committed'
+
+
+def test_undelivered_charge_is_refunded(make_user):
+    # 6 - 1 leaves 5 credits, at the low-balance threshold
+    user_id = make_user(6)
+
+    async def fail_delivery():
+        charge = await async_database.charge_message(user_id, 'text')
+        assert charge.notify_low_balance and low_balance_claimed(user_id)
+        # What master_message_handler does when delivered is False
+        assert await async_database.release_reservation(charge.reservation_id)
+        await async_database.clear_low_balance_notification_status(user_id)
+        return charge
+
+    charge = asyncio.run(fail_delivery())
+    assert balance(user_id) == 6
+    assert status(charge.reservation_id) == 'released'
+    assert not low_balance_claimed(user_id)
+    # A refunded hold cannot be charged after all
+    assert not database.commit_reservation(charge.reservation_id)
+    assert balance(user_id) == 6
+
+
+def test_insufficient_credits_reserve_nothing(make_user):
+    user_id = make_user(0)
+    charge = database.charge_message(user_id, 'text')
+    assert charge.found and not charge.charged
+    assert charge.reservation_id is None
+    assert balance(user_id) == 0
+
+
+def test_unknown_user_is_not_an_error():
+    charge = database.charge_message(799_999_999, 'text')
+    assert not charge.found and not charge.error
+
+
+def test_database_error_is_reported(make_user, monkeypatch):
+    user_id = make_user(20)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(database, '_charge_message_sqlite', broken)
+    charge = database.charge_message(user_id, 'text')
+    assert charge.error and not charge.charged
+    assert balance(user_id) == 20
+
+
+def test_expired_hold_is_swept_and_recharged_on_late_commit(make_user):
+    user_id = make_user(10)
+    hold = database.reserve_credits(user_id, 3)
+    assert balance(user_id) == 7
+    expire_holds(user_id)
+
+    assert database.release_expired_reservations() >= 1
+    assert balance(user_id) == 10
+    assert status(hold) == 'expired'
+
+    # The message went out after all: charge it again
+    assert database.commit_reservation(hold)
+    assert balance(user_id) == 7
+    assert status(hold) == 'committed'
+
+
+def test_reserve_never_oversells(make_user):
+    user_id = make_user(5)
+    assert database.reserve_credits(user_id, 3) is not None
+    assert database.reserve_credits(user_id, 3) is None
+    assert balance(user_id) == 2
@@ -0,0 +1,86 @@
+"""ReplyMap: routes are answered from memory, written in batches and found again after a restart."""
+
+import asyncio
+import itertools
+
+from src import reply_map
+from src.reply_map import ReplyMap
+
+ADMIN_CHAT = 42
+_message_ids = itertools.count(1_000)
+
+
+def test_recorded_route_is_answered_from_memory():
+    routes = ReplyMap(max_entries=100)
+    message_id = next(_message_ids)
+    routes.record(ADMIN_CHAT, message_id, 7)
+
+    assert asyncio.run(routes.lookup(ADMIN_CHAT, message_id)) == 7
+    assert routes.hits == 1 and routes.db_lookups == 0
+
+
+def test_flushed_routes_survive_a_restart():
+    routes = ReplyMap(max_entries=100)
+    first, second = next(_message_ids), next(_message_ids)
+    routes.record(ADMIN_CHAT, first, 7)
+    routes.record(ADMIN_CHAT, second, 8)
+    assert asyncio.run(routes.flush()) == 2
+    assert routes.get_stats()['pending'] == 0
+
+    restarted = ReplyMap(max_entries=100)
+
+    async def lookups():
+        return [await restarted.lookup(ADMIN_CHAT, first), await restarted.lookup(ADMIN_CHAT, second),
+                await restarted.lookup(ADMIN_CHAT, first)]
+
+    assert asyncio.run(lookups()) == [7, 8, 7]
+    # The third lookup was served by the route cached on the first
+    assert restarted.db_lookups == 2 and restarted.db_hits == 2 and restarted.hits == 1
+
+
+def test_routes_evicted_from_memory_come_from_the_database():
+    routes = ReplyMap(max_entries=2)
+    message_ids = [next(_message_ids) for _ in range(3)]
+    for user_id, message_id in enumerate(message_ids, start=1):
+        routes.record(ADMIN_CHAT, message_id, user_id)
+    asyncio.run(routes.flush())
+
+    assert routes.get_stats()['cached'] == 2
+    assert asyncio.run(routes.lookup(ADMIN_CHAT, message_ids[0])) == 1
+    assert routes.db_hits == 1
+
+
+def test_unknown_route():
+    routes = ReplyMap(max_entries=100)
+    assert asyncio.run(routes.lookup(ADMIN_CHAT, next(_message_ids))) is None
+    assert routes.db_lookups == 1 and routes.db_hits == 0
+
+
+def test_failed_flush_keeps_routes_for_the_next_one(monkeypatch):
+    routes = ReplyMap(max_entries=100)
+    message_id = next(_message_ids)
+    routes.record(ADMIN_CHAT, message_id, 7)
+    write = reply_map._write_routes
+
+    def broken(rows):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(reply_map, '_write_routes', broken)
+    assert asyncio.run(routes.flush()) == 0
+    assert routes.write_errors == 1 and routes.get_stats()['pending'] == 1
+
+    monkeypatch.setattr(reply_map, '_write_routes', write)
+    assert asyncio.run(routes.flush()) == 1
+    assert asyncio.run(ReplyMap(max_entries=100).lookup(ADMIN_CHAT, message_id)) == 7
+
+
+def test_full_batch_wakes_the_flusher():
+    routes = ReplyMap(max_entries=100, batch_size=2)
+
+    async def record_batch():
+        waiter = asyncio.create_task(routes.wait_for_batch(5.0))
+        routes.record(ADMIN_CHAT, next(_message_ids), 7)
+        routes.record(ADMIN_CHAT, next(_message_ids), 8)
+        await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(record_batch())
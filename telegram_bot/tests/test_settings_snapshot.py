@@ -0,0 +1,127 @@
+"""SettingsStore: when a snapshot counts as stale and what readers see meanwhile."""
+
+import asyncio
+import time
+
+import pytest
+
+from src.database import db_manager
+from src.settings_snapshot import SettingsSnapshot, SettingsStore
+
+KEY = 'test_snapshot_setting'
+
+
+def write(value: str) -> None:
+    """Change the setting behind the store's back, as another replica would."""
+    db_manager.execute_query(
+        "INSERT INTO bot_settings (setting_key, setting_value) VALUES (?, ?) "
+        "ON CONFLICT (setting_key) DO UPDATE SET setting_value = excluded.setting_value",
+        (KEY, value)
+    )
+
+
+async def wait_for_load(store: SettingsStore, loads: int) -> None:
+    deadline = time.monotonic() + 2.0
+    while store.loads < loads:
+        assert time.monotonic() < deadline, "background reload did not finish"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def store():
+    write('old')
+    store = SettingsStore(ttl=60.0)
+    store.load()
+    return store
+
+
+def test_snapshot_is_immutable(store):
+    snapshot = store.current()
+    with pytest.raises(AttributeError):
+        snapshot.version = 5
+    with pytest.raises(TypeError):
+        snapshot.values[KEY] = 'new'
+
+
+def test_fresh_snapshot_is_served_without_loading(store):
+    write('new')
+    assert store.current().get(KEY) == 'old'
+    assert store.loads == 1
+
+
+def test_version_bump_reloads_off_the_loop(store):
+    write('new')
+    store.invalidate()
+    assert store.current().get(KEY) == 'new'
+    assert store.loads == 2
+
+
+def test_version_bump_serves_old_snapshot_on_the_loop(store):
+    write('new')
+    store.invalidate()
+
+    async def read():
+        before = store.current().get(KEY)
+        await wait_for_load(store, 2)
+        return before, store.current().get(KEY)
+
+    assert asyncio.run(read()) == ('old', 'new')
+
+
+def test_expired_snapshot_reloads(store):
+    store.ttl = 0.05
+    write('new')
+    time.sleep(0.1)
+    assert store.current().get(KEY) == 'new'
+
+
+def test_own_write_is_visible_before_the_reload(store):
+    write('mine')
+    store.invalidate()
+    store.apply_local(KEY, 'mine')
+
+    async def read():
+        seen = store.current().get(KEY)
+        # The patched snapshot is stale by design: the whole table is reloaded behind it
+        await wait_for_load(store, 2)
+        return seen, store.current().get(KEY)
+
+    assert asyncio.run(read()) == ('mine', 'mine')
+
+
+def test_load_that_started_before_a_bump_does_not_win(store):
+    write('new')
+    store.invalidate()
+    newer = store.load()
+    # A reload begun at the previous version finishes late
+    store._version -= 1
+    store.load()
+    store._version += 1
+    assert store.current() is newer
+
+
+def test_defaults_before_first_load():
+    write('old')
+    store = SettingsStore()
+
+    async def read():
+        snapshot = store.current()
+        await wait_for_load(store, 1)
+        return snapshot
+
+    snapshot = asyncio.run(read())
+    assert isinstance(snapshot, SettingsSnapshot) and snapshot.version == -1
+    assert snapshot.low_credit_threshold == 5
+    assert store.current().get(KEY) == 'old'
+
+
+def test_failed_load_keeps_last_snapshot(store, monkeypatch):
+    before = store.current()
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(db_manager, 'execute_query', broken)
+    store.invalidate()
+    assert store.current() is before
+    assert store.load_errors == 1
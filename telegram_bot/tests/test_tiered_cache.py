@@ -0,0 +1,110 @@
+"""TieredCache: invalidations must win over loads and writes still in flight."""
+
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from src.cache import NAMESPACE_TTLS, CacheEngine, TieredCache  # noqa: E402
+
+KEY = 'user:1:credits'
+
+
+def wait_for(predicate, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def replicas(server):
+    """Two replicas sharing one Redis."""
+    caches = [TieredCache(CacheEngine(namespace_ttls=NAMESPACE_TTLS),
+                          fakeredis.FakeRedis(server=server, decode_responses=True))
+              for _ in range(2)]
+    # Both listeners subscribed, so no invalidation is published into the void
+    channel = caches[0].l2.channel
+    wait_for(lambda: dict(caches[0].l2.client.pubsub_numsub(channel)).get(channel) == 2)
+    yield caches
+    for cache in caches:
+        cache.l2.close()
+
+
+def in_redis(cache: TieredCache, key: str) -> bool:
+    return cache.l2.client.exists(cache.l2._key(key)) == 1
+
+
+def test_load_fills_both_tiers(replicas):
+    a, b = replicas
+    assert a.get_or_load(KEY, lambda: 10) == 10
+    wait_for(lambda: in_redis(a, KEY))
+    # The other replica is served from Redis without loading
+    assert b.get_or_load(KEY, lambda: pytest.fail("loaded despite L2 hit")) == 10
+
+
+def test_invalidation_reaches_other_replicas(replicas):
+    a, b = replicas
+    a.get_or_load(KEY, lambda: 10)
+    wait_for(lambda: in_redis(a, KEY))
+    b.get_or_load(KEY, lambda: 10)
+
+    a.invalidate_user(1)
+    wait_for(lambda: b.l2.received == 1)
+    assert not in_redis(a, KEY)
+    assert b.get_or_load(KEY, lambda: 15) == 15
+
+
+def test_stale_load_does_not_overwrite_newer_write(replicas):
+    a, b = replicas
+    # b reads the old value, then a writes and invalidates before b stores it
+    stamp = b._stamp(KEY)
+    old = 20
+    a.invalidate_user(1)
+    wait_for(lambda: a.l2.published == 1 and b.l2.received == 1)
+    b._store_loaded(KEY, old, stamp, None, None, 0.0)
+
+    assert b.discarded_loads == 1
+    assert not in_redis(b, KEY)
+    assert b.get_or_load(KEY, lambda: 25) == 25
+
+
+def test_queued_set_is_dropped_under_tombstone(replicas):
+    a, b = replicas
+    a.invalidate_user(1)
+    wait_for(lambda: a.l2.published == 1)
+    # Even without a stamp check, the writer skips the key while its tombstone lives
+    b.l2.set(KEY, 20, 60.0)
+    wait_for(lambda: b.l2.superseded == 1)
+    assert not in_redis(b, KEY)
+
+
+def test_l2_not_read_while_own_delete_is_queued(replicas, monkeypatch):
+    a, _ = replicas
+    a.set(KEY, 10)
+    wait_for(lambda: in_redis(a, KEY))
+
+    gate = threading.Event()
+    write = a.l2._write
+
+    def held_write(op):
+        gate.wait(2.0)
+        write(op)
+
+    monkeypatch.setattr(a.l2, '_write', held_write)
+    a.invalidate_user(1)
+    # Redis still has the old value, but this replica knows it is being deleted
+    assert in_redis(a, KEY)
+    assert a.get(KEY) is None
+    assert a.get_or_load(KEY, lambda: 15) == 15
+
+    gate.set()
+    wait_for(lambda: not any(a._pending))
+    assert a.get(KEY) == 15
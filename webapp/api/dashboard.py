@@ -5,12 +5,19 @@ Fresh database deployment - trigger redeploy with new DATABASE_URL.
 """
 
 import os
+import sys
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
-from flask import Flask, jsonify, request, send_from_directory, send_file
+from flask import Flask, g, jsonify, request, send_from_directory, send_file
 from flask_cors import CORS
 
+# Shared replica routing from the bot: telegram_bot/ in the repo, ../telegram_bot in the image
+for _root in ('../../telegram_bot', '../telegram_bot'):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), _root))
+from src.replica import ReplicaRouter, REPLICA_LAG_SQL
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,6 +32,16 @@ if not DATABASE_URL:
     # Fallback for local development
     DATABASE_URL = os.getenv('POSTGRES_URL') or os.getenv('DB_URL')
 
+# Optional read replica for the read-only endpoints
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG_S = float(os.getenv('DB_REPLICA_MAX_LAG_S', '5'))
+READ_YOUR_WRITES_S = float(os.getenv('DB_READ_YOUR_WRITES_S', '10'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', '5'))
+
+# Wall-clock time until which this browser's reads stay on the primary. A cookie,
+# unlike a module global, is seen by every worker process serving the admin
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
+
 # Try to import psycopg2, fallback to None if not available
 try:
     import psycopg2
@@ -36,8 +53,59 @@ except ImportError:
     RealDictCursor = None
     HAS_POSTGRES = False
 
-def get_db_connection():
-    """Get database connection."""
+def _replica_lag():
+    """Seconds the replica is behind the primary (raises if it is unreachable)."""
+    conn = psycopg2.connect(DATABASE_REPLICA_URL, cursor_factory=RealDictCursor, connect_timeout=5)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            return float(cursor.fetchone()['lag_seconds'] or 0)
+    finally:
+        conn.close()
+
+# Probes the lag at most every REPLICA_LAG_CHECK_INTERVAL, not on every request
+replica_router = ReplicaRouter(_replica_lag, window=READ_YOUR_WRITES_S, max_lag=REPLICA_MAX_LAG_S,
+                               check_interval=REPLICA_LAG_CHECK_INTERVAL)
+
+def record_write():
+    """Serve this admin's reads from the primary for a while, so they see their own change."""
+    g.primary_until = time.time() + READ_YOUR_WRITES_S
+
+@app.after_request
+def set_primary_until_cookie(response):
+    """Hand the read-your-writes window to the browser after a write."""
+    primary_until = g.get('primary_until')
+    if primary_until:
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, f"{primary_until:.3f}",
+                            max_age=int(READ_YOUR_WRITES_S) + 1, httponly=True, samesite='Lax')
+    return response
+
+def wrote_recently():
+    """True while this admin's last write may not have reached the replica."""
+    try:
+        return float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_replica_connection():
+    """Connection to the read replica, or None if unset, recently written to, lagging or down."""
+    if not (HAS_POSTGRES and DATABASE_REPLICA_URL):
+        return None
+    if wrote_recently() or not replica_router.use_replica():
+        return None
+    try:
+        return psycopg2.connect(DATABASE_REPLICA_URL, cursor_factory=RealDictCursor, connect_timeout=5)
+    except Exception as e:
+        replica_router.replica_failed(e)
+        return None
+
+def get_db_connection(read_only=False):
+    """Get database connection; read_only endpoints may be served by the replica."""
+    if read_only:
+        conn = get_replica_connection()
+        if conn:
+            return conn
+
     if not HAS_POSTGRES:
         logger.warning("psycopg2 not available - using fallback mode")
         return None
@@ -95,7 +163,7 @@ def health_check():
 def get_dashboard_stats():
     """Get dashboard statistics."""
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if not conn:
             # Return sample data if database is not available
             return jsonify({
@@ -167,7 +235,7 @@ def get_dashboard_stats():
 def get_settings():
     """Get bot settings."""
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if not conn:
             # Return default settings if database is not available
             return jsonify({
@@ -246,6 +314,7 @@ def update_settings():
             conn.commit()
             
         conn.close()
+        record_write()
         
         logger.info(f"Settings updated: {data}")
         return jsonify({'message': 'Settings updated successfully'})
@@ -258,7 +327,7 @@ def update_settings():
 def get_products():
     """Get credit packages/products."""
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if not conn:
             # Return sample products if database is not available
             return jsonify([
@@ -365,6 +434,7 @@ def create_product():
             conn.commit()
             
         conn.close()
+        record_write()
         
         logger.info(f"Product created: {data}")
         return jsonify({'id': product_id, 'message': 'Product created successfully'})
@@ -402,6 +472,7 @@ def update_product(product_id):
             conn.commit()
             
         conn.close()
+        record_write()
         
         logger.info(f"Product {product_id} updated: {data}")
         return jsonify({'message': 'Product updated successfully'})
@@ -423,6 +494,7 @@ def delete_product(product_id):
             conn.commit()
             
         conn.close()
+        record_write()
         
         logger.info(f"Product {product_id} deleted")
         return jsonify({'message': 'Product deleted successfully'})
@@ -435,7 +507,7 @@ def delete_product(product_id):
 def get_users():
     """Get users overview."""
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if not conn:
             return jsonify([])
         